@@ -0,0 +1,1539 @@
+#!/usr/bin/env python3
+"""
+自适应策略族数组回测引擎 (Array Engine for SMA-crossover + ATR-stop + 2%-risk)
+==========================================================================
+
+功能: 项目中同一套逻辑 (均线交叉入场 + ATR×3 止损 + 2%风险仓位) 有多份逐K线Python实现:
+      backtrader 的 LLM_Adaptive / Adaptive_Strategy_13, HardCodedAdaptiveStrategy, 以及 补充实验
+      脚本里的 SimpleStrategy / SimpleBacktest (.iloc[i] 循环)。本模块用一个数组引擎统一:
+
+    - 信号一次性预计算为数组: SMA/RSI/ATR 使用 feature_store 内核 (kind='bt' 与backtrader逐位一致),
+      CrossOver 复刻 backtrader 的 NonZeroDifference 口径
+    - 持仓/止损状态机只在"事件K线"上运行: 空仓时在入场信号下标上 searchsorted 跳转,
+      持仓时对后续K线做一次向量化比较找到第一个离场K线, 中间的K线不进入Python循环
+    - 权益曲线由成交后的 (cash, size, price) 阶梯向量化重建, 指标口径与各驱动脚本 run_backtest 相同:
+      SharpeRatio (年度收益, rf=1%), DrawDown, TradeAnalyzer closed
+
+两种撮合口径 (fill):
+    next_open  backtrader默认broker: 订单在下一根K线开盘价成交; 提交后先按创建K线收盘价预检资金
+               (check_submitted), 成交时再检查一次, 资金不足为 Margin; 佣金 abs(size)*commission*price
+    close      手写循环口径: 信号K线收盘价即时成交, cost = size*price*(1+commission)
+
+成本方案 (simulate / simulate_batch 的 cost=cost_model.schedule(...), 只支持 next_open):
+    与 cost_model.make_broker 的backtrader逐笔一致 — 费用由 order_fees 计算 (卖出印花税 / 最低佣金),
+    买单向下取整到整手 (不足一手的买单 Rejected), 开盘滑点, 涨跌停/停牌掩码下订单顺延到第一根能成交的K线;
+    release='accepted' 的策略在顺延期间会继续下单, 遇到这种情况时报 ValueError (批量模式记为该组的 error)
+
+预设 (PRESETS):
+    llm_adaptive   LLM_Adaptive (multi_year_rolling_validation / transaction_cost_sensitivity /
+                   extended_baseline_comparison), 止损与死叉可在同一根K线各发一次 close()
+    adaptive_13    Adaptive_Strategy_13 (run_strategy_on_new_data)
+    hard_coded     HardCodedAdaptiveStrategy.backtest
+    simple_adaptive / simple_fixed
+                   SimpleBacktest.run_adaptive_strategy / run_fixed_strategy 与 SimpleStrategy.run
+    sensitivity_*  parameter_sensitivity_strategies 的 Strategy13 变体 (固定止损/ATR止损/2%仓位/完全自适应)
+    triple_fusion  experiment8 的 AdaptiveMultiFactorStrategy (三均线 + RSI区间 + ATR止损)
+
+批量参数模式 (simulate_batch / run_batch): 参数扫描中只有止损倍数、仓位等数值参数变化,
+    P组参数在一次 T根K线的遍历中同时模拟 — 价格与指标共享, 状态为 (P,) 数组; 每组结果与单独运行一致
+
+断点续跑 (simulate_segment): next_open 状态机的完整状态 (现金/持仓/入场价/未成交订单) 是一个可保存的dict,
+    新K线到来时只在新K线上继续运行, 见 incremental_engine
+
+使用方法:
+    python adaptive_engine.py verify                  # 与backtrader逐笔对比 (全部标的 × 年份)
+    python adaptive_engine.py benchmark               # 每个 symbol-year 的耗时与加速比
+    python adaptive_engine.py verify-batch            # 批量模式 vs 逐组合backtrader (参数网格)
+
+    from adaptive_engine import run_adaptive, run_batch
+    result = run_adaptive(df, 'llm_adaptive', commission=0.0015)   # df: open/high/low/close 列
+    results = run_batch(df, 'sensitivity_fixed', {'stop_loss': [50, 100, 200], 'position_size': [10, 20]})
+"""
+
+import itertools
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from feature_store import compute as compute_feature
+
+
+# =============================================================================
+# 策略预设
+# =============================================================================
+
+PRESETS = {
+    'llm_adaptive': {
+        'sma_fast': 5, 'sma_slow': 20, 'rsi_period': 7, 'atr_period': 14,
+        'atr_multiplier': 3.0, 'risk_percent': 0.02,
+        'entry': 'crossover',          # bt.indicators.CrossOver > 0
+        'rsi_above': 50, 'rsi_below': None,
+        'sizing': 'atr_risk',          # int(value * risk / (atr * mult))
+        'min_size': 1, 'max_size': 100,
+        'stop': 'position_loss',       # (close - entry) * size < -(atr * mult * size)
+        'exits': 'independent',        # 止损与死叉各自 close(), 同一K线可能发出两张卖单
+        'release': 'completed',        # notify_order 只在 Completed 时清空 self.order
+        'entry_price': 'fill',         # 买单成交后 entry_price 更新为成交价
+        'fill': 'next_open', 'kind': 'bt',
+    },
+    'adaptive_13': {
+        'sma_fast': 20, 'sma_slow': 50, 'rsi_period': 14, 'atr_period': 14,
+        'atr_multiplier': 3.0, 'risk_percent': 0.02,
+        'entry': 'golden_cross',       # fast > slow and fast[-1] <= slow[-1]
+        'rsi_above': None, 'rsi_below': 70,
+        'sizing': 'atr_risk',
+        'min_size': None, 'max_size': None,
+        'stop': 'price',               # close < buy_price - atr * mult
+        'exits': 'chain',              # if/elif: 每根K线至多一张卖单
+        'release': 'final',            # Completed / Canceled / Margin 均清空 self.order (Rejected 不清空)
+        'entry_price': 'fill',
+        'fill': 'next_open', 'kind': 'bt',
+    },
+    'simple_adaptive': {
+        'sma_fast': 20, 'sma_slow': 50, 'rsi_period': None, 'atr_period': 14,
+        'atr_multiplier': 3, 'risk_percent': 0.02,
+        'entry': 'golden_cross', 'rsi_above': None, 'rsi_below': None,
+        'sizing': 'atr_risk',
+        'min_size': None, 'max_size': None,
+        'stop': 'price',
+        'exits': 'sequential',         # 死叉与止损两个独立的 if (死叉平仓后止损仍会被检查)
+        'fill': 'close', 'kind': 'simple', 'require_cash': True,
+    },
+    'hard_coded': {
+        'sma_fast': 10, 'sma_slow': 50, 'rsi_period': None, 'atr_period': 14,
+        'atr_multiplier': 3.0, 'risk_percent': 0.02, 'cap_affordable': True,
+        'entry': 'golden_cross', 'rsi_above': None, 'rsi_below': None,
+        'sizing': 'atr_risk',
+        'min_size': None, 'max_size': None,
+        'stop': 'entry_level',         # close <= entry - mult * atr(入场K线), 止损价入场时固定
+        'exits': 'stop_first',         # 先止损, 再处理信号 (止损后同一根K线可再入场)
+        'fill': 'close', 'kind': 'simple', 'require_cash': True,
+    },
+    'simple_fixed': {
+        'sma_fast': 20, 'sma_slow': 50, 'rsi_period': None, 'atr_period': None,
+        'sizing': 'fixed', 'position_size': 100, 'stop_loss': 1000.0,
+        'entry': 'golden_cross', 'rsi_above': None, 'rsi_below': None,
+        'stop': 'fixed_loss',          # (entry - close) * size > stop_loss
+        'exits': 'sequential',
+        'fill': 'close', 'kind': 'simple', 'require_cash': False,
+    },
+
+    # parameter_sensitivity_strategies: Strategy13 的参数敏感性变体
+    'sensitivity_fixed': {             # Strategy13_FixedStopLoss / Strategy13_FixedPositionSize
+        'sma_fast': 20, 'sma_slow': 50, 'rsi_period': None, 'atr_period': None,
+        'entry': 'crossover', 'rsi_above': None, 'rsi_below': None,
+        'sizing': 'fixed', 'position_size': 20, 'stop_loss': 200,
+        'stop': 'fixed_amount',        # (close - entry) * size < -stop_loss
+        'exits': 'chain',
+        'release': 'any',              # Submitted/Accepted 之外的任何状态 (含 Rejected) 都清空 self.order
+        'entry_price': 'signal',       # entry_price 为信号K线收盘价, 成交后不更新
+        'fill': 'next_open', 'kind': 'bt',
+    },
+    'sensitivity_atr': {               # Strategy13_ATR_Adaptive
+        'sma_fast': 20, 'sma_slow': 50, 'rsi_period': None, 'atr_period': 14,
+        'atr_multiplier': 2.0,
+        'entry': 'crossover', 'rsi_above': None, 'rsi_below': None,
+        'sizing': 'fixed', 'position_size': 20,
+        'stop': 'position_loss',
+        'exits': 'chain', 'entry_price': 'signal',
+        'release': 'accepted',         # 任何通知 (含 Accepted) 都清空 self.order, 挂单未成交时也会继续下单
+        'fill': 'next_open', 'kind': 'bt',
+    },
+    'sensitivity_risk2pct': {          # Strategy13_Risk2Pct
+        'sma_fast': 20, 'sma_slow': 50, 'rsi_period': None, 'atr_period': None,
+        'risk_percent': 0.02, 'stop_loss': 200,
+        'entry': 'crossover', 'rsi_above': None, 'rsi_below': None,
+        'sizing': 'amount_risk',       # int(value * risk / (stop_loss / 20 + 0.01))
+        'min_size': 1, 'max_size': 100,
+        'stop': 'fixed_amount',
+        'exits': 'chain', 'release': 'accepted', 'entry_price': 'signal',
+        'fill': 'next_open', 'kind': 'bt',
+    },
+    'sensitivity_fully_adaptive': {    # Strategy13_FullyAdaptive
+        'sma_fast': 20, 'sma_slow': 50, 'rsi_period': None, 'atr_period': 14,
+        'atr_multiplier': 2.0, 'risk_percent': 0.02,
+        'entry': 'crossover', 'rsi_above': None, 'rsi_below': None,
+        'sizing': 'atr_risk', 'min_stop_distance': 0.01,
+        'min_size': 1, 'max_size': 100,
+        'stop': 'position_loss',
+        'exits': 'chain', 'release': 'accepted', 'entry_price': 'signal',
+        'fill': 'next_open', 'kind': 'bt',
+    },
+
+    # experiment8 innovation_triple_fusion (AdaptiveMultiFactorStrategy)
+    'triple_fusion': {
+        'sma_fast': 10, 'sma_medium': 20, 'sma_slow': 50, 'rsi_period': 14, 'atr_period': 14,
+        'atr_multiplier': 3.0, 'risk_percent': 0.01,
+        'entry': 'trend_stack',        # fast > medium > slow, 离场信号为 fast < medium
+        'rsi_above': None, 'rsi_below': None,
+        'rsi_outside': (30, 70),       # rsi < 30 or rsi > 70
+        'rsi_raises': False,           # 指标由 StoredFeature 查表, 下跌均值为0时不抛出异常
+        'atr_fallback': 0.02,          # atr > 0 否则 close * 0.02 (仓位与止损共用)
+        'sizing': 'atr_risk',
+        'min_size': None, 'max_size': None,
+        'stop': 'price',
+        'exits': 'chain', 'release': 'completed', 'entry_price': 'fill',
+        'fill': 'next_open', 'kind': 'bt',
+    },
+}
+
+# 事件搜索的初始窗口 (找不到时翻倍), 避免每个事件都对剩余全部K线做比较
+_SEARCH_WINDOW = 64
+
+
+def resolve_rules(preset, **overrides):
+    """预设 + 覆盖参数 → 规则dict (未知参数报错, 防止拼写错误静默生效)"""
+    if preset not in PRESETS:
+        raise ValueError(f"未知预设: {preset} (可选: {', '.join(PRESETS)})")
+    rules = dict(PRESETS[preset])
+    unknown = set(overrides) - set(rules) - {'position_size', 'stop_loss', 'require_cash', 'cap_affordable'}
+    if unknown:
+        raise ValueError(f"未知参数: {sorted(unknown)}")
+    rules.update(overrides)
+    return rules
+
+
+# =============================================================================
+# 信号预计算
+# =============================================================================
+
+def _crossover_bt(fast, slow):
+    """
+    bt.indicators.CrossOver: 以"最近一个非零差值" (NonZeroDifference) 判断上一状态
+    返回 1.0 (上穿) / -1.0 (下穿) / 0.0, 预热期为NaN
+    """
+    n = len(fast)
+    cross = np.full(n, np.nan)
+    valid = np.flatnonzero(~np.isnan(fast) & ~np.isnan(slow))
+    if len(valid) < 2:
+        return cross
+    seed = valid[0]
+    diff = fast - slow
+    # nzd[i] = diff[i] if diff[i] else nzd[i-1]; 种子行无条件取 diff[seed]
+    keep = diff != 0.0
+    keep[seed] = True
+    keep[:seed] = False
+    last = np.maximum.accumulate(np.where(keep, np.arange(n), -1))
+    nzd = np.where(last >= 0, diff[np.maximum(last, 0)], np.nan)
+
+    prev = nzd[seed:-1]
+    f, s = fast[seed + 1:], slow[seed + 1:]
+    up = (prev < 0.0) & (f > s)
+    down = (prev > 0.0) & (f < s)
+    cross[seed + 1:] = up.astype(np.float64) - down.astype(np.float64)
+    return cross
+
+
+def _golden_death(fast, slow):
+    """手写口径的金叉/死叉: fast > slow and fast[-1] <= slow[-1] (NaN比较为False)"""
+    f_prev = np.concatenate(([np.nan], fast[:-1]))
+    s_prev = np.concatenate(([np.nan], slow[:-1]))
+    golden = (fast > slow) & (f_prev <= s_prev)
+    death = (fast < slow) & (f_prev >= s_prev)
+    return golden, death
+
+
+def strategy_start(rules):
+    """
+    第一根运行策略逻辑的K线下标
+
+    next_open: backtrader策略的minperiod - 1 (各指标minperiod的最大值, CrossOver比慢线多1);
+    close: 手写循环的 range(sma_slow, len(data))
+    """
+    slow = max(rules['sma_fast'], rules['sma_slow'], rules.get('sma_medium') or 0)
+    if rules['fill'] == 'close':
+        return rules['sma_slow']
+    minperiod = slow + (1 if rules['entry'] == 'crossover' else 0)
+    for key in ('rsi_period', 'atr_period'):
+        if rules.get(key):
+            minperiod = max(minperiod, rules[key] + 1)
+    return minperiod - 1
+
+
+def compute_signals(arrays, rules, features=None):
+    """
+    预计算信号数组
+
+    Args:
+        arrays: {'open', 'high', 'low', 'close'} (ndarray或Series)
+        rules: resolve_rules() 的结果
+        features: 可选, 调用方已算好的 {'sma_fast', 'sma_medium', 'sma_slow', 'rsi', 'atr'} (例如参数扫描中复用)
+
+    Returns:
+        dict: sma_fast / sma_medium / sma_slow / rsi / atr / entry / exit_signal /
+              valid (bool, 手写循环跳过的K线为False)
+    """
+    features = dict(features or {})
+    close = np.asarray(arrays['close'], dtype=np.float64)
+    kind = rules['kind']
+
+    for key, name, period in (('sma_fast', 'sma', rules['sma_fast']),
+                              ('sma_medium', 'sma', rules.get('sma_medium')),
+                              ('sma_slow', 'sma', rules['sma_slow']),
+                              ('rsi', 'rsi', rules.get('rsi_period')),
+                              ('atr', 'atr', rules.get('atr_period'))):
+        if key in features:
+            features[key] = np.asarray(features[key], dtype=np.float64)
+        elif period:
+            features[key] = compute_feature(name, arrays, [period], kind=kind)[0]
+        else:
+            features[key] = None
+
+    rsi = features['rsi']
+    if kind == 'bt' and rsi is not None and rules.get('rsi_raises', True):
+        # backtrader RSI 为 maup / madown 的普通除法: 下跌均值为0时整个回测抛出ZeroDivisionError
+        warm = rsi[rules['rsi_period']:]
+        if np.any(np.isnan(warm) | (warm == 100.0)):
+            raise ZeroDivisionError('RSI: float division by zero (madown == 0)')
+
+    if rules.get('atr_fallback') and features['atr'] is not None:
+        with np.errstate(invalid='ignore'):
+            features['atr'] = np.where(features['atr'] > 0, features['atr'], close * rules['atr_fallback'])
+
+    fast, slow = features['sma_fast'], features['sma_slow']
+    with np.errstate(invalid='ignore'):
+        if rules['entry'] == 'crossover':
+            cross = _crossover_bt(fast, slow)
+            entry, exit_signal = cross > 0, cross < 0
+        elif rules['entry'] == 'trend_stack':
+            medium = features['sma_medium']
+            entry, exit_signal = (fast > medium) & (medium > slow), fast < medium
+        else:
+            entry, exit_signal = _golden_death(fast, slow)
+
+        if rules.get('rsi_above') is not None:
+            entry &= rsi > rules['rsi_above']
+        if rules.get('rsi_below') is not None:
+            entry &= rsi < rules['rsi_below']
+        if rules.get('rsi_outside') is not None:
+            low, high = rules['rsi_outside']
+            entry &= (rsi < low) | (rsi > high)
+
+        valid = np.ones(len(close), dtype=bool)
+        if rules['fill'] == 'close' and features['atr'] is not None:
+            # 手写循环: ATR (及快线) 为NaN的K线整根跳过
+            valid = ~np.isnan(features['atr']) & ~np.isnan(fast)
+            entry &= valid
+            exit_signal &= valid
+
+    features.update(close=close, entry=entry, exit_signal=exit_signal, valid=valid)
+    return features
+
+
+# =============================================================================
+# 状态机
+# =============================================================================
+
+def _first_event(make_mask, t, n):
+    """从t开始找第一个make_mask(lo, hi)为True的K线; 窗口按倍数扩大"""
+    width = _SEARCH_WINDOW
+    lo = t
+    while lo < n:
+        hi = min(n, lo + width)
+        hits = np.flatnonzero(make_mask(lo, hi))
+        if len(hits):
+            return lo + hits[0]
+        lo, width = hi, width * 2
+    return None
+
+
+def stop_mask(rules, close, atr, entry_ref, size, stop_level=None):
+    """止损条件 (与各实现的表达式逐项一致, 保证浮点结果相同)"""
+    stop = rules['stop']
+    if stop is None:
+        return lambda lo, hi: np.zeros(hi - lo, dtype=bool)
+    if stop == 'position_loss':
+        mult = rules['atr_multiplier']
+        return lambda lo, hi: ((close[lo:hi] - entry_ref) * size) < -((atr[lo:hi] * mult) * size)
+    if stop == 'price':
+        mult = rules['atr_multiplier']
+        return lambda lo, hi: close[lo:hi] < (entry_ref - (atr[lo:hi] * mult))
+    if stop == 'fixed_loss':
+        limit = rules['stop_loss']
+        return lambda lo, hi: ((entry_ref - close[lo:hi]) * size) > limit
+    if stop == 'fixed_amount':
+        limit = rules['stop_loss']
+        return lambda lo, hi: ((close[lo:hi] - entry_ref) * size) < -limit
+    if stop == 'entry_level':
+        return lambda lo, hi: close[lo:hi] <= stop_level
+    raise ValueError(f"未知止损规则: {stop}")
+
+
+def entry_size(rules, value, atr, price):
+    """入场数量; 0 表示不下单"""
+    sizing = rules['sizing']
+    if sizing == 'fixed':
+        return int(rules['position_size'])
+    if sizing == 'amount_risk':
+        # 每股风险按 stop_loss / 20 估算 (Strategy13_Risk2Pct)
+        size = int(value * rules['risk_percent'] / (rules['stop_loss'] / 20 + 0.01))
+    else:
+        stop_distance = atr * rules['atr_multiplier']
+        if rules.get('min_stop_distance') is not None and stop_distance < rules['min_stop_distance']:
+            stop_distance = rules['min_stop_distance']
+        if not stop_distance > 0:
+            return 0
+        size = int(value * rules['risk_percent'] / stop_distance)
+    if rules.get('max_size') is not None:
+        size = min(size, rules['max_size'])
+    if rules.get('min_size') is not None:
+        size = max(rules['min_size'], size)
+    if rules.get('cap_affordable'):
+        size = min(size, int(value / price))
+    return max(size, 0)
+
+
+def _update_position(size, price, delta, fill_price):
+    """bt.Position.update: 返回 (新size, 新price, opened, closed)"""
+    new_size = size + delta
+    if not new_size:
+        return 0, 0.0, 0, delta
+    if not size:
+        return new_size, fill_price, delta, 0
+    if size > 0:
+        if delta > 0:
+            return new_size, (price * size + delta * fill_price) / new_size, delta, 0
+        if new_size > 0:
+            return new_size, price, 0, delta
+        return new_size, fill_price, new_size, -size
+    if delta < 0:
+        return new_size, (price * size + delta * fill_price) / new_size, delta, 0
+    if new_size < 0:
+        return new_size, price, 0, delta
+    return new_size, fill_price, new_size, -size
+
+
+def _commission_fee(commission):
+    """setcommission(commission=...) 的费用: abs(size) * commission * price"""
+    return lambda size, price: abs(size) * commission * price
+
+
+def _schedule_rules(cost, arrays, symbol=None, dates=None):
+    """
+    成本方案 (cost_model.schedule) 在单标的数据上的撮合规则, 与 cost_model.make_broker 的backtrader一致
+
+    Returns:
+        dict: fee(size, price) 费用 (AShareCommission) / lot_size 买入整手 (AShareBroker) /
+              fill_price(bar, delta) 开盘成交价 (含滑点) / masks (can_buy, can_sell) 或 None (PriceLimitFiller)
+    """
+    from cost_model import _fill_prices, order_fees, schedule_masks
+
+    commission, stamp_duty = cost['commission'], cost.get('stamp_duty', 0.0)
+    min_commission, slippage = cost.get('min_commission', 0.0), cost.get('slippage', 0.0)
+    if stamp_duty or min_commission:
+        fee = lambda size, price: order_fees(size, price, commission, stamp_duty, min_commission)  # noqa: E731
+    else:
+        fee = _commission_fee(commission)
+    if slippage:
+        fill_price = lambda bar, delta: float(_fill_prices(arrays, bar, delta, slippage))  # noqa: E731
+    else:
+        fill_price = lambda bar, delta: arrays['open'][bar]  # noqa: E731
+    masks = schedule_masks(arrays, cost, symbol, dates) if cost.get('price_limit') is not None else None
+    return {'fee': fee, 'lot_size': int(cost.get('lot_size', 1)), 'fill_price': fill_price, 'masks': masks}
+
+
+def _check_submitted(orders, created_price, fee, cash, size, price):
+    """
+    BackBroker.check_submitted: 克隆持仓 + 累计现金, pnl=0, 按订单创建时的收盘价依次伪成交
+
+    Returns:
+        (accepted, margin): 资金>=0 的订单 / 资金<0 被置为 Margin 的订单
+    """
+    accepted, margin = [], []
+    p_cash, p_size, p_price = cash, size, price
+    for delta in orders:
+        p_size, p_price, opened, closed = _update_position(p_size, p_price, delta, created_price)
+        if closed:
+            p_cash += (-closed) * created_price
+            p_cash -= fee(closed, created_price)
+        if opened:
+            p_cash -= opened * created_price
+            p_cash -= fee(opened, created_price)
+        (accepted if p_cash >= 0.0 else margin).append(delta)
+    return accepted, margin
+
+
+def _execute_orders(accepted, fill_price, fee, cash, size, price):
+    """
+    通过 check_submitted 的订单依次在开盘价成交 (开仓部分资金不足为 Margin)
+
+    Returns:
+        (cash, size, price, fills): fills 为 [(delta, status, trade_closed)] (按通知顺序),
+        trade_closed 表示持仓因此回到0或反向 (TradeAnalyzer 计一笔closed)
+    """
+    fills = []
+    for delta in accepted:
+        _, _, opened, closed = _update_position(size, price, delta, fill_price)
+        if closed:
+            pnl = (-closed) * (fill_price - price) * 1.0
+            cash += (-closed) * price + pnl
+            cash -= fee(closed, fill_price)
+        if opened:
+            trial = cash - opened * fill_price
+            trial -= fee(opened, fill_price)
+            if trial < 0.0:
+                opened = 0
+            else:
+                cash = trial
+        executed = closed + opened
+        trade_closed = bool(closed) and (size + executed == 0 or bool(opened))
+        if executed:
+            size, price, _, _ = _update_position(size, price, executed, fill_price)
+        fills.append((delta, 'Completed' if opened or delta == closed else 'Margin', trade_closed))
+    return cash, size, price, fills
+
+
+def initial_state(rules, initial_cash):
+    """next_open 状态机的初始状态 (断点续跑时随checkpoint保存, 见 incremental_engine)"""
+    return {'t': strategy_start(rules), 'cash': float(initial_cash), 'size': 0, 'price': 0.0,
+            'entry_ref': None, 'pending': None, 'halted': False}
+
+
+def _simulate_next_open(open_, signals, rules, initial_cash, commission, state=None, market=None):
+    """
+    Args:
+        state: 可选, 上一段结束时返回的状态; 下标 t 相对本段第一根K线,
+               pending 为上一段最后一根K线提交、尚未成交的订单 (本段第一根K线开盘成交)
+        market: 可选, _schedule_rules() 的结果 (印花税/最低佣金/整手/滑点/涨跌停); None 为 setcommission 口径
+
+    Returns:
+        (steps, orders_log, closed_trades, state)
+    """
+    close, atr = signals['close'], signals['atr']
+    n = len(close)
+    entries = np.flatnonzero(signals['entry'])
+    exit_signal = signals['exit_signal']
+    independent = rules['exits'] == 'independent'
+    release_completed = rules['release'] == 'completed'
+    # AShareBroker 拒绝的买单在下一根K线通知 Rejected
+    release_rejected = rules['release'] in ('any', 'accepted')
+    track_fill = rules['entry_price'] == 'fill'
+    if market is None:
+        market = {'fee': _commission_fee(commission), 'lot_size': 1, 'fill_price': lambda bar, delta: open_[bar],
+                  'masks': None}
+    fee, masks = market['fee'], market['masks']
+
+    state = dict(state or initial_state(rules, initial_cash))
+    cash, size, price = state['cash'], state['size'], state['price']
+    entry_ref, pending = state['entry_ref'], state['pending']
+    steps = [(0, cash, size, price)]
+    orders_log = []
+    closed_trades = 0
+
+    t = state['t']
+    while not state['halted'] and n:
+        if pending is not None:
+            k, (orders, created_price) = -1, pending
+            pending = None
+        elif t >= n:
+            break
+        elif not size:
+            j = np.searchsorted(entries, t)
+            if j == len(entries):
+                break
+            k = int(entries[j])
+            # 空仓时 broker.getvalue() == cash
+            order_size = entry_size(rules, cash + 0.0, atr[k] if atr is not None else None, close[k])
+            if order_size <= 0:
+                t = k + 1
+                continue
+            orders, created_price = [order_size], close[k]
+            entry_ref = close[k]
+            if market['lot_size'] > 1 and order_size < market['lot_size']:
+                # 不足一手: AShareBroker 直接拒绝, 下一根K线通知 Rejected
+                if k + 1 < n:
+                    orders_log.append({'bar': k + 1, 'size': int(order_size), 'price': None, 'status': 'Rejected'})
+                if not release_rejected:
+                    state['halted'] = True
+                t = k + 1
+                continue
+            orders = [order_size // market['lot_size'] * market['lot_size']]
+        else:
+            stop = stop_mask(rules, close, atr, entry_ref, size)
+            k = _first_event(lambda lo, hi: stop(lo, hi) | exit_signal[lo:hi], t, n)
+            if k is None:
+                break
+            # close() 按当前持仓定量 (不考虑未成交订单)
+            count = int(stop(k, k + 1)[0]) + int(exit_signal[k]) if independent else 1
+            orders, created_price = [-size] * count, close[k]
+
+        if k + 1 >= n:
+            # 最后一根K线提交的订单在本段内不会成交; 续跑时在下一段第一根K线开盘成交
+            pending = (orders, float(created_price))
+            t = n
+            break
+
+        accepted, margin = _check_submitted(orders, created_price, fee, cash, size, price)
+        released = not release_completed and bool(margin)
+        for delta in margin:
+            orders_log.append({'bar': k + 1, 'size': int(delta), 'price': float((0.0 + delta * open_[k + 1]) / delta),
+                               'status': 'Margin'})
+
+        # 涨跌停/停牌: 通过检查的订单保留到第一根能成交的K线 (PriceLimitFiller)
+        fill_bar = k + 1
+        if accepted and masks is not None:
+            allowed = masks[0] if accepted[0] > 0 else masks[1]
+            if not allowed[k + 1] and rules['release'] == 'accepted':
+                raise ValueError("订单因涨跌停/停牌延迟成交, 而该策略在 Accepted 时即清空 self.order "
+                                 "(等待期间会继续下单), 数组引擎不支持, 请用backtrader")
+            waits = np.flatnonzero(allowed[k + 1:])
+            if not len(waits):
+                t = n
+                break  # 订单到最后都无法成交, self.order 不会被清空
+            fill_bar = k + 1 + int(waits[0])
+
+        fill_price = market['fill_price'](fill_bar, accepted[0]) if accepted else open_[fill_bar]
+        cash, size, price, fills = _execute_orders(accepted, fill_price, fee, cash, size, price)
+
+        for delta, status, trade_closed in fills:
+            # order.executed.price 为执行块的加权均价: (0.0 + size * price) / size, 末位可能与开盘价不同
+            executed_price = (0.0 + delta * fill_price) / delta
+            orders_log.append({'bar': fill_bar, 'size': int(delta), 'price': float(executed_price), 'status': status})
+            if status == 'Completed':
+                released = True
+                if delta > 0 and track_fill:
+                    entry_ref = executed_price
+                if trade_closed:
+                    closed_trades += 1
+            elif not release_completed:
+                released = True
+        steps.append((fill_bar, cash, size, price))
+
+        if not released:
+            state['halted'] = True  # self.order 永远不会被清空: 策略之后不再下单
+        t = fill_bar
+
+    state.update(t=int(max(t, n) - n), cash=float(cash), size=int(size), price=float(price),
+                 entry_ref=None if entry_ref is None else float(entry_ref), pending=pending)
+    return steps, orders_log, closed_trades, state
+
+
+def _simulate_close(signals, rules, initial_cash, commission):
+    close, atr, valid = signals['close'], signals['atr'], signals['valid']
+    n = len(close)
+    entry = signals['entry']
+    entries = np.flatnonzero(entry)
+    exit_signal = signals['exit_signal']
+    sequential = rules['exits'] == 'sequential'
+    stop_first = rules['exits'] == 'stop_first'
+    mult = rules.get('atr_multiplier')
+
+    cash, size = float(initial_cash), 0
+    entry_ref = stop_level = None
+    steps = [(0, cash, size, 0.0)]
+    trades = []
+
+    def enter(k, value):
+        """收盘价买入; 成功返回True"""
+        nonlocal cash, size, entry_ref, stop_level
+        price = close[k]
+        order_size = entry_size(rules, value, atr[k] if atr is not None else None, price)
+        if order_size <= 0:
+            return False
+        cost = order_size * price * (1 + commission)
+        if rules.get('require_cash') and not cost <= cash:
+            return False
+        size, entry_ref = order_size, price
+        if stop_first:
+            stop_level = price - mult * atr[k]
+        cash -= cost
+        trades.append({'bar': k, 'type': 'buy', 'price': float(price), 'size': order_size})
+        steps.append((k, cash, size, price))
+        return True
+
+    t = strategy_start(rules)
+    while t < n:
+        if not size:
+            j = np.searchsorted(entries, t)
+            if j == len(entries):
+                break
+            k = int(entries[j])
+            if enter(k, cash + size * close[k]) and not stop_first:
+                t = k  # 原循环在入场的同一根K线上继续检查离场
+            else:
+                t = k + 1
+            continue
+
+        stop = stop_mask(rules, close, atr, entry_ref, size, stop_level)
+        k = _first_event(lambda lo, hi: (stop(lo, hi) | exit_signal[lo:hi]) & valid[lo:hi], t, n)
+        if k is None:
+            break
+        price = close[k]
+        value = cash + size * price  # 当根K线处理前的权益
+        stopped = bool(stop(k, k + 1)[0])
+        reason = 'stop' if (stopped if stop_first else not exit_signal[k]) else 'sell'
+        cash += size * price * (1 - commission)
+        trades.append({'bar': k, 'type': reason, 'price': float(price), 'size': size})
+        if reason == 'sell' and sequential and stop_mask(rules, close, atr, entry_ref, 0)(k, k + 1)[0]:
+            # 原循环死叉平仓后仍检查止损: 条件成立时记一笔 size=0 的 'stop' (计入 total_trades)
+            trades.append({'bar': k, 'type': 'stop', 'price': float(price), 'size': 0})
+        size = 0
+        steps.append((k, cash, size, 0.0))
+        if reason == 'stop' and stop_first and entry[k]:
+            # 止损在信号之前处理: 同一根K线可以按止损前的权益重新入场
+            enter(k, value)
+        t = k + 1
+
+    return steps, trades
+
+
+def _equity(steps, close, mode):
+    """由 (bar, cash, size, price) 阶梯重建每根K线收盘后的账户价值"""
+    bars = np.array([s[0] for s in steps])
+    at = np.searchsorted(bars, np.arange(len(close)), side='right') - 1
+    cash = np.array([s[1] for s in steps])[at]
+    size = np.array([s[2] for s in steps], dtype=np.float64)[at]
+    price = np.array([s[3] for s in steps])[at]
+    value = size * close
+    if mode == 'close':
+        return cash + value
+    # BackBroker._get_value (shortcash=True, leverage=1): 多头为 (value - unrealized) + unrealized
+    unrealized = size * (close - price) * 1.0
+    long_value = (value - unrealized) / 1.0 + unrealized
+    return cash + np.where(value > 0, long_value, value)
+
+
+# =============================================================================
+# 指标 (backtrader分析器口径)
+# =============================================================================
+
+def _bt_average(x):
+    return math.fsum(x) / len(x)
+
+
+def _year_last_bars(dates):
+    """每个自然年最后一根K线的下标 (TimeReturn 年度收益的取值点)"""
+    years = pd.DatetimeIndex(dates).year.values
+    return np.flatnonzero(np.diff(years) != 0).tolist() + [len(years) - 1]
+
+
+def _sharpe_from_year_values(values, initial_cash, riskfreerate):
+    bases = [float(initial_cash)] + values[:-1]
+    returns = [v / b - 1.0 for v, b in zip(values, bases)]
+
+    rate = pow(1.0 + riskfreerate, 1.0 / 1) - 1.0
+    ret_free = [r - rate for r in returns]
+    avg = _bt_average(ret_free)
+    dev = math.sqrt(_bt_average([pow(r - avg, 2.0) for r in ret_free]))
+    try:
+        return avg / dev
+    except ZeroDivisionError:
+        return None
+
+
+def bt_sharpe(dates, equity, initial_cash, riskfreerate=0.01):
+    """
+    bt.analyzers.SharpeRatio 默认参数: 年度收益 (TimeReturn, 基准为上一年最后的账户价值),
+    rf按年换算, 总体标准差; 只有一年时标准差为0 → None
+    """
+    values = [float(equity[i]) for i in _year_last_bars(dates)]
+    return _sharpe_from_year_values(values, initial_cash, riskfreerate)
+
+
+def bt_max_drawdown(equity):
+    """bt.analyzers.DrawDown max.drawdown (百分比)"""
+    peak = np.maximum.accumulate(equity)
+    return max(0.0, float(np.max(100.0 * (peak - equity) / peak))) if len(equity) else 0.0
+
+
+# =============================================================================
+# 接口
+# =============================================================================
+
+def simulate(df, rules, initial_cash=100000, commission=0.0015, features=None, cost=None, symbol=None):
+    """
+    运行状态机
+
+    Args:
+        df: DataFrame (open/high/low/close 列, DatetimeIndex 或 'Close' 等首字母大写列)
+        rules: resolve_rules() 的结果
+        features: 可选, 预先算好的指标数组 (见 compute_signals)
+        cost: 可选, cost_model.schedule() 方案 (印花税/最低佣金/整手/滑点/涨跌停, 只支持 next_open 口径),
+              给出时忽略 commission, 与 cost_model.make_broker 的backtrader逐笔一致
+        symbol: price_limit='board' 时按代码判断板块涨跌幅
+
+    Returns:
+        dict: equity (ndarray, 每根K线), cash / position (结束时), orders / trades, closed_trades, start, signals
+    """
+    columns = {c.lower(): c for c in df.columns}
+    arrays = {f: df[columns[f]].to_numpy(dtype=np.float64)
+              for f in ('open', 'high', 'low', 'close', 'volume') if f in columns}
+    signals = compute_signals(arrays, rules, features)
+
+    if cost is not None and rules['fill'] != 'next_open':
+        raise ValueError("成本方案 (cost) 只支持 next_open 口径的预设")
+    if rules['fill'] == 'next_open':
+        market = _schedule_rules(cost, arrays, symbol, df.index) if cost is not None else None
+        steps, orders, closed, _ = _simulate_next_open(arrays['open'], signals, rules, initial_cash, commission,
+                                                       market=market)
+        trades = orders
+    else:
+        steps, trades = _simulate_close(signals, rules, initial_cash, commission)
+        orders = None
+        closed = sum(1 for t in trades if t['type'] != 'buy')
+
+    return {
+        'equity': _equity(steps, signals['close'], rules['fill']),
+        'cash': steps[-1][1],
+        'position': int(steps[-1][2]),
+        'orders': orders,
+        'trades': trades,
+        'closed_trades': closed,
+        'start': strategy_start(rules),
+        'signals': signals,
+    }
+
+
+def simulate_segment(open_, signals, rules, state, commission=0.0015):
+    """
+    从 state 继续运行 next_open 状态机 (断点续跑: signals 只包含新追加的K线)
+
+    Returns:
+        dict: equity (本段每根K线), orders (bar为本段下标), closed_trades (本段新增), state
+    """
+    if rules['fill'] != 'next_open':
+        raise ValueError("断点续跑只支持 next_open 口径的预设")
+    open_ = np.asarray(open_, dtype=np.float64)
+    steps, orders, closed, state = _simulate_next_open(open_, signals, rules, state['cash'], commission, state)
+    return {
+        'equity': _equity(steps, signals['close'], 'next_open'),
+        'orders': orders,
+        'closed_trades': closed,
+        'state': state,
+    }
+
+
+def run_adaptive(df, preset='llm_adaptive', initial_cash=100000, commission=0.0015, features=None, **overrides):
+    """
+    与驱动脚本 run_backtest 同口径的结果dict (next_open 预设与 backtrader 逐笔一致)
+
+    Returns:
+        dict: returns_pct, final_value, sharpe_ratio, max_drawdown_pct, total_trades,
+              initial_cash, data_points, orders
+    """
+    rules = resolve_rules(preset, **overrides)
+    sim = simulate(df, rules, initial_cash, commission, features)
+    equity = sim['equity']
+    final_value = float(equity[-1]) if len(equity) else float(initial_cash)
+    sharpe = bt_sharpe(df.index, equity, initial_cash) if len(equity) else None
+
+    return {
+        'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
+        'final_value': round(final_value, 2),
+        'sharpe_ratio': round(sharpe or 0, 3),
+        'max_drawdown_pct': round(bt_max_drawdown(equity), 2),
+        'total_trades': sim['closed_trades'],
+        'initial_cash': initial_cash,
+        'data_points': len(df),
+        'orders': sim['trades'],
+    }
+
+
+# =============================================================================
+# 批量参数模式 (P组参数 × T根K线, 一次数组遍历)
+# =============================================================================
+
+# 逐组可以不同的数值参数; 其余规则 (入场/止损/撮合口径等) 必须在整批中相同
+_BATCH_NUMERIC = ('atr_multiplier', 'risk_percent', 'position_size', 'stop_loss',
+                  'min_size', 'max_size', 'min_stop_distance')
+# 决定信号与指标数组的参数: 取值相同的参数组共享一份信号
+_BATCH_SIGNAL = ('sma_fast', 'sma_medium', 'sma_slow', 'rsi_period', 'atr_period',
+                 'rsi_above', 'rsi_below', 'rsi_outside')
+_FEATURE_KEYS = (('sma_fast', 'sma'), ('sma_medium', 'sma'), ('sma_slow', 'sma'),
+                 ('rsi_period', 'rsi'), ('atr_period', 'atr'))
+
+
+def _update_position_batch(size, price, delta, fill_price):
+    """_update_position 的向量版本 (逐元素分支相同)"""
+    new_size = size + delta
+    flat = new_size == 0
+    opening = size == 0
+    increase = ~opening & ((size > 0) == (delta > 0))
+    reduce = ~opening & ~increase & ~flat & ((size > 0) == (new_size > 0))
+    flip = ~flat & ~opening & ~increase & ~reduce
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        averaged = (price * size + delta * fill_price) / new_size
+    new_price = np.where(increase, averaged, np.where(reduce, price, fill_price))
+    new_price = np.where(flat, 0.0, new_price)
+    opened = np.where(opening | increase, delta, np.where(flip, new_size, 0))
+    closed = np.where(flat, delta, np.where(reduce, delta, np.where(flip, -size, 0)))
+    return new_size, new_price, opened, closed
+
+
+class _BatchState:
+    """P组参数的账户 / 持仓 / 挂单 / TradeAnalyzer 状态"""
+
+    def __init__(self, count, initial_cash):
+        self.cash = np.full(count, float(initial_cash))
+        self.size = np.zeros(count, dtype=np.int64)
+        self.price = np.zeros(count)
+        self.entry_ref = np.full(count, np.nan)
+        self.pending = np.zeros(count, dtype=np.int64)        # 上一根K线提交的订单数 (0/1/2)
+        self.pending_size = np.zeros(count, dtype=np.int64)   # 同一批订单数量相同
+        self.frozen = np.zeros(count, dtype=bool)             # self.order 永远不会被清空
+        self.waiting = np.zeros(count, dtype=bool)            # 已通过 check_submitted, 等待能成交的K线
+        self.accepted = np.zeros((count, 2), dtype=bool)      # 每张订单是否通过 check_submitted
+
+        # 当前交易 (bt.Trade): 均价 / 累计佣金 / 累计盈亏
+        self.trade_price = np.zeros(count)
+        self.trade_comm = np.zeros(count)
+        self.trade_pnl = np.zeros(count)
+        self.opened_trades = np.zeros(count, dtype=np.int64)
+        self.closed_trades = np.zeros(count, dtype=np.int64)
+        self.won_trades = np.zeros(count, dtype=np.int64)
+
+
+def _check_submitted_batch(state, rows, created_price, fee, release_completed):
+    """_check_submitted 的向量版本: rows 为上一根K线提交了订单的参数组, 通过检查的进入等待成交 (waiting)"""
+    count = state.pending[rows]
+    delta = state.pending_size[rows]
+
+    # check_submitted: 克隆持仓 + 累计现金, 依次伪成交
+    p_cash, p_size, p_price = state.cash[rows], state.size[rows], state.price[rows]
+    for j in range(int(count.max())):
+        has = count > j
+        new_size, new_price, opened, closed = _update_position_batch(p_size, p_price, delta, created_price)
+        trial = p_cash + (-closed) * created_price
+        trial = trial - np.where(closed != 0, fee(closed, created_price), 0.0)
+        trial = trial - opened * created_price
+        trial = trial - np.where(opened != 0, fee(opened, created_price), 0.0)
+        p_cash = np.where(has, trial, p_cash)
+        p_size = np.where(has, new_size, p_size)
+        p_price = np.where(has, new_price, p_price)
+        state.accepted[rows, j] = has & (p_cash >= 0.0)
+
+    # 全部为 Margin: 不会成交, 只有 release='completed' 的策略永远不再下单
+    waiting = state.accepted[rows].any(axis=1)
+    state.waiting[rows] = waiting
+    done = rows[~waiting]
+    state.pending[done] = 0
+    state.frozen[done] |= release_completed
+
+
+def _process_orders_batch(state, rows, fill_price, fee, release_completed, track_fill):
+    """_execute_orders 的向量版本: rows 为本根K线能成交的等待参数组, fill_price 为标量或 (len(rows),)"""
+    delta = state.pending_size[rows]
+    cash, size, price = state.cash[rows], state.size[rows], state.price[rows]
+
+    released = np.zeros(len(rows), dtype=bool) if release_completed else np.ones(len(rows), dtype=bool)
+    executed_price = (0.0 + delta * fill_price) / delta
+    for j in range(state.accepted.shape[1]):
+        ok = state.accepted[rows, j]
+        new_size, new_price, opened, closed = _update_position_batch(size, price, delta, fill_price)
+        opened = np.where(ok, opened, 0)
+        closed = np.where(ok, closed, 0)
+
+        # 平仓部分
+        pnl = (-closed) * (fill_price - price) * 1.0
+        has_closed = closed != 0
+        closed_comm = np.where(has_closed, fee(closed, fill_price), 0.0)
+        cash = np.where(has_closed, cash + ((-closed) * price + pnl), cash)
+        cash = np.where(has_closed, cash - closed_comm, cash)
+
+        trade_pnl = (-closed) * (fill_price - state.trade_price[rows]) * 1.0
+        state.trade_comm[rows] = np.where(has_closed, state.trade_comm[rows] + closed_comm, state.trade_comm[rows])
+        state.trade_pnl[rows] = np.where(has_closed, state.trade_pnl[rows] + trade_pnl, state.trade_pnl[rows])
+        trade_closed = has_closed & (size + closed == 0)
+        state.closed_trades[rows] += trade_closed
+        state.won_trades[rows] += trade_closed & (state.trade_pnl[rows] - state.trade_comm[rows] >= 0.0)
+
+        # 开仓部分: 成交时现金不足则开仓部分作废
+        opened_comm = np.where(opened != 0, fee(opened, fill_price), 0.0)
+        trial = cash - opened * fill_price
+        trial = trial - opened_comm
+        opened = np.where(trial < 0.0, 0, opened)
+        has_opened = opened != 0
+        cash = np.where(has_opened, trial, cash)
+
+        # 交易均价: (oldsize * price + size * price) / newsize; 新交易 (justopened) 的佣金与盈亏从0开始
+        remaining = size + closed
+        fresh = has_opened & (remaining == 0)
+        base_price = np.where(fresh, 0.0, state.trade_price[rows])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            opened_price = (remaining * base_price + opened * fill_price) / (remaining + opened)
+        state.trade_price[rows] = np.where(has_opened, opened_price, state.trade_price[rows])
+        state.trade_comm[rows] = np.where(has_opened, np.where(fresh, 0.0, state.trade_comm[rows]) + opened_comm,
+                                          state.trade_comm[rows])
+        state.trade_pnl[rows] = np.where(fresh, 0.0, state.trade_pnl[rows])
+        state.opened_trades[rows] += fresh
+
+        executed = closed + opened
+        new_size, new_price, _, _ = _update_position_batch(size, price, executed, fill_price)
+        moved = executed != 0
+        size = np.where(moved, new_size, size)
+        price = np.where(moved, new_price, price)
+
+        completed = ok & (has_opened | (delta == closed))
+        released |= completed if release_completed else ok
+        if track_fill:
+            bought = completed & (delta > 0)
+            state.entry_ref[rows] = np.where(bought, executed_price, state.entry_ref[rows])
+
+    state.cash[rows], state.size[rows], state.price[rows] = cash, size, price
+    state.pending[rows] = 0
+    state.waiting[rows] = False
+    state.accepted[rows] = False
+    state.frozen[rows] |= ~released
+
+
+def _order_size_batch(rules, params, rows, value, atr, price):
+    """_order_size 的向量版本; 0 表示不下单"""
+    sizing = rules['sizing']
+    if sizing == 'fixed':
+        return params['position_size'][rows].astype(np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if sizing == 'amount_risk':
+            raw = value * params['risk_percent'][rows] / (params['stop_loss'][rows] / 20 + 0.01)
+            ok = np.ones(len(rows), dtype=bool)
+        else:
+            stop_distance = atr * params['atr_multiplier'][rows]
+            floor = params['min_stop_distance'][rows]
+            stop_distance = np.where(stop_distance < floor, floor, stop_distance)
+            ok = stop_distance > 0
+            raw = value * params['risk_percent'][rows] / stop_distance
+        size = np.trunc(np.where(ok, raw, 0.0))
+        size = np.minimum(size, params['max_size'][rows])
+        size = np.maximum(params['min_size'][rows], size)
+        if rules.get('cap_affordable'):
+            size = np.minimum(size, np.trunc(value / price))
+    return np.where(ok, np.maximum(size, 0), 0).astype(np.int64)
+
+
+def _stop_batch(rules, params, rows, close, atr, entry_ref, size):
+    """_stop_mask 的向量版本 (单根K线, 各组的入场价与持仓不同)"""
+    stop = rules['stop']
+    if stop is None:
+        return np.zeros(len(rows), dtype=bool)
+    if stop == 'position_loss':
+        return ((close - entry_ref) * size) < -((atr * params['atr_multiplier'][rows]) * size)
+    if stop == 'price':
+        return close < (entry_ref - (atr * params['atr_multiplier'][rows]))
+    if stop == 'fixed_amount':
+        return ((close - entry_ref) * size) < -params['stop_loss'][rows]
+    if stop == 'fixed_loss':
+        return ((entry_ref - close) * size) > params['stop_loss'][rows]
+    raise ValueError(f"批量模式不支持的止损规则: {stop}")
+
+
+def _batch_params(rules_list):
+    """检查整批规则一致, 数值参数转为 (P,) 数组 (None → 不限制)"""
+    base = rules_list[0]
+    fixed = {k: v for k, v in base.items() if k not in _BATCH_NUMERIC + _BATCH_SIGNAL}
+    for rules in rules_list[1:]:
+        other = {k: v for k, v in rules.items() if k not in _BATCH_NUMERIC + _BATCH_SIGNAL}
+        if other != fixed:
+            diff = sorted(k for k in set(fixed) | set(other) if fixed.get(k) != other.get(k))
+            raise ValueError(f"批量模式中以下规则必须相同: {diff}")
+    if base['fill'] != 'next_open':
+        raise ValueError("批量模式只支持 next_open (backtrader) 口径")
+
+    defaults = {'min_size': -np.inf, 'max_size': np.inf, 'min_stop_distance': -np.inf}
+    params = {}
+    for key in _BATCH_NUMERIC:
+        fill = defaults.get(key, np.nan)
+        params[key] = np.array([fill if r.get(key) is None else r[key] for r in rules_list], dtype=np.float64)
+    return params
+
+
+def simulate_batch(df, rules_list, initial_cash=100000, commission=0.0015, riskfreerate=0.01, cost=None, symbol=None):
+    """
+    一次数组遍历回测多组参数 (backtrader next_open 口径, 每组结果与 simulate 逐组运行完全一致)
+
+    价格与指标在整批中共享: 每个指标周期只计算一次, 信号按 _BATCH_SIGNAL 取值分组;
+    逐K线的 broker / 策略逻辑在 (P,) 状态数组上向量化执行, 只有挂单的参数组进入撮合
+
+    Args:
+        df: DataFrame (open/high/low/close 列, DatetimeIndex)
+        rules_list: resolve_rules() 结果的列表, 除 _BATCH_NUMERIC / _BATCH_SIGNAL 外的规则必须相同
+        riskfreerate: SharpeRatio 的无风险利率
+        cost / symbol: 可选, 成本方案 (见 simulate), 给出时忽略 commission
+
+    Returns:
+        dict: 每项为长度P的数组/列表 — final_value, sharpe (None表示无法计算), max_drawdown,
+              closed_trades (TradeAnalyzer total.closed), total_trades (total.total),
+              won_trades, lost_trades, error (None 或错误信息 (ZeroDivisionError / 数组引擎不支持的
+              涨跌停延迟成交), 该组其余结果无效)
+    """
+    rules = rules_list[0]
+    params = _batch_params(rules_list)
+    count = len(rules_list)
+
+    columns = {c.lower(): c for c in df.columns}
+    arrays = {f: df[columns[f]].to_numpy(dtype=np.float64)
+              for f in ('open', 'high', 'low', 'close', 'volume') if f in columns}
+    open_, close = arrays['open'], arrays['close']
+    n = len(close)
+    market = _schedule_rules(cost, arrays, symbol, df.index) if cost is not None else None
+    fee = market['fee'] if market else _commission_fee(commission)
+    lot_size = market['lot_size'] if market else 1
+    masks = market['masks'] if market else None
+
+    # 指标: 每个 (指标, 周期) 只算一次
+    periods = {}
+    for key, name in _FEATURE_KEYS:
+        periods.setdefault(name, set()).update(r[key] for r in rules_list if r.get(key))
+    cache = {}
+    for name, values in periods.items():
+        values = sorted(values)
+        if values:
+            for period, column in zip(values, compute_feature(name, arrays, values, kind=rules['kind'])):
+                cache[name, period] = column
+
+    # 信号分组
+    groups, group_of = {}, np.empty(count, dtype=np.int64)
+    for i, r in enumerate(rules_list):
+        group_of[i] = groups.setdefault(tuple(r.get(k) for k in _BATCH_SIGNAL), len(groups))
+    entry = np.zeros((n, len(groups)), dtype=bool)
+    exit_signal = np.zeros((n, len(groups)), dtype=bool)
+    atr = np.full((n, len(groups)), np.nan)
+    error = [None] * count
+    failed = np.zeros(count, dtype=bool)
+    for key, g in groups.items():
+        r = rules_list[int(np.flatnonzero(group_of == g)[0])]
+        features = {feature: cache[name, r[period_key]]
+                    for (period_key, name), feature in zip(_FEATURE_KEYS, ('sma_fast', 'sma_medium', 'sma_slow', 'rsi', 'atr'))
+                    if r.get(period_key)}
+        try:
+            signals = compute_signals(arrays, r, features)
+        except ZeroDivisionError as e:
+            members = group_of == g
+            failed |= members
+            for i in np.flatnonzero(members):
+                error[i] = str(e)
+            continue
+        entry[:, g], exit_signal[:, g] = signals['entry'], signals['exit_signal']
+        if signals['atr'] is not None:
+            atr[:, g] = signals['atr']
+
+    start = np.array([strategy_start(r) for r in rules_list])
+    year_last = _year_last_bars(df.index) if n else []
+    year_values = np.empty((count, len(year_last)))
+    is_year_last = np.zeros(n, dtype=bool)
+    is_year_last[year_last] = True
+    independent = rules['exits'] == 'independent'
+    release_completed = rules['release'] == 'completed'
+    release_rejected = rules['release'] in ('any', 'accepted')
+    track_fill = rules['entry_price'] == 'fill'
+
+    state = _BatchState(count, initial_cash)
+    peak = np.full(count, -np.inf)
+    max_dd = np.zeros(count)
+    value = state.cash.copy()
+    year = 0
+
+    for t in range(n):
+        c = close[t]
+
+        # broker: 上一根K线提交的订单先按其收盘价检查资金, 通过的在本根 (涨跌停/停牌时顺延) 开盘价成交
+        if t:
+            rows = np.flatnonzero((state.pending > 0) & ~state.waiting)
+            if len(rows):
+                _check_submitted_batch(state, rows, close[t - 1], fee, release_completed)
+                if masks is not None and rules['release'] == 'accepted':
+                    # Accepted 时即清空 self.order 的策略在等待期间会继续下单, 数组引擎不支持
+                    buying = state.pending_size[rows] > 0
+                    blocked = rows[state.waiting[rows] & ~np.where(buying, masks[0][t], masks[1][t])]
+                    failed[blocked] = True
+                    for i in blocked:
+                        error[i] = "订单因涨跌停/停牌延迟成交, 数组引擎不支持 (请用backtrader)"
+                    state.pending[blocked] = 0
+                    state.waiting[blocked] = False
+            rows = np.flatnonzero(state.waiting)
+            if len(rows) and masks is not None:
+                buying = state.pending_size[rows] > 0
+                rows = rows[np.where(buying, masks[0][t], masks[1][t])]
+            if len(rows):
+                if market:
+                    fill_price = np.where(state.pending_size[rows] > 0, market['fill_price'](t, 1),
+                                          market['fill_price'](t, -1))
+                else:
+                    fill_price = open_[t]
+                _process_orders_batch(state, rows, fill_price, fee, release_completed, track_fill)
+
+        # 账户价值 (_equity 同式) / DrawDown / 年末价值
+        held = state.size * c
+        unrealized = state.size * (c - state.price) * 1.0
+        value = state.cash + np.where(held > 0, (held - unrealized) / 1.0 + unrealized, held)
+        peak = np.maximum(peak, value)
+        max_dd = np.maximum(max_dd, 100.0 * (peak - value) / peak)
+        if is_year_last[t]:
+            year_values[:, year] = value
+            year += 1
+
+        # 策略 next()
+        if t == n - 1:
+            break  # 最后一根K线提交的订单不会成交
+        active = (start <= t) & ~state.frozen & ~failed & (state.pending == 0)
+        if not active.any():
+            continue
+        g = group_of
+        flat = state.size == 0
+
+        rows = np.flatnonzero(active & flat & entry[t][g])
+        if len(rows):
+            # 空仓时 broker.getvalue() == cash
+            order_size = _order_size_batch(rules, params, rows, state.cash[rows] + 0.0, atr[t][g[rows]], c)
+            rows, order_size = rows[order_size > 0], order_size[order_size > 0]
+            if lot_size > 1:
+                # 不足一手: AShareBroker 拒绝 (Rejected 在下一根K线通知), 其余向下取整到整手
+                rejected = order_size < lot_size
+                if not release_rejected:
+                    state.frozen[rows[rejected]] = True
+                rows, order_size = rows[~rejected], order_size[~rejected] // lot_size * lot_size
+            state.pending[rows] = 1
+            state.pending_size[rows] = order_size
+            state.entry_ref[rows] = c
+
+        rows = np.flatnonzero(active & ~flat)
+        if len(rows):
+            size = state.size[rows]
+            stop = _stop_batch(rules, params, rows, c, atr[t][g[rows]], state.entry_ref[rows], size)
+            signal = exit_signal[t][g[rows]]
+            orders = stop.astype(np.int64) + signal if independent else (stop | signal).astype(np.int64)
+            state.pending[rows] = orders
+            state.pending_size[rows] = -size
+
+    sharpe = [None if failed[i] or not n else
+              _sharpe_from_year_values(year_values[i].tolist(), initial_cash, riskfreerate)
+              for i in range(count)]
+    closed = state.closed_trades
+    return {
+        'final_value': value if n else state.cash,
+        'sharpe': sharpe,
+        'max_drawdown': max_dd,
+        'closed_trades': closed,
+        'total_trades': state.opened_trades,
+        'won_trades': state.won_trades,
+        'lost_trades': closed - state.won_trades,
+        'error': error,
+    }
+
+
+def run_batch(df, preset, param_sets, initial_cash=100000, commission=0.0015, riskfreerate=0.01,
+              cost=None, symbol=None):
+    """
+    多组参数的 run_adaptive: 每组一个与驱动脚本 run_backtest 同口径的结果dict
+
+    Args:
+        param_sets: 覆盖参数dict的列表 (键同 resolve_rules), 或 {参数: [取值...]} (取笛卡尔积)
+        cost / symbol: 可选, 成本方案 (见 simulate)
+
+    Returns:
+        list[dict]: 与 param_sets 顺序一致; 每项含 returns_pct, final_value, sharpe_ratio,
+                    max_drawdown_pct, total_trades, initial_cash, data_points, params
+                    (RSI除零的参数组为 {'params', 'error'})
+    """
+    if isinstance(param_sets, dict):
+        names = list(param_sets)
+        param_sets = [dict(zip(names, combo)) for combo in itertools.product(*param_sets.values())]
+    param_sets = list(param_sets)
+    if not param_sets:
+        return []
+    batch = simulate_batch(df, [resolve_rules(preset, **p) for p in param_sets],
+                           initial_cash, commission, riskfreerate, cost, symbol)
+
+    results = []
+    for i, params in enumerate(param_sets):
+        if batch['error'][i]:
+            results.append({'params': params, 'error': batch['error'][i]})
+            continue
+        final_value = float(batch['final_value'][i])
+        results.append({
+            'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
+            'final_value': round(final_value, 2),
+            'sharpe_ratio': round(batch['sharpe'][i] or 0, 3),
+            'max_drawdown_pct': round(float(batch['max_drawdown'][i]), 2),
+            'total_trades': int(batch['closed_trades'][i]),
+            'initial_cash': initial_cash,
+            'data_points': len(df),
+            'params': params,
+        })
+    return results
+
+
+# =============================================================================
+# backtrader 参考实现 (verify / benchmark)
+# =============================================================================
+
+def _reference_strategies():
+    """预设 → (backtrader策略类, {规则参数: 策略参数名})"""
+    root = Path(__file__).resolve().parent
+    sys.path.insert(0, str(root / 'code'))
+    sys.path.insert(0, str(root / 'evolved_strategies'))
+    from multi_year_rolling_validation import LLM_Adaptive
+    from run_strategy_on_new_data import Adaptive_Strategy_13
+    import parameter_sensitivity_strategies as ps
+    # experiment8 版本的指标改为 StoredFeature 查表, 此处用原生bt指标的原始版本
+    from innovation_triple_fusion import AdaptiveMultiFactorStrategy
+
+    same = {k: k for k in ('sma_fast', 'sma_slow', 'rsi_period', 'atr_period', 'atr_multiplier', 'risk_percent')}
+    sensitivity = {'sma_fast': 'short_period', 'sma_slow': 'long_period', 'stop_loss': 'stop_loss_amount',
+                   'position_size': 'position_size', 'atr_period': 'atr_period',
+                   'atr_multiplier': 'atr_multiplier', 'risk_percent': 'risk_percent'}
+    triple = {'sma_fast': 'fast_ma_period', 'sma_medium': 'medium_ma_period', 'sma_slow': 'slow_ma_period',
+              'rsi_period': 'rsi_period', 'atr_period': 'atr_period',
+              'atr_multiplier': 'atr_multiple', 'risk_percent': 'risk_factor'}
+    return {
+        'llm_adaptive': (LLM_Adaptive, same),
+        'adaptive_13': (Adaptive_Strategy_13, same),
+        'sensitivity_fixed': (ps.Strategy13_FixedStopLoss, sensitivity),
+        'sensitivity_atr': (ps.Strategy13_ATR_Adaptive, sensitivity),
+        'sensitivity_risk2pct': (ps.Strategy13_Risk2Pct, sensitivity),
+        'sensitivity_fully_adaptive': (ps.Strategy13_FullyAdaptive, sensitivity),
+        'triple_fusion': (AdaptiveMultiFactorStrategy, triple),
+    }
+
+
+def run_reference(df, preset, initial_cash=100000, commission=0.0015, cost=None, symbol=None, **overrides):
+    """
+    用backtrader跑对应策略, 额外记录每笔订单的最终状态 (用于逐笔对比)
+
+    cost: 可选, cost_model.schedule() 方案, 给出时 broker 为 cost_model.make_broker (忽略 commission)
+    """
+    import backtrader as bt
+
+    base, names = _reference_strategies()[preset]
+    log = []
+
+    class Recorded(base):
+        def notify_order(self, order):
+            super().notify_order(order)
+            if order.status in (order.Completed, order.Margin, order.Rejected):
+                log.append({'bar': len(self.data) - 1, 'size': order.size,
+                            'price': order.executed.price if order.status == order.Completed else None,
+                            'status': order.getstatusname()})
+
+    cerebro = bt.Cerebro()
+    if cost is not None:
+        from cost_model import _arrays, make_broker, schedule_masks
+
+        masks = schedule_masks(_arrays(df), cost, symbol, df.index) if cost.get('price_limit') is not None else None
+        cerebro.broker = make_broker(cost, initial_cash, masks)
+    else:
+        cerebro.broker.setcash(initial_cash)
+        cerebro.broker.setcommission(commission=commission)
+    cerebro.adddata(bt.feeds.PandasData(dataname=df, openinterest=-1))
+    cerebro.addstrategy(Recorded, **{names[k]: v for k, v in overrides.items()})
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
+    strat = cerebro.run()[0]
+    final_value = cerebro.broker.getvalue()
+    trades = strat.analyzers.trades.get_analysis()
+
+    return {
+        'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
+        'final_value': round(final_value, 2),
+        'sharpe_ratio': round(strat.analyzers.sharpe.get_analysis().get('sharperatio', 0) or 0, 3),
+        'max_drawdown_pct': round(strat.analyzers.drawdown.get_analysis().get('max', {}).get('drawdown', 0), 2),
+        'total_trades': trades.get('total', {}).get('closed', 0),
+        'initial_cash': initial_cash,
+        'data_points': len(df),
+        'orders': log,
+        'raw_final_value': final_value,
+        'opened_trades': trades.get('total', {}).get('total', 0),
+        'won_trades': trades.get('won', {}).get('total', 0),
+    }
+
+
+def _symbol_years(data_dir=None, min_bars=50):
+    """(symbol, year, df) : 全部个股 / 指数 / ETF 的自然年窗口"""
+    from data_quality import load_clean_history
+    from price_store import DATA_DIR
+
+    data_dir = Path(data_dir or DATA_DIR)
+    for csv_path in sorted(data_dir.glob('*.csv')):
+        history = load_clean_history(csv_path)
+        for year in history.index.years():
+            df = history.year(year)
+            if len(df) >= min_bars:
+                yield csv_path.stem, year, df
+
+
+def _orders_match(ours, ref):
+    if len(ours) != len(ref):
+        return False
+    for a, b in zip(ours, ref):
+        if (a['bar'], a['size'], a['status']) != (b['bar'], b['size'], b['status']):
+            return False
+        if a['status'] == 'Completed' and a['price'] != b['price']:
+            return False
+    return True
+
+
+def verify(presets=('llm_adaptive', 'adaptive_13'), commissions=(0.0015,), data_dir=None):
+    """逐 symbol-year 对比引擎与backtrader: 订单序列 / 最终价值 (精确相等) / 各指标"""
+    mismatches = []
+    total = 0
+    for symbol, year, df in _symbol_years(data_dir):
+        for preset in presets:
+            for commission in commissions:
+                total += 1
+                try:
+                    ref = run_reference(df, preset, commission=commission)
+                except ZeroDivisionError:
+                    ref = None
+                try:
+                    ours = run_adaptive(df, preset, commission=commission)
+                    sim_final = float(simulate(df, resolve_rules(preset), commission=commission)['equity'][-1])
+                except ZeroDivisionError:
+                    ours = None
+                if ref is None or ours is None:
+                    if ref is not ours:
+                        mismatches.append((symbol, year, preset, commission))
+                        print(f"  MISMATCH {symbol} {year} {preset}: ZeroDivisionError 只在一侧出现")
+                    continue
+                same = (_orders_match(ours['orders'], ref['orders'])
+                        and sim_final == ref['raw_final_value']
+                        and all(ours[k] == ref[k] for k in
+                                ('returns_pct', 'sharpe_ratio', 'max_drawdown_pct', 'total_trades')))
+                if not same:
+                    mismatches.append((symbol, year, preset, commission))
+                    print(f"  MISMATCH {symbol} {year} {preset} c={commission}: "
+                          f"engine={ours['final_value']}/{ours['total_trades']} "
+                          f"bt={ref['final_value']}/{ref['total_trades']}")
+    print(f"\n对比完成: {total - len(mismatches)}/{total} 一致")
+    return mismatches
+
+
+# verify-batch 的参数网格 (每个 symbol-year 一次批量运行, 再逐组合跑backtrader)
+BATCH_GRIDS = {
+    'sensitivity_fixed': {'stop_loss': [50, 100, 150, 200, 250, 300], 'position_size': [5, 20, 30]},
+    'sensitivity_atr': {'atr_multiplier': [1.0, 2.0, 3.0], 'position_size': [20, 100]},
+    'sensitivity_risk2pct': {'stop_loss': [50, 200, 300], 'risk_percent': [0.02, 0.05]},
+    'sensitivity_fully_adaptive': {'atr_multiplier': [1.0, 2.0, 3.0], 'risk_percent': [0.02, 0.05]},
+    'llm_adaptive': {'atr_multiplier': [2.0, 3.0], 'risk_percent': [0.02, 0.2]},
+    'adaptive_13': {'atr_multiplier': [2.0, 3.0], 'rsi_period': [7, 14]},
+    'triple_fusion': {'sma_fast': [5, 10], 'sma_medium': [15, 20], 'atr_multiplier': [2.0, 3.0],
+                      'risk_percent': [0.01, 0.03]},
+}
+
+
+def verify_batch(presets=tuple(BATCH_GRIDS), commission=0.0015, data_dir=None, step=1):
+    """
+    批量模式逐组合对比backtrader: 最终价值 (精确相等) / 各指标 / TradeAnalyzer total, won
+
+    step: 每隔step个 symbol-year 取一个 (全量对比较慢)
+    """
+    mismatches = []
+    total = 0
+    batch_seconds = bt_seconds = 0.0
+    for k, (symbol, year, df) in enumerate(_symbol_years(data_dir)):
+        if k % step:
+            continue
+        for preset in presets:
+            grid = BATCH_GRIDS[preset]
+            names = list(grid)
+            combos = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+            # 参考实现使用原生bt RSI (下跌均值为0时抛出 ZeroDivisionError), 引擎按同样方式报错
+            rules_list = [dict(resolve_rules(preset, **c), rsi_raises=True) for c in combos]
+            t0 = time.perf_counter()
+            batch = simulate_batch(df, rules_list, commission=commission)
+            batch_seconds += time.perf_counter() - t0
+
+            for i, combo in enumerate(combos):
+                total += 1
+                t0 = time.perf_counter()
+                try:
+                    ref = run_reference(df, preset, commission=commission, **combo)
+                except ZeroDivisionError:
+                    ref = None
+                bt_seconds += time.perf_counter() - t0
+                if ref is None or batch['error'][i]:
+                    if (ref is None) != bool(batch['error'][i]):
+                        mismatches.append((symbol, year, preset, combo))
+                        print(f"  MISMATCH {symbol} {year} {preset} {combo}: ZeroDivisionError 只在一侧出现")
+                    continue
+                same = (float(batch['final_value'][i]) == ref['raw_final_value']
+                        and round(batch['sharpe'][i] or 0, 3) == ref['sharpe_ratio']
+                        and round(float(batch['max_drawdown'][i]), 2) == ref['max_drawdown_pct']
+                        and batch['closed_trades'][i] == ref['total_trades']
+                        and batch['total_trades'][i] == ref['opened_trades']
+                        and batch['won_trades'][i] == ref['won_trades'])
+                if not same:
+                    mismatches.append((symbol, year, preset, combo))
+                    print(f"  MISMATCH {symbol} {year} {preset} {combo}: "
+                          f"engine={float(batch['final_value'][i]):.2f}/{batch['closed_trades'][i]} "
+                          f"bt={ref['raw_final_value']:.2f}/{ref['total_trades']}")
+    print(f"\n对比完成: {total - len(mismatches)}/{total} 一致")
+    if batch_seconds:
+        print(f"耗时: 批量 {batch_seconds:.2f}s vs backtrader {bt_seconds:.1f}s ({bt_seconds / batch_seconds:.0f}x)")
+    return mismatches
+
+
+def benchmark(presets=('llm_adaptive', 'adaptive_13'), repeat=3, data_dir=None):
+    """每个 symbol-year: backtrader vs 数组引擎 的单次回测耗时 (ms) 与加速比"""
+    results = []
+    for symbol, year, df in _symbol_years(data_dir):
+        for preset in presets:
+            t0 = time.perf_counter()
+            try:
+                for _ in range(repeat):
+                    run_reference(df, preset)
+            except ZeroDivisionError:
+                continue  # RSI下跌均值为0, 两侧均无结果
+            bt_ms = (time.perf_counter() - t0) / repeat * 1000
+
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                run_adaptive(df, preset)
+            engine_ms = (time.perf_counter() - t0) / repeat * 1000
+            results.append({'symbol': symbol, 'year': year, 'preset': preset, 'bars': len(df),
+                            'bt_ms': round(bt_ms, 3), 'engine_ms': round(engine_ms, 3),
+                            'speedup': round(bt_ms / engine_ms, 1)})
+
+    print(f"\n{'Symbol':<20} {'Year':>5} {'Preset':<13} {'Bars':>5} {'bt (ms)':>9} {'engine (ms)':>12} {'Speedup':>8}")
+    print('-' * 78)
+    for r in results:
+        print(f"{r['symbol']:<20} {r['year']:>5} {r['preset']:<13} {r['bars']:>5} "
+              f"{r['bt_ms']:>9.2f} {r['engine_ms']:>12.3f} {r['speedup']:>7.1f}x")
+    if results:
+        bt_total = sum(r['bt_ms'] for r in results)
+        engine_total = sum(r['engine_ms'] for r in results)
+        print('-' * 78)
+        print(f"{'TOTAL':<20} {len(results):>5} {'':<13} {sum(r['bars'] for r in results):>5} "
+              f"{bt_total:>9.1f} {engine_total:>12.1f} {bt_total / engine_total:>7.1f}x")
+    return results
+
+
+# =============================================================================
+# 命令行接口
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='自适应策略数组引擎: verify / benchmark / verify-batch')
+    parser.add_argument('command', choices=['verify', 'benchmark', 'verify-batch'])
+    parser.add_argument('--data-dir', default=None, help='CSV数据目录 (默认 backtest_data_extended)')
+    parser.add_argument('--preset', action='append', choices=list(BATCH_GRIDS),
+                        help='只运行指定预设 (可重复)')
+    parser.add_argument('--commission', type=float, action='append', help='verify的佣金率 (可重复)')
+    parser.add_argument('--repeat', type=int, default=3, help='benchmark重复次数')
+    parser.add_argument('--step', type=int, default=1, help='verify-batch: 每隔N个 symbol-year 取一个')
+    args = parser.parse_args()
+
+    if args.command == 'verify-batch':
+        print('=' * 80)
+        print('Adaptive Array Engine - verify-batch')
+        print('=' * 80)
+        bad = verify_batch(tuple(args.preset or BATCH_GRIDS), (args.commission or [0.0015])[0],
+                           args.data_dir, args.step)
+        sys.exit(1 if bad else 0)
+
+    presets = tuple(args.preset or ('llm_adaptive', 'adaptive_13'))
+
+    print('=' * 80)
+    print(f'Adaptive Array Engine - {args.command}')
+    print('=' * 80)
+
+    if args.command == 'verify':
+        bad = verify(presets, tuple(args.commission or (0.0015,)), args.data_dir)
+        sys.exit(1 if bad else 0)
+    benchmark(presets, args.repeat, args.data_dir)
+    sys.exit(0)
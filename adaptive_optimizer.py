@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+自适应参数搜索 (Successive Halving + Surrogate Search)
+=====================================================
+
+功能: experiment8_parameter_optimization.grid_search 原来对 param_space 的笛卡尔积逐个回测,
+      每加一个参数组合数就成倍增长 (strategy_022 已是 729 个组合)。本模块在回测次数预算内搜索:
+
+    1. 逐级减半 (successive halving): 从网格中随机抽 n0 个组合, 先在最早一段较短的日期窗口上回测,
+       按得分保留前 1/eta 进入下一级, 窗口按 eta 倍增长, 最后一级为完整区间
+    2. 代理模型搜索: 用已有的全部回测 (含短窗口, 窗口长度作为一个输入维) 拟合高斯过程,
+       在完整区间上按期望改进 (EI) 挑选尚未回测的组合, 每批 batch_size 个, 直到用完预算
+
+    每次回测 (不论窗口长短) 计 1 次预算; 另报告按K线折算的 "完整回测当量"。
+    回测通过 sweep_executor 分发到进程池, evaluate 接口与其相同: evaluate(data, params) → 结果dict
+    (含得分字段, 默认 return_pct; success 为 False 视为最差)。
+
+使用方法:
+    from adaptive_optimizer import optimize
+    search = optimize(evaluate, param_space, data, budget=60)
+    search['results']        # 完整区间上回测过的结果, 按得分降序 (与 grid_search 的结果dict相同)
+    search['backtests'], search['full_equivalent']
+
+    # 与穷举网格对比: 找回最优解的程度 vs 回测次数
+    python adaptive_optimizer.py report --strategy strategy_016 --budget 12 20
+    python adaptive_optimizer.py report --strategy strategy_007 --budget 40 80 --seeds 3
+"""
+
+import math
+import sys
+from functools import partial
+
+import numpy as np
+
+from sweep_executor import collect, grid
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+ETA = 3                       # 每级保留 1/ETA, 窗口增长 ETA 倍
+MIN_BARS = 250                # 最短窗口 (K线数)
+HALVING_SHARE = 0.5           # 逐级减半阶段占用的预算比例
+BATCH_SIZE = 4                # 代理模型阶段每批回测数
+LENGTH_SCALES = (0.1, 0.2, 0.3, 0.5, 1.0)
+NOISE = 1e-2                  # 标准化得分上的观测噪声方差
+
+
+def default_budget(n):
+    """默认预算: 网格的 10%, 至少 20 次 (不超过网格大小)"""
+    return min(n, max(20, math.ceil(n * 0.1)))
+
+
+def _score(result, key):
+    if result is None or not result.get('success', True) or result.get(key) is None:
+        return -np.inf
+    return float(result[key])
+
+
+def _window_task(data, item, evaluate):
+    """item = (窗口K线数, 参数): 在前 bars 根K线上回测"""
+    bars, params = item
+    return evaluate(data.iloc[:bars], params)
+
+
+# =============================================================================
+# 窗口与逐级减半
+# =============================================================================
+
+def windows(total_bars, eta=ETA, min_bars=MIN_BARS):
+    """逐级的窗口长度 (递增, 最后一级为完整区间)"""
+    bars = [total_bars]
+    while bars[0] // eta >= min_bars:
+        bars.insert(0, bars[0] // eta)
+    return bars
+
+
+def rung_sizes(n0, rungs, eta=ETA):
+    """每级回测的组合数"""
+    sizes = [n0]
+    for _ in range(rungs - 1):
+        sizes.append(max(1, math.ceil(sizes[-1] / eta)))
+    return sizes
+
+
+def initial_count(n, rungs, budget, eta=ETA):
+    """在 budget 次回测内能走完全部级别的最大起始组合数"""
+    n0 = min(n, budget)
+    while n0 > 1 and sum(rung_sizes(n0, rungs, eta)) > budget:
+        n0 -= 1
+    return max(n0, 1)
+
+
+# =============================================================================
+# 代理模型 (高斯过程, RBF核)
+# =============================================================================
+
+def _rbf(a, b, length_scale):
+    sq = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=-1)
+    return np.exp(-0.5 * sq / length_scale ** 2)
+
+
+def _fit(x, y, noise=NOISE, length_scales=LENGTH_SCALES):
+    """按对数边际似然从 length_scales 中选核宽度; 返回 (length_scale, cholesky, alpha)"""
+    best = None
+    for ls in length_scales:
+        k = _rbf(x, x, ls) + noise * np.eye(len(x))
+        chol = np.linalg.cholesky(k)
+        alpha = np.linalg.solve(chol.T, np.linalg.solve(chol, y))
+        loglik = -0.5 * y @ alpha - np.log(np.diag(chol)).sum()
+        if best is None or loglik > best[0]:
+            best = (loglik, ls, chol, alpha)
+    return best[1:]
+
+
+def _predict(model, x, x_new):
+    ls, chol, alpha = model
+    k = _rbf(x_new, x, ls)
+    mean = k @ alpha
+    v = np.linalg.solve(chol, k.T)
+    var = np.maximum(1.0 - (v ** 2).sum(axis=0), 1e-12)
+    return mean, np.sqrt(var)
+
+
+_erf = np.vectorize(math.erf)
+
+
+def expected_improvement(mean, std, best):
+    z = (mean - best) / std
+    cdf = 0.5 * (1.0 + _erf(z / math.sqrt(2.0)))
+    pdf = np.exp(-0.5 * z ** 2) / math.sqrt(2.0 * math.pi)
+    return (mean - best) * cdf + std * pdf
+
+
+def _features(param_space, combos):
+    """组合 → 每个参数在其取值列表中的位置, 缩放到 [0, 1]"""
+    columns = []
+    for name, values in param_space.items():
+        position = {v: i for i, v in enumerate(values)}
+        columns.append([position[c[name]] / max(len(values) - 1, 1) for c in combos])
+    return np.array(columns, dtype=np.float64).T.reshape(len(combos), len(param_space))
+
+
+# =============================================================================
+# 搜索
+# =============================================================================
+
+def optimize(evaluate, param_space, data, budget=None, score='return_pct', eta=ETA, min_bars=MIN_BARS,
+             halving_share=HALVING_SHARE, batch_size=BATCH_SIZE, seed=0, workers=None, log=print):
+    """
+    在回测预算内搜索 param_space
+
+    Args:
+        evaluate: evaluate(data, params) → 结果dict (需可pickle)
+        param_space: {参数: [取值]} (与 grid_search 相同)
+        budget: 回测次数上限 (默认 default_budget)
+        score: 结果dict中的得分字段 (越大越好)
+
+    Returns:
+        dict: results (完整区间的结果, 按得分降序), history [(阶段, 窗口K线数, 组合序号, 得分)],
+              backtests, full_equivalent, combinations
+    """
+    combos = grid(param_space)
+    n = len(combos)
+    total_bars = len(data)
+    bars = windows(total_bars, eta, min_bars)
+    budget = min(budget or default_budget(n), n * len(bars))
+    rng = np.random.default_rng(seed)
+    task = partial(_window_task, evaluate=evaluate)
+
+    history = []
+    full = {}                     # 组合序号 → 完整区间结果
+
+    def run(phase, window, indices):
+        items = [(window, combos[i]) for i in indices]
+        results = collect(task, items, workers=workers, data=data)
+        for i, result in zip(indices, results):
+            history.append((phase, window, i, _score(result, score)))
+            if window == total_bars:
+                full[i] = result
+        return results
+
+    # ---------- 逐级减半 ----------
+    halving_budget = max(1, int(budget * halving_share))
+    n0 = initial_count(n, len(bars), halving_budget, eta)
+    alive = [int(i) for i in rng.choice(n, size=n0, replace=False)]
+    for rung, (window, size) in enumerate(zip(bars, rung_sizes(n0, len(bars), eta))):
+        alive = alive[:size]
+        results = run('halving', window, alive)
+        order = sorted(range(len(alive)), key=lambda j: _score(results[j], score), reverse=True)
+        alive = [alive[j] for j in order]
+        if log:
+            log(f"  逐级减半 {rung + 1}/{len(bars)}: {len(results)} 个组合 × {window} 根K线, "
+                f"最佳 {_score(results[order[0]], score):.2f}")
+
+    # ---------- 代理模型 ----------
+    x_all = _features(param_space, combos)
+    fidelity_scale = math.log(total_bars / bars[0]) or 1.0
+    while len(history) < budget and len(full) < n:
+        x = np.column_stack([x_all[[h[2] for h in history]],
+                             [1.0 - math.log(total_bars / h[1]) / fidelity_scale for h in history]])
+        y = np.array([h[3] for h in history])
+        finite = np.isfinite(y)
+        y = np.where(finite, y, y[finite].min() if finite.any() else 0.0)
+        mu, sigma = y.mean(), y.std() or 1.0
+        y = (y - mu) / sigma
+
+        candidates = np.array([i for i in range(n) if i not in full])
+        x_new = np.column_stack([x_all[candidates], np.ones(len(candidates))])
+        mean, std = _predict(_fit(x, y), x, x_new)
+        scores = np.array([_score(r, score) for r in full.values()])
+        incumbent = (scores[np.isfinite(scores)].max() - mu) / sigma if np.isfinite(scores).any() else y.max()
+        ei = expected_improvement(mean, std, incumbent)
+
+        take = min(batch_size, budget - len(history), len(candidates))
+        picked = [int(candidates[j]) for j in np.argsort(-ei, kind='stable')[:take]]
+        results = run('surrogate', total_bars, picked)
+        if log:
+            log(f"  代理模型: {len(history)}/{budget} 次回测, 本批最佳 "
+                f"{max(_score(r, score) for r in results):.2f}")
+
+    ranked = sorted(full, key=lambda i: _score(full[i], score), reverse=True)
+    return {
+        'results': [full[i] for i in ranked],
+        'history': history,
+        'backtests': len(history),
+        'full_equivalent': sum(h[1] for h in history) / total_bars,
+        'combinations': n,
+    }
+
+
+# =============================================================================
+# 与穷举网格对比 (report)
+# =============================================================================
+
+def report(strategy_names, budgets, seeds=1, workers=None, symbol=None):
+    """
+    experiment8 的策略: 穷举网格一次, 再按各预算 / 随机种子运行 optimize
+    (symbol 为 price_store 标的, 默认 experiment8 的数据文件名; 特征库按该名称查表, 不要换成其他标的)
+
+    Returns:
+        [{strategy, combinations, budget, seed, backtests, full_equivalent,
+          exhaustive_best, found_best, gap, rank}]   rank 为找到的最优组合在穷举结果中的名次 (1 = 最优)
+    """
+    import experiment8_parameter_optimization as exp8
+
+    data = exp8.load_data(symbol or exp8.DATA_FILE.stem)
+    classes = {
+        'strategy_007': exp8.TrendFollowingStrategy,
+        'strategy_016': exp8.VolatilityBreakoutStrategy016,
+        'strategy_022': exp8.VolatilityBreakoutStrategy022,
+        'innovation_triple_fusion': exp8.AdaptiveMultiFactorStrategy,
+    }
+
+    rows = []
+    for name in strategy_names:
+        evaluate = partial(exp8.evaluate_params, strategy_class=classes[name])
+        combos = grid(exp8.PARAM_SPACES[name])
+        exhaustive = collect(evaluate, combos, workers=workers, data=data)
+        ranking = sorted((_score(r, 'return_pct') for r in exhaustive), reverse=True)
+        for budget in budgets:
+            for seed in range(seeds):
+                search = optimize(evaluate, exp8.PARAM_SPACES[name], data, budget=budget, seed=seed,
+                                  workers=workers, log=None)
+                found = _score(search['results'][0], 'return_pct') if search['results'] else -np.inf
+                rows.append({
+                    'strategy': name, 'combinations': len(combos), 'budget': budget, 'seed': seed,
+                    'backtests': search['backtests'], 'full_equivalent': search['full_equivalent'],
+                    'exhaustive_best': ranking[0], 'found_best': found, 'gap': ranking[0] - found,
+                    'rank': 1 + sum(s > found for s in ranking),
+                })
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='自适应参数搜索: 与穷举网格对比')
+    parser.add_argument('command', choices=['report'])
+    parser.add_argument('--strategy', nargs='+', default=['strategy_016'],
+                        help='experiment8 中的策略名 (默认 strategy_016)')
+    parser.add_argument('--budget', type=int, nargs='+', default=[20], help='回测次数预算 (可多个)')
+    parser.add_argument('--seeds', type=int, default=1, help='每个预算运行的随机种子数')
+    parser.add_argument('--workers', type=int, default=None, help='进程数 (默认全部可用CPU)')
+    parser.add_argument('--symbol', default=None, help='price_store 标的 (默认 experiment8 的数据文件名)')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("Adaptive Optimizer - report (穷举网格 vs 逐级减半 + 代理模型)")
+    print("=" * 80)
+    print(f"\n{'策略':<16} {'组合':>5} {'预算':>5} {'种子':>4} {'回测':>5} {'完整当量':>8} "
+          f"{'穷举最优%':>10} {'找到%':>9} {'差距':>7} {'名次':>5}")
+    print("-" * 88)
+    for row in report(args.strategy, args.budget, args.seeds, args.workers, args.symbol):
+        print(f"{row['strategy']:<16} {row['combinations']:>5} {row['budget']:>5} {row['seed']:>4} "
+              f"{row['backtests']:>5} {row['full_equivalent']:>8.1f} {row['exhaustive_best']:>10.2f} "
+              f"{row['found_best']:>9.2f} {row['gap']:>7.2f} {row['rank']:>5}")
+
+    sys.exit(0)
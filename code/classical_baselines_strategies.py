@@ -19,9 +19,15 @@ import backtrader as bt
 import pandas as pd
 import json
 import numpy as np
+import sys
 from datetime import datetime
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from equity_recorder import RECORDER, save_records
+from perf_metrics import bt_summary
+from shared_feed_runner import CSV_FEED, run_strategies
+
 # =============================================================================
 # 策略1: 动量策略 (Momentum)
 # =============================================================================
@@ -254,55 +260,61 @@ PERIODS = {
 }
 
 
-def run_backtest(strategy_class, data_path, start_date, end_date, initial_cash=100000):
-    """运行单个回测"""
-    try:
-        df = pd.read_csv(data_path, parse_dates=['date'])
-        df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-
-        if len(df) < 50:
-            return None
-
-        cerebro = bt.Cerebro()
-        cerebro.broker.setcash(initial_cash)
-        cerebro.broker.setcommission(commission=0.0015)
-
-        data_feed = bt.feeds.PandasData(
-            dataname=df,
-            datetime='date',
-            open='open',
-            high='high',
-            low='low',
-            close='close',
-            volume='volume',
-            openinterest=-1
-        )
+def _summarize(run, initial_cash):
+    """run_strategies 的单个策略结果 → 汇总指标 (由记录的权益/交易数组计算, 与原分析器读数一致)"""
+    if 'error' in run:
+        print(f"      ERROR: {run['error']}")
+        return None
 
-        cerebro.adddata(data_feed)
-        cerebro.addstrategy(strategy_class)
+    summary = bt_summary(run['record'])
+    final_value = summary['final_value']
+    return {
+        'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
+        'final_value': round(final_value, 2),
+        'sharpe_ratio': round(summary['sharpe_ratio'] or 0, 3),
+        'max_drawdown_pct': round(summary['max_drawdown_pct'], 2),
+        'total_trades': summary['total_trades'],
+    }
 
-        cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
-        cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-        cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
 
-        results = cerebro.run()
-        final_value = cerebro.broker.getvalue()
+def run_period(df, strategies, initial_cash=100000, records=None):
+    """
+    同一资产/时期的全部策略共享一份数据, 返回 {策略名: 结果或None}
+
+    records: 可选dict, 填入 {策略名: equity_recorder的record} (供 perf_metrics 事后计算指标)
+    """
+    if len(df) < 50:
+        return dict.fromkeys(strategies)
 
-        sharpe = results[0].analyzers.sharpe.get_analysis()
-        drawdown = results[0].analyzers.drawdown.get_analysis()
-        trades = results[0].analyzers.trades.get_analysis()
+    runs = run_strategies(df, strategies, initial_cash=initial_cash, commission=0.0015,
+                          analyzers=(RECORDER,), feed_kwargs=CSV_FEED)
+    if records is not None:
+        records.update({name: run.get('record') for name, run in runs.items()})
+    return {name: _summarize(run, initial_cash) for name, run in runs.items()}
 
-        return {
-            'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
-            'final_value': round(final_value, 2),
-            'sharpe_ratio': round(sharpe.get('sharperatio', 0) or 0, 3),
-            'max_drawdown_pct': round(drawdown.get('max', {}).get('drawdown', 0), 2),
-            'total_trades': trades.get('total', {}).get('closed', 0),
-        }
 
+def run_asset(data_path, strategies=STRATEGIES, periods=PERIODS, initial_cash=100000, records=None):
+    """一个资产的CSV只读取一次, 返回 {时期: {策略名: 结果或None}}; records 填入 {(时期, 策略名): record}"""
+    try:
+        df = pd.read_csv(data_path, parse_dates=['date'])
     except Exception as e:
         print(f"      ERROR: {str(e)}")
-        return None
+        return {period_name: dict.fromkeys(strategies) for period_name in periods}
+
+    asset_runs = {}
+    for period_name, (start, end) in periods.items():
+        period_records = {}
+        asset_runs[period_name] = run_period(df[(df['date'] >= start) & (df['date'] <= end)], strategies,
+                                             initial_cash, period_records)
+        if records is not None:
+            records.update({(period_name, name): r for name, r in period_records.items()})
+    return asset_runs
+
+
+def run_backtest(strategy_class, data_path, start_date, end_date, initial_cash=100000):
+    """运行单个回测"""
+    return run_asset(data_path, {'strategy': strategy_class}, {'period': (start_date, end_date)},
+                     initial_cash)['period']['strategy']
 
 
 def main():
@@ -317,18 +329,26 @@ def main():
     counter = 0
     total = len(STRATEGIES) * len(ASSETS) * len(PERIODS)
 
-    for strategy_name, strategy_class in STRATEGIES.items():
+    # 每个资产/时期一次性跑完全部策略, 再按 策略 → 资产 → 时期 的顺序输出
+    records = {}
+    asset_runs = {}
+    for asset_name, data_path in ASSETS.items():
+        asset_records = {}
+        asset_runs[asset_name] = run_asset(data_path, records=asset_records)
+        records.update({(asset_name,) + key: r for key, r in asset_records.items()})
+
+    for strategy_name in STRATEGIES:
         print(f"\n[{strategy_name}] 策略测试")
         results[strategy_name] = {}
 
-        for asset_name, data_path in ASSETS.items():
+        for asset_name in ASSETS:
             results[strategy_name][asset_name] = {}
 
-            for period_name, (start, end) in PERIODS.items():
+            for period_name in PERIODS:
                 counter += 1
                 print(f"  [{counter}/{total}] {asset_name} - {period_name}...", end=' ')
 
-                result = run_backtest(strategy_class, data_path, start, end)
+                result = asset_runs[asset_name][period_name][strategy_name]
 
                 if result:
                     results[strategy_name][asset_name][period_name] = result
@@ -353,11 +373,15 @@ def main():
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(output_data, f, indent=2, ensure_ascii=False)
 
+    # 权益曲线/交易数组 (资产, 时期, 策略): 新指标用 perf_metrics 计算, 无需重跑
+    records_file = save_records(output_file.replace('.json', '_records.npz'), records)
+
     print("\n" + "=" * 80)
     print("经典策略基线扩展 - 执行完成")
     print("=" * 80)
     print(f"结束时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"输出文件: {output_file}")
+    print(f"权益/交易数组: {records_file}")
     print("=" * 80)
 
 
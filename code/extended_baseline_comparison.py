@@ -31,6 +31,10 @@ from pathlib import Path
 # 导入策略
 import sys
 sys.path.append(str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from equity_recorder import RECORDER, save_records
+from perf_metrics import bt_summary
+from shared_feed_runner import CSV_FEED, run_strategies
 
 # =============================================================================
 # 配置
@@ -203,59 +207,66 @@ STRATEGIES = {
 # 回测执行器
 # =============================================================================
 
-def run_backtest(strategy_class, data_path, start_date, end_date, initial_cash=100000):
-    """运行单个回测"""
+def _summarize(run, df, start_date, end_date, initial_cash):
+    """run_strategies 的单个策略结果 → 汇总指标 (由记录的权益/交易数组计算, 与原分析器读数一致)"""
+    if 'error' in run:
+        print(f"      ERROR: {run['error']}")
+        return None
+
+    summary = bt_summary(run['record'])
+    final_value = summary['final_value']
+    return {
+        'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
+        'final_value': round(final_value, 2),
+        'sharpe_ratio': round(summary['sharpe_ratio'] or 0, 3),
+        'max_drawdown_pct': round(summary['max_drawdown_pct'], 2),
+        'total_trades': summary['total_trades'],
+        'initial_cash': initial_cash,
+        'data_points': len(df),
+        'start_date': start_date,
+        'end_date': end_date
+    }
+
+
+def run_asset(data_path, strategies=STRATEGIES, periods=PERIODS, initial_cash=100000, records=None):
+    """
+    一个资产的CSV只读取一次, 每个时期的全部策略共享一份数据 (shared_feed_runner)
+
+    records: 可选dict, 填入 {(时期, 策略名): equity_recorder的record}
+
+    Returns:
+        {时期: {策略名: 结果或None}}
+    """
     try:
-        df = pd.read_csv(data_path, parse_dates=['date'])
-        df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
+        full = pd.read_csv(data_path, parse_dates=['date'])
+    except Exception as e:
+        print(f"      ERROR: {str(e)}")
+        return {period_name: dict.fromkeys(strategies) for period_name in periods}
+
+    asset_runs = {}
+    for period_name, period_dates in periods.items():
+        start_date, end_date = period_dates['start'], period_dates['end']
+        df = full[(full['date'] >= start_date) & (full['date'] <= end_date)]
 
         if len(df) < 50:
-            return None
-
-        cerebro = bt.Cerebro()
-        cerebro.broker.setcash(initial_cash)
-        cerebro.broker.setcommission(commission=0.0015)
-
-        data_feed = bt.feeds.PandasData(
-            dataname=df,
-            datetime='date',
-            open='open',
-            high='high',
-            low='low',
-            close='close',
-            volume='volume',
-            openinterest=-1
-        )
-
-        cerebro.adddata(data_feed)
-        cerebro.addstrategy(strategy_class)
-
-        cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
-        cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-        cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
-
-        results = cerebro.run()
-        final_value = cerebro.broker.getvalue()
-
-        sharpe = results[0].analyzers.sharpe.get_analysis()
-        drawdown = results[0].analyzers.drawdown.get_analysis()
-        trades = results[0].analyzers.trades.get_analysis()
-
-        return {
-            'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
-            'final_value': round(final_value, 2),
-            'sharpe_ratio': round(sharpe.get('sharperatio', 0) or 0, 3),
-            'max_drawdown_pct': round(drawdown.get('max', {}).get('drawdown', 0), 2),
-            'total_trades': trades.get('total', {}).get('closed', 0),
-            'initial_cash': initial_cash,
-            'data_points': len(df),
-            'start_date': start_date,
-            'end_date': end_date
+            asset_runs[period_name] = dict.fromkeys(strategies)
+            continue
+
+        runs = run_strategies(df, strategies, initial_cash=initial_cash, commission=0.0015,
+                              analyzers=(RECORDER,), feed_kwargs=CSV_FEED)
+        if records is not None:
+            records.update({(period_name, name): run.get('record') for name, run in runs.items()})
+        asset_runs[period_name] = {
+            name: _summarize(run, df, start_date, end_date, initial_cash) for name, run in runs.items()
         }
+    return asset_runs
 
-    except Exception as e:
-        print(f"      ERROR: {str(e)}")
-        return None
+
+def run_backtest(strategy_class, data_path, start_date, end_date, initial_cash=100000):
+    """运行单个回测"""
+    period = {'start': start_date, 'end': end_date}
+    return run_asset(data_path, {'strategy': strategy_class}, {'period': period},
+                     initial_cash)['period']['strategy']
 
 
 # =============================================================================
@@ -274,7 +285,15 @@ def main():
     counter = 0
     total = len(STRATEGIES) * len(ASSETS_EXTENDED) * len(PERIODS)
 
-    for strategy_name, strategy_class in STRATEGIES.items():
+    # 每个资产/时期一次性跑完全部策略, 再按 策略 → 资产 → 时期 的顺序输出
+    records = {}
+    asset_runs = {}
+    for asset_name, asset_info in ASSETS_EXTENDED.items():
+        asset_records = {}
+        asset_runs[asset_name] = run_asset(asset_info['file'], records=asset_records)
+        records.update({(asset_name,) + key: r for key, r in asset_records.items()})
+
+    for strategy_name in STRATEGIES:
         print(f"\n[{strategy_name}]")
         results[strategy_name] = {}
 
@@ -285,15 +304,10 @@ def main():
                 'sector': asset_info['sector']
             }
 
-            for period_name, period_dates in PERIODS.items():
+            for period_name in PERIODS:
                 counter += 1
 
-                result = run_backtest(
-                    strategy_class=strategy_class,
-                    data_path=asset_info['file'],
-                    start_date=period_dates['start'],
-                    end_date=period_dates['end']
-                )
+                result = asset_runs[asset_name][period_name][strategy_name]
 
                 if result:
                     results[strategy_name][asset_name][f'{period_name}_period'] = result
@@ -319,11 +333,15 @@ def main():
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(output_data, f, indent=2, ensure_ascii=False)
 
+    # 权益曲线/交易数组 (资产, 时期, 策略): 新指标用 perf_metrics 计算, 无需重跑
+    records_file = save_records(output_file.replace('.json', '_records.npz'), records)
+
     print("\n" + "=" * 80)
     print("扩展基线对比 - 执行完成")
     print("=" * 80)
     print(f"结束时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"输出文件: {output_file}")
+    print(f"权益/交易数组: {records_file}")
     print("=" * 80)
 
 
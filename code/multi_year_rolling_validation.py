@@ -25,6 +25,17 @@ import pandas as pd
 import json
 from datetime import datetime
 from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cost_model
+import data_quality
+import perf_metrics
+from cost_model import make_broker, schedule
+from data_quality import load_clean_history
+from equity_recorder import RECORDER, save_records
+from perf_metrics import bt_summary
+from result_cache import ResultCache, cache_key
 
 # =============================================================================
 # 配置
@@ -82,6 +93,9 @@ ROLLING_WINDOWS = [
     }
 ]
 
+# 回测结果缓存 (策略源码 / 数据内容 / 区间 / broker设置 不变时直接复用)
+RESULT_CACHE = ResultCache()
+
 # =============================================================================
 # 策略定义 (LLM_Adaptive完全自适应)
 # =============================================================================
@@ -143,53 +157,48 @@ class LLM_Adaptive(bt.Strategy):
 # =============================================================================
 
 def run_backtest(data_path, start_date, end_date, initial_cash=100000):
-    """运行单个回测"""
+    """运行单个回测 (命中结果缓存时不重新回测); 结果含 equity_recorder 的 record"""
+    key = cache_key(LLM_Adaptive, data=(Path(data_path), data_quality), start=start_date, end=end_date,
+                    broker=(cost_model, {'cash': initial_cash, 'commission': 0.0015}), recorder=RECORDER[1],
+                    metrics=perf_metrics)
+    return RESULT_CACHE.lookup(key, lambda: _run_backtest(data_path, start_date, end_date, initial_cash))
+
+
+def _run_backtest(data_path, start_date, end_date, initial_cash=100000):
     try:
-        df = pd.read_csv(data_path, parse_dates=['date'])
-        df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
+        # 完整历史只加载一次, 各窗口为 O(log n) 零拷贝视图
+        df = load_clean_history(data_path).window(start_date, end_date)
 
         if len(df) < 50:
             return None
 
         cerebro = bt.Cerebro()
-        cerebro.broker.setcash(initial_cash)
-        cerebro.broker.setcommission(commission=0.0015)  # 0.15% standard rate
-
-        data_feed = bt.feeds.PandasData(
-            dataname=df,
-            datetime='date',
-            open='open',
-            high='high',
-            low='low',
-            close='close',
-            volume='volume',
-            openinterest=-1
-        )
+        cerebro.broker = make_broker(schedule(0.0015), initial_cash)  # 0.15% standard rate
+
+        data_feed = bt.feeds.PandasData(dataname=df, openinterest=-1)
 
         cerebro.adddata(data_feed)
         cerebro.addstrategy(LLM_Adaptive)
-
-        cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
-        cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-        cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
+        cerebro.addanalyzer(RECORDER[1], _name=RECORDER[0])
 
         results = cerebro.run()
-        final_value = cerebro.broker.getvalue()
+        record = results[0].analyzers.getbyname(RECORDER[0]).get_analysis()
 
-        sharpe = results[0].analyzers.sharpe.get_analysis()
-        drawdown = results[0].analyzers.drawdown.get_analysis()
-        trades = results[0].analyzers.trades.get_analysis()
+        # 指标由记录的权益/交易数组计算 (与原 SharpeRatio / DrawDown / TradeAnalyzer 读数一致)
+        summary = bt_summary(record)
+        final_value = summary['final_value']
 
         return {
             'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
             'final_value': round(final_value, 2),
-            'sharpe_ratio': round(sharpe.get('sharperatio', 0) or 0, 3),
-            'max_drawdown_pct': round(drawdown.get('max', {}).get('drawdown', 0), 2),
-            'total_trades': trades.get('total', {}).get('closed', 0),
+            'sharpe_ratio': round(summary['sharpe_ratio'] or 0, 3),
+            'max_drawdown_pct': round(summary['max_drawdown_pct'], 2),
+            'total_trades': summary['total_trades'],
             'initial_cash': initial_cash,
             'data_points': len(df),
             'start_date': start_date,
-            'end_date': end_date
+            'end_date': end_date,
+            'record': record
         }
 
     except Exception as e:
@@ -210,6 +219,7 @@ def main():
     print("=" * 80)
 
     results = {}
+    records = {}  # (窗口, 资产) → equity_recorder的record
     counter = 0
     total = len(ROLLING_WINDOWS) * len(ASSETS)
 
@@ -240,6 +250,7 @@ def main():
             )
 
             if test_result:
+                records[(window_name, asset_name)] = test_result.pop('record', None)
                 results[window_name]['assets'][asset_name] = {
                     'volatility': asset_info['volatility'],
                     'test_period': test_result
@@ -294,6 +305,7 @@ def main():
 
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(output_data, f, indent=2, ensure_ascii=False)
+    records_file = save_records(output_file.replace('.json', '_records.npz'), records)
 
     print("\n" + "=" * 80)
     print("多年份滚动验证 - 执行完成")
@@ -301,6 +313,8 @@ def main():
     print(f"结束时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"输出文件: {output_file}")
     print(f"文件大小: {Path(output_file).stat().st_size / 1024:.1f} KB")
+    print(f"权益/交易数组: {records_file}")
+    print(f"结果缓存: {RESULT_CACHE.summary()}")
     print("=" * 80)
 
 
@@ -13,13 +13,23 @@ Experiment Design:
 - Total: 40 backtests
 """
 
-import backtrader as bt
 import pandas as pd
 import json
 from datetime import datetime
 from pathlib import Path
 import sys
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import data_quality
+import equity_recorder
+import perf_metrics
+import shared_feed_runner
+from data_quality import load_clean_history
+from equity_recorder import RECORDER, save_records
+from perf_metrics import bt_summary
+from result_cache import ResultCache, cache_key
+from shared_feed_runner import run_strategies
+
 # Import strategies
 from ablation_study_strategies import (
     Strategy_Baseline_Fixed,
@@ -80,65 +90,80 @@ INITIAL_CASH = 100000
 # Backtest Runner
 # =============================================================================
 
-def run_single_backtest(strategy_class, data_path, start_date, end_date, initial_cash=100000):
+# Sharpe uses riskfreerate=0.0 (SharpeRatio analyzer setting of the original runs)
+RISKFREE_RATE = 0.0
+
+# Backtest result cache: a (strategy source, data content, period, broker) cell is reused across reruns
+RESULT_CACHE = ResultCache()
+
+# Project modules the cached results depend on (their source is part of the cache key)
+ENGINE_MODULES = (shared_feed_runner, equity_recorder, perf_metrics)
+
+
+def run_period_backtests(strategies, data_path, start_date, end_date, initial_cash=100000, records=None):
     """
-    Run a single backtest
+    Run all strategies on one asset/period, sharing a single prepared feed
+
+    Metrics are computed from the recorded equity/trade arrays (equity_recorder), which
+    reproduce the SharpeRatio / DrawDown / TradeAnalyzer readings exactly. If `records`
+    is given it is filled with {strategy_name: record}. Strategies whose cell is in
+    RESULT_CACHE (metrics + record) are not re-run.
 
     Returns:
-        dict: {returns_pct, final_value, sharpe_ratio, max_drawdown_pct, total_trades}
+        dict: {strategy_name: {returns_pct, final_value, sharpe_ratio, max_drawdown_pct,
+                               total_trades, ...} or None}
     """
+    keys = {name: cache_key(strategy_class, data=(Path(data_path), data_quality), start=start_date,
+                            end=end_date, broker={'cash': initial_cash, 'commission': 0.0015},
+                            riskfree=RISKFREE_RATE, engine=ENGINE_MODULES)
+            for name, strategy_class in strategies.items()}
+    cached = {name: RESULT_CACHE.get(key) for name, key in keys.items()}
+    pending = {name: strategies[name] for name, hit in cached.items() if hit is None}
+
+    results = dict.fromkeys(strategies)
+    for name, hit in cached.items():
+        if hit is not None:
+            results[name] = hit['result']
+            if records is not None:
+                records[name] = hit['record']
+    if not pending:
+        return results
+
     try:
-        # Load data
-        df = pd.read_csv(data_path, parse_dates=['date'])
-        df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-
-        if len(df) < 50:
-            return None
-
-        # Initialize Cerebro
-        cerebro = bt.Cerebro()
-        cerebro.broker.setcash(initial_cash)
-        cerebro.broker.setcommission(commission=0.0015)
-
-        # Create data feed
-        data_feed = bt.feeds.PandasData(
-            dataname=df,
-            datetime='date',
-            open='open',
-            high='high',
-            low='low',
-            close='close',
-            volume='volume',
-            openinterest=-1
-        )
-
-        cerebro.adddata(data_feed)
-        cerebro.addstrategy(strategy_class)
-
-        # Add analyzers
-        cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe', riskfreerate=0.0)
-        cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-        cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
-
-        # Run backtest
-        results = cerebro.run()
-        final_value = cerebro.broker.getvalue()
+        # Load data (full history loaded once; each period is an O(log n) zero-copy view)
+        df = load_clean_history(data_path).window(start_date, end_date)
+    except Exception as e:
+        print(f"    ERROR: {str(e)}")
+        return results
 
-        # Extract metrics
-        sharpe = results[0].analyzers.sharpe.get_analysis()
-        drawdown = results[0].analyzers.drawdown.get_analysis()
-        trades = results[0].analyzers.trades.get_analysis()
+    if len(df) < 50:
+        return results
+
+    # One Cerebro per strategy over the same preloaded columns (shared_feed_runner)
+    runs = run_strategies(df, pending, initial_cash=initial_cash, commission=0.0015,
+                          analyzers=(RECORDER,), feed_kwargs={'openinterest': -1})
+    if records is not None:
+        records.update({name: run.get('record') for name, run in runs.items()})
 
-        sharpe_ratio = sharpe.get('sharperatio', 0.0)
+    for strategy_name, run in runs.items():
+        if 'error' in run:
+            print(f"    ERROR: {run['error']}")
+            results[strategy_name] = None
+            continue
+
+        # Extract metrics
+        summary = bt_summary(run['record'], riskfreerate=RISKFREE_RATE)
+        final_value = summary['final_value']
+        sharpe_ratio = summary['sharpe_ratio']
         if sharpe_ratio is None:
             sharpe_ratio = 0.0
 
-        max_drawdown_pct = drawdown.get('max', {}).get('drawdown', 0.0)
-        total_trades = trades.get('total', {}).get('closed', 0)
+        max_drawdown_pct = summary['max_drawdown_pct']
+        total_trades = summary['total_trades']
 
         returns_pct = ((final_value - initial_cash) / initial_cash) * 100
 
-        return {
+        results[strategy_name] = {
             'returns_pct': round(returns_pct, 2),
             'final_value': round(final_value, 2),
             'sharpe_ratio': round(sharpe_ratio, 3),
@@ -149,10 +174,20 @@ def run_single_backtest(strategy_class, data_path, start_date, end_date, initial
             'start_date': start_date,
             'end_date': end_date
         }
+        RESULT_CACHE.put(keys[strategy_name], {'result': results[strategy_name], 'record': run['record']})
 
-    except Exception as e:
-        print(f"    ERROR: {str(e)}")
-        return None
+    return results
+
+
+def run_single_backtest(strategy_class, data_path, start_date, end_date, initial_cash=100000):
+    """
+    Run a single backtest
+
+    Returns:
+        dict: {returns_pct, final_value, sharpe_ratio, max_drawdown_pct, total_trades}
+    """
+    return run_period_backtests({'strategy': strategy_class}, data_path, start_date, end_date,
+                                initial_cash)['strategy']
 
 
 # =============================================================================
@@ -171,7 +206,19 @@ def main():
     counter = 0
     total = len(STRATEGIES) * len(ASSETS) * len(PERIODS)
 
-    for strategy_name, strategy_class in STRATEGIES.items():
+    # Run every strategy per asset/period first (data prepared once), then report
+    # in the original strategy → asset → period order
+    records = {}
+    period_runs = {}
+    for asset_name, asset_info in ASSETS.items():
+        for period_name, period_dates in PERIODS.items():
+            period_records = {}
+            period_runs[asset_name, period_name] = run_period_backtests(
+                STRATEGIES, asset_info['file'], period_dates['start'], period_dates['end'], INITIAL_CASH,
+                period_records)
+            records.update({(asset_name, period_name, name): r for name, r in period_records.items()})
+
+    for strategy_name in STRATEGIES:
         print(f"\n[{strategy_name}]")
         results[strategy_name] = {}
 
@@ -181,17 +228,11 @@ def main():
             results[strategy_name][asset_name]['volatility'] = asset_info['volatility']
             results[strategy_name][asset_name]['sector'] = asset_info['sector']
 
-            for period_name, period_dates in PERIODS.items():
+            for period_name in PERIODS:
                 counter += 1
                 print(f"    [{counter}/{total}] {period_name}...", end=' ')
 
-                result = run_single_backtest(
-                    strategy_class=strategy_class,
-                    data_path=asset_info['file'],
-                    start_date=period_dates['start'],
-                    end_date=period_dates['end'],
-                    initial_cash=INITIAL_CASH
-                )
+                result = period_runs[asset_name, period_name][strategy_name]
 
                 if result:
                     results[strategy_name][asset_name][f'{period_name}_period'] = result
@@ -219,12 +260,17 @@ def main():
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(output_data, f, indent=2, ensure_ascii=False)
 
+    # Equity/trade arrays keyed (asset, period, strategy): new metrics via perf_metrics, no re-run
+    records_file = save_records(output_file.replace('.json', '_records.npz'), records)
+
     print("\n" + "=" * 80)
     print("Ablation Study - Execution Complete")
     print("=" * 80)
     print(f"End time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"Output file: {output_file}")
+    print(f"Records file: {records_file}")
     print(f"File size: {Path(output_file).stat().st_size / 1024:.1f} KB")
+    print(f"Result cache: {RESULT_CACHE.summary()}")
     print("=" * 80)
 
 
@@ -13,7 +13,13 @@ Python: 3.8+
 - 实验C: 完全自适应 × 5资产 × 2期 = 10回测
 - 总计: 150个独立回测
 
-预计运行时间: 3-4小时
+回测由 adaptive_engine 的批量数组引擎执行: 同一资产/时期的整组参数一次运行,
+结果与逐个Cerebro回测 (run_single_backtest) 完全一致, 全部实验数秒完成;
+每个参数单元格的结果存入 result_cache, 重跑时只计算失效的单元格
+
+使用共享任务队列 (work_queue.py): python run_parameter_sensitivity_analysis.py --queue
+(或设置环境变量 PARAM_SENSITIVITY_QUEUE=1); 三组实验的全部任务在开始时一次提交,
+其它主机运行 `python work_queue.py work --queue parameter_sensitivity` 即可一起完成
 """
 
 import backtrader as bt
@@ -21,17 +27,21 @@ import pandas as pd
 import json
 from pathlib import Path
 from datetime import datetime
-import numpy as np
+import argparse
+import os
 import sys
 import traceback
 
-from parameter_sensitivity_strategies import (
-    Strategy13_FixedStopLoss,
-    Strategy13_FixedPositionSize,
-    Strategy13_ATR_Adaptive,
-    Strategy13_Risk2Pct,
-    Strategy13_FullyAdaptive
-)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import adaptive_engine
+import cost_model
+import feature_store
+import price_loader
+from adaptive_engine import run_batch
+from cost_model import make_broker, schedule
+from result_cache import ResultCache, cache_key
+from work_queue import WorkQueue, content_signature
 
 
 # =============================================================================
@@ -99,6 +109,29 @@ ASSETS = {
 STOP_LOSS_PARAMS = [50, 100, 150, 200, 250, 300]  # 6个固定止损值
 POSITION_SIZE_PARAMS = [5, 10, 15, 20, 25, 30]    # 6个固定仓位值
 
+# 回测结果缓存 (策略/引擎源码、参数、数据内容、区间、broker设置 不变时直接复用)
+RESULT_CACHE = ResultCache()
+
+# 批量回测结果依赖的项目模块: 源文件内容进入 cache key 与队列任务签名, 任一改动即重新回测
+ENGINE_MODULES = (adaptive_engine, feature_store, price_loader, cost_model)
+
+# 共享任务队列 (work_queue.py): 设为 WorkQueue() 后每个 (预设, 参数组, 资产, 时期) 批量回测作为一个任务,
+# 可由多台主机的worker完成, 中断后重跑只补未完成的任务; None 为本进程内运行 (--queue / 环境变量开启)
+QUEUE = None
+QUEUE_NAME = 'parameter_sensitivity'
+QUEUE_ENV = 'PARAM_SENSITIVITY_QUEUE'
+
+# 三组实验的 (预设, 参数组); 每组在每个资产 × 时期上批量运行一次
+SWEEPS = {
+    'A_fixed': ('sensitivity_fixed',
+                [{'stop_loss': stop_loss, 'position_size': 20} for stop_loss in STOP_LOSS_PARAMS]),
+    'A_atr': ('sensitivity_atr', [{'position_size': 20}]),
+    'B_fixed': ('sensitivity_fixed',
+                [{'stop_loss': 200, 'position_size': position_size} for position_size in POSITION_SIZE_PARAMS]),
+    'B_risk2pct': ('sensitivity_risk2pct', [{}]),
+    'C_fully_adaptive': ('sensitivity_fully_adaptive', [{}]),
+}
+
 
 # =============================================================================
 # 核心回测函数
@@ -122,6 +155,13 @@ def run_single_backtest(strategy_class, params, data_path, start_date, end_date,
         dict: 包含Returns, Sharpe, Max DD, Trades等指标
               如果失败返回None
     """
+    key = cache_key(strategy_class, params=params, data=Path(data_path), start=start_date, end=end_date,
+                    broker=(cost_model, {'cash': initial_cash, 'commission': commission}))
+    return RESULT_CACHE.lookup(key, lambda: _run_single_backtest(strategy_class, params, data_path, start_date,
+                                                                 end_date, initial_cash, commission))
+
+
+def _run_single_backtest(strategy_class, params, data_path, start_date, end_date, initial_cash, commission):
     try:
         # 1. 加载数据
         df = pd.read_csv(data_path, parse_dates=['date'], index_col='date')
@@ -143,8 +183,7 @@ def run_single_backtest(strategy_class, params, data_path, start_date, end_date,
         cerebro.addstrategy(strategy_class, **params)
 
         # 6. 设置初始资金和手续费
-        cerebro.broker.setcash(initial_cash)
-        cerebro.broker.setcommission(commission=commission)
+        cerebro.broker = make_broker(schedule(commission), initial_cash)
 
         # 7. 添加分析器
         cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
@@ -196,6 +235,100 @@ def run_single_backtest(strategy_class, params, data_path, start_date, end_date,
         return None
 
 
+def batch_backtest_task(preset, param_list, data_path, start_date, end_date,
+                        initial_cash=100000, commission=0.0005, signature=None):
+    """
+    批量运行一组参数 (adaptive_engine 预设), 每项与 run_single_backtest 的返回值相同; 也是队列任务
+
+    读数据/回测出错时直接抛出: 在队列中由 WorkQueue 记为失败并重发 (不能把失败当作结果写入),
+    本进程内运行由 run_batch_backtest 捕获并报告
+
+    Args:
+        preset: adaptive_engine 预设名 (sensitivity_fixed / sensitivity_atr / ...)
+        param_list: 覆盖参数dict的列表 (键为引擎参数: stop_loss, position_size, ...)
+        signature: 队列任务的内容签名 (数据文件 + 引擎代码), 只用于任务去重
+
+    Returns:
+        list: 与 param_list 顺序一致; 单个参数组合回测失败 (引擎不支持等确定性错误) 时该项为 None,
+              区间内数据不足时整组为 None (命中缓存的单元格不重新回测)
+    """
+    keys = [cache_key(ENGINE_MODULES, preset=preset, params=params, data=Path(data_path), start=start_date,
+                      end=end_date, broker={'cash': initial_cash, 'commission': commission})
+            for params in param_list]
+    results = [RESULT_CACHE.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    df = pd.read_csv(data_path, parse_dates=['date'], index_col='date')
+    df = df[(df.index >= start_date) & (df.index <= end_date)]
+
+    if len(df) < 10:
+        return [None] * len(param_list)
+
+    batch = run_batch(df, preset, [param_list[i] for i in missing], initial_cash=initial_cash,
+                      commission=commission)
+    for i, result in zip(missing, batch):
+        if 'error' in result:
+            print(f"      ❌ 回测失败: {result['error']}")
+            continue
+        result.pop('params')
+        result['sharpe_ratio'] = result['sharpe_ratio'] or 0.0
+        result.update(start_date=start_date, end_date=end_date)
+        results[i] = result
+        RESULT_CACHE.put(keys[i], result)
+    return results
+
+
+def run_batch_backtest(preset, param_list, data_path, start_date, end_date,
+                       initial_cash=100000, commission=0.0005):
+    """本进程内的 batch_backtest_task: 失败时报告并返回整组 None"""
+    try:
+        return batch_backtest_task(preset, param_list, data_path, start_date, end_date, initial_cash, commission)
+    except FileNotFoundError:
+        print(f"      ❌ 数据文件不存在: {data_path}")
+        return [None] * len(param_list)
+    except Exception as e:
+        print(f"      ❌ 回测失败: {str(e)}")
+        return [None] * len(param_list)
+
+
+def period_tasks(preset, param_list, asset_info):
+    """一个资产训练期 / 测试期的两个队列任务"""
+    signature = content_signature(asset_info['path'], batch_backtest_task, *ENGINE_MODULES)
+    return [{'preset': preset, 'param_list': param_list, 'data_path': asset_info['path'],
+             'start_date': asset_info[f'{period}_start'], 'end_date': asset_info[f'{period}_end'],
+             'signature': signature}
+            for period in ('train', 'test')]
+
+
+def submit_all_sweeps():
+    """
+    三组实验的全部 (预设, 参数组, 资产, 时期) 任务一次提交并运行到结束
+
+    其它主机的worker从一开始就有全部任务可领; 之后各实验的 run_period_sweep 只取回结果
+    """
+    tasks = [task for preset, param_list in SWEEPS.values() for asset_info in ASSETS.values()
+             for task in period_tasks(preset, param_list, asset_info)]
+    QUEUE.map(batch_backtest_task, tasks, QUEUE_NAME)
+
+
+def run_period_sweep(preset, param_list, asset_info):
+    """
+    一个资产的训练期 / 测试期各批量运行一次 (使用队列时任务已由 submit_all_sweeps 完成, 这里只取回结果;
+    重试次数用尽仍失败的任务为 None, 重跑脚本时重置再试)
+    """
+    if QUEUE is not None:
+        train, test = QUEUE.results(batch_backtest_task, period_tasks(preset, param_list, asset_info), QUEUE_NAME)
+        return {'train': train or [None] * len(param_list), 'test': test or [None] * len(param_list)}
+    return {
+        'train': run_batch_backtest(preset, param_list, asset_info['path'],
+                                    asset_info['train_start'], asset_info['train_end']),
+        'test': run_batch_backtest(preset, param_list, asset_info['path'],
+                                   asset_info['test_start'], asset_info['test_end']),
+    }
+
+
 # =============================================================================
 # 实验A: 止损参数扫描
 # =============================================================================
@@ -221,8 +354,12 @@ def experiment_A_stop_loss_sweep():
     total_tests = (len(STOP_LOSS_PARAMS) + 1) * len(ASSETS) * 2
     completed = 0
 
+    # 每个资产 × 时期: 全部止损参数一次批量运行
+    sweeps = {asset_name: run_period_sweep(*SWEEPS['A_fixed'], asset_info)
+              for asset_name, asset_info in ASSETS.items()}
+
     # 测试固定止损
-    for stop_loss in STOP_LOSS_PARAMS:
+    for index, stop_loss in enumerate(STOP_LOSS_PARAMS):
         print(f"\n{'─'*80}")
         print(f"📊 测试止损参数: ${stop_loss}")
         print(f"{'─'*80}")
@@ -233,13 +370,7 @@ def experiment_A_stop_loss_sweep():
             print(f"\n  资产: {asset_name} ({asset_info['sector']}, {asset_info['volatility']}波动)")
 
             # 训练期
-            train_result = run_single_backtest(
-                Strategy13_FixedStopLoss,
-                {'stop_loss_amount': stop_loss, 'position_size': 20},
-                asset_info['path'],
-                asset_info['train_start'],
-                asset_info['train_end']
-            )
+            train_result = sweeps[asset_name]['train'][index]
             completed += 1
 
             if train_result:
@@ -251,13 +382,7 @@ def experiment_A_stop_loss_sweep():
                 print(f"    ❌ 训练期失败 [{completed}/{total_tests}]")
 
             # 测试期
-            test_result = run_single_backtest(
-                Strategy13_FixedStopLoss,
-                {'stop_loss_amount': stop_loss, 'position_size': 20},
-                asset_info['path'],
-                asset_info['test_start'],
-                asset_info['test_end']
-            )
+            test_result = sweeps[asset_name]['test'][index]
             completed += 1
 
             if test_result:
@@ -285,13 +410,8 @@ def experiment_A_stop_loss_sweep():
     for asset_name, asset_info in ASSETS.items():
         print(f"\n  资产: {asset_name}")
 
-        train_result = run_single_backtest(
-            Strategy13_ATR_Adaptive,
-            {'position_size': 20},
-            asset_info['path'],
-            asset_info['train_start'],
-            asset_info['train_end']
-        )
+        periods = run_period_sweep(*SWEEPS['A_atr'], asset_info)
+        train_result = periods['train'][0]
         completed += 1
 
         if train_result:
@@ -299,13 +419,7 @@ def experiment_A_stop_loss_sweep():
         else:
             print(f"    ❌ 训练期失败 [{completed}/{total_tests}]")
 
-        test_result = run_single_backtest(
-            Strategy13_ATR_Adaptive,
-            {'position_size': 20},
-            asset_info['path'],
-            asset_info['test_start'],
-            asset_info['test_end']
-        )
+        test_result = periods['test'][0]
         completed += 1
 
         if test_result:
@@ -350,8 +464,12 @@ def experiment_B_position_size_sweep():
     total_tests = (len(POSITION_SIZE_PARAMS) + 1) * len(ASSETS) * 2
     completed = 0
 
+    # 每个资产 × 时期: 全部仓位参数一次批量运行
+    sweeps = {asset_name: run_period_sweep(*SWEEPS['B_fixed'], asset_info)
+              for asset_name, asset_info in ASSETS.items()}
+
     # 测试固定仓位
-    for position_size in POSITION_SIZE_PARAMS:
+    for index, position_size in enumerate(POSITION_SIZE_PARAMS):
         print(f"\n{'─'*80}")
         print(f"📊 测试仓位大小: {position_size}股")
         print(f"{'─'*80}")
@@ -361,13 +479,7 @@ def experiment_B_position_size_sweep():
         for asset_name, asset_info in ASSETS.items():
             print(f"\n  资产: {asset_name}")
 
-            train_result = run_single_backtest(
-                Strategy13_FixedPositionSize,
-                {'stop_loss_amount': 200, 'position_size': position_size},
-                asset_info['path'],
-                asset_info['train_start'],
-                asset_info['train_end']
-            )
+            train_result = sweeps[asset_name]['train'][index]
             completed += 1
 
             if train_result:
@@ -375,13 +487,7 @@ def experiment_B_position_size_sweep():
             else:
                 print(f"    ❌ 训练期失败 [{completed}/{total_tests}]")
 
-            test_result = run_single_backtest(
-                Strategy13_FixedPositionSize,
-                {'stop_loss_amount': 200, 'position_size': position_size},
-                asset_info['path'],
-                asset_info['test_start'],
-                asset_info['test_end']
-            )
+            test_result = sweeps[asset_name]['test'][index]
             completed += 1
 
             if test_result:
@@ -404,13 +510,8 @@ def experiment_B_position_size_sweep():
     for asset_name, asset_info in ASSETS.items():
         print(f"\n  资产: {asset_name}")
 
-        train_result = run_single_backtest(
-            Strategy13_Risk2Pct,
-            {},
-            asset_info['path'],
-            asset_info['train_start'],
-            asset_info['train_end']
-        )
+        periods = run_period_sweep(*SWEEPS['B_risk2pct'], asset_info)
+        train_result = periods['train'][0]
         completed += 1
 
         if train_result:
@@ -418,13 +519,7 @@ def experiment_B_position_size_sweep():
         else:
             print(f"    ❌ 训练期失败 [{completed}/{total_tests}]")
 
-        test_result = run_single_backtest(
-            Strategy13_Risk2Pct,
-            {},
-            asset_info['path'],
-            asset_info['test_start'],
-            asset_info['test_end']
-        )
+        test_result = periods['test'][0]
         completed += 1
 
         if test_result:
@@ -469,13 +564,8 @@ def experiment_C_fully_adaptive():
         print(f"📊 资产: {asset_name}")
         print(f"{'─'*80}")
 
-        train_result = run_single_backtest(
-            Strategy13_FullyAdaptive,
-            {},
-            asset_info['path'],
-            asset_info['train_start'],
-            asset_info['train_end']
-        )
+        periods = run_period_sweep(*SWEEPS['C_fully_adaptive'], asset_info)
+        train_result = periods['train'][0]
         completed += 1
 
         if train_result:
@@ -487,13 +577,7 @@ def experiment_C_fully_adaptive():
         else:
             print(f"  ❌ 训练期失败 [{completed}/{total_tests}]")
 
-        test_result = run_single_backtest(
-            Strategy13_FullyAdaptive,
-            {},
-            asset_info['path'],
-            asset_info['test_start'],
-            asset_info['test_end']
-        )
+        test_result = periods['test'][0]
         completed += 1
 
         if test_result:
@@ -534,10 +618,13 @@ def main():
     print(f"  - 实验B: 仓位参数扫描 (7个参数 × 5资产 × 2期 = 70回测)")
     print(f"  - 实验C: 完全自适应 (1个策略 × 5资产 × 2期 = 10回测)")
     print(f"  - 总计: 150个独立回测")
-    print(f"预计时间: 3-4小时")
+    print(f"回测引擎: adaptive_engine 批量模式 (与Cerebro逐笔一致)")
     print("="*80)
 
     try:
+        if QUEUE is not None:
+            submit_all_sweeps()
+
         # 实验A: 止损参数扫描
         print("\n" + "🚀 开始实验A")
         results_A = experiment_A_stop_loss_sweep()
@@ -608,6 +695,7 @@ def main():
         print(f"  1. {output_path_A}")
         print(f"  2. {output_path_B}")
         print(f"  3. {output_path_C}")
+        print(f"\n结果缓存: {RESULT_CACHE.summary()}")
         print("="*80)
 
     except KeyboardInterrupt:
@@ -618,4 +706,11 @@ def main():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='参数敏感性分析 (实验A/B/C)')
+    parser.add_argument('--queue', action='store_true', default=bool(os.environ.get(QUEUE_ENV)),
+                        help=f'使用共享任务队列 work_queue.py (也可设置环境变量 {QUEUE_ENV}=1)')
+    args = parser.parse_args()
+
+    if args.queue:
+        QUEUE = WorkQueue()
     main()
@@ -14,12 +14,25 @@ python run_strategy_on_new_data.py \
   --train-end 2023-12-31 \
   --test-start 2024-01-01 \
   --test-end 2024-12-31
+
+分钟线 (流式读取, 内存与文件大小无关):
+python run_strategy_on_new_data.py --data minute.csv --chunksize 200000 --timeframe minutes
+
+每日刷新 (断点续跑, 只模拟上次运行之后新增的K线, 结果与完整重放一致):
+python run_strategy_on_new_data.py --data new_stock.csv --test-end 2025-12-31 --checkpoint-dir outputs/checkpoints
 """
 
 import backtrader as bt
 import pandas as pd
 import argparse
+import sys
 from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from cost_model import make_broker, schedule
+from incremental_engine import run_incremental
+from intraday_stream import StreamingBarData
 
 # ============================================================================
 # Adaptive Strategy #13 (来自LLM生成 + 人工改进参数)
@@ -108,8 +121,58 @@ class Adaptive_Strategy_13(bt.Strategy):
 # 回测执行函数
 # ============================================================================
 
+def _run_period(data_feed, initial_cash, **run_kwargs):
+    """单个时间段的回测, 返回 (结果dict, K线数)"""
+    cerebro = bt.Cerebro()
+    cerebro.broker = make_broker(schedule(0.0015), initial_cash)
+
+    cerebro.adddata(data_feed)
+    cerebro.addstrategy(Adaptive_Strategy_13)
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
+
+    strat = cerebro.run(**run_kwargs)[0]
+    final_value = cerebro.broker.getvalue()
+
+    sharpe = strat.analyzers.sharpe.get_analysis()
+    dd = strat.analyzers.drawdown.get_analysis()
+    trades = strat.analyzers.trades.get_analysis()
+
+    result = {
+        'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
+        'final_value': round(final_value, 2),
+        'sharpe_ratio': round(sharpe.get('sharperatio', 0) or 0, 3),
+        'max_drawdown_pct': round(dd.get('max', {}).get('drawdown', 0), 2),
+        'total_trades': trades.get('total', {}).get('closed', 0),
+    }
+    return result, len(strat.data)
+
+
+def _pandas_feed(df):
+    return bt.feeds.PandasData(
+        dataname=df,
+        datetime='date',
+        open='open',
+        high='high',
+        low='low',
+        close='close',
+        volume='volume',
+        openinterest=-1
+    )
+
+
+def _run_period_incremental(df, checkpoint_path, start, end, initial_cash):
+    """数组引擎的 adaptive_13 预设 (与Adaptive_Strategy_13逐笔一致) + checkpoint续跑"""
+    result, resumed = run_incremental(df.set_index('date'), checkpoint_path, 'adaptive_13',
+                                      initial_cash=initial_cash, start=start, end=end)
+    print(f"  {'续跑' if resumed else '完整运行'}: 新增 {result['new_bars']} 根K线")
+    keys = ('returns_pct', 'final_value', 'sharpe_ratio', 'max_drawdown_pct', 'total_trades')
+    return {k: result[k] for k in keys}, result['data_points']
+
+
 def run_backtest(data_path, train_start, train_end, test_start, test_end,
-                 initial_cash=100000):
+                 initial_cash=100000, chunksize=None, timeframe='days', checkpoint_dir=None):
     """
     在新数据上运行Adaptive策略
 
@@ -118,6 +181,10 @@ def run_backtest(data_path, train_start, train_end, test_start, test_end,
         train_start/end: 训练期日期
         test_start/end: 测试期日期
         initial_cash: 初始资金
+        chunksize: 给出时按块流式读取 (分钟线等大文件), 以 exactbars=1 运行,
+                   内存不随K线总数增长; None 为整体读入 (日线)
+        timeframe: 'days' / 'minutes' (流式读取时的K线周期)
+        checkpoint_dir: 给出时 (日线) 每个时期保存checkpoint, 再次运行只模拟新增的K线
 
     返回:
         dict: 回测结果
@@ -127,102 +194,44 @@ def run_backtest(data_path, train_start, train_end, test_start, test_end,
     print(f"运行Adaptive策略 on {data_path}")
     print("=" * 80)
 
-    # 读取数据
-    df = pd.read_csv(data_path, parse_dates=['date'])
+    if chunksize is None:
+        # 读取数据
+        df = pd.read_csv(data_path, parse_dates=['date'])
 
-    results = {}
+    periods = [
+        ('training', '[1/2] 训练期回测...', '训练期收益', train_start, train_end),
+        ('testing', '[2/2] 测试期回测...', '测试期收益', test_start, test_end),
+    ]
 
-    # 训练期回测
-    print("\n[1/2] 训练期回测...")
-    train_df = df[(df['date'] >= train_start) & (df['date'] <= train_end)]
-
-    if len(train_df) >= 50:
-        cerebro_train = bt.Cerebro()
-        cerebro_train.broker.setcash(initial_cash)
-        cerebro_train.broker.setcommission(commission=0.0015)
-
-        data_feed = bt.feeds.PandasData(
-            dataname=train_df,
-            datetime='date',
-            open='open',
-            high='high',
-            low='low',
-            close='close',
-            volume='volume',
-            openinterest=-1
-        )
-
-        cerebro_train.adddata(data_feed)
-        cerebro_train.addstrategy(Adaptive_Strategy_13)
-        cerebro_train.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
-        cerebro_train.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-        cerebro_train.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
-
-        train_results = cerebro_train.run()
-        final_value_train = cerebro_train.broker.getvalue()
-
-        sharpe_train = train_results[0].analyzers.sharpe.get_analysis()
-        dd_train = train_results[0].analyzers.drawdown.get_analysis()
-        trades_train = train_results[0].analyzers.trades.get_analysis()
-
-        results['training'] = {
-            'returns_pct': round(((final_value_train - initial_cash) / initial_cash) * 100, 2),
-            'final_value': round(final_value_train, 2),
-            'sharpe_ratio': round(sharpe_train.get('sharperatio', 0) or 0, 3),
-            'max_drawdown_pct': round(dd_train.get('max', {}).get('drawdown', 0), 2),
-            'total_trades': trades_train.get('total', {}).get('closed', 0),
-        }
-
-        print(f"  训练期收益: {results['training']['returns_pct']:+.2f}%")
-        print(f"  夏普比率: {results['training']['sharpe_ratio']:.3f}")
-        print(f"  最大回撤: {results['training']['max_drawdown_pct']:.2f}%")
-        print(f"  交易次数: {results['training']['total_trades']}")
-
-    # 测试期回测
-    print("\n[2/2] 测试期回测...")
-    test_df = df[(df['date'] >= test_start) & (df['date'] <= test_end)]
-
-    if len(test_df) >= 50:
-        cerebro_test = bt.Cerebro()
-        cerebro_test.broker.setcash(initial_cash)
-        cerebro_test.broker.setcommission(commission=0.0015)
-
-        data_feed = bt.feeds.PandasData(
-            dataname=test_df,
-            datetime='date',
-            open='open',
-            high='high',
-            low='low',
-            close='close',
-            volume='volume',
-            openinterest=-1
-        )
-
-        cerebro_test.adddata(data_feed)
-        cerebro_test.addstrategy(Adaptive_Strategy_13)
-        cerebro_test.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
-        cerebro_test.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-        cerebro_test.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
-
-        test_results = cerebro_test.run()
-        final_value_test = cerebro_test.broker.getvalue()
-
-        sharpe_test = test_results[0].analyzers.sharpe.get_analysis()
-        dd_test = test_results[0].analyzers.drawdown.get_analysis()
-        trades_test = test_results[0].analyzers.trades.get_analysis()
-
-        results['testing'] = {
-            'returns_pct': round(((final_value_test - initial_cash) / initial_cash) * 100, 2),
-            'final_value': round(final_value_test, 2),
-            'sharpe_ratio': round(sharpe_test.get('sharperatio', 0) or 0, 3),
-            'max_drawdown_pct': round(dd_test.get('max', {}).get('drawdown', 0), 2),
-            'total_trades': trades_test.get('total', {}).get('closed', 0),
-        }
-
-        print(f"  测试期收益: {results['testing']['returns_pct']:+.2f}%")
-        print(f"  夏普比率: {results['testing']['sharpe_ratio']:.3f}")
-        print(f"  最大回撤: {results['testing']['max_drawdown_pct']:.2f}%")
-        print(f"  交易次数: {results['testing']['total_trades']}")
+    results = {}
+    for key, title, label, start, end in periods:
+        print(f"\n{title}")
+
+        if chunksize is None and checkpoint_dir is not None:
+            checkpoint_path = Path(checkpoint_dir) / f"{Path(data_path).stem}_{key}_{start}.json"
+            result, bars = _run_period_incremental(df, checkpoint_path, start, end, initial_cash)
+            if bars < 50:
+                continue
+            results[key] = result
+        elif chunksize is None:
+            period_df = df[(df['date'] >= start) & (df['date'] <= end)]
+            if len(period_df) < 50:
+                continue
+            results[key], _ = _run_period(_pandas_feed(period_df), initial_cash)
+        else:
+            data_feed = StreamingBarData(
+                path=data_path, chunksize=chunksize, start=start, end=end,
+                timeframe=bt.TimeFrame.Minutes if timeframe == 'minutes' else bt.TimeFrame.Days
+            )
+            result, bars = _run_period(data_feed, initial_cash, exactbars=1)
+            if bars < 50:
+                continue
+            results[key] = dict(result, data_points=bars)
+
+        print(f"  {label}: {results[key]['returns_pct']:+.2f}%")
+        print(f"  夏普比率: {results[key]['sharpe_ratio']:.3f}")
+        print(f"  最大回撤: {results[key]['max_drawdown_pct']:.2f}%")
+        print(f"  交易次数: {results[key]['total_trades']}")
 
     print("\n" + "=" * 80)
     return results
@@ -241,6 +250,9 @@ if __name__ == '__main__':
     parser.add_argument('--test-start', default='2024-01-01', help='测试期开始日期')
     parser.add_argument('--test-end', default='2024-12-31', help='测试期结束日期')
     parser.add_argument('--cash', type=float, default=100000, help='初始资金')
+    parser.add_argument('--chunksize', type=int, default=None, help='流式读取块大小 (分钟线大文件)')
+    parser.add_argument('--timeframe', default='days', choices=['days', 'minutes'], help='K线周期')
+    parser.add_argument('--checkpoint-dir', default=None, help='断点续跑的checkpoint目录 (日线)')
 
     args = parser.parse_args()
 
@@ -250,7 +262,10 @@ if __name__ == '__main__':
         train_end=args.train_end,
         test_start=args.test_start,
         test_end=args.test_end,
-        initial_cash=args.cash
+        initial_cash=args.cash,
+        chunksize=args.chunksize,
+        timeframe=args.timeframe,
+        checkpoint_dir=args.checkpoint_dir
     )
 
     # 保存结果
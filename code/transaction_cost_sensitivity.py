@@ -11,6 +11,10 @@
 - 总计: 4 × 5 × 2 = 40回测
 
 策略: LLM_Adaptive (完全自适应)
+
+执行: 每个 资产 × 时期 只模拟一次, 4个费率档位由 cost_model.sweep 对成交序列重定价得到
+      (与逐档 run_backtest 的结果相同; 路径随费率改变的档位自动完整重新模拟)
+      每个档位的结果存入 result_cache, 重跑时只计算失效的档位
 """
 
 import backtrader as bt
@@ -18,6 +22,17 @@ import pandas as pd
 import json
 from datetime import datetime
 from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import adaptive_engine
+import cost_model
+import data_quality
+import feature_store
+from cost_model import make_broker, schedule, sweep
+from data_quality import load_clean_history
+from equity_recorder import save_records
+from result_cache import ResultCache, cache_key
 
 # =============================================================================
 # 配置
@@ -53,6 +68,9 @@ PERIODS = {
     'testing': {'start': '2024-01-01', 'end': '2024-12-31'}
 }
 
+# 回测结果缓存 (策略源码 / 引擎源码 / 数据内容 / 区间 / broker设置 不变时直接复用)
+RESULT_CACHE = ResultCache()
+
 # =============================================================================
 # 策略定义
 # =============================================================================
@@ -112,19 +130,17 @@ class LLM_Adaptive(bt.Strategy):
 def run_backtest(commission_rate, data_path, start_date, end_date, initial_cash=100000):
     """运行单个回测"""
     try:
-        df = pd.read_csv(data_path, parse_dates=['date'])
-        df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
+        # 质量检查后的清洗副本, 各窗口为 O(log n) 零拷贝视图
+        df = load_clean_history(data_path).window(start_date, end_date)
 
         if len(df) < 50:
             return None
 
         cerebro = bt.Cerebro()
-        cerebro.broker.setcash(initial_cash)
-        cerebro.broker.setcommission(commission=commission_rate)  # 关键参数
+        cerebro.broker = make_broker(schedule(commission_rate), initial_cash)  # 关键参数
 
         data_feed = bt.feeds.PandasData(
             dataname=df,
-            datetime='date',
             open='open',
             high='high',
             low='low',
@@ -163,6 +179,55 @@ def run_backtest(commission_rate, data_path, start_date, end_date, initial_cash=
         return None
 
 
+def run_commission_sweep(data_path, start_date, end_date, initial_cash=100000):
+    """
+    全部费率档位一次完成: 零成本模拟一次后按成交序列重定价 (cost_model.sweep),
+    仓位随权益变化等路径会改变的档位自动回退到完整重新模拟; 结果与逐档 run_backtest 相同
+
+    Returns:
+        dict: {commission_rate: result} (与 run_backtest 同字段, 另含 record: 日期与权益曲线),
+              数据不足或出错时为None
+    """
+    keys = {rate: cache_key(LLM_Adaptive, engine=(adaptive_engine, feature_store, cost_model),
+                            data=(Path(data_path), data_quality), start=start_date, end=end_date,
+                            broker={'cash': initial_cash, 'commission': rate}, record=('date', 'equity'))
+            for rate in COMMISSION_RATES}
+    cached = {rate: RESULT_CACHE.get(key) for rate, key in keys.items()}
+    missing = [rate for rate in COMMISSION_RATES if cached[rate] is None]
+    if not missing:
+        return cached
+
+    try:
+        df = load_clean_history(data_path).window(start_date, end_date)
+
+        if len(df) < 50:
+            return None
+
+        results = sweep(df, 'llm_adaptive', [schedule(rate) for rate in missing],
+                        initial_cash, strategy_class=LLM_Adaptive)
+        computed = {
+            rate: {
+                'returns_pct': r['returns_pct'],
+                'final_value': r['final_value'],
+                'sharpe_ratio': r['sharpe_ratio'],
+                'max_drawdown_pct': r['max_drawdown_pct'],
+                'total_trades': r['total_trades'],
+                'commission_rate': rate,
+                'initial_cash': initial_cash,
+                'data_points': len(df),
+                'record': {'date': df.index.values, 'equity': r['equity'], 'initial_cash': initial_cash}
+            }
+            for rate, r in zip(missing, results)
+        }
+        for rate, result in computed.items():
+            RESULT_CACHE.put(keys[rate], result)
+        return {rate: cached[rate] or computed[rate] for rate in COMMISSION_RATES}
+
+    except Exception as e:
+        print(f"    ERROR: {str(e)}")
+        return None
+
+
 # =============================================================================
 # 主程序
 # =============================================================================
@@ -176,6 +241,8 @@ def main():
     print("=" * 80)
 
     results = {}
+    records = {}  # (费率, 资产, 时期) → 日期与权益曲线
+    sweeps = {}  # (资产, 时期) → 全部费率档位的结果, 第一次用到时计算
     counter = 0
     total = len(COMMISSION_RATES) * len(ASSETS) * len(PERIODS)
 
@@ -192,14 +259,17 @@ def main():
                 counter += 1
                 print(f"    [{counter}/{total}] {period_name}...", end=' ')
 
-                result = run_backtest(
-                    commission_rate=commission_rate,
-                    data_path=asset_info['file'],
-                    start_date=period_dates['start'],
-                    end_date=period_dates['end']
-                )
+                key = (asset_name, period_name)
+                if key not in sweeps:
+                    sweeps[key] = run_commission_sweep(
+                        data_path=asset_info['file'],
+                        start_date=period_dates['start'],
+                        end_date=period_dates['end']
+                    )
+                result = sweeps[key] and dict(sweeps[key][commission_rate])
 
                 if result:
+                    records[(rate_key, asset_name, period_name)] = result.pop('record', None)
                     results[rate_key][asset_name][f'{period_name}_period'] = result
                     print(f"OK ({result['returns_pct']:+.2f}%)")
                 else:
@@ -221,6 +291,7 @@ def main():
 
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(output_data, f, indent=2, ensure_ascii=False)
+    records_file = save_records(output_file.replace('.json', '_records.npz'), records)
 
     print("\n" + "=" * 80)
     print("交易成本敏感性分析 - 执行完成")
@@ -228,6 +299,8 @@ def main():
     print(f"结束时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"输出文件: {output_file}")
     print(f"文件大小: {Path(output_file).stat().st_size / 1024:.1f} KB")
+    print(f"权益曲线: {records_file}")
+    print(f"结果缓存: {RESULT_CACHE.summary()}")
     print("=" * 80)
 
 
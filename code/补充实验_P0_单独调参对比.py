@@ -32,6 +32,16 @@ import json
 from datetime import datetime
 import sys
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import adaptive_engine
+import price_loader
+from price_loader import load_prices
+from adaptive_engine import resolve_rules, simulate
+from trade_log import fills_log
+from equity_recorder import save_records
+from sweep_executor import grid, run_sweep
+from work_queue import WorkQueue, content_signature
+
 # ===========================
 # Configuration
 # ===========================
@@ -66,6 +76,14 @@ TRAIN_END = '2021-12-31'
 TEST_START = '2022-01-01'
 TEST_END = '2023-12-31'
 
+# 网格搜索的进程数 (None 为全部可用CPU, 1 为当前进程串行)
+WORKERS = None
+
+# 共享任务队列 (work_queue.py): 设为 WorkQueue() 后10只股票的网格写入队列, 本进程与其它主机上的
+# `python work_queue.py work` 一起完成, 中断后重跑只补未完成的组合; None 为本进程内 (WORKERS) 运行
+QUEUE = None
+QUEUE_NAME = 'per_market_optimization'
+
 # ===========================
 # Simple Backtest Engine
 # ===========================
@@ -78,75 +96,82 @@ class SimpleStrategy:
         self.data = data
         self.stop_loss = stop_loss
         self.position_size = position_size
+        self.initial_cash = initial_cash
         self.cash = initial_cash
         self.position = 0
         self.entry_price = 0
-        self.trades = []
+        self.trades = fills_log([])
 
     def calculate_sma(self, period):
         return self.data['Close'].rolling(window=period).mean()
 
     def run(self):
-        sma_fast = self.calculate_sma(20)
-        sma_slow = self.calculate_sma(50)
-
-        for i in range(50, len(self.data)):
-            current_price = self.data['Close'].iloc[i]
-
-            # Entry: Golden Cross
-            if sma_fast.iloc[i] > sma_slow.iloc[i] and sma_fast.iloc[i-1] <= sma_slow.iloc[i-1]:
-                if self.position == 0 and self.cash >= current_price * self.position_size:
-                    self.position = self.position_size
-                    self.entry_price = current_price
-                    self.cash -= self.position * current_price
-                    self.trades.append({
-                        'date': self.data.index[i],
-                        'type': 'buy',
-                        'price': current_price,
-                        'size': self.position_size
-                    })
-
-            # Exit: Death Cross or Stop-Loss
-            if self.position > 0:
-                # Death cross
-                if sma_fast.iloc[i] < sma_slow.iloc[i] and sma_fast.iloc[i-1] >= sma_slow.iloc[i-1]:
-                    self.cash += self.position * current_price
-                    self.trades.append({
-                        'date': self.data.index[i],
-                        'type': 'sell',
-                        'price': current_price,
-                        'size': self.position
-                    })
-                    self.position = 0
-
-                # Fixed stop-loss (dollar amount)
-                loss = (self.entry_price - current_price) * self.position
-                if loss > self.stop_loss:
-                    self.cash += self.position * current_price
-                    self.trades.append({
-                        'date': self.data.index[i],
-                        'type': 'stop',
-                        'price': current_price,
-                        'size': self.position
-                    })
-                    self.position = 0
+        """
+        Entry: SMA20/SMA50金叉 (现金足够时按收盘价买入固定仓位)
+        Exit: 死叉, 否则亏损金额 > stop_loss; 由数组引擎 (adaptive_engine) 执行
+        """
+        rules = resolve_rules('simple_fixed', stop_loss=self.stop_loss,
+                              position_size=self.position_size, require_cash=True)
+        features = {'sma_fast': self.calculate_sma(20), 'sma_slow': self.calculate_sma(50)}
+        sim = simulate(self.data, rules, self.cash, commission=0, features=features)
+
+        self.cash, self.position = sim['cash'], sim['position']
+        self.trades = fills_log(sim['trades'], self.data.index)
+        buys = self.trades['price'][self.trades.labels('type') == 'buy']
+        if len(buys):
+            self.entry_price = buys[-1]
 
         # Final value
-        final_price = self.data['Close'].iloc[-1]
-        final_value = self.cash + self.position * final_price
+        final_value = float(sim['equity'][-1])
         returns = (final_value - 100000) / 100000 * 100
 
         return {
             'final_value': final_value,
             'returns_pct': returns,
             'total_trades': len(self.trades),
-            'trades': self.trades
+            'trades': self.trades,
+            'equity': sim['equity']
         }
 
 # ===========================
 # Grid Search Optimization
 # ===========================
 
+def load_period(data_path, start, end):
+    """读取一只股票的一个时期 (每个worker进程启动时调用一次)"""
+    data = load_prices(data_path).rename(columns=str.capitalize)
+    return data.loc[start:end]
+
+
+def evaluate_params(data, params):
+    """一个参数组合的训练期回测; 失败时返回 None"""
+    try:
+        return SimpleStrategy(data=data, **params).run()
+    except Exception:
+        return None
+
+
+def run_grid_task(data_path, start, end, params, signature=None):
+    """队列任务: 一只股票一个时期的一个参数组合 (结果不含逐笔成交); signature 只用于任务去重"""
+    result = evaluate_params(load_period(data_path, start, end), params)
+    return result and {k: v for k, v in result.items() if k != 'trades'}
+
+
+def param_grid():
+    """网格搜索范围"""
+    stop_loss_range = [100, 200, 300, 400, 500, 600, 700, 800, 900, 1000]  # RMB
+    position_size_range = [5, 10, 15, 20, 25, 30]  # shares
+    return grid({'stop_loss': stop_loss_range, 'position_size': position_size_range})
+
+
+def grid_tasks(data_path, start, end):
+    # 签名 = 数据文件内容 + 回测代码, 数据更新或策略/引擎改动后不会取回队列中的旧结果
+    signature = content_signature(data_path, run_grid_task, evaluate_params, SimpleStrategy,
+                                  adaptive_engine, price_loader)
+    return [{'data_path': str(data_path), 'start': start, 'end': end, 'params': params, 'signature': signature}
+            for params in param_grid()]
+
+
 def grid_search_optimal_params(stock_file, stock_name, train_start, train_end):
     """
     在训练期网格搜索最优固定参数
@@ -164,8 +189,7 @@ def grid_search_optimal_params(stock_file, stock_name, train_start, train_end):
         print(f"✗ Data file not found: {data_path}")
         return None
 
-    data = pd.read_csv(data_path, index_col=0, parse_dates=True)
-    data = data.loc[train_start:train_end]
+    data = load_period(data_path, train_start, train_end)
 
     if len(data) < 100:
         print(f"✗ Insufficient data: {len(data)} rows")
@@ -176,44 +200,39 @@ def grid_search_optimal_params(stock_file, stock_name, train_start, train_end):
     print(f"  Price range: ¥{data['Close'].min():.2f} - ¥{data['Close'].max():.2f}")
     print()
 
-    # 网格搜索范围
-    stop_loss_range = [100, 200, 300, 400, 500, 600, 700, 800, 900, 1000]  # RMB
-    position_size_range = [5, 10, 15, 20, 25, 30]  # shares
+    combos = param_grid()
+
+    print("  Grid Search Progress:")
+    total_combinations = len(combos)
+
+    if QUEUE is not None:
+        # 任务可能已由其它worker (或中断前的上一次运行) 完成
+        results = QUEUE.map(run_grid_task, grid_tasks(data_path, train_start, train_end), QUEUE_NAME)
+    else:
+        # 组合分发到进程池, 每个worker读一次训练期数据; 结果按完成顺序返回,
+        # 最优按组合原顺序选 (收益相同取先出现者, 与逐个循环一致)
+        results = [None] * total_combinations
+        best_so_far = -np.inf
+        for tested, (index, _, result) in enumerate(
+                run_sweep(evaluate_params, combos, load_period, (data_path, train_start, train_end),
+                          workers=WORKERS), 1):
+            results[index] = result
+            if result is not None:
+                best_so_far = max(best_so_far, result['returns_pct'])
+            if tested % 10 == 0:
+                print(f"    Progress: {tested}/{total_combinations} combinations tested... "
+                      f"Current best: {best_so_far:.2f}%")
 
     best_return = -np.inf
     best_params = None
-
-    print("  Grid Search Progress:")
-    total_combinations = len(stop_loss_range) * len(position_size_range)
-    tested = 0
-
-    for stop_loss in stop_loss_range:
-        for position_size in position_size_range:
-            tested += 1
-
-            try:
-                strategy = SimpleStrategy(
-                    data=data,
-                    stop_loss=stop_loss,
-                    position_size=position_size
-                )
-                result = strategy.run()
-
-                if result['returns_pct'] > best_return:
-                    best_return = result['returns_pct']
-                    best_params = {
-                        'stop_loss': stop_loss,
-                        'position_size': position_size,
-                        'train_return': best_return,
-                        'train_trades': result['total_trades']
-                    }
-
-                if tested % 10 == 0:
-                    print(f"    Progress: {tested}/{total_combinations} combinations tested... "
-                          f"Current best: {best_return:.2f}%")
-
-            except Exception as e:
-                continue
+    for params, result in zip(combos, results):
+        if result is not None and result['returns_pct'] > best_return:
+            best_return = result['returns_pct']
+            best_params = {
+                **params,
+                'train_return': best_return,
+                'train_trades': result['total_trades']
+            }
 
     print()
     if best_params:
@@ -236,7 +255,7 @@ def evaluate_on_test_period(stock_file, stock_name, params, test_start, test_end
     在测试期评估给定参数的表现
     """
     data_path = DATA_DIR / stock_file
-    data = pd.read_csv(data_path, index_col=0, parse_dates=True)
+    data = load_prices(data_path).rename(columns=str.capitalize)
     data = data.loc[test_start:test_end]
 
     if len(data) < 50:
@@ -254,7 +273,9 @@ def evaluate_on_test_period(stock_file, stock_name, params, test_start, test_end
         'method': method_name,
         'test_return': result['returns_pct'],
         'test_trades': result['total_trades'],
-        'params': params
+        'params': params,
+        'record': {'date': data.index.values, 'equity': result['equity'], 'initial_cash': strategy.initial_cash,
+                   **result['trades'].to_record()}
     }
 
 # ===========================
@@ -341,6 +362,12 @@ def main():
 
     optimized_params = {}
 
+    # 全部股票的网格先一次提交, 其它主机的worker从一开始就有任务可领
+    if QUEUE is not None:
+        for stock_file, _ in ASHARE_STOCKS:
+            if (DATA_DIR / stock_file).exists():
+                QUEUE.enqueue(run_grid_task, grid_tasks(DATA_DIR / stock_file, TRAIN_START, TRAIN_END), QUEUE_NAME)
+
     for stock_file, stock_name in ASHARE_STOCKS:
         optimal = grid_search_optimal_params(
             stock_file=stock_file,
@@ -366,6 +393,7 @@ def main():
     print()
 
     optimized_results = []
+    records = {}  # 股票 → 测试期的权益曲线与成交 (equity_recorder.save_records)
 
     for stock_file, stock_name in ASHARE_STOCKS:
         if stock_name not in optimized_params:
@@ -383,10 +411,14 @@ def main():
         )
 
         if result:
+            records[stock_name] = result.pop('record')
             optimized_results.append(result)
             print(f"  {stock_name:12s}: {result['test_return']:+7.2f}%  "
                   f"(stop=¥{params['stop_loss']}, size={params['position_size']})")
 
+    records_output = save_records(OUTPUT_DIR / 'optimized_test_records.npz', records)
+    print(f"\n✓ Test-period equity/trades saved to: {records_output}")
+
     # Step 4: 汇总对比
     print("\n" + "="*80)
     print("Step 3: Three-Way Comparison Results")
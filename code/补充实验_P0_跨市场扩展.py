@@ -24,6 +24,18 @@ import numpy as np
 from datetime import datetime
 import json
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import adaptive_engine
+import feature_store
+import price_loader
+from feature_store import compute as compute_feature, get_features
+from price_loader import load_prices
+from adaptive_engine import resolve_rules, simulate
+from trade_log import fills_log
+from equity_recorder import save_records
+from work_queue import WorkQueue, content_signature
 
 # ===========================
 # Configuration
@@ -64,6 +76,15 @@ MARKETS = {
 
 OUTPUT_DIR = '/root/autodl-tmp/outputs/cross_market_expansion'
 
+# US市场最优参数 (从之前实验获得)
+US_OPTIMAL_STOP_LOSS = 200  # $200
+US_OPTIMAL_POSITION_SIZE = 20  # 20 shares
+
+# 共享任务队列 (work_queue.py): 设为 WorkQueue() 后每个市场的回测作为一个任务, 可由多台主机的worker完成,
+# 中断后重跑只补未完成的市场; None 为本进程内逐个运行
+QUEUE = None
+QUEUE_NAME = 'cross_market_expansion'
+
 # ===========================
 # Step 1: Download Data
 # ===========================
@@ -145,7 +166,7 @@ def analyze_market_differences():
         if not os.path.exists(csv_path):
             continue
 
-        data = pd.read_csv(csv_path, index_col=0, parse_dates=True)
+        data = load_prices(csv_path).rename(columns=str.capitalize)
 
         # 计算关键统计指标
         returns = data['Close'].pct_change().dropna()
@@ -209,73 +230,52 @@ def calculate_max_drawdown(prices):
 class SimpleBacktest:
     """
     简化版回测引擎（不依赖backtrader）
+
+    symbol: data 所来自的行情CSV (data 为该文件完整历史时); 给出时指标从特征库读取
+    (feature_store 按完整历史持久化的 kind='simple' 序列, 与 data 逐行对齐), 否则在 data 上计算
     """
-    def __init__(self, data, initial_cash=100000):
+    def __init__(self, data, initial_cash=100000, symbol=None):
         self.data = data
         self.initial_cash = initial_cash
+        self.symbol = symbol
         self.cash = initial_cash
         self.position = 0
         self.entry_price = 0
-        self.trades = []
-        self.equity_curve = []
+        self.trades = fills_log([])
+        self.equity_curve = np.empty(0)
+
+    def _feature(self, name, period):
+        if self.symbol is not None:
+            values = get_features(self.symbol, name, [period], kind='simple')[period]
+            if len(values) == len(self.data):
+                return pd.Series(np.asarray(values), index=self.data.index)
+        arrays = {'high': self.data['High'], 'low': self.data['Low'], 'close': self.data['Close']}
+        values = compute_feature(name, arrays, [period], kind='simple')[0]
+        return pd.Series(values, index=self.data.index)
 
     def calculate_sma(self, period):
-        return self.data['Close'].rolling(window=period).mean()
+        return self._feature('sma', period)
 
     def calculate_atr(self, period=14):
-        high = self.data['High']
-        low = self.data['Low']
-        close = self.data['Close']
-
-        tr1 = high - low
-        tr2 = abs(high - close.shift())
-        tr3 = abs(low - close.shift())
-
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-        atr = tr.rolling(window=period).mean()
-
-        return atr
-
-    def run_fixed_strategy(self, stop_loss_fixed, position_size):
-        """
-        固定参数策略：固定止损金额 + 固定仓位
-        """
-        sma_fast = self.calculate_sma(20)
-        sma_slow = self.calculate_sma(50)
-
-        for i in range(50, len(self.data)):
-            current_price = self.data['Close'].iloc[i]
-
-            # Entry: Golden Cross
-            if sma_fast.iloc[i] > sma_slow.iloc[i] and sma_fast.iloc[i-1] <= sma_slow.iloc[i-1]:
-                if self.position == 0:
-                    self.position = position_size
-                    self.entry_price = current_price
-                    self.cash -= self.position * current_price
-                    self.trades.append({'type': 'buy', 'price': current_price, 'size': position_size})
-
-            # Exit: Death Cross or Stop-Loss
-            if self.position > 0:
-                # Death cross
-                if sma_fast.iloc[i] < sma_slow.iloc[i] and sma_fast.iloc[i-1] >= sma_slow.iloc[i-1]:
-                    self.cash += self.position * current_price
-                    self.trades.append({'type': 'sell', 'price': current_price, 'size': self.position})
-                    self.position = 0
-
-                # Fixed stop-loss
-                loss = (self.entry_price - current_price) * self.position
-                if loss > stop_loss_fixed:
-                    self.cash += self.position * current_price
-                    self.trades.append({'type': 'stop', 'price': current_price, 'size': self.position})
-                    self.position = 0
-
-            # 记录权益
-            portfolio_value = self.cash + self.position * current_price
-            self.equity_curve.append(portfolio_value)
+        # TR的滚动均值 (与特征库 kind='simple' 同一实现)
+        return self._feature('atr', period)
+
+    def _run_engine(self, rules, features, skip_nan_atr=False):
+        """数组引擎 (adaptive_engine, 收盘价成交口径) 运行, 结果与原逐K线循环一致"""
+        sim = simulate(self.data, rules, self.initial_cash, commission=0, features=features)
+        start = sim['start']
+        equity = sim['equity']
+        self.cash, self.position = sim['cash'], sim['position']
+        self.trades = fills_log(sim['trades'], self.data.index)
+
+        # 记录权益 (ATR为NaN的K线原循环直接跳过)
+        curve = equity[start:]
+        if skip_nan_atr:
+            curve = curve[~np.isnan(sim['signals']['atr'][start:])]
+        self.equity_curve = curve
 
         # 最终价值
-        final_price = self.data['Close'].iloc[-1]
-        final_value = self.cash + self.position * final_price
+        final_value = float(equity[-1])
         returns = (final_value - self.initial_cash) / self.initial_cash * 100
 
         return {
@@ -286,68 +286,27 @@ class SimpleBacktest:
             'sharpe_ratio': self._calculate_sharpe()
         }
 
-    def run_adaptive_strategy(self, atr_multiplier=3, risk_percent=0.02):
-        """
-        自适应参数策略：ATR止损 + 风险百分比仓位
+    def run_fixed_strategy(self, stop_loss_fixed, position_size):
         """
-        sma_fast = self.calculate_sma(20)
-        sma_slow = self.calculate_sma(50)
-        atr = self.calculate_atr(14)
-
-        for i in range(50, len(self.data)):
-            current_price = self.data['Close'].iloc[i]
-            current_atr = atr.iloc[i]
-
-            if pd.isna(current_atr):
-                continue
+        固定参数策略：固定止损金额 + 固定仓位
 
-            # Entry: Golden Cross
-            if sma_fast.iloc[i] > sma_slow.iloc[i] and sma_fast.iloc[i-1] <= sma_slow.iloc[i-1]:
-                if self.position == 0:
-                    # Adaptive position sizing
-                    portfolio_value = self.cash + self.position * current_price
-                    risk_amount = portfolio_value * risk_percent
-                    stop_distance = current_atr * atr_multiplier
-
-                    if stop_distance > 0:
-                        position_size = int(risk_amount / stop_distance)
-                        if position_size > 0 and position_size * current_price <= self.cash:
-                            self.position = position_size
-                            self.entry_price = current_price
-                            self.cash -= self.position * current_price
-                            self.trades.append({'type': 'buy', 'price': current_price, 'size': position_size})
-
-            # Exit: Death Cross or Adaptive Stop-Loss
-            if self.position > 0:
-                # Death cross
-                if sma_fast.iloc[i] < sma_slow.iloc[i] and sma_fast.iloc[i-1] >= sma_slow.iloc[i-1]:
-                    self.cash += self.position * current_price
-                    self.trades.append({'type': 'sell', 'price': current_price, 'size': self.position})
-                    self.position = 0
-
-                # Adaptive stop-loss (ATR-based)
-                stop_price = self.entry_price - (current_atr * atr_multiplier)
-                if current_price < stop_price:
-                    self.cash += self.position * current_price
-                    self.trades.append({'type': 'stop', 'price': current_price, 'size': self.position})
-                    self.position = 0
-
-            # 记录权益
-            portfolio_value = self.cash + self.position * current_price
-            self.equity_curve.append(portfolio_value)
+        Entry: SMA20/SMA50金叉 (收盘价成交); Exit: 死叉, 否则亏损金额 > stop_loss_fixed
+        """
+        rules = resolve_rules('simple_fixed', stop_loss=stop_loss_fixed, position_size=position_size)
+        features = {'sma_fast': self.calculate_sma(20), 'sma_slow': self.calculate_sma(50)}
+        return self._run_engine(rules, features)
 
-        # 最终价值
-        final_price = self.data['Close'].iloc[-1]
-        final_value = self.cash + self.position * final_price
-        returns = (final_value - self.initial_cash) / self.initial_cash * 100
+    def run_adaptive_strategy(self, atr_multiplier=3, risk_percent=0.02):
+        """
+        自适应参数策略：ATR止损 + 风险百分比仓位
 
-        return {
-            'final_value': final_value,
-            'returns_pct': returns,
-            'total_trades': len(self.trades),
-            'max_drawdown': self._calculate_drawdown(),
-            'sharpe_ratio': self._calculate_sharpe()
-        }
+        Entry: SMA20/SMA50金叉, 仓位 int(权益 × risk_percent / (ATR × multiplier)), 需现金足够;
+        Exit: 死叉, 否则 close < entry - ATR × multiplier
+        """
+        rules = resolve_rules('simple_adaptive', atr_multiplier=atr_multiplier, risk_percent=risk_percent)
+        features = {'sma_fast': self.calculate_sma(20), 'sma_slow': self.calculate_sma(50),
+                    'atr': self.calculate_atr(14)}
+        return self._run_engine(rules, features, skip_nan_atr=True)
 
     def _calculate_drawdown(self):
         if len(self.equity_curve) == 0:
@@ -370,6 +329,65 @@ class SimpleBacktest:
 # Step 4: Cross-Market Experiments
 # ===========================
 
+def run_market(market_id, signature=None):
+    """
+    一个市场上的 固定参数 (US最优) vs 自适应 对比 (也是队列任务, signature 只用于任务去重)
+
+    读数据/回测出错时直接抛出: 在队列中由 WorkQueue 记为失败并重发 (不能把失败当作结果写入),
+    本进程内运行由 run_market_safe 捕获
+
+    返回值的 records 为两种方法的权益曲线与成交 ({'fixed': record, 'adaptive': record})
+    """
+    config = MARKETS[market_id]
+    csv_path = os.path.join(OUTPUT_DIR, f'{market_id}_data.csv')
+
+    data = load_prices(csv_path).rename(columns=str.capitalize)
+
+    # Method 1: Fixed (US parameters)
+    bt_fixed = SimpleBacktest(data, symbol=csv_path)
+    result_fixed = bt_fixed.run_fixed_strategy(
+        stop_loss_fixed=US_OPTIMAL_STOP_LOSS,
+        position_size=US_OPTIMAL_POSITION_SIZE
+    )
+
+    # Method 2: Adaptive Framework
+    bt_adaptive = SimpleBacktest(data, symbol=csv_path)
+    result_adaptive = bt_adaptive.run_adaptive_strategy(
+        atr_multiplier=3,
+        risk_percent=0.02
+    )
+
+    # Calculate improvement
+    improvement = result_adaptive['returns_pct'] - result_fixed['returns_pct']
+
+    return {
+        'Market': config['name'],
+        'Symbol': config['symbol'],
+        'Currency': config['currency'],
+        'Fixed_Return': result_fixed['returns_pct'],
+        'Adaptive_Return': result_adaptive['returns_pct'],
+        'Improvement_pp': improvement,
+        'Fixed_Sharpe': result_fixed['sharpe_ratio'],
+        'Adaptive_Sharpe': result_adaptive['sharpe_ratio'],
+        'Fixed_MaxDD': result_fixed['max_drawdown'],
+        'Adaptive_MaxDD': result_adaptive['max_drawdown'],
+        'Fixed_Trades': result_fixed['total_trades'],
+        'Adaptive_Trades': result_adaptive['total_trades'],
+        'records': {
+            method: {'equity': bt.equity_curve, 'initial_cash': bt.initial_cash, **bt.trades.to_record()}
+            for method, bt in (('fixed', bt_fixed), ('adaptive', bt_adaptive))
+        }
+    }
+
+
+def run_market_safe(market_id):
+    """本进程内的 run_market: 失败时返回 {'error': 信息}"""
+    try:
+        return run_market(market_id)
+    except Exception as e:
+        return {'error': str(e)}
+
+
 def run_cross_market_experiments():
     """
     在所有市场上运行对比实验
@@ -379,65 +397,39 @@ def run_cross_market_experiments():
     print("=" * 80)
     print()
 
-    results = []
-
-    # 假设US市场最优参数（从之前实验获得）
-    us_optimal_stop_loss = 200  # $200
-    us_optimal_position_size = 20  # 20 shares
-
-    for market_id, config in MARKETS.items():
-        csv_path = os.path.join(OUTPUT_DIR, f'{market_id}_data.csv')
-
-        if not os.path.exists(csv_path):
-            continue
+    available = [market_id for market_id in MARKETS
+                 if os.path.exists(os.path.join(OUTPUT_DIR, f'{market_id}_data.csv'))]
+
+    if QUEUE is not None:
+        # 签名 = 市场数据文件内容 + 回测代码与参数, 重新下载数据或改动策略后不会取回旧结果
+        tasks = [{'market_id': market_id,
+                  'signature': content_signature(os.path.join(OUTPUT_DIR, f'{market_id}_data.csv'),
+                                                 run_market, SimpleBacktest, adaptive_engine, feature_store,
+                                                 price_loader, config=MARKETS[market_id],
+                                                 fixed=[US_OPTIMAL_STOP_LOSS, US_OPTIMAL_POSITION_SIZE])}
+                 for market_id in available]
+        entries = QUEUE.map(run_market, tasks, QUEUE_NAME)
+    else:
+        entries = [run_market_safe(market_id) for market_id in available]
 
+    results = []
+    records = {}  # (市场, 方法) → 权益曲线与成交
+    for market_id, entry in zip(available, entries):
+        config = MARKETS[market_id]
         print(f"Testing on {config['name']} ({config['symbol']})...")
 
-        try:
-            data = pd.read_csv(csv_path, index_col=0, parse_dates=True)
-
-            # Method 1: Fixed (US parameters)
-            bt_fixed = SimpleBacktest(data)
-            result_fixed = bt_fixed.run_fixed_strategy(
-                stop_loss_fixed=us_optimal_stop_loss,
-                position_size=us_optimal_position_size
-            )
-
-            # Method 2: Adaptive Framework
-            bt_adaptive = SimpleBacktest(data)
-            result_adaptive = bt_adaptive.run_adaptive_strategy(
-                atr_multiplier=3,
-                risk_percent=0.02
-            )
-
-            # Calculate improvement
-            improvement = result_adaptive['returns_pct'] - result_fixed['returns_pct']
-
-            result_entry = {
-                'Market': config['name'],
-                'Symbol': config['symbol'],
-                'Currency': config['currency'],
-                'Fixed_Return': result_fixed['returns_pct'],
-                'Adaptive_Return': result_adaptive['returns_pct'],
-                'Improvement_pp': improvement,
-                'Fixed_Sharpe': result_fixed['sharpe_ratio'],
-                'Adaptive_Sharpe': result_adaptive['sharpe_ratio'],
-                'Fixed_MaxDD': result_fixed['max_drawdown'],
-                'Adaptive_MaxDD': result_adaptive['max_drawdown'],
-                'Fixed_Trades': result_fixed['total_trades'],
-                'Adaptive_Trades': result_adaptive['total_trades']
-            }
-
-            results.append(result_entry)
-
-            print(f"  Fixed Return:    {result_fixed['returns_pct']:7.2f}%")
-            print(f"  Adaptive Return: {result_adaptive['returns_pct']:7.2f}%")
-            print(f"  Improvement:     {improvement:+7.2f}pp")
+        if entry is None or 'error' in entry:
+            print(f"  ✗ Error: {entry['error'] if entry else 'task failed'}")
             print()
+            continue
 
-        except Exception as e:
-            print(f"  ✗ Error: {e}")
-            print()
+        records.update({(market_id, method): r for method, r in entry.pop('records').items()})
+        results.append(entry)
+
+        print(f"  Fixed Return:    {entry['Fixed_Return']:7.2f}%")
+        print(f"  Adaptive Return: {entry['Adaptive_Return']:7.2f}%")
+        print(f"  Improvement:     {entry['Improvement_pp']:+7.2f}pp")
+        print()
 
     # 保存结果
     df = pd.DataFrame(results)
@@ -461,6 +453,8 @@ def run_cross_market_experiments():
     csv_output = os.path.join(OUTPUT_DIR, 'cross_market_results.csv')
     df.to_csv(csv_output, index=False)
     print(f"✓ Saved to: {csv_output}")
+    records_output = save_records(os.path.join(OUTPUT_DIR, 'cross_market_records.npz'), records)
+    print(f"✓ Equity/trades saved to: {records_output}")
 
     # 生成论文表格
     generate_paper_table(df)
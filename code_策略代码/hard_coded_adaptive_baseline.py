@@ -17,9 +17,17 @@ Author: Human Expert (for comparison with LLM)
 Date: 2025-11-29
 """
 
+import sys
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
-from typing import Dict, Tuple
+from typing import Dict, Iterable, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from adaptive_engine import resolve_rules, simulate
+from intraday_stream import RollingCarry, StreamStats
+from trade_log import CLOSED_TRADE_FIELDS, EXIT_REASONS, TradeLog
 
 
 class HardCodedAdaptiveStrategy:
@@ -64,33 +72,24 @@ class HardCodedAdaptiveStrategy:
 
         self.position = 0  # Current position size
         self.cash = initial_capital
-        self.equity_curve = []
-        self.trades = []
+        self.equity_curve = np.empty(0)
+        self.trades = self._new_trade_log()
 
-    def calculate_atr(self, data: pd.DataFrame) -> pd.Series:
+    def calculate_atr(self, data: pd.DataFrame, carry: RollingCarry = None) -> pd.Series:
         """
         Calculate Average True Range (ATR)
 
         Formula:
         TR = max(high - low, abs(high - prev_close), abs(low - prev_close))
         ATR = rolling_mean(TR, period)
-        """
-        high = data['high']
-        low = data['low']
-        close = data['close']
-
-        # True Range components
-        hl = high - low
-        hc = np.abs(high - close.shift(1))
-        lc = np.abs(low - close.shift(1))
 
-        # True Range = max of three components
-        true_range = pd.concat([hl, hc, lc], axis=1).max(axis=1)
-
-        # ATR = simple moving average of TR
-        atr = true_range.rolling(window=self.atr_period).mean()
+        carry: rolling state of the previous chunks (backtest_stream)
+        """
+        # Shared kernel with the feature store (kind='simple' = rolling mean of TR)
+        carry = carry or RollingCarry()
+        atr = carry.compute('atr', data, [self.atr_period])[0]
 
-        return atr
+        return pd.Series(atr, index=data.index)
 
     def calculate_position_size(
         self,
@@ -127,7 +126,7 @@ class HardCodedAdaptiveStrategy:
 
         return min(position_size, max_affordable)
 
-    def generate_signals(self, data: pd.DataFrame) -> pd.DataFrame:
+    def generate_signals(self, data: pd.DataFrame, carry: RollingCarry = None) -> pd.DataFrame:
         """
         Generate trading signals based on MA crossover
 
@@ -137,35 +136,108 @@ class HardCodedAdaptiveStrategy:
 
         This is the simplest trend-following logic.
         Note: LLM-generated strategies may have more sophisticated entry logic
+
+        carry: rolling state of the previous chunks (backtest_stream); the
+        indicators are then identical to a single pass over the whole series
         """
+        carry = carry or RollingCarry()
         signals = data.copy()
 
-        # Calculate moving averages
-        signals['sma_fast'] = signals['close'].rolling(window=self.sma_fast).mean()
-        signals['sma_slow'] = signals['close'].rolling(window=self.sma_slow).mean()
+        # Calculate moving averages (feature store kernel, rolling mean of close)
+        sma_fast, sma_slow = carry.compute('sma', signals, [self.sma_fast, self.sma_slow])
+        signals['sma_fast'] = sma_fast
+        signals['sma_slow'] = sma_slow
 
         # Calculate ATR
-        signals['atr'] = self.calculate_atr(signals)
+        signals['atr'] = self.calculate_atr(signals, carry)
 
         # Generate signals
         signals['signal'] = 0
+        prev_fast, prev_slow = carry.shift('sma_fast', sma_fast), carry.shift('sma_slow', sma_slow)
 
         # Golden cross: BUY
-        golden_cross = (
-            (signals['sma_fast'] > signals['sma_slow']) &
-            (signals['sma_fast'].shift(1) <= signals['sma_slow'].shift(1))
-        )
+        golden_cross = (sma_fast > sma_slow) & (prev_fast <= prev_slow)
         signals.loc[golden_cross, 'signal'] = 1
 
         # Death cross: SELL
-        death_cross = (
-            (signals['sma_fast'] < signals['sma_slow']) &
-            (signals['sma_fast'].shift(1) >= signals['sma_slow'].shift(1))
-        )
+        death_cross = (sma_fast < sma_slow) & (prev_fast >= prev_slow)
         signals.loc[death_cross, 'signal'] = -1
 
         return signals
 
+    @staticmethod
+    def _new_trade_log() -> TradeLog:
+        """Columnar closed-trade log (trade_log.TradeLog) instead of one dict per trade"""
+        return TradeLog(CLOSED_TRADE_FIELDS, categories={'exit_reason': EXIT_REASONS})
+
+    def _reset(self):
+        """Reset account state before a run"""
+        self.cash = self.initial_capital
+        self.position = 0
+        self.equity_curve = np.empty(0)
+        self.trades = self._new_trade_log()
+        self.entry_price = 0
+        self.stop_loss = 0
+
+    def _close_position(self, price: float, commission: float, reason: str):
+        self.cash += self.position * price * (1 - commission)
+        self.trades.append(
+            entry_price=self.entry_price,
+            exit_price=price,
+            shares=self.position,
+            pnl=(price - self.entry_price) * self.position,
+            exit_reason=reason
+        )
+        self.position = 0
+
+    def _on_bar(
+        self,
+        current_price: float,
+        atr: float,
+        sma_fast: float,
+        signal: int,
+        commission: float
+    ) -> float:
+        """
+        Process one bar (shared by backtest and backtest_stream)
+
+        Returns:
+        - equity after the bar
+        """
+        if np.isnan(atr) or np.isnan(sma_fast):
+            # Skip rows with missing indicators
+            return self.cash + self.position * current_price
+
+        current_equity = self.cash + self.position * current_price
+
+        # Check stop-loss if in position
+        if self.position > 0 and current_price <= self.stop_loss:
+            # Stop-loss triggered
+            self._close_position(current_price, commission, 'stop_loss')
+
+        # Process signals
+        if signal == 1 and self.position == 0:
+            # BUY signal
+            position_size = self.calculate_position_size(
+                current_price,
+                atr,
+                current_equity
+            )
+
+            if position_size > 0:
+                cost = position_size * current_price * (1 + commission)
+                if cost <= self.cash:
+                    self.position = position_size
+                    self.cash -= cost
+                    self.entry_price = current_price
+                    self.stop_loss = current_price - self.atr_multiplier * atr
+
+        elif signal == -1 and self.position > 0:
+            # SELL signal
+            self._close_position(current_price, commission, 'signal')
+
+        return self.cash + self.position * current_price
+
     def backtest(
         self,
         data: pd.DataFrame,
@@ -185,83 +257,42 @@ class HardCodedAdaptiveStrategy:
         signals = self.generate_signals(data)
 
         # Initialize
-        self.cash = self.initial_capital
-        self.position = 0
-        self.equity_curve = []
-        self.trades = []
-        entry_price = 0
-        stop_loss = 0
-
-        for i in range(len(signals)):
-            row = signals.iloc[i]
-
-            if pd.isna(row['atr']) or pd.isna(row['sma_fast']):
-                # Skip rows with missing indicators
-                equity = self.cash + self.position * row['close']
-                self.equity_curve.append(equity)
-                continue
-
-            current_price = row['close']
-            current_equity = self.cash + self.position * current_price
-
-            # Check stop-loss if in position
-            if self.position > 0 and current_price <= stop_loss:
-                # Stop-loss triggered
-                self.cash += self.position * current_price * (1 - commission)
-                self.trades.append({
-                    'entry_price': entry_price,
-                    'exit_price': current_price,
-                    'shares': self.position,
-                    'pnl': (current_price - entry_price) * self.position,
-                    'exit_reason': 'stop_loss'
-                })
-                self.position = 0
-
-            # Process signals
-            if row['signal'] == 1 and self.position == 0:
-                # BUY signal
-                position_size = self.calculate_position_size(
-                    current_price,
-                    row['atr'],
-                    current_equity
-                )
-
-                if position_size > 0:
-                    cost = position_size * current_price * (1 + commission)
-                    if cost <= self.cash:
-                        self.position = position_size
-                        self.cash -= cost
-                        entry_price = current_price
-                        stop_loss = current_price - self.atr_multiplier * row['atr']
-
-            elif row['signal'] == -1 and self.position > 0:
-                # SELL signal
-                self.cash += self.position * current_price * (1 - commission)
-                self.trades.append({
-                    'entry_price': entry_price,
-                    'exit_price': current_price,
-                    'shares': self.position,
-                    'pnl': (current_price - entry_price) * self.position,
-                    'exit_reason': 'signal'
-                })
-                self.position = 0
-
-            # Record equity
-            equity = self.cash + self.position * current_price
-            self.equity_curve.append(equity)
+        self._reset()
+
+        # Same bar logic as _on_bar, executed by the array engine (event bars only)
+        rules = resolve_rules(
+            'hard_coded',
+            sma_fast=self.sma_fast, sma_slow=self.sma_slow, atr_period=self.atr_period,
+            atr_multiplier=self.atr_multiplier, risk_percent=self.risk_percent
+        )
+        features = {name: signals[name] for name in ('sma_fast', 'sma_slow', 'atr')}
+        sim = simulate(signals, rules, self.initial_capital, commission, features)
+
+        self.cash, self.position = sim['cash'], sim['position']
+        self.equity_curve = sim['equity']
+        orders = sim['trades']
+        if orders:
+            kind = np.array([order['type'] for order in orders])
+            price = np.array([order['price'] for order in orders], dtype=np.float64)
+            size = np.array([order['size'] for order in orders], dtype=np.int64)
+            # Each exit closes the position opened by the latest buy before it
+            buy = kind == 'buy'
+            last_buy = np.maximum.accumulate(np.where(buy, np.arange(len(orders)), -1))
+            exits = np.flatnonzero(~buy)
+            entry_price = np.where(last_buy[exits] >= 0, price[np.maximum(last_buy[exits], 0)], self.entry_price)
+            self.trades.extend(
+                entry_price=entry_price,
+                exit_price=price[exits],
+                shares=size[exits],
+                pnl=(price[exits] - entry_price) * size[exits],
+                exit_reason=np.where(kind[exits] == 'stop', 'stop_loss', 'signal')
+            )
+            if buy.any():
+                self.entry_price = price[np.flatnonzero(buy)[-1]]
 
         # Close any remaining position
         if self.position > 0:
-            final_price = signals.iloc[-1]['close']
-            self.cash += self.position * final_price * (1 - commission)
-            self.trades.append({
-                'entry_price': entry_price,
-                'exit_price': final_price,
-                'shares': self.position,
-                'pnl': (final_price - entry_price) * self.position,
-                'exit_reason': 'end_of_period'
-            })
-            self.position = 0
+            self._close_position(signals.iloc[-1]['close'], commission, 'end_of_period')
 
         # Calculate metrics
         total_return = (self.cash - self.initial_capital) / self.initial_capital
@@ -277,8 +308,7 @@ class HardCodedAdaptiveStrategy:
         max_drawdown = drawdown.min()
 
         # Win rate
-        profitable_trades = [t for t in self.trades if t['pnl'] > 0]
-        win_rate = len(profitable_trades) / len(self.trades) if self.trades else 0
+        win_rate = np.mean(self.trades['pnl'] > 0) if len(self.trades) else 0
 
         return {
             'total_return': total_return * 100,  # As percentage
@@ -291,6 +321,59 @@ class HardCodedAdaptiveStrategy:
             'equity_curve': self.equity_curve
         }
 
+    def backtest_stream(
+        self,
+        chunks: Iterable[pd.DataFrame],
+        commission: float = 0.001,
+        periods_per_year: int = 252
+    ) -> Dict:
+        """
+        Run the same backtest over a stream of OHLCV chunks (e.g. minute bars)
+
+        Memory is bounded by the chunk size: indicators are continued chunk by
+        chunk from the carried rolling state (RollingCarry), so trades and the
+        final equity equal backtest() for any chunk size, and the equity curve
+        is summarized online instead of being stored.
+
+        Parameters:
+        - chunks: iterable of ascending OHLCV DataFrames (intraday_stream.iter_bars)
+        - periods_per_year: bars per year for Sharpe annualization
+          (252 for daily bars, 240 * 252 for A-share 1-minute bars)
+
+        Returns the same metrics as backtest(), without 'equity_curve'.
+        """
+        carry = RollingCarry()
+        stats = StreamStats()
+        self._reset()
+        last_price = None
+
+        for chunk in chunks:
+            signals = self.generate_signals(chunk, carry)
+
+            for close, atr, sma_fast, signal in zip(
+                    signals['close'].values, signals['atr'].values,
+                    signals['sma_fast'].values, signals['signal'].values):
+                stats.update(self._on_bar(close, atr, sma_fast, signal, commission))
+            last_price = signals['close'].values[-1]
+
+        # Close any remaining position
+        if self.position > 0:
+            self._close_position(last_price, commission, 'end_of_period')
+
+        total_return = (self.cash - self.initial_capital) / self.initial_capital
+        win_rate = np.mean(self.trades['pnl'] > 0) if len(self.trades) else 0
+
+        return {
+            'total_return': total_return * 100,  # As percentage
+            'sharpe_ratio': stats.sharpe(periods_per_year),
+            'max_drawdown': stats.max_drawdown * 100,
+            'num_trades': len(self.trades),
+            'win_rate': win_rate * 100,
+            'final_equity': self.cash,
+            'trades': self.trades,
+            'bars': stats.count + (stats.last is not None)
+        }
+
 
 def run_comparison_experiment(
     data_us: pd.DataFrame,
@@ -24,7 +24,9 @@ from datetime import datetime
 
 # Import hard-coded strategy
 sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from hard_coded_adaptive_baseline import HardCodedAdaptiveStrategy, run_comparison_experiment
+from equity_recorder import save_records
 
 
 def load_market_data(data_path: str, market: str = 'SPY') -> pd.DataFrame:
@@ -215,10 +217,24 @@ def main():
         }
     }
 
+    # Per-trade logs and equity curves go to a binary .npz (trade_log.load_trade_logs reads them back);
+    # the JSON keeps only the summary metrics
+    records_file = output_file.replace('.json', '_records.npz')
+    records = {}
+    for name in ('us_hard_coded', 'china_hard_coded'):
+        if name in results:
+            run = results[name]
+            records[name] = {'equity': run.pop('equity_curve'), **run.pop('trades').to_record()}
+    if records:
+        save_records(records_file, records)
+        results['metadata']['records_file'] = records_file
+
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(results, f, indent=2, ensure_ascii=False)
 
     print(f"  ✓ Results saved: {os.path.getsize(output_file)/1024:.1f} KB")
+    if records:
+        print(f"  ✓ Trades/equity saved: {records_file} ({os.path.getsize(records_file)/1024:.1f} KB)")
 
     print("\n" + "=" * 80)
     print("✅ Experiment Complete")
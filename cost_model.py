@@ -0,0 +1,621 @@
+#!/usr/bin/env python3
+"""
+交易成本模型: A股成交规则与成交序列重定价 (Cost Model: A-share Fill Rules & Trade-list Repricing)
+============================================================================================
+
+功能: transaction_cost_sensitivity 对每个 费率 × 资产 × 时期 都完整重跑一次backtrader, 但对
+      LLM_Adaptive 这类策略, 信号与成本无关, 成本只影响成交价和 (通过权益) 仓位。本模块:
+
+    1. record_gross: 用 adaptive_engine (与backtrader逐笔一致) 在零成本下跑一次, 记录毛成交序列
+    2. reprice: 对 S 个成本方案 (佣金 / 印花税(卖出) / 滑点) 一次遍历全部成交, 状态为 (S,) 数组,
+       逐笔复刻 BackBroker 的现金算术 (开仓扣 size*price 与佣金, 平仓返还成本价 + pnl 再扣佣金),
+       权益曲线 (S, T) 由成交阶梯向量化重建
+    3. 路径检查: 某方案下若任一处与毛成交序列的路径不同, 该方案标记为不可重定价:
+         - 仓位与权益相关 (2%风险仓位): 按该方案的现金重新计算每次入场的数量, 必须与记录相同
+         - 资金检查: 提交时 (创建K线收盘价) 与成交时的现金检查都必须通过 (毛序列中不能有Margin订单)
+         - 滑点改变成交价 → 入场价 → 止损线: 每段持仓内按该方案入场价重算的止损信号必须与记录相同
+         - 整手: 入场数量必须已是整手; 涨跌停/停牌: 每次成交所在K线在该方案的掩码下必须能成交
+    4. sweep: 可重定价的方案直接给出结果, 其余自动回退到完整重新模拟 (resimulate): 数组引擎
+       simulate(cost=...) 与 make_broker 的backtrader逐笔一致; 只有数组引擎不支持的情况 (涨跌停延迟成交
+       遇到在 Accepted 时即清空 self.order 的策略) 才用backtrader
+
+    A股成交规则 (ashare_schedule): 卖出印花税 / 每笔最低佣金 / 买入100股整手 / 涨跌停与停牌。
+    涨跌停按 开盘价 / 前收盘 - 1 与板块涨跌幅 (limit_pct) 比较, 由OHLCV一次性预计算为逐K线掩码
+    (fill_masks, 形状 (T,) 或 (S, T)), 数组引擎 (portfolio_engine) 与backtrader (PriceLimitFiller)
+    使用同一组掩码; 费用统一由 order_fees 计算 (AShareCommission 也调用它), 两边逐位一致。
+    印花税在一个方案内为常数 (backtrader的 CommInfo 不知道成交日期): 2023-08-28 起减半为0.05%,
+    ashare_schedule(as_of=...) 按回测区间的起始日期取税率, 跨越该日期的区间需要分段或显式传 stamp_duty
+
+    成本口径与backtrader一致: 佣金 abs(size) * commission * price (不低于最低佣金), 卖出另加
+    abs(size) * stamp_duty * price; 滑点 set_slippage_perc(slip_open=True): 买入 open*(1+s) /
+    卖出 open*(1-s), 超出当根K线高低点时取高低点
+
+使用方法:
+    python cost_model.py report                     # 重定价 vs backtrader完整重跑: 一致性与加速比
+    python cost_model.py report --stamp-duty 0.001 --slippage 0.0005
+    python cost_model.py report --commission 0.00025 --stamp-duty 0.001 --min-commission 5 --lot-size 100 --price-limit board
+
+    from cost_model import schedule, sweep
+    results = sweep(df, 'llm_adaptive', [schedule(c) for c in (0.001, 0.0015, 0.002, 0.003)],
+                    strategy_class=LLM_Adaptive)
+    results[0]['final_value'], results[0]['method']    # 'repriced' / 'resimulated'
+
+    from cost_model import ashare_schedule, make_broker, schedule_masks
+    cost = ashare_schedule()
+    cerebro.broker = make_broker(cost, 100000, schedule_masks(arrays, cost, 'stock_sz_300059', dates))
+"""
+
+import itertools
+import sys
+import time
+from pathlib import Path
+
+import backtrader as bt
+import numpy as np
+
+from adaptive_engine import (_reference_strategies, bt_max_drawdown, bt_sharpe, entry_size, resolve_rules,
+                             simulate, stop_mask, strategy_start)
+
+
+# =============================================================================
+# 成本方案
+# =============================================================================
+
+# 涨跌停判定的相对容差: 涨停价按 round(前收盘 × 1.1, 2) 取整, 前复权价格上开盘/前收盘 - 1 略低于10%
+LIMIT_TOLERANCE = 0.002
+
+# 创业板注册制改革后 (2020-08-24 起) 涨跌幅限制为20%
+CHINEXT_REFORM = np.datetime64('2020-08-24')
+
+# 证券交易印花税减半 (2023-08-28 起卖出 0.1% → 0.05%)
+STAMP_DUTY_CUT = np.datetime64('2023-08-28')
+
+
+def schedule(commission=0.0015, stamp_duty=0.0, slippage=0.0, min_commission=0.0, lot_size=1, price_limit=None):
+    """
+    一个成本/成交方案
+
+    Args:
+        commission: 佣金率 (双边)
+        stamp_duty: 印花税率 (仅卖出)
+        slippage: 滑点比例 (开盘成交价的不利方向)
+        min_commission: 每笔最低佣金 (不含印花税)
+        lot_size: 买入整手股数 (向下取整, 不足一手的买单被拒绝; 卖出不限)
+        price_limit: 涨跌停: None 不限制 / 比例 (如0.1) / 'board' 按板块与日期 (见 limit_pct)
+    """
+    return {'commission': commission, 'stamp_duty': stamp_duty, 'slippage': slippage,
+            'min_commission': min_commission, 'lot_size': lot_size, 'price_limit': price_limit}
+
+
+def ashare_schedule(as_of=None, **overrides):
+    """
+    A股常用口径: 万2.5佣金最低5元, 卖出印花税, 100股一手, 按板块涨跌停
+
+    印花税为常数: 默认0.1%; as_of (回测区间起始日期) 不早于 2023-08-28 时为0.05%;
+    overrides 中的 stamp_duty 优先
+    """
+    stamp_duty = 0.0005 if as_of is not None and np.datetime64(as_of, 'D') >= STAMP_DUTY_CUT else 0.001
+    return schedule(**dict({'commission': 0.00025, 'stamp_duty': stamp_duty, 'min_commission': 5.0,
+                            'lot_size': 100, 'price_limit': 'board'}, **overrides))
+
+
+def _schedule_arrays(schedules):
+    keys = ('commission', 'stamp_duty', 'slippage', 'min_commission')
+    return {k: np.array([float(s.get(k, 0.0)) for s in schedules]) for k in keys}
+
+
+def order_fees(size, price, commission, stamp_duty=0.0, min_commission=0.0):
+    """
+    一笔成交 (或其开仓/平仓部分) 的费用, 与 AShareCommission 逐位一致; 参数可为同形状数组
+
+    佣金 abs(size) * commission * price (不低于 min_commission), 卖出 (size < 0) 另加印花税
+    """
+    fee = np.abs(size) * commission * price
+    fee = np.where(min_commission > 0, np.maximum(fee, min_commission), fee)
+    return fee + np.where(np.asarray(size) < 0, np.abs(size) * stamp_duty * price, 0.0)
+
+
+def round_lot(size, lot_size):
+    """买入数量向下取整到整手"""
+    return (np.asarray(size) // lot_size) * lot_size if lot_size > 1 else size
+
+
+# =============================================================================
+# A股成交规则: 逐K线掩码 (由OHLCV一次性预计算)
+# =============================================================================
+
+def limit_pct(symbol, dates):
+    """
+    每根K线的涨跌幅限制 (T,): 科创板20%, 创业板2020-08-24起20%, 北交所30%, 其余A股10%,
+    指数与非A股为 inf (不限制); ST股的5%无法从行情数据判断, 不在此处理
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    code = str(symbol).replace('stock_', '')
+    if not code.startswith(('sh_', 'sz_', 'bj_')):
+        return np.full(len(dates), np.inf)
+    if code.startswith('sh_688'):
+        return np.full(len(dates), 0.2)
+    if code.startswith('bj_'):
+        return np.full(len(dates), 0.3)
+    if code.startswith('sz_300'):
+        return np.where(dates >= CHINEXT_REFORM, 0.2, 0.1)
+    return np.full(len(dates), 0.1)
+
+
+def previous_close(close):
+    """沿最后一维的前收盘价 (第一根K线为NaN); 有停牌缺口时传入前向填充后的收盘价"""
+    close = np.asarray(close, dtype=np.float64)
+    return np.concatenate((np.full(close.shape[:-1] + (1,), np.nan), close[..., :-1]), axis=-1)
+
+
+def fill_masks(open_, prev_close, limit=np.inf, volume=None, tolerance=LIMIT_TOLERANCE):
+    """
+    开盘市价单能否成交 (数组沿最后一维为时间, 可为 (T,) 或 (S, T))
+
+    - 开盘即涨停 (open / 前收盘 - 1 >= limit - tolerance): 买单无法成交
+    - 开盘即跌停: 卖单无法成交
+    - 成交量为0 (停牌日以前收盘价填充的K线): 买卖都无法成交
+
+    Returns:
+        (can_buy, can_sell): bool数组; 无法成交的订单保留到下一根K线 (与停牌的处理相同)
+    """
+    prev_close = np.where(np.asarray(prev_close) > 0, prev_close, np.nan)  # 上市首日无前收盘
+    with np.errstate(invalid='ignore', divide='ignore'):
+        change = np.asarray(open_, dtype=np.float64) / prev_close - 1.0
+        can_buy = ~(change >= limit - tolerance)
+        can_sell = ~(change <= -(limit - tolerance))
+    if volume is not None:
+        traded = np.asarray(volume) > 0
+        can_buy &= traded
+        can_sell &= traded
+    return can_buy, can_sell
+
+
+def schedule_masks(arrays, cost, symbol=None, dates=None):
+    """一个方案在单标的数据上的 (can_buy, can_sell); 不限制涨跌停时只排除成交量为0的K线"""
+    limit = cost.get('price_limit')
+    if limit == 'board':
+        limit = limit_pct(symbol, dates)
+    elif limit is None:
+        limit = np.inf
+    return fill_masks(arrays['open'], previous_close(arrays['close']), limit,
+                      arrays.get('volume') if limit is not np.inf else None)
+
+
+# =============================================================================
+# backtrader适配: 与数组引擎共用同一方案
+# =============================================================================
+
+class AShareCommission(bt.CommInfoBase):
+    """股票类按比例佣金 (最低佣金), 卖出另加印花税; 默认参数时与 setcommission(commission=...) 相同"""
+
+    params = (
+        ('stamp_duty', 0.0),
+        ('min_commission', 0.0),
+        ('stocklike', True),
+        ('commtype', bt.CommInfoBase.COMM_PERC),
+        ('percabs', True),
+    )
+
+    def _getcommission(self, size, price, pseudoexec):
+        return float(order_fees(size, price, self.p.commission, self.p.stamp_duty, self.p.min_commission))
+
+
+class PriceLimitFiller:
+    """BackBroker filler: 按预计算掩码决定开盘能否成交, 不能成交时返回0 (订单保留到下一根K线)"""
+
+    def __init__(self, can_buy, can_sell):
+        self.can_buy, self.can_sell = can_buy, can_sell
+
+    def __call__(self, order, price, ago):
+        i = len(order.data) - 1
+        allowed = self.can_buy[i] if order.isbuy() else self.can_sell[i]
+        return abs(order.executed.remsize) if allowed else 0
+
+
+class AShareBroker(bt.brokers.BackBroker):
+    """买单数量向下取整到整手, 不足一手的买单直接拒绝 (Rejected)"""
+
+    params = (('lot_size', 1),)
+
+    def buy(self, owner, data, size, *args, **kwargs):
+        lots = int(round_lot(size, self.p.lot_size))
+        if lots > 0:
+            return super().buy(owner, data, lots, *args, **kwargs)
+        order = bt.BuyOrder(owner=owner, data=data, size=size, exectype=kwargs.get('exectype'))
+        order.reject(self)
+        self.notify(order)
+        return order
+
+
+def make_broker(cost, initial_cash=100000, masks=None):
+    """按方案配置的backtrader broker (cerebro.broker = make_broker(...)); masks 为单标的 (can_buy, can_sell)"""
+    broker = AShareBroker(lot_size=cost.get('lot_size', 1), filler=PriceLimitFiller(*masks) if masks else None)
+    broker.setcash(initial_cash)
+    broker.addcommissioninfo(AShareCommission(commission=cost['commission'], stamp_duty=cost['stamp_duty'],
+                                              min_commission=cost.get('min_commission', 0.0)))
+    if cost['slippage']:
+        broker.set_slippage_perc(cost['slippage'], slip_open=True, slip_match=True, slip_out=False)
+    return broker
+
+
+# =============================================================================
+# 毛成交序列
+# =============================================================================
+
+def _arrays(df):
+    columns = {c.lower(): c for c in df.columns}
+    return {f: df[columns[f]].to_numpy(dtype=np.float64)
+            for f in ('open', 'high', 'low', 'close', 'volume') if f in columns}
+
+
+def record_gross(df, preset='llm_adaptive', initial_cash=100000, symbol=None, **overrides):
+    """
+    零成本运行一次, 记录毛成交序列 (symbol 用于 price_limit='board' 的涨跌幅)
+
+    Returns:
+        dict: rules / arrays / dates / signals / groups [(成交K线, [size, ...])] / initial_cash /
+              repriceable (False 时全部方案都需要重新模拟) / reason
+    """
+    rules = resolve_rules(preset, **overrides)
+    gross = {'rules': rules, 'preset': preset, 'overrides': overrides, 'initial_cash': initial_cash,
+             'symbol': symbol, 'dates': df.index, 'arrays': _arrays(df), 'groups': [], 'repriceable': True, 'reason': None}
+    if rules['fill'] != 'next_open':
+        gross.update(repriceable=False, reason='只支持 next_open 口径')
+        return gross
+
+    sim = simulate(df, rules, initial_cash, commission=0.0)
+    gross['signals'] = sim['signals']
+    gross['closed_trades'] = sim['closed_trades']
+    for order in sim['orders']:
+        if order['status'] != 'Completed':
+            gross.update(repriceable=False, reason='毛成交序列中有资金不足 (Margin) 的订单')
+            return gross
+        bar = int(order['bar'])
+        if not gross['groups'] or gross['groups'][-1][0] != bar:
+            gross['groups'].append((bar, []))
+        gross['groups'][-1][1].append(int(order['size']))
+    return gross
+
+
+# =============================================================================
+# 重定价
+# =============================================================================
+
+def _split(size, delta):
+    """bt.Position.update 的 (opened, closed); 只依赖数量, 与价格无关"""
+    new_size = size + delta
+    if not new_size:
+        return 0, delta
+    if not size or (size > 0) == (delta > 0):
+        return delta, 0
+    if (new_size > 0) == (size > 0):
+        return 0, delta
+    return new_size, -size
+
+
+def _position_price(size, price, delta, fill_price):
+    """bt.Position.update 之后的持仓均价 ((S,) 数组)"""
+    new_size = size + delta
+    if not new_size:
+        return np.zeros_like(fill_price)
+    if not size or (new_size > 0) != (size > 0):
+        return fill_price
+    if (size > 0) == (delta > 0):
+        return (price * size + delta * fill_price) / new_size
+    return price
+
+
+def _fill_prices(arrays, bar, delta, slippage):
+    """BackBroker._slip_up / _slip_down (slip_match=True, slip_out=False)"""
+    price = arrays['open'][bar]
+    if delta > 0:
+        slipped = price * (1 + slippage)
+        return np.where(slippage == 0, price, np.where(slipped <= arrays['high'][bar], slipped, arrays['high'][bar]))
+    slipped = price * (1 - slippage)
+    return np.where(slippage == 0, price, np.where(slipped >= arrays['low'][bar], slipped, arrays['low'][bar]))
+
+
+def reprice(gross, schedules):
+    """
+    在 S 个成本方案下重定价毛成交序列
+
+    Returns:
+        dict: exact (S,) bool 路径与毛序列相同 (结果可用) / reason (S,) 不可重定价的原因 /
+              equity (S, T) / final_value / sharpe / max_drawdown (S,) / closed_trades
+    """
+    S = len(schedules)
+    cost = _schedule_arrays(schedules)
+    exact = np.full(S, gross['repriceable'])
+    reason = [None if gross['repriceable'] else gross['reason']] * S
+    if not gross['repriceable']:
+        return {'exact': exact, 'reason': reason}
+
+    rules, arrays = gross['rules'], gross['arrays']
+    close, atr = arrays['close'], gross['signals']['atr']
+    entries = np.flatnonzero(gross['signals']['entry'])
+    n = len(close)
+    track_fill = rules['entry_price'] == 'fill'
+
+    def fail(mask, why):
+        for s in np.flatnonzero(mask & exact):
+            reason[s] = why
+        exact[mask] = False
+
+    def fees(part, price):
+        return order_fees(part, price, cost['commission'], cost['stamp_duty'], cost['min_commission'])
+
+    # 整手: 入场数量必须已是整手; 涨跌停/停牌: 毛序列的每次成交在该方案下都必须能成交
+    lots = np.array([int(sc.get('lot_size', 1)) for sc in schedules])
+    masks = {}
+    for sc in schedules:
+        key = repr(sc.get('price_limit'))
+        if sc.get('price_limit') is not None and key not in masks:
+            masks[key] = schedule_masks(arrays, sc, gross['symbol'], gross['dates'])
+    limit_keys = [repr(sc.get('price_limit')) for sc in schedules]
+
+    def sizes_at(k, cash):
+        # 空仓时 broker.getvalue() == cash
+        atr_k = atr[k] if atr is not None else None
+        return np.array([entry_size(rules, c + 0.0, atr_k, close[k]) for c in cash])
+
+    cash = np.full(S, float(gross['initial_cash']))
+    price = np.zeros(S)
+    size = 0
+    entry_ref = gross_ref = None
+    flat_from = strategy_start(rules)
+    bars, cash_steps, price_steps, size_steps = [0], [cash.copy()], [price.copy()], [0]
+    groups = gross['groups']
+
+    for i, (bar, deltas) in enumerate(groups):
+        k = bar - 1  # 订单在上一根K线收盘时创建
+        if not size:
+            # 毛序列中因数量为0而跳过的入场信号, 在该方案下也必须跳过; 本次入场数量必须相同
+            for j in entries[np.searchsorted(entries, flat_from):np.searchsorted(entries, k)]:
+                fail(sizes_at(j, cash) > 0, '仓位随权益变化 (该方案下多出入场)')
+            fail(sizes_at(k, cash) != deltas[0], '仓位随权益变化 (该方案下入场数量不同)')
+            fail(deltas[0] % lots != 0, '入场数量不是整手')
+            entry_ref = np.full(S, close[k])
+            gross_ref = close[k]
+
+        # check_submitted: 克隆持仓按创建K线收盘价伪成交, 资金<0为Margin
+        p_cash, p_size = cash, size
+        for delta in deltas:
+            opened, closed = _split(p_size, delta)
+            if closed:
+                p_cash = p_cash + (-closed) * close[k]
+                p_cash = p_cash - fees(closed, close[k])
+            if opened:
+                p_cash = p_cash - opened * close[k]
+                p_cash = p_cash - fees(opened, close[k])
+            fail(p_cash < 0.0, '资金不足 (Margin)')
+            p_size += delta
+
+        for key, (can_buy, can_sell) in masks.items():
+            if not all(can_buy[bar] if delta > 0 else can_sell[bar] for delta in deltas):
+                fail(np.array([lk == key for lk in limit_keys]), '涨跌停/停牌K线无法成交')
+
+        for delta in deltas:
+            fill_price = _fill_prices(arrays, bar, delta, cost['slippage'])
+            opened, closed = _split(size, delta)
+            if closed:
+                pnl = (-closed) * (fill_price - price) * 1.0
+                cash = cash + ((-closed) * price + pnl)
+                cash = cash - fees(closed, fill_price)
+            if opened:
+                trial = cash - opened * fill_price
+                trial = trial - fees(opened, fill_price)
+                fail(trial < 0.0, '资金不足 (Margin)')
+                cash = trial
+            price = _position_price(size, price, delta, fill_price)
+            size += delta
+            if delta > 0 and track_fill:
+                entry_ref = (0.0 + delta * fill_price) / delta
+                gross_ref = (0.0 + delta * arrays['open'][bar]) / delta
+
+        # 滑点改变入场价 → 止损线: 本段持仓内 (直到下一次下单的K线) 的止损信号必须与毛序列相同
+        last = groups[i + 1][0] - 1 if i + 1 < len(groups) else n - 1
+        if size and rules['stop'] is not None and np.any(entry_ref != gross_ref):
+            expected = stop_mask(rules, close, atr, gross_ref, size)(bar, last + 1)
+            changed = np.array([not np.array_equal(stop_mask(rules, close, atr, ref, size)(bar, last + 1), expected)
+                                for ref in entry_ref])
+            fail(changed, '滑点改变入场价, 止损信号不同')
+        if not size:
+            flat_from = bar
+
+        bars.append(bar)
+        cash_steps.append(cash.copy())
+        price_steps.append(price.copy())
+        size_steps.append(size)
+
+    if not size:
+        for j in entries[np.searchsorted(entries, flat_from):]:
+            if j + 1 < n:
+                fail(sizes_at(j, cash) > 0, '仓位随权益变化 (该方案下多出入场)')
+
+    # 权益 (S, T): adaptive_engine._equity 的 next_open 口径
+    at = np.searchsorted(np.array(bars), np.arange(n), side='right') - 1
+    cash_t = np.array(cash_steps).T[:, at]
+    price_t = np.array(price_steps).T[:, at]
+    size_t = np.array(size_steps, dtype=np.float64)[at]
+    value = size_t * close
+    unrealized = size_t * (close - price_t) * 1.0
+    long_value = (value - unrealized) / 1.0 + unrealized
+    equity = cash_t + np.where(value > 0, long_value, value)
+
+    initial_cash = gross['initial_cash']
+    return {
+        'exact': exact,
+        'reason': reason,
+        'equity': equity,
+        'final_value': equity[:, -1],
+        'sharpe': [bt_sharpe(gross['dates'], row, initial_cash) for row in equity],
+        'max_drawdown': np.array([bt_max_drawdown(row) for row in equity]),
+        'closed_trades': gross['closed_trades'],
+    }
+
+
+# =============================================================================
+# 完整重新模拟 (回退)
+# =============================================================================
+
+def _summary(final_value, sharpe, max_drawdown, closed_trades, initial_cash):
+    return {
+        'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
+        'final_value': round(final_value, 2),
+        'sharpe_ratio': round(sharpe or 0, 3),
+        'max_drawdown_pct': round(max_drawdown, 2),
+        'total_trades': closed_trades,
+        'raw_final_value': float(final_value),
+    }
+
+
+def run_backtrader(df, strategy_class, cost, initial_cash=100000, symbol=None, **strategy_kwargs):
+    """backtrader完整回测: make_broker (佣金/印花税/最低佣金/整手/涨跌停) + 开盘滑点"""
+    from equity_recorder import RECORDER
+    from perf_metrics import bt_summary
+
+    cerebro = bt.Cerebro(stdstats=False)
+    masks = schedule_masks(_arrays(df), cost, symbol, df.index) if cost.get('price_limit') is not None else None
+    cerebro.broker = make_broker(cost, initial_cash, masks)
+    cerebro.adddata(bt.feeds.PandasData(dataname=df, open='open', high='high', low='low', close='close',
+                                        volume='volume', openinterest=-1))
+    cerebro.addstrategy(strategy_class, **strategy_kwargs)
+    cerebro.addanalyzer(RECORDER[1], _name=RECORDER[0])
+    strat = cerebro.run()[0]
+    record = strat.analyzers.getbyname(RECORDER[0]).get_analysis()
+    s = bt_summary(record)
+    return dict(_summary(s['final_value'], s['sharpe_ratio'], s['max_drawdown_pct'], s['total_trades'], initial_cash),
+                equity=record['equity'])
+
+
+def resimulate(df, preset, cost, initial_cash=100000, strategy_class=None, symbol=None, **overrides):
+    """
+    完整重新模拟一个方案: 数组引擎 (与 make_broker 的backtrader逐笔一致);
+    数组引擎不支持时用backtrader (overrides 按 adaptive_engine 的参数映射转为策略参数名)
+    """
+    try:
+        sim = simulate(df, resolve_rules(preset, **overrides), initial_cash, cost['commission'],
+                       cost=cost, symbol=symbol)
+    except ValueError:
+        if strategy_class is None:
+            raise
+    else:
+        equity = sim['equity']
+        return dict(_summary(float(equity[-1]), bt_sharpe(df.index, equity, initial_cash), bt_max_drawdown(equity),
+                             sim['closed_trades'], initial_cash), equity=equity)
+    names = _reference_strategies()[preset][1]
+    return run_backtrader(df, strategy_class, cost, initial_cash, symbol,
+                          **{names[k]: v for k, v in overrides.items()})
+
+
+def sweep(df, preset, schedules, initial_cash=100000, strategy_class=None, symbol=None, **overrides):
+    """
+    全部成本方案的结果: 可重定价的方案来自一次重定价, 其余完整重新模拟
+
+    Returns:
+        list: 每个方案一个dict (returns_pct / final_value / sharpe_ratio / max_drawdown_pct /
+              total_trades / method / reason / equity (T,) 权益曲线)
+    """
+    gross = record_gross(df, preset, initial_cash, symbol, **overrides)
+    priced = reprice(gross, schedules)
+    results = []
+    for s, cost in enumerate(schedules):
+        if priced['exact'][s]:
+            r = _summary(float(priced['final_value'][s]), priced['sharpe'][s], float(priced['max_drawdown'][s]),
+                         priced['closed_trades'], initial_cash)
+            results.append(dict(r, method='repriced', reason=None, equity=priced['equity'][s]))
+        else:
+            r = resimulate(df, preset, cost, initial_cash, strategy_class, symbol, **overrides)
+            results.append(dict(r, method='resimulated', reason=priced['reason'][s]))
+    return results
+
+
+# =============================================================================
+# 报告: 重定价 vs backtrader 完整重跑
+# =============================================================================
+
+def report(schedules, assets=None, periods=None, data_dir=None):
+    """transaction_cost_sensitivity 的 资产 × 时期 网格: 逐方案对比 sweep 与 backtrader 完整重跑"""
+    from data_quality import load_clean_history
+    from price_store import DATA_DIR
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent / 'code'))
+    import transaction_cost_sensitivity as tcs
+
+    assets = assets or tcs.ASSETS
+    periods = periods or tcs.PERIODS
+    keys = ('returns_pct', 'final_value', 'sharpe_ratio', 'max_drawdown_pct', 'total_trades')
+    rows = []
+    sweep_seconds = bt_seconds = 0.0
+    for asset_name, info in assets.items():
+        path = Path(data_dir or DATA_DIR) / Path(info['file']).name
+        history = load_clean_history(path)
+        for period_name, dates in periods.items():
+            df = history.window(dates['start'], dates['end'])
+            if len(df) < 50:
+                continue
+            t0 = time.perf_counter()
+            ours = sweep(df, 'llm_adaptive', schedules, strategy_class=tcs.LLM_Adaptive, symbol=path.stem)
+            sweep_seconds += time.perf_counter() - t0
+
+            for cost, r in zip(schedules, ours):
+                t0 = time.perf_counter()
+                ref = run_backtrader(df, tcs.LLM_Adaptive, cost, symbol=path.stem)
+                bt_seconds += time.perf_counter() - t0
+                rows.append({'asset': asset_name, 'period': period_name, **cost, 'method': r['method'],
+                             'reason': r['reason'], 'same': all(r[k] == ref[k] for k in keys),
+                             'bitwise': r['raw_final_value'] == ref['raw_final_value']})
+    return rows, sweep_seconds, bt_seconds
+
+
+# =============================================================================
+# 命令行
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='交易成本模型: 重定价 vs 完整重跑 报告')
+    parser.add_argument('command', choices=['report'])
+    parser.add_argument('--commission', type=float, action='append',
+                        help='佣金率 (可重复, 默认 transaction_cost_sensitivity 的4档)')
+    parser.add_argument('--stamp-duty', type=float, action='append', help='卖出印花税率 (可重复, 默认0)')
+    parser.add_argument('--slippage', type=float, action='append', help='滑点比例 (可重复, 默认0)')
+    parser.add_argument('--min-commission', type=float, action='append', help='每笔最低佣金 (可重复, 默认0)')
+    parser.add_argument('--lot-size', type=int, default=1, help='买入整手股数 (A股为100)')
+    parser.add_argument('--price-limit', default=None, help="涨跌停: 'board' 按板块, 或比例如 0.1 (默认不限制)")
+    parser.add_argument('--data-dir', default=None, help='数据目录 (默认 backtest_data_extended)')
+    args = parser.parse_args()
+
+    commissions = args.commission or [0.001, 0.0015, 0.002, 0.003]
+    limit = args.price_limit if args.price_limit in (None, 'board') else float(args.price_limit)
+    schedules = [schedule(c, d, s, m, args.lot_size, limit) for c, d, s, m in itertools.product(
+        commissions, args.stamp_duty or [0.0], args.slippage or [0.0], args.min_commission or [0.0])]
+
+    print('=' * 80)
+    print(f'Cost Model - report ({len(schedules)} 个成本方案)')
+    print(f"整手: {args.lot_size}  涨跌停: {limit}")
+    print('=' * 80)
+    rows, sweep_seconds, bt_seconds = report(schedules, data_dir=args.data_dir)
+
+    print(f"\n{'佣金':>7} {'印花税':>7} {'滑点':>7} {'最低佣金':>8} {'重定价':>7} {'回退':>5} {'一致':>7} {'逐位相同':>8}")
+    print('-' * 69)
+    for cost in schedules:
+        mine = [r for r in rows if all(r[k] == cost[k] for k in cost)]
+        repriced = sum(r['method'] == 'repriced' for r in mine)
+        print(f"{cost['commission']:>7.4f} {cost['stamp_duty']:>7.4f} {cost['slippage']:>7.4f} "
+              f"{cost['min_commission']:>8.2f} "
+              f"{repriced:>7} {len(mine) - repriced:>5} {sum(r['same'] for r in mine):>3}/{len(mine):<3} "
+              f"{sum(r['bitwise'] for r in mine):>4}/{len(mine):<3}")
+
+    fallback = [r for r in rows if r['method'] != 'repriced']
+    if fallback:
+        print("\n回退到完整重新模拟:")
+        for r in fallback:
+            print(f"  {r['asset']} {r['period']} c={r['commission']} d={r['stamp_duty']} s={r['slippage']} "
+                  f"m={r['min_commission']}: {r['reason']}")
+
+    print(f"\n耗时: 重定价+回退 {sweep_seconds:.2f}s vs backtrader逐方案重跑 {bt_seconds:.2f}s "
+          f"({bt_seconds / sweep_seconds:.1f}x)")
+    sys.exit(0 if all(r['same'] for r in rows) else 1)
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+行情数据质量检查 (Data Quality Pass)
+====================================
+
+功能: 对 backtest_data_extended/ 下每个CSV按文件内容哈希只做一次向量化质量检查,
+      持久化一份精简报告 + 一份清洗后的列式副本。之后的运行只需计算哈希并查表,
+      各驱动脚本不再各自 dropna / to_numeric(coerce) 地"自我保护"
+
+检查项 (全部为整列numpy运算, 无逐行循环):
+    order         原始文件中日期是否升序 (SPY.csv 为倒序), 倒退/重复日期数
+    invalid       含NaN或非正价格的K线
+    ohlc          high < max(open, close, low) 或 low > min(open, close, high)
+    zero_volume   成交量为0的K线 (A股停牌日通常以前收盘价填充、成交量为0)
+    calendar      与参考交易日历 (A股: 上证指数, 美股: SPY) 对比的缺失/多余交易日
+    jumps         相邻收盘价变动超过阈值 (远超涨跌停限制), 疑似未复权的拆股/送转
+
+清洗规则 (清洗副本):
+    - 日期升序, 重复日期保留最后一条
+    - 删除含NaN或非正价格的K线
+    - OHLC不一致的K线修复为 high=max(o,h,l,c), low=min(o,h,l,c)
+    - 停牌/跳空等只标记不删除, 逐行标记位保存在 flags.npy (见 FLAG_*)
+
+存储布局:
+    backtest_data_extended/data_quality/
+        index.json                         {symbol: 最近一次检查的 key/签名/摘要}
+        <key>/report.json                  精简报告, key = 文件哈希[:16] + '_' + 日历哈希[:8]
+        <key>/date.npy, open.npy, ...      清洗后的列式副本
+        <key>/flags.npy                    uint8 逐行标记位
+
+使用方法:
+    python data_quality.py run               # 检查全部CSV (已检查过的内容直接跳过)
+    python data_quality.py run --force
+    python data_quality.py report            # 打印各文件摘要
+
+    from data_quality import load_clean, load_clean_history
+    df = load_clean('stock_sh_600519', '2020-01-01', '2023-12-31')
+    history = load_clean_history(csv_path)   # WindowedFrame, 各窗口为零拷贝视图
+"""
+
+import hashlib
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from date_index import WindowedFrame, date_bounds
+from price_loader import load_prices
+from price_store import DATA_DIR, FIELDS, resolve_symbol
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+QUALITY_DIRNAME = 'data_quality'
+
+# 参考交易日历 (市场 → 标的)
+CALENDARS = {
+    'cn': 'index_sh000001',
+    'us': 'SPY',
+}
+
+# 单日收盘价变动阈值 (超过即疑似拆股/送转): A股涨跌停最多20%, 美股放宽
+JUMP_THRESHOLDS = {
+    'cn': 0.25,
+    'us': 0.40,
+}
+
+# 逐行标记位
+FLAG_ZERO_VOLUME = 1
+FLAG_OHLC_REPAIRED = 2
+FLAG_JUMP = 4
+FLAG_OFF_CALENDAR = 8
+
+# 报告中每类问题最多列出的日期数
+MAX_EXAMPLES = 10
+
+# 进程内文件哈希: {path: (signature, sha256)}
+_HASHES = {}
+
+# 进程内已打开的清洗副本: {csv_path: (signature, key, arrays)}
+_OPEN_CLEAN = {}
+
+# 进程内已加载的完整清洗历史: {key: WindowedFrame}
+_HISTORIES = {}
+
+
+def quality_dir_for(data_dir=None):
+    return Path(data_dir or DATA_DIR) / QUALITY_DIRNAME
+
+
+def market_of(symbol):
+    """stock_* / index_* 为A股, 其余 (SPY/QQQ) 为美股"""
+    stem = Path(str(symbol)).stem
+    return 'cn' if stem.startswith(('stock_', 'index_')) else 'us'
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """文件内容 sha256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _signature(path):
+    st = Path(path).stat()
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def _content_hash(path):
+    """file_hash 的进程内缓存版本 (size/mtime 未变化时不重新读取文件)"""
+    path = Path(path)
+    signature = _signature(path)
+    cached = _HASHES.get(path)
+    if cached is None or cached[0] != signature:
+        cached = (signature, file_hash(path))
+        _HASHES[path] = cached
+    return cached[1]
+
+
+def _examples(dates, mask):
+    return [str(d)[:10] for d in dates[mask][:MAX_EXAMPLES]]
+
+
+# =============================================================================
+# 向量化检查
+# =============================================================================
+
+def check_frame(raw, calendar=None, market='cn'):
+    """
+    对原始行序的OHLCV执行全部检查并生成清洗结果
+
+    Args:
+        raw: load_prices(..., sort=False) 的结果 (保留文件原始行顺序)
+        calendar: 参考交易日历 (升序datetime64数组), None表示跳过日历检查
+        market: 'cn' / 'us', 决定跳空阈值
+
+    Returns:
+        (report, clean, flags): report为dict, clean为清洗后的DataFrame, flags为uint8数组
+    """
+    dates = raw.index.values
+    n_raw = len(dates)
+    steps = np.diff(dates.astype(np.int64))
+    n_backward = int((steps < 0).sum())
+    n_repeat = int((steps == 0).sum())
+    if n_backward == 0:
+        order = 'ascending'
+    elif n_backward == len(steps) - n_repeat:
+        order = 'descending'
+    else:
+        order = 'unordered'
+
+    # 升序 + 去重 (保留最后一条)
+    df = raw.sort_index(kind='stable')
+    df = df[~df.index.duplicated(keep='last')]
+
+    values = df[list(FIELDS)].to_numpy(dtype=np.float64)
+    o, h, l, c, v = values.T
+    prices = values[:, :4]
+    invalid = np.isnan(values).any(axis=1) | (prices <= 0).any(axis=1)
+    invalid_dates = _examples(df.index.values, invalid)
+
+    values = values[~invalid]
+    dates = df.index.values[~invalid]
+    o, h, l, c, v = values.T
+
+    hi_env = values[:, :4].max(axis=1)
+    lo_env = values[:, :4].min(axis=1)
+    ohlc_bad = (h < hi_env) | (l > lo_env)
+    values[:, 1] = hi_env
+    values[:, 2] = lo_env
+
+    zero_volume = v <= 0
+
+    threshold = JUMP_THRESHOLDS[market]
+    log_ret = np.zeros(len(c))
+    log_ret[1:] = np.abs(np.log(c[1:] / c[:-1])) if len(c) > 1 else 0.0
+    jump = log_ret > np.log1p(threshold)
+
+    flags = (zero_volume * FLAG_ZERO_VOLUME
+             | ohlc_bad * FLAG_OHLC_REPAIRED
+             | jump * FLAG_JUMP).astype(np.uint8)
+
+    cal_report = None
+    if calendar is not None and len(dates):
+        lo, hi = date_bounds(calendar, dates[0], dates[-1])
+        span = calendar[lo:hi]
+        missing = ~np.isin(span, dates)
+        off_calendar = ~np.isin(dates, span)
+        flags |= (off_calendar * FLAG_OFF_CALENDAR).astype(np.uint8)
+        cal_report = {
+            'expected': int(len(span)),
+            'missing': int(missing.sum()),
+            'missing_dates': _examples(span, missing),
+            'off_calendar': int(off_calendar.sum()),
+            'off_calendar_dates': _examples(dates, off_calendar),
+        }
+
+    report = {
+        'rows_raw': int(n_raw),
+        'rows_clean': int(len(dates)),
+        'start': str(dates[0])[:10] if len(dates) else None,
+        'end': str(dates[-1])[:10] if len(dates) else None,
+        'order': order,
+        'backward_steps': n_backward,
+        'duplicate_dates': n_raw - len(df),
+        'invalid': int(invalid.sum()),
+        'invalid_dates': invalid_dates,
+        'ohlc_repaired': int(ohlc_bad.sum()),
+        'ohlc_dates': _examples(dates, ohlc_bad),
+        'zero_volume': int(zero_volume.sum()),
+        'zero_volume_dates': _examples(dates, zero_volume),
+        'jump_threshold': threshold,
+        'jumps': int(jump.sum()),
+        'jump_events': [
+            {'date': str(d)[:10], 'ratio': round(float(r), 4)}
+            for d, r in zip(dates[jump][:MAX_EXAMPLES],
+                            (c[1:] / c[:-1])[jump[1:]][:MAX_EXAMPLES])
+        ],
+        'calendar': cal_report,
+    }
+
+    clean = pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='date'), columns=list(FIELDS))
+    return report, clean, flags
+
+
+# =============================================================================
+# 按内容哈希缓存
+# =============================================================================
+
+def _calendar_for(csv_path, market):
+    """返回 (参考日历CSV路径, 文件哈希); 日历文件不存在时为 (None, '')"""
+    cal_path = csv_path.parent / f'{CALENDARS[market]}.csv'
+    if not cal_path.exists():
+        return None, ''
+    return cal_path, _content_hash(cal_path)
+
+
+def _load_index(quality_dir):
+    index_path = quality_dir / 'index.json'
+    if index_path.exists():
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def _save_index(quality_dir, index):
+    # 每个写入者一个临时文件, 并发保存时不会互相覆盖写了一半的内容
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=quality_dir, prefix='index.',
+                                     suffix='.tmp', delete=False) as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    Path(f.name).replace(quality_dir / 'index.json')
+
+
+def check_file(csv_path, force=False):
+    """
+    检查单个CSV (同一内容 + 同一参考日历只检查一次)
+
+    Returns:
+        dict: 报告 (含 'key' / 'hash' / 'cached')
+    """
+    csv_path = Path(csv_path)
+    symbol = csv_path.stem
+    market = market_of(symbol)
+    quality_dir = quality_dir_for(csv_path.parent)
+
+    digest = _content_hash(csv_path)
+    cal_path, cal_digest = _calendar_for(csv_path, market)
+    key = f'{digest[:16]}_{cal_digest[:8] or "nocal"}'
+    key_dir = quality_dir / key
+    report_path = key_dir / 'report.json'
+
+    if not force and report_path.exists():
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        report['cached'] = True
+    else:
+        raw = load_prices(csv_path, cache=False, sort=False)
+        calendar = load_prices(cal_path).index.values if cal_path is not None else None
+        report, clean, flags = check_frame(raw, calendar, market)
+        report.update({'symbol': symbol, 'market': market, 'key': key, 'hash': digest,
+                       'calendar_symbol': CALENDARS[market] if calendar is not None else None,
+                       'checked_at': pd.Timestamp.now().isoformat()})
+
+        key_dir.mkdir(parents=True, exist_ok=True)
+        # report最后写入: 中断的检查不会留下"看似有效"的副本
+        if report_path.exists():
+            report_path.unlink()
+        np.save(key_dir / 'date.npy', clean.index.values.astype('datetime64[ns]'))
+        for field in FIELDS:
+            np.save(key_dir / f'{field}.npy', np.ascontiguousarray(clean[field].values))
+        np.save(key_dir / 'flags.npy', flags)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        report['cached'] = False
+
+    index = _load_index(quality_dir)
+    entry = {'key': key, 'source': _signature(csv_path)}
+    previous = index.get(symbol, {})
+    if previous.get('key') != key or previous.get('source') != entry['source']:
+        index[symbol] = dict(entry, summary=summarize(report))
+        _save_index(quality_dir, index)
+        # 源文件更新后旧版本的副本不再被引用, 删除
+        old_key = previous.get('key')
+        if old_key and old_key != key and all(e.get('key') != old_key for e in index.values()):
+            shutil.rmtree(quality_dir / old_key, ignore_errors=True)
+    return report
+
+
+def summarize(report):
+    """报告摘要 (一行统计)"""
+    cal = report.get('calendar') or {}
+    return {
+        'rows': report['rows_clean'],
+        'order': report['order'],
+        'duplicates': report['duplicate_dates'],
+        'invalid': report['invalid'],
+        'ohlc': report['ohlc_repaired'],
+        'zero_volume': report['zero_volume'],
+        'missing_days': cal.get('missing'),
+        'jumps': report['jumps'],
+    }
+
+
+def run_all(data_dir=None, force=False):
+    """检查数据目录下全部CSV"""
+    data_dir = Path(data_dir or DATA_DIR)
+    reports = {}
+    for csv_path in sorted(data_dir.glob('*.csv')):
+        try:
+            reports[csv_path.stem] = check_file(csv_path, force=force)
+        except Exception as e:
+            print(f"  ❌ {csv_path.stem:<20} {str(e)[:80]}")
+    return reports
+
+
+# =============================================================================
+# 读取清洗副本
+# =============================================================================
+
+def _open_clean(symbol, data_dir=None):
+    """返回 (key, arrays); 源文件 size/mtime 未变化时不重新计算哈希"""
+    csv_path, _ = resolve_symbol(symbol, data_dir)
+    signature = _signature(csv_path)
+    cached = _OPEN_CLEAN.get(csv_path)
+    if cached is not None and cached[0] == signature:
+        return cached[1], cached[2]
+
+    key = check_file(csv_path)['key']
+    key_dir = quality_dir_for(csv_path.parent) / key
+    arrays = {name: np.load(key_dir / f'{name}.npy', mmap_mode='r')
+              for name in ('date', *FIELDS, 'flags')}
+    _OPEN_CLEAN[csv_path] = (signature, key, arrays)
+    return key, arrays
+
+
+def load_clean(symbol, start=None, end=None, data_dir=None, exclude=0):
+    """
+    读取清洗后的OHLCV DataFrame
+
+    Args:
+        symbol: 'stock_sh_600519' / 文件名 / CSV完整路径
+        start, end: 日期闭区间
+        exclude: 需要剔除的标记位组合, 例如 FLAG_ZERO_VOLUME 剔除停牌日 (默认不剔除)
+
+    Returns:
+        pd.DataFrame: index='date' (升序), 列 open/high/low/close/volume (float64)
+    """
+    _, arrays = _open_clean(symbol, data_dir)
+    lo, hi = date_bounds(arrays['date'], start, end)
+    rows = slice(lo, hi)
+    if exclude:
+        rows = np.flatnonzero((arrays['flags'][lo:hi] & exclude) == 0) + lo
+    index = pd.DatetimeIndex(arrays['date'][rows], name='date')
+    return pd.DataFrame({field: arrays[field][rows] for field in FIELDS}, index=index)
+
+
+def load_clean_history(symbol, data_dir=None):
+    """
+    清洗后的完整历史 (WindowedFrame, 进程内按key缓存)
+
+    多时间段驱动脚本对同一标的反复取窗口时使用: history.window(start, end) 为零拷贝视图。
+    """
+    key, _ = _open_clean(symbol, data_dir)
+    history = _HISTORIES.get(key)
+    if history is None:
+        history = WindowedFrame(load_clean(symbol, data_dir=data_dir))
+        _HISTORIES[key] = history
+    return history
+
+
+def load_report(symbol, data_dir=None):
+    """读取某标的的质量报告 (必要时先检查)"""
+    csv_path, _ = resolve_symbol(symbol, data_dir)
+    return check_file(csv_path)
+
+
+# =============================================================================
+# 命令行接口
+# =============================================================================
+
+def _print_summary(reports):
+    print(f"\n{'Symbol':<20} {'行数':>6} {'顺序':<10} {'重复':>4} {'无效':>4} {'OHLC':>4} "
+          f"{'零成交':>6} {'缺失日':>6} {'跳空':>4} {'缓存':>4}")
+    print('-' * 90)
+    for symbol, r in reports.items():
+        s = summarize(r)
+        missing = '-' if s['missing_days'] is None else s['missing_days']
+        print(f"{symbol:<20} {s['rows']:>6} {s['order']:<10} {s['duplicates']:>4} {s['invalid']:>4} "
+              f"{s['ohlc']:>4} {s['zero_volume']:>6} {missing:>6} {s['jumps']:>4} "
+              f"{'是' if r.get('cached') else '否':>4}")
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='行情数据质量检查: run / report')
+    parser.add_argument('command', choices=['run', 'report'])
+    parser.add_argument('--data-dir', default=str(DATA_DIR), help='CSV数据目录')
+    parser.add_argument('--force', action='store_true', help='忽略已有报告, 重新检查')
+    args = parser.parse_args()
+
+    print('=' * 80)
+    print(f'Data Quality - {args.command}')
+    print('=' * 80)
+
+    t0 = time.perf_counter()
+    reports = run_all(args.data_dir, force=args.force and args.command == 'run')
+    elapsed = time.perf_counter() - t0
+    _print_summary(reports)
+    n_cached = sum(1 for r in reports.values() if r.get('cached'))
+    print(f"\n完成: {len(reports)} 个文件 (缓存命中 {n_cached}), 耗时 {elapsed:.2f}s → {quality_dir_for(args.data_dir)}")
+
+    sys.exit(0)
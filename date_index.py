@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+有序日期索引切片层 (Sorted Date Index)
+======================================
+
+功能: 用二分查找代替 (df.index >= start) & (df.index <= end) 布尔掩码,
+      每个窗口只需 O(log n) 定位, 返回的是原数据的零拷贝视图 (df.iloc[lo:hi]),
+      不再为每个窗口分配并扫描一次完整历史
+
+    - date_bounds(dates, start, end)   [start, end] 闭区间 → 行号范围 (lo, hi)
+    - DateIndex                        对 DatetimeIndex 的切片 + 年/月偏移表 (首次使用时计算)
+    - WindowedFrame                    完整历史DataFrame + DateIndex, 按窗口/年/月取视图
+
+使用方法:
+    from date_index import WindowedFrame
+    history = WindowedFrame(df)                        # df.index 必须升序
+    train = history.window('2018-01-01', '2021-12-31')
+    test = history.year(2022)
+    jan = history.month(2024, 1)
+
+注意: 返回的视图与完整历史共享内存, 需要原地修改时请先 .copy()。
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _to_ns(value):
+    return np.datetime64(pd.Timestamp(value), 'ns')
+
+
+def date_bounds(dates, start=None, end=None):
+    """二分查找 [start, end] (闭区间) 对应的行号范围, dates 为升序datetime64数组"""
+    lo = 0 if start is None else int(np.searchsorted(dates, _to_ns(start), side='left'))
+    hi = len(dates) if end is None else int(np.searchsorted(dates, _to_ns(end), side='right'))
+    return lo, max(lo, hi)
+
+
+def _group_offsets(keys):
+    """升序键数组 → {key: (lo, hi)}"""
+    values, starts = np.unique(keys, return_index=True)
+    ends = np.append(starts[1:], len(keys))
+    return {int(v): (int(s), int(e)) for v, s, e in zip(values, starts, ends)}
+
+
+class DateIndex:
+    """
+    升序 DatetimeIndex 的切片索引
+
+    构造本身是零拷贝的 (直接引用 index 的datetime64[ns]数组);
+    年/月偏移表在第一次调用 year()/month() 时一次性计算。
+    """
+
+    def __init__(self, index):
+        index = pd.DatetimeIndex(index)
+        if not index.is_monotonic_increasing:
+            raise ValueError("DateIndex要求日期升序, 请先 sort_index()")
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        self.dates = index.values
+        self._years = None
+        self._months = None
+
+    def __len__(self):
+        return len(self.dates)
+
+    def bounds(self, start=None, end=None):
+        return date_bounds(self.dates, start, end)
+
+    def _year_offsets(self):
+        if self._years is None:
+            self._years = _group_offsets(self.dates.astype('datetime64[Y]').astype(np.int64) + 1970)
+        return self._years
+
+    def _month_offsets(self):
+        if self._months is None:
+            # 键为 year*12 + (month-1)
+            self._months = _group_offsets(self.dates.astype('datetime64[M]').astype(np.int64) + 1970 * 12)
+        return self._months
+
+    def year_bounds(self, year):
+        return self._year_offsets().get(int(year), (0, 0))
+
+    def month_bounds(self, year, month):
+        return self._month_offsets().get(int(year) * 12 + int(month) - 1, (0, 0))
+
+    def years(self):
+        """数据覆盖的全部年份"""
+        return sorted(self._year_offsets())
+
+
+class WindowedFrame:
+    """完整历史 + DateIndex; 所有窗口均为 df.iloc[lo:hi] 视图"""
+
+    def __init__(self, df):
+        self.df = df
+        self.index = DateIndex(df.index)
+
+    def __len__(self):
+        return len(self.df)
+
+    def _rows(self, bounds):
+        lo, hi = bounds
+        return self.df.iloc[lo:hi]
+
+    def window(self, start=None, end=None):
+        """[start, end] 闭区间窗口"""
+        return self._rows(self.index.bounds(start, end))
+
+    def year(self, year):
+        return self._rows(self.index.year_bounds(year))
+
+    def month(self, year, month):
+        return self._rows(self.index.month_bounds(year, month))
+
+    def windows(self, periods):
+        """多个 (start, end) 区间依次取视图"""
+        return [self.window(start, end) for start, end in periods]
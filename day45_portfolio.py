@@ -7,6 +7,8 @@ import json
 from datetime import datetime
 import logging
 
+from price_loader import load_prices
+
 logging.disable(logging.CRITICAL)
 
 DATA_DIR = Path('/root/autodl-tmp/eoh/backtest_data')
@@ -19,11 +21,8 @@ print('='*60)
 
 # Load data for two stocks
 def load_data(symbol):
-    df = pd.read_csv(DATA_DIR / f'{symbol}.csv')
-    df['日期'] = pd.to_datetime(df['日期'])
-    df.set_index('日期', inplace=True)
-    df = df.rename(columns={'开盘':'open', '收盘':'close', '最高':'high', '最低':'low', '成交量':'volume'})
-    return df[['open', 'high', 'low', 'close', 'volume']]
+    # akshare中文列名由统一读取器识别并规范
+    return load_prices(DATA_DIR / f'{symbol}.csv')
 
 # Combined Portfolio Strategy
 class PortfolioStrategy(bt.Strategy):
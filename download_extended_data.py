@@ -2,28 +2,35 @@
 """
 扩展数据下载脚本
 下载15年历史数据 (2010-2025) + 多元化股票 + 指数基准
+
+使用方法:
+    python download_extended_data.py                          # 全量下载 (串行, 与原流程一致)
+    python download_extended_data.py --incremental --workers 4
+    python download_extended_data.py --incremental --source /path/to/csv_dir   # 本地文件数据源
+
+增量模式:
+    从 download_metadata.json 读取每个标的已存储的最后日期 (缺失或文件已改动时读CSV最后一行),
+    只拉取之后的数据, 合并后写临时文件再 os.replace 原子替换。
+    拉取区间包含最后一个已存储交易日, 用于校验重叠日收盘价: 前复权数据在除权后
+    会整体变化, 此时自动回退为该标的全量下载。
+
+数据源可插拔:
+    AkshareSource    akshare在线接口 (默认)
+    LocalFileSource  从本地CSV目录读取, 用于测试与基准测试 (可模拟网络延迟)
 """
 
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 import json
 
-# 安装akshare
-try:
-    import akshare as ak
-    print("✅ akshare已安装")
-except ImportError:
-    import subprocess, sys
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "akshare", "-q"])
-    import akshare as ak
-    print("✅ akshare安装完成")
-
 import pandas as pd
 
 # 配置
 DATA_DIR = Path("/root/autodl-tmp/eoh/backtest_data_extended")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 START_DATE = "20100101"  # 15年数据
 END_DATE = "20251122"
@@ -68,143 +75,370 @@ INDICES = {
     "sz399006": "创业板指",
 }
 
-def download_stock(symbol: str, name: str) -> dict:
-    """下载单只股票数据"""
-    result = {"symbol": symbol, "name": name, "success": False, "rows": 0, "error": None}
 
-    try:
-        print(f"  ⏳ {symbol} {name}...", end=" ", flush=True)
+def stock_filename(symbol: str) -> str:
+    """股票文件名 (与 backtest_data_extended/ 现有文件一致: stock_sh_600519.csv)"""
+    market = "sh" if symbol.startswith("6") else "sz"
+    return f"stock_{market}_{symbol}.csv"
+
+
+def index_filename(code: str) -> str:
+    return f"index_{code}.csv"
+
+
+# =============================================================================
+# 数据源
+# =============================================================================
+
+class AkshareSource:
+    """akshare在线数据源 (首次使用时才导入/安装akshare)"""
+
+    name = "akshare"
+
+    def __init__(self):
+        self._ak = None
 
-        df = ak.stock_zh_a_hist(
+    @property
+    def ak(self):
+        if self._ak is None:
+            try:
+                import akshare as ak
+                print("✅ akshare已安装")
+            except ImportError:
+                import subprocess, sys
+                subprocess.check_call([sys.executable, "-m", "pip", "install", "akshare", "-q"])
+                import akshare as ak
+                print("✅ akshare安装完成")
+            self._ak = ak
+        return self._ak
+
+    def fetch_stock(self, symbol: str, start: str, end: str) -> pd.DataFrame:
+        df = self.ak.stock_zh_a_hist(
             symbol=symbol,
             period="daily",
-            start_date=START_DATE,
-            end_date=END_DATE,
+            start_date=start,
+            end_date=end,
             adjust="qfq"  # 前复权
         )
-
         if df is None or len(df) == 0:
-            result["error"] = "No data"
-            print("❌ 无数据")
-            return result
+            return None
 
         # 标准化列名
         df.columns = ['date', 'code', 'open', 'close', 'high', 'low',
                       'volume', 'turnover', 'amplitude', 'pct_change', 'change', 'turnover_rate']
         df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
-
-        # 保存
-        save_path = DATA_DIR / f"stock_{symbol}.csv"
-        df.to_csv(save_path)
-
-        result["success"] = True
-        result["rows"] = len(df)
-        result["start"] = str(df.index.min().date())
-        result["end"] = str(df.index.max().date())
-
-        print(f"✅ {len(df)} 行 ({result['start']} ~ {result['end']})")
-
-        time.sleep(0.5)  # 避免请求过快
-
-    except Exception as e:
-        result["error"] = str(e)[:100]
-        print(f"❌ {str(e)[:50]}")
-
-    return result
-
-def download_index(code: str, name: str) -> dict:
-    """下载指数数据"""
-    result = {"code": code, "name": name, "success": False, "rows": 0, "error": None}
-
-    try:
-        print(f"  ⏳ {code} {name}...", end=" ", flush=True)
-
-        # 根据代码判断市场
-        if code.startswith("sh"):
-            symbol = code[2:]
-            df = ak.stock_zh_index_daily(symbol=f"sh{symbol}")
-        else:
-            symbol = code[2:]
-            df = ak.stock_zh_index_daily(symbol=f"sz{symbol}")
+        return df.set_index('date')
 
+    def fetch_index(self, code: str, start: str, end: str) -> pd.DataFrame:
+        # 指数接口不支持日期参数, 返回全部历史后再截取
+        df = self.ak.stock_zh_index_daily(symbol=code)
         if df is None or len(df) == 0:
-            result["error"] = "No data"
-            print("❌ 无数据")
-            return result
+            return None
 
         # 标准化
         df.columns = ['date', 'open', 'high', 'low', 'close', 'volume']
         df['date'] = pd.to_datetime(df['date'])
-        df = df[(df['date'] >= START_DATE) & (df['date'] <= END_DATE)]
-        df.set_index('date', inplace=True)
+        df = df[(df['date'] >= start) & (df['date'] <= end)]
+        return df.set_index('date')
+
+
+class LocalFileSource:
+    """
+    本地CSV目录数据源 (akshare的替身, 用于测试与基准测试)
+
+    目录中的文件按 stock_filename/index_filename 命名, 格式与下载结果相同。
+    latency 秒用于模拟每次请求的网络耗时。
+    """
+
+    def __init__(self, root, latency: float = 0.0):
+        self.root = Path(root)
+        self.latency = latency
+        self.name = f"local:{self.root}"
+
+    def _read(self, filename: str, start: str, end: str) -> pd.DataFrame:
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.root / filename
+        if not path.exists():
+            return None
+        df = pd.read_csv(path, index_col='date', parse_dates=['date']).sort_index()
+        df = df.loc[pd.Timestamp(start):pd.Timestamp(end)]
+        return df if len(df) else None
+
+    def fetch_stock(self, symbol: str, start: str, end: str) -> pd.DataFrame:
+        return self._read(stock_filename(symbol), start, end)
+
+    def fetch_index(self, code: str, start: str, end: str) -> pd.DataFrame:
+        return self._read(index_filename(code), start, end)
+
+
+def make_source(spec: str = "akshare", latency: float = 0.0):
+    """'akshare' 或本地CSV目录路径"""
+    if spec == "akshare":
+        return AkshareSource()
+    return LocalFileSource(spec, latency=latency)
+
+
+class RateLimiter:
+    """线程安全的请求限速: 任意两次请求之间至少间隔 1/rate 秒"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# =============================================================================
+# 增量合并
+# =============================================================================
+
+def load_previous_metadata(data_dir: Path) -> dict:
+    """读取上次的 download_metadata.json, 返回 {文件名: 记录}"""
+    meta_path = data_dir / "download_metadata.json"
+    if not meta_path.exists():
+        return {}
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    records = {}
+    for r in previous.get("stocks", []):
+        records[r.get("file") or stock_filename(r["symbol"])] = r
+    for r in previous.get("indices", []):
+        records[r.get("file") or index_filename(r["code"])] = r
+    return records
+
+
+def _file_signature(save_path: Path) -> dict:
+    st = save_path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def last_stored_date(save_path: Path, record: dict = None):
+    """
+    已存储的最后日期
+
+    元数据中的end仅在文件签名 (size + mtime) 与记录一致时采信,
+    否则 (旧版元数据 / 文件被改动) 读CSV最后一行。
+    """
+    if not save_path.exists():
+        return None
+    if record and record.get("success") and record.get("end") \
+            and record.get("file_signature") == _file_signature(save_path):
+        return pd.Timestamp(record["end"])
+    with open(save_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = f.read().decode('utf-8', errors='ignore').strip().splitlines()
+    if len(lines) < 2 or lines[-1].startswith('date'):
+        return None
+    return pd.Timestamp(lines[-1].split(',')[0])
+
+
+def atomic_write_csv(df: pd.DataFrame, save_path: Path):
+    """写临时文件后 os.replace, 读者不会看到写了一半的CSV"""
+    tmp_path = save_path.with_name(save_path.name + ".tmp")
+    df.to_csv(tmp_path)
+    os.replace(tmp_path, save_path)
+
+
+def merge_tail(save_path: Path, tail: pd.DataFrame, last_date):
+    """
+    把新拉取的尾部数据合并进已有CSV
+
+    Returns:
+        (merged_df, new_rows); 重叠日收盘价不一致 (复权因子变化) 时返回 (None, 0)
+    """
+    existing = pd.read_csv(save_path, index_col='date', parse_dates=['date'])
+    tail = tail.reindex(columns=existing.columns)
+
+    if last_date in tail.index and last_date in existing.index:
+        old_close = float(existing.loc[last_date, 'close'])
+        new_close = float(tail.loc[last_date, 'close'])
+        if abs(old_close - new_close) > 1e-6 * max(1.0, abs(old_close)):
+            return None, 0
+
+    new_rows = tail[tail.index > last_date]
+    merged = pd.concat([existing, new_rows])
+    merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+    return merged, len(new_rows)
+
+
+# =============================================================================
+# 下载
+# =============================================================================
+
+def _download(kind: str, key: str, name: str, source, data_dir: Path, start: str, end: str,
+              incremental: bool = False, previous: dict = None, limiter: RateLimiter = None) -> dict:
+    """下载单个标的 (kind: 'stock' / 'index')"""
+    id_field = "symbol" if kind == "stock" else "code"
+    filename = stock_filename(key) if kind == "stock" else index_filename(key)
+    fetch = source.fetch_stock if kind == "stock" else source.fetch_index
+    save_path = data_dir / filename
+
+    result = {id_field: key, "name": name, "file": filename, "success": False,
+              "rows": 0, "new_rows": 0, "mode": "full", "error": None}
+    limiter = limiter or RateLimiter(0)
+
+    try:
+        last_date = last_stored_date(save_path, (previous or {}).get(filename)) if incremental else None
+        df = None
+
+        if last_date is not None:
+            if last_date >= pd.Timestamp(end):
+                existing = pd.read_csv(save_path, index_col='date', parse_dates=['date'])
+                result.update(success=True, mode="up_to_date", rows=len(existing),
+                              start=str(existing.index.min().date()), end=str(existing.index.max().date()),
+                              file_signature=_file_signature(save_path))
+                return result
+
+            limiter.wait()
+            tail = fetch(key, last_date.strftime("%Y%m%d"), end)
+            if tail is None or len(tail) == 0:
+                df, new_rows = pd.read_csv(save_path, index_col='date', parse_dates=['date']), 0
+            else:
+                df, new_rows = merge_tail(save_path, tail, last_date)
+            if df is not None:
+                result["mode"] = "incremental"
+                result["new_rows"] = new_rows
+            else:
+                result["mode"] = "full (复权调整)"
+
+        if df is None:
+            limiter.wait()
+            df = fetch(key, start, end)
+            if df is None or len(df) == 0:
+                result["error"] = "No data"
+                return result
+            result["new_rows"] = len(df)
 
         # 保存
-        save_path = DATA_DIR / f"index_{code}.csv"
-        df.to_csv(save_path)
+        if result["new_rows"] or result["mode"] != "incremental":
+            atomic_write_csv(df, save_path)
 
         result["success"] = True
         result["rows"] = len(df)
         result["start"] = str(df.index.min().date())
         result["end"] = str(df.index.max().date())
-
-        print(f"✅ {len(df)} 行 ({result['start']} ~ {result['end']})")
-
-        time.sleep(0.5)
+        result["file_signature"] = _file_signature(save_path)
 
     except Exception as e:
         result["error"] = str(e)[:100]
-        print(f"❌ {str(e)[:50]}")
 
     return result
 
-def main():
+
+def download_stock(symbol: str, name: str, source=None, data_dir: Path = DATA_DIR,
+                   start: str = START_DATE, end: str = END_DATE, **kwargs) -> dict:
+    """下载单只股票数据"""
+    return _download("stock", symbol, name, source or AkshareSource(), Path(data_dir), start, end, **kwargs)
+
+
+def download_index(code: str, name: str, source=None, data_dir: Path = DATA_DIR,
+                   start: str = START_DATE, end: str = END_DATE, **kwargs) -> dict:
+    """下载指数数据"""
+    return _download("index", code, name, source or AkshareSource(), Path(data_dir), start, end, **kwargs)
+
+
+def _print_result(result: dict):
+    key = result.get("symbol", result.get("code"))
+    if not result["success"]:
+        print(f"  ❌ {key} {result['name']}: {str(result['error'])[:50]}")
+    elif result["mode"] == "up_to_date":
+        print(f"  ⏭️  {key} {result['name']}: 已是最新 ({result['end']})")
+    else:
+        print(f"  ✅ {key} {result['name']}: {result['rows']} 行 (+{result['new_rows']}, {result['mode']}) "
+              f"({result['start']} ~ {result['end']})")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='扩展数据下载 (全量 / 增量)')
+    parser.add_argument('--data-dir', default=str(DATA_DIR), help='保存目录')
+    parser.add_argument('--incremental', action='store_true', help='只拉取已存储最后日期之后的数据')
+    parser.add_argument('--workers', type=int, default=1, help='并发下载线程数')
+    parser.add_argument('--rate', type=float, default=2.0, help='每秒最多请求数 (0表示不限速)')
+    parser.add_argument('--source', default='akshare', help="'akshare' 或本地CSV目录")
+    parser.add_argument('--latency', type=float, default=0.0, help='本地数据源模拟的请求延迟(秒)')
+    parser.add_argument('--start', default=START_DATE)
+    parser.add_argument('--end', default=None, help=f'默认: 增量模式为今天, 否则 {END_DATE}')
+    args = parser.parse_args(argv)
+
+    data_dir = Path(args.data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    end = args.end or (datetime.now().strftime("%Y%m%d") if args.incremental else END_DATE)
+    source = make_source(args.source, args.latency)
+    limiter = RateLimiter(args.rate)
+    previous = load_previous_metadata(data_dir) if args.incremental else {}
+
     print("="*80)
-    print("扩展数据下载 - 15年历史数据")
+    print("扩展数据下载 - 15年历史数据" + (" (增量)" if args.incremental else ""))
     print("="*80)
-    print(f"时间范围: {START_DATE} ~ {END_DATE}")
+    print(f"时间范围: {args.start} ~ {end}")
     print(f"股票数量: {len(STOCKS)}")
     print(f"指数数量: {len(INDICES)}")
-    print(f"保存目录: {DATA_DIR}")
+    print(f"数据源: {source.name}  并发: {args.workers}  限速: {args.rate}/s")
+    print(f"保存目录: {data_dir}")
     print()
 
-    results = {"stocks": [], "indices": [], "summary": {}}
+    common = dict(source=source, data_dir=data_dir, start=args.start, end=end,
+                  incremental=args.incremental, previous=previous, limiter=limiter)
+    jobs = [(download_stock, symbol, name) for symbol, name in STOCKS.items()]
+    jobs += [(download_index, code, name) for code, name in INDICES.items()]
 
-    # 下载股票
-    print("="*80)
-    print("[1/2] 下载股票数据")
-    print("="*80)
-
-    for symbol, name in STOCKS.items():
-        result = download_stock(symbol, name)
-        results["stocks"].append(result)
-
-    # 下载指数
-    print("\n" + "="*80)
-    print("[2/2] 下载指数数据")
-    print("="*80)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = [executor.submit(func, key, name, **common) for func, key, name in jobs]
+        outcomes = []
+        for future in futures:
+            result = future.result()
+            _print_result(result)
+            outcomes.append(result)
+    elapsed = time.perf_counter() - t0
 
-    for code, name in INDICES.items():
-        result = download_index(code, name)
-        results["indices"].append(result)
+    results = {"stocks": outcomes[:len(STOCKS)], "indices": outcomes[len(STOCKS):], "summary": {}}
 
     # 汇总
     stock_success = sum(1 for r in results["stocks"] if r["success"])
     index_success = sum(1 for r in results["indices"] if r["success"])
     total_rows = sum(r["rows"] for r in results["stocks"] + results["indices"])
+    new_rows = sum(r["new_rows"] for r in results["stocks"] + results["indices"])
 
     results["summary"] = {
         "download_time": datetime.now().isoformat(),
+        "mode": "incremental" if args.incremental else "full",
+        "source": source.name,
+        "end_date": end,
         "stocks_success": f"{stock_success}/{len(STOCKS)}",
         "indices_success": f"{index_success}/{len(INDICES)}",
         "total_data_points": total_rows,
-        "data_directory": str(DATA_DIR)
+        "new_data_points": new_rows,
+        "elapsed_seconds": round(elapsed, 2),
+        "data_directory": str(data_dir)
     }
 
-    # 保存元数据
-    meta_path = DATA_DIR / "download_metadata.json"
-    with open(meta_path, 'w', encoding='utf-8') as f:
+    # 失败的标的保留上次成功的记录, 下次增量仍能找到最后日期
+    for group in ("stocks", "indices"):
+        for i, r in enumerate(results[group]):
+            old = previous.get(r["file"])
+            if not r["success"] and old and old.get("success"):
+                results[group][i] = dict(old, file=r["file"], last_error=r["error"])
+
+    # 保存元数据 (同样原子替换)
+    meta_path = data_dir / "download_metadata.json"
+    tmp_path = meta_path.with_name(meta_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(results, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
 
     # 打印汇总
     print("\n" + "="*80)
@@ -212,11 +446,12 @@ def main():
     print("="*80)
     print(f"股票: {stock_success}/{len(STOCKS)} 成功")
     print(f"指数: {index_success}/{len(INDICES)} 成功")
-    print(f"总数据点: {total_rows:,}")
+    print(f"总数据点: {total_rows:,} (新增 {new_rows:,})")
+    print(f"耗时: {elapsed:.1f}s")
     print(f"元数据: {meta_path}")
 
     # 列出失败的
-    failed = [r for r in results["stocks"] + results["indices"] if not r["success"]]
+    failed = [r for r in outcomes if not r["success"]]
     if failed:
         print(f"\n❌ 失败 ({len(failed)}):")
         for f in failed:
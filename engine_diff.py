@@ -0,0 +1,779 @@
+#!/usr/bin/env python3
+"""
+跨引擎差分测试与性能对比 (Cross-engine Differential Test & Benchmark)
+====================================================================
+
+功能: 项目里"同一个"策略跑在几种引擎上 — backtrader (code/*.py), backtesting.py
+      (eoh_gpu_loop_fixed.run_bt), 手写逐K线循环 (HardCodedAdaptiveStrategy / SimpleBacktest,
+      现委托给 adaptive_engine 的收盘价成交口径)。本模块把一组规范策略 (CANONICAL) 在全部引擎上
+      逐个数据集运行, 以 backtrader 为参照比对成交与权益曲线, 并记录各引擎的耗时、bars/sec、峰值内存
+
+    引擎:
+        backtrader   参照实现, bt.indicators 计算指标; close 口径用 broker.set_coc(True)
+        backtesting  backtesting.py (与 run_bt 相同: exclusive_orders=True); close 口径用 trade_on_close=True
+                     未安装时跳过
+        eoh_run_bt   规范策略交给 eoh_gpu_loop_fixed.run_bt 本身运行 (固定 cash=100_000, 只有 next_open 口径);
+                     torch / transformers 未安装时跳过
+        array        adaptive_engine.simulate (next_open / close 两种撮合口径)
+        loop         最朴素的逐K线Python循环 (对照实现)
+    非backtrader引擎的指标统一取 feature_store kind='bt' (与backtrader逐位一致的内核)
+
+    撮合口径 (convention):
+        next_open    K线收盘产生信号, 下一根K线开盘成交 (backtrader / backtesting.py 默认)
+        close        信号K线收盘价成交 (手写循环)
+
+    比对 (相对 backtrader):
+        成交         逐笔 (K线, 数量) 完全一致, 成交价在 price_rtol 内
+        权益曲线     各引擎在成交K线上记账的时点不同 (收盘前/后), 成交K线不比较,
+                     其余K线的最大相对偏差须在 equity_rtol 内
+
+    已知的口径差异 (会报告为不一致, 不是bug):
+        - close口径下手写循环在最后一根K线的信号上也会成交, 事件驱动引擎的订单没有下一根K线可处理
+        - backtrader 提交订单时先按信号K线收盘价预检资金 (check_submitted), backtesting.py 和 loop
+          只按成交价检查: 下单金额贴近可用资金时, 一方成交、另一方 Margin/撤单
+
+项目入口 (PROJECT_ENGINES):
+    项目脚本里的引擎本身 — P0 脚本的 SimpleBacktest.run_fixed_strategy / run_adaptive_strategy 与
+    SimpleStrategy.run, HardCodedAdaptiveStrategy.backtest 及其分块流式 backtest_stream — 以脚本中的参数
+    运行, 与各自原来的逐K线循环 (参照, 收盘价成交) 比对逐笔成交、权益曲线和最终价值。
+    入口现在委托给 adaptive_engine (数组引擎) 或分块续算的指标, 参照保留改写前的语义;
+    脚本的依赖未安装时 (如 yfinance) 跳过该入口
+
+使用方法:
+    python engine_diff.py                                   # 全部数据集 × 全部规范策略 × 两种口径
+    python engine_diff.py --symbol stock_sh_600519 --start 2018-01-01 --end 2023-12-31
+    python engine_diff.py --engine array --engine loop --json outputs/engine_diff.json
+    python engine_diff.py --project hard_coded_stream      # 只比对指定的项目入口
+
+    from engine_diff import run_engine, diff_runs
+    ref = run_engine('backtrader', df, 'sma_cross_atr_stop')
+    ours = run_engine('array', df, 'sma_cross_atr_stop')
+    problems, deviation = diff_runs(ref, ours)
+
+    from engine_diff import run_project, diff_project
+    problems, deviation = diff_project(*run_project('hard_coded', df))
+"""
+
+import importlib.util
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from adaptive_engine import simulate
+from feature_store import compute as compute_feature
+from trade_log import fills_log
+
+os.environ.setdefault('TQDM_DISABLE', '1')  # backtesting.py 每次 run() 的逐K线进度条 (须在导入tqdm之前)
+try:
+    import backtesting
+except ImportError:  # 可选依赖
+    backtesting = None
+
+ROOT = Path(__file__).resolve().parent
+
+
+# =============================================================================
+# 规范策略
+# =============================================================================
+
+# 金叉入场 (fast > slow 且上一根 fast <= slow), 死叉或止损离场 (同一根K线只平仓一次)
+CANONICAL = {
+    'sma_cross': {
+        'sma_fast': 10, 'sma_slow': 30, 'atr_period': None,
+        'sizing': 'fixed', 'position_size': 10,
+        'stop': None,
+    },
+    'sma_cross_atr_stop': {
+        'sma_fast': 10, 'sma_slow': 30, 'atr_period': 14, 'atr_multiplier': 3.0,
+        'sizing': 'fixed', 'position_size': 10,
+        'stop': 'price',               # close < 成交价 - atr * mult
+    },
+    'sma_cross_atr_risk': {
+        'sma_fast': 20, 'sma_slow': 50, 'atr_period': 14, 'atr_multiplier': 3.0,
+        'sizing': 'atr_risk', 'risk_percent': 0.01, 'cap_affordable': True,
+        'stop': 'price',
+    },
+}
+
+CONVENTIONS = ('next_open', 'close')
+ENGINES = ('backtrader', 'backtesting', 'eoh_run_bt', 'array', 'loop')
+REFERENCE = 'backtrader'
+
+# 只支持部分撮合口径的引擎 (run_bt 固定 trade_on_close=False)
+ENGINE_CONVENTIONS = {'eoh_run_bt': ('next_open',)}
+EOH_CASH = 100_000  # run_bt 固定的初始资金
+
+
+def order_size(spec, value, atr, price):
+    """入场数量 (0 表示不下单)"""
+    if spec['sizing'] == 'fixed':
+        return int(spec['position_size'])
+    stop_distance = atr * spec['atr_multiplier']
+    if not stop_distance > 0:
+        return 0
+    size = int(value * spec['risk_percent'] / stop_distance)
+    if spec.get('cap_affordable'):
+        size = min(size, int(value / price))
+    return max(size, 0)
+
+
+def _indicators(df, spec):
+    """fast / slow / atr (feature_store kind='bt'; 无ATR时为None)"""
+    arrays = {f: df[f].to_numpy(dtype=np.float64) for f in ('high', 'low', 'close')}
+    fast, slow = compute_feature('sma', arrays, [spec['sma_fast'], spec['sma_slow']], kind='bt')
+    atr = compute_feature('atr', arrays, [spec['atr_period']], kind='bt')[0] if spec['atr_period'] else None
+    return fast, slow, atr
+
+
+# =============================================================================
+# 引擎适配 (每个返回 {'fills': [(bar, size, price)], 'equity': ndarray})
+# =============================================================================
+
+def _run_backtrader(df, spec, convention, initial_cash, commission):
+    import backtrader as bt
+
+    class Canonical(bt.Strategy):
+        def __init__(self):
+            self.fast = bt.indicators.SMA(self.data.close, period=spec['sma_fast'])
+            self.slow = bt.indicators.SMA(self.data.close, period=spec['sma_slow'])
+            self.atr = bt.indicators.ATR(self.data, period=spec['atr_period']) if spec['atr_period'] else None
+            self.order = None
+            self.entry_price = None
+            self.values = []
+            self.fills = []
+
+        def prenext(self):
+            self.values.append(self.broker.getvalue())
+
+        def next(self):
+            self.values.append(self.broker.getvalue())
+            if self.order:
+                return
+            close = self.data.close[0]
+            atr = self.atr[0] if self.atr is not None else None
+            if not self.position:
+                if self.fast[0] > self.slow[0] and self.fast[-1] <= self.slow[-1]:
+                    size = order_size(spec, self.broker.getvalue(), atr, close)
+                    if size > 0:
+                        self.order = self.buy(size=size)
+                return
+            stopped = spec['stop'] == 'price' and close < self.entry_price - atr * spec['atr_multiplier']
+            if stopped or (self.fast[0] < self.slow[0] and self.fast[-1] >= self.slow[-1]):
+                self.order = self.close()
+
+        def notify_order(self, order):
+            if order.status in [order.Submitted, order.Accepted]:
+                return
+            if order.status == order.Completed:
+                # close口径 (cheat-on-close) 在下一根K线处理, 成交价为信号K线收盘价
+                bar = len(self.data) - 1 - (convention == 'close')
+                self.fills.append((bar, int(order.executed.size), order.executed.price))
+                if order.isbuy():
+                    self.entry_price = order.executed.price
+            self.order = None
+
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(initial_cash)
+    cerebro.broker.setcommission(commission=commission)
+    if convention == 'close':
+        cerebro.broker.set_coc(True)
+    cerebro.adddata(bt.feeds.PandasData(dataname=df, openinterest=-1))
+    cerebro.addstrategy(Canonical)
+    strat = cerebro.run()[0]
+    return {'fills': strat.fills, 'equity': np.asarray(strat.values, dtype=np.float64)}
+
+
+def _backtesting_strategy(df, spec):
+    """规范策略的 backtesting.Strategy 子类 (指标取 feature_store kind='bt')"""
+    fast, slow, atr = _indicators(df, spec)
+
+    class Canonical(backtesting.Strategy):
+        def init(self):
+            self.fast = self.I(lambda: fast, name='fast')
+            self.slow = self.I(lambda: slow, name='slow')
+            self.atr = self.I(lambda: atr, name='atr') if atr is not None else None
+
+        def next(self):
+            close = self.data.Close[-1]
+            if not self.position:
+                if self.fast[-1] > self.slow[-1] and self.fast[-2] <= self.slow[-2]:
+                    size = order_size(spec, self.equity, self.atr[-1] if self.atr is not None else None, close)
+                    if size > 0:
+                        self.buy(size=size)
+                return
+            stopped = (spec['stop'] == 'price'
+                       and close < self.trades[-1].entry_price - self.atr[-1] * spec['atr_multiplier'])
+            if stopped or (self.fast[-1] < self.slow[-1] and self.fast[-2] >= self.slow[-2]):
+                self.position.close()
+
+    return Canonical
+
+
+def _backtesting_result(stats):
+    strategy = stats['_strategy']
+    fills = []
+    for trade in list(strategy.closed_trades) + list(strategy.trades):
+        fills.append((trade.entry_bar, trade.size, trade.entry_price))
+        if trade.exit_bar is not None:
+            fills.append((trade.exit_bar, -trade.size, trade.exit_price))
+    fills.sort(key=lambda f: f[0])
+    return {'fills': fills, 'equity': stats['_equity_curve']['Equity'].to_numpy(dtype=np.float64)}
+
+
+def _run_backtesting(df, spec, convention, initial_cash, commission):
+    data = df[['open', 'high', 'low', 'close', 'volume']].rename(columns=str.capitalize)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # 期末未平仓 / 资金不足撤单 的提示
+        stats = backtesting.Backtest(data, _backtesting_strategy(df, spec), cash=initial_cash,
+                                     commission=commission, exclusive_orders=True,
+                                     trade_on_close=convention == 'close').run()
+    return _backtesting_result(stats)
+
+
+def _eoh_run_bt():
+    """eoh_gpu_loop_fixed.run_bt (该模块导入 torch / transformers, 未安装时为None)"""
+    try:
+        from eoh_gpu_loop_fixed import run_bt
+    except ImportError:
+        return None
+    return run_bt
+
+
+def _run_eoh_run_bt(df, spec, convention, initial_cash, commission):
+    if initial_cash != EOH_CASH:
+        raise ValueError(f"run_bt 固定初始资金 {EOH_CASH}, 不支持 initial_cash={initial_cash}")
+    data = df[['open', 'high', 'low', 'close', 'volume']].rename(columns=str.capitalize)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        stats, _ = _eoh_run_bt()(data, _backtesting_strategy(df, spec), commission)
+    return _backtesting_result(stats)
+
+
+def _run_array(df, spec, convention, initial_cash, commission):
+    rules = dict(spec, entry='golden_cross', rsi_period=None, rsi_above=None, rsi_below=None,
+                 min_size=None, max_size=None, exits='chain', release='final', entry_price='fill',
+                 fill=convention, kind='bt', require_cash=True)
+    sim = simulate(df, rules, initial_cash, commission)
+    if convention == 'next_open':
+        fills = [(o['bar'], o['size'], o['price']) for o in sim['orders'] if o['status'] == 'Completed']
+    else:
+        fills = [(t['bar'], t['size'] if t['type'] == 'buy' else -t['size'], t['price']) for t in sim['trades']]
+    return {'fills': fills, 'equity': sim['equity']}
+
+
+def _run_loop(df, spec, convention, initial_cash, commission):
+    fast, slow, atr = _indicators(df, spec)
+    open_ = df['open'].to_numpy(dtype=np.float64)
+    close = df['close'].to_numpy(dtype=np.float64)
+    n = len(close)
+
+    cash, size, entry_price = float(initial_cash), 0, 0.0
+    pending = 0
+    fills = []
+    equity = np.empty(n)
+
+    def fill(bar, delta, price):
+        nonlocal cash, size, entry_price
+        if delta > 0:
+            cost = delta * price + delta * price * commission
+            if cost > cash:
+                return  # 资金不足, 撤单
+            cash -= cost
+            size, entry_price = delta, price
+        else:
+            cash += size * price - size * price * commission
+            size = 0
+        fills.append((bar, delta, price))
+
+    for i in range(n):
+        if pending:
+            fill(i, pending, open_[i])
+            pending = 0
+
+        order = 0
+        if i >= 1:
+            if not size:
+                if fast[i] > slow[i] and fast[i - 1] <= slow[i - 1]:
+                    order = order_size(spec, cash, atr[i] if atr is not None else None, close[i])
+            else:
+                stopped = spec['stop'] == 'price' and close[i] < entry_price - atr[i] * spec['atr_multiplier']
+                if stopped or (fast[i] < slow[i] and fast[i - 1] >= slow[i - 1]):
+                    order = -size
+        if order:
+            if convention == 'close':
+                fill(i, order, close[i])
+            else:
+                pending = order
+
+        equity[i] = cash + size * close[i]
+
+    return {'fills': fills, 'equity': equity}
+
+
+_RUNNERS = {
+    'backtrader': _run_backtrader,
+    'backtesting': _run_backtesting,
+    'eoh_run_bt': _run_eoh_run_bt,
+    'array': _run_array,
+    'loop': _run_loop,
+}
+
+
+def available_engines():
+    missing = set()
+    if backtesting is None:
+        missing.update(('backtesting', 'eoh_run_bt'))
+    elif _eoh_run_bt() is None:
+        missing.add('eoh_run_bt')
+    return [e for e in ENGINES if e not in missing]
+
+
+def supports(engine, convention):
+    return convention in ENGINE_CONVENTIONS.get(engine, CONVENTIONS)
+
+
+def run_engine(engine, df, strategy, convention='next_open', initial_cash=100000, commission=0.0015):
+    """df: 小写 open/high/low/close/volume 列 + DatetimeIndex"""
+    if not supports(engine, convention):
+        raise ValueError(f"{engine} 不支持 {convention} 口径")
+    return _RUNNERS[engine](df, CANONICAL[strategy], convention, initial_cash, commission)
+
+
+# =============================================================================
+# 项目入口 (每个返回 {'trades': 逐笔成交/平仓行, 'equity': ndarray 或 None, 'final_value': float})
+# =============================================================================
+
+P0_CROSS_MARKET = ROOT / 'code' / '补充实验_P0_跨市场扩展.py'
+P0_PER_MARKET = ROOT / 'code' / '补充实验_P0_单独调参对比.py'
+BASELINE = ROOT / 'code_策略代码' / 'hard_coded_adaptive_baseline.py'
+
+# 脚本中调用入口的参数 (跨市场扩展: US最优固定参数 / 自适应默认参数)
+SIMPLE_FIXED = {'stop_loss': 200, 'position_size': 20}
+SIMPLE_ADAPTIVE = {'atr_multiplier': 3, 'risk_percent': 0.02}
+SIMPLE_CASH = 100000
+HARD_CODED_COMMISSION = 0.001
+STREAM_CHUNKSIZE = 333  # 不整除数据长度, 指标窗口跨越分块边界
+
+_SCRIPTS = {}
+
+
+def _load_script(path):
+    """按路径加载项目脚本 (只加载一次); 脚本的依赖未安装时返回None"""
+    if path not in _SCRIPTS:
+        if str(path.parent) not in sys.path:
+            sys.path.insert(0, str(path.parent))
+        module_spec = importlib.util.spec_from_file_location(f'_engine_diff_{path.stem}', path)
+        module = importlib.util.module_from_spec(module_spec)
+        try:
+            module_spec.loader.exec_module(module)
+        except ImportError:
+            module = None
+        _SCRIPTS[path] = module
+    return _SCRIPTS[path]
+
+
+def _project_result(trades, equity, final_value):
+    return {'trades': trades.rows(), 'equity': None if equity is None else np.asarray(equity, dtype=np.float64),
+            'final_value': float(final_value)}
+
+
+def _run_simple_backtest_fixed(df):
+    engine = _load_script(P0_CROSS_MARKET).SimpleBacktest(df.rename(columns=str.capitalize), SIMPLE_CASH)
+    result = engine.run_fixed_strategy(SIMPLE_FIXED['stop_loss'], SIMPLE_FIXED['position_size'])
+    return _project_result(engine.trades, engine.equity_curve, result['final_value'])
+
+
+def _run_simple_backtest_adaptive(df):
+    engine = _load_script(P0_CROSS_MARKET).SimpleBacktest(df.rename(columns=str.capitalize), SIMPLE_CASH)
+    result = engine.run_adaptive_strategy(**SIMPLE_ADAPTIVE)
+    return _project_result(engine.trades, engine.equity_curve, result['final_value'])
+
+
+def _run_simple_strategy(df):
+    strategy = _load_script(P0_PER_MARKET).SimpleStrategy(df.rename(columns=str.capitalize),
+                                                            initial_cash=SIMPLE_CASH, **SIMPLE_FIXED)
+    result = strategy.run()
+    return _project_result(result['trades'], result['equity'], result['final_value'])
+
+
+def _run_hard_coded(df):
+    result = _load_script(BASELINE).HardCodedAdaptiveStrategy().backtest(df, HARD_CODED_COMMISSION)
+    return _project_result(result['trades'], result['equity_curve'], result['final_equity'])
+
+
+def _run_hard_coded_stream(df):
+    chunks = (df.iloc[i:i + STREAM_CHUNKSIZE] for i in range(0, len(df), STREAM_CHUNKSIZE))
+    result = _load_script(BASELINE).HardCodedAdaptiveStrategy().backtest_stream(chunks, HARD_CODED_COMMISSION)
+    return _project_result(result['trades'], None, result['final_equity'])
+
+
+def _reference_simple(df, sma, adaptive=False, require_cash=False, record_all=False):
+    """
+    SimpleBacktest / SimpleStrategy 改写前的逐K线循环 (收盘价成交, 无手续费)
+
+    adaptive     ATR风险仓位 + ATR止损 (run_adaptive_strategy), 否则固定仓位 + 固定亏损金额止损
+    require_cash 固定仓位买入前检查现金 (SimpleStrategy)
+    record_all   权益记录全部K线 (SimpleStrategy), 否则从第50根起 (自适应时跳过ATR为NaN的K线)
+    """
+    close = df['close'].to_numpy(dtype=np.float64)
+    arrays = {f: df[f].to_numpy(dtype=np.float64) for f in ('high', 'low', 'close')}
+    fast, slow = sma(df, 20), sma(df, 50)
+    atr = compute_feature('atr', arrays, [14], kind='simple')[0]
+
+    cash, position, entry_price = float(SIMPLE_CASH), 0, 0.0
+    trades = []
+    equity = [cash] * min(50, len(close)) if record_all else []
+    for i in range(50, len(close)):
+        price = close[i]
+        if adaptive and np.isnan(atr[i]):
+            continue
+
+        # Entry: Golden Cross
+        if fast[i] > slow[i] and fast[i - 1] <= slow[i - 1] and position == 0:
+            if adaptive:
+                stop_distance = atr[i] * SIMPLE_ADAPTIVE['atr_multiplier']
+                size = int(cash * SIMPLE_ADAPTIVE['risk_percent'] / stop_distance) if stop_distance > 0 else 0
+                affordable = size > 0 and size * price <= cash
+            else:
+                size = SIMPLE_FIXED['position_size']
+                affordable = not require_cash or cash >= price * size
+            if affordable:
+                position, entry_price = size, price
+                cash -= size * price
+                trades.append({'bar': i, 'type': 'buy', 'price': price, 'size': size})
+
+        # Exit: Death Cross, 然后止损 (死叉平仓后止损仍会被检查)
+        if position > 0:
+            if fast[i] < slow[i] and fast[i - 1] >= slow[i - 1]:
+                cash += position * price
+                trades.append({'bar': i, 'type': 'sell', 'price': price, 'size': position})
+                position = 0
+            if adaptive:
+                stopped = price < entry_price - atr[i] * SIMPLE_ADAPTIVE['atr_multiplier']
+            else:
+                stopped = (entry_price - price) * position > SIMPLE_FIXED['stop_loss']
+            if stopped:
+                cash += position * price
+                trades.append({'bar': i, 'type': 'stop', 'price': price, 'size': position})
+                position = 0
+
+        equity.append(cash + position * price)
+
+    return {'trades': fills_log(trades, df.index).rows(), 'equity': np.asarray(equity, dtype=np.float64),
+            'final_value': cash + position * close[-1]}
+
+
+def _sma_feature(df, period):
+    """SimpleBacktest.calculate_sma: 特征库 kind='simple'"""
+    return compute_feature('sma', {'close': df['close'].to_numpy(dtype=np.float64)}, [period], kind='simple')[0]
+
+
+def _sma_pandas(df, period):
+    """SimpleStrategy.calculate_sma: pandas rolling mean"""
+    return df['close'].rolling(window=period).mean().to_numpy()
+
+
+def _reference_hard_coded(df):
+    """HardCodedAdaptiveStrategy 改写前的 backtest: 整段指标 + 逐K线 _on_bar"""
+    strategy = _load_script(BASELINE).HardCodedAdaptiveStrategy()
+    signals = strategy.generate_signals(df)
+    strategy._reset()
+    equity = [strategy._on_bar(close, atr, sma_fast, signal, HARD_CODED_COMMISSION)
+              for close, atr, sma_fast, signal in zip(signals['close'].values, signals['atr'].values,
+                                                      signals['sma_fast'].values, signals['signal'].values)]
+    if strategy.position > 0:
+        strategy._close_position(signals['close'].values[-1], HARD_CODED_COMMISSION, 'end_of_period')
+    return {'trades': strategy.trades.rows(), 'equity': np.asarray(equity, dtype=np.float64),
+            'final_value': float(strategy.cash)}
+
+
+# 入口名: (脚本, 真实入口, 参照)
+PROJECT_ENGINES = {
+    'simple_backtest_fixed': (P0_CROSS_MARKET, _run_simple_backtest_fixed,
+                              lambda df: _reference_simple(df, _sma_feature)),
+    'simple_backtest_adaptive': (P0_CROSS_MARKET, _run_simple_backtest_adaptive,
+                                 lambda df: _reference_simple(df, _sma_feature, adaptive=True)),
+    'simple_strategy': (P0_PER_MARKET, _run_simple_strategy,
+                        lambda df: _reference_simple(df, _sma_pandas, require_cash=True, record_all=True)),
+    'hard_coded': (BASELINE, _run_hard_coded, _reference_hard_coded),
+    'hard_coded_stream': (BASELINE, _run_hard_coded_stream, _reference_hard_coded),
+}
+
+
+def available_projects():
+    return [name for name, (script, _, _) in PROJECT_ENGINES.items() if _load_script(script) is not None]
+
+
+def run_project(name, df):
+    """
+    df: 小写 open/high/low/close/volume 列 + DatetimeIndex
+
+    Returns:
+        (ref, ours): 参照循环与真实入口的结果
+    """
+    _, entry, reference = PROJECT_ENGINES[name]
+    return reference(df), entry(df)
+
+
+# =============================================================================
+# 比对
+# =============================================================================
+
+def diff_runs(ref, other, price_rtol=1e-9, equity_rtol=1e-6):
+    """
+    Returns:
+        (problems, deviation): problems 为差异描述列表 (空表示一致),
+        deviation 为非成交K线上权益的最大相对偏差
+    """
+    problems = []
+    ref_fills, other_fills = ref['fills'], other['fills']
+    if len(ref_fills) != len(other_fills):
+        problems.append(f"成交笔数 {len(other_fills)} vs {len(ref_fills)}")
+    for a, b in zip(other_fills, ref_fills):
+        if (a[0], a[1]) != (b[0], b[1]):
+            problems.append(f"首个不同成交: bar {a[0]} size {a[1]} vs bar {b[0]} size {b[1]}")
+            break
+        if not math.isclose(a[2], b[2], rel_tol=price_rtol):
+            problems.append(f"bar {a[0]} 成交价 {a[2]!r} vs {b[2]!r}")
+            break
+    else:
+        common = min(len(ref_fills), len(other_fills))
+        extra = (other_fills if len(other_fills) > common else ref_fills)[common:]
+        if extra:
+            side = '本引擎' if len(other_fills) > common else 'backtrader'
+            last = ' (末根K线信号)' if extra[0][0] == len(ref['equity']) - 1 else ''
+            problems.append(f"{side}多出成交: bar {extra[0][0]} size {extra[0][1]}{last}")
+
+    ref_equity, other_equity = ref['equity'], other['equity']
+    if len(ref_equity) != len(other_equity):
+        problems.append(f"权益曲线长度 {len(other_equity)} vs {len(ref_equity)}")
+        return problems, float('nan')
+
+    settled = np.ones(len(ref_equity), dtype=bool)
+    settled[[f[0] for f in ref_fills + other_fills]] = False
+    deviation = np.zeros(len(ref_equity))
+    deviation[settled] = np.abs(other_equity[settled] - ref_equity[settled]) / np.abs(ref_equity[settled])
+    worst = int(np.argmax(deviation)) if len(deviation) else 0
+    max_deviation = float(deviation[worst]) if len(deviation) else 0.0
+    if max_deviation > equity_rtol:
+        problems.append(f"权益偏差 {max_deviation:.2e} (bar {worst}: {other_equity[worst]:.2f} vs {ref_equity[worst]:.2f})")
+    return problems, max_deviation
+
+
+def _same_value(a, b, rtol):
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=rtol) or (math.isnan(a) and math.isnan(b))
+    return a == b
+
+
+def diff_project(ref, other, price_rtol=1e-9, equity_rtol=1e-6):
+    """
+    项目入口 vs 参照循环: 逐笔成交/平仓行 (浮点字段在 price_rtol 内, 其余完全一致)、最终价值、
+    权益曲线 (入口不保留权益曲线时只比最终价值, 如 backtest_stream)
+
+    Returns:
+        (problems, deviation): deviation 为最终价值与权益曲线的最大相对偏差
+    """
+    problems = []
+    ref_trades, other_trades = ref['trades'], other['trades']
+    if len(ref_trades) != len(other_trades):
+        problems.append(f"成交笔数 {len(other_trades)} vs {len(ref_trades)}")
+    for k, (a, b) in enumerate(zip(other_trades, ref_trades)):
+        different = [f for f in b if not _same_value(a[f], b[f], price_rtol)]
+        if different:
+            problems.append(f"首个不同成交: 第{k}笔 " + ', '.join(f"{f} {a[f]!r} vs {b[f]!r}" for f in different))
+            break
+
+    deviation = abs(other['final_value'] - ref['final_value']) / abs(ref['final_value'])
+    if deviation > equity_rtol:
+        problems.append(f"最终价值 {other['final_value']:.2f} vs {ref['final_value']:.2f}")
+
+    if other['equity'] is not None:
+        ref_equity, other_equity = ref['equity'], other['equity']
+        if len(ref_equity) != len(other_equity):
+            problems.append(f"权益曲线长度 {len(other_equity)} vs {len(ref_equity)}")
+            return problems, float('nan')
+        if len(ref_equity):
+            curve = np.abs(other_equity - ref_equity) / np.abs(ref_equity)
+            worst = int(np.argmax(curve))
+            if curve[worst] > equity_rtol:
+                problems.append(f"权益偏差 {curve[worst]:.2e} (bar {worst}: {other_equity[worst]:.2f} "
+                                f"vs {ref_equity[worst]:.2f})")
+            deviation = max(deviation, float(curve[worst]))
+    return problems, float(deviation)
+
+
+# =============================================================================
+# 差分测试 + 性能记录
+# =============================================================================
+
+def _datasets(symbols=None, start=None, end=None, data_dir=None, min_bars=100):
+    """(symbol, df): 数据目录下全部CSV的清洗后历史 (可按窗口截取)"""
+    from data_quality import load_clean_history
+    from price_store import DATA_DIR
+
+    for csv_path in sorted(Path(data_dir or DATA_DIR).glob('*.csv')):
+        if symbols and csv_path.stem not in symbols:
+            continue
+        df = load_clean_history(csv_path).window(start, end)
+        if len(df) >= min_bars:
+            yield csv_path.stem, df
+
+
+def _measure(engine, df, strategy, convention, commission, repeat):
+    """一次 tracemalloc 运行 (结果 + 峰值内存) + repeat 次计时运行"""
+    tracemalloc.start()
+    result = run_engine(engine, df, strategy, convention, commission=commission)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        run_engine(engine, df, strategy, convention, commission=commission)
+    seconds = (time.perf_counter() - t0) / repeat
+    return result, seconds, peak
+
+
+def run_harness(engines=None, strategies=None, conventions=CONVENTIONS, symbols=None, start=None, end=None,
+                commission=0.0015, repeat=1, price_rtol=1e-9, equity_rtol=1e-6, data_dir=None, projects=None):
+    """
+    projects: 比对的项目入口 (None 为全部可用入口, 空列表不比对)
+
+    Returns:
+        dict: cases (每个 数据集 × 策略 × 口径 × 引擎 的比对结果) / perf (各引擎汇总) /
+              projects (每个 数据集 × 项目入口 的比对结果)
+    """
+    engines = [e for e in (engines or available_engines()) if e in available_engines()]
+    projects = [p for p in (available_projects() if projects is None else projects) if p in available_projects()]
+    if REFERENCE not in engines:
+        engines.insert(0, REFERENCE)
+    strategies = strategies or list(CANONICAL)
+
+    cases, project_cases = [], []
+    perf = {e: {'runs': 0, 'bars': 0, 'seconds': 0.0, 'peak_bytes': 0} for e in engines}
+    for symbol, df in _datasets(symbols, start, end, data_dir):
+        for strategy in strategies:
+            for convention in conventions:
+                ref = None
+                for engine in engines:
+                    if not supports(engine, convention):
+                        continue
+                    result, seconds, peak = _measure(engine, df, strategy, convention, commission, repeat)
+                    stats = perf[engine]
+                    stats['runs'] += 1
+                    stats['bars'] += len(df)
+                    stats['seconds'] += seconds
+                    stats['peak_bytes'] = max(stats['peak_bytes'], peak)
+                    if engine == REFERENCE:
+                        ref = result
+                        continue
+                    problems, deviation = diff_runs(ref, result, price_rtol, equity_rtol)
+                    cases.append({'symbol': symbol, 'strategy': strategy, 'convention': convention,
+                                  'engine': engine, 'bars': len(df), 'fills': len(result['fills']),
+                                  'ref_fills': len(ref['fills']), 'max_equity_deviation': deviation,
+                                  'problems': problems})
+                    if problems:
+                        print(f"  MISMATCH {symbol} {strategy} {convention} {engine}: {'; '.join(problems)}")
+
+        for project in projects:
+            ref, result = run_project(project, df)
+            problems, deviation = diff_project(ref, result, price_rtol, equity_rtol)
+            project_cases.append({'symbol': symbol, 'project': project, 'bars': len(df),
+                                  'trades': len(result['trades']), 'ref_trades': len(ref['trades']),
+                                  'max_equity_deviation': deviation, 'problems': problems})
+            if problems:
+                print(f"  MISMATCH {symbol} {project}: {'; '.join(problems)}")
+
+    for stats in perf.values():
+        stats['bars_per_sec'] = stats['bars'] / stats['seconds'] if stats['seconds'] else 0.0
+        stats['peak_mb'] = stats['peak_bytes'] / 1024 / 1024
+    return {'cases': cases, 'perf': perf, 'projects': project_cases}
+
+
+def print_report(report):
+    cases, perf = report['cases'], report['perf']
+
+    print(f"\n{'引擎':<12} {'口径':<10} {'一致':>9} {'最大权益偏差':>14}")
+    print('-' * 50)
+    for engine in perf:
+        for convention in CONVENTIONS:
+            rows = [c for c in cases if c['engine'] == engine and c['convention'] == convention]
+            if not rows:
+                continue
+            same = sum(1 for c in rows if not c['problems'])
+            deviation = np.nanmax([c['max_equity_deviation'] for c in rows])
+            print(f"{engine:<12} {convention:<10} {same:>4}/{len(rows):<4} {deviation:>14.2e}")
+
+    fastest = min(perf, key=lambda e: perf[e]['seconds'])
+    print(f"\n{'引擎':<12} {'运行次数':>8} {'K线数':>9} {'耗时(s)':>9} {'bars/sec':>11} {'峰值内存(MB)':>13} {'相对最快':>9}")
+    print('-' * 78)
+    for engine, s in perf.items():
+        print(f"{engine:<12} {s['runs']:>8} {s['bars']:>9} {s['seconds']:>9.2f} {s['bars_per_sec']:>11.0f} "
+              f"{s['peak_mb']:>13.2f} {s['seconds'] / perf[fastest]['seconds']:>8.1f}x")
+
+    projects = report.get('projects') or []
+    if projects:
+        print(f"\n{'项目入口 (vs 参照循环)':<26} {'一致':>9} {'最大权益偏差':>14}")
+        print('-' * 52)
+        for project in PROJECT_ENGINES:
+            rows = [c for c in projects if c['project'] == project]
+            if not rows:
+                continue
+            same = sum(1 for c in rows if not c['problems'])
+            deviation = np.nanmax([c['max_equity_deviation'] for c in rows])
+            print(f"{project:<26} {same:>4}/{len(rows):<4} {deviation:>14.2e}")
+
+
+# =============================================================================
+# 命令行
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='跨引擎差分测试: 规范策略 × 数据集 × 引擎')
+    parser.add_argument('--engine', action='append', choices=ENGINES, help='只运行指定引擎 (可重复, 始终包含backtrader)')
+    parser.add_argument('--strategy', action='append', choices=list(CANONICAL), help='只运行指定规范策略 (可重复)')
+    parser.add_argument('--convention', action='append', choices=CONVENTIONS, help='只运行指定撮合口径 (可重复)')
+    parser.add_argument('--project', action='append', choices=list(PROJECT_ENGINES),
+                        help='只比对指定项目入口 (可重复, 默认全部可用入口)')
+    parser.add_argument('--no-project', action='store_true', help='不比对项目入口')
+    parser.add_argument('--symbol', action='append', help='只运行指定数据集 (文件名去掉.csv, 可重复)')
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--commission', type=float, default=0.0015)
+    parser.add_argument('--repeat', type=int, default=1, help='计时重复次数')
+    parser.add_argument('--price-rtol', type=float, default=1e-9)
+    parser.add_argument('--equity-rtol', type=float, default=1e-6)
+    parser.add_argument('--data-dir', default=None, help='CSV数据目录 (默认 backtest_data_extended)')
+    parser.add_argument('--json', default=None, help='把比对结果与性能数据写入JSON文件')
+    args = parser.parse_args()
+
+    print('=' * 80)
+    print('Cross-engine Differential Test')
+    print('=' * 80)
+    skipped = [e for e in ENGINES if e not in available_engines()] + \
+              [p for p in PROJECT_ENGINES if p not in available_projects()]
+    if skipped:
+        print(f"依赖未安装, 跳过: {', '.join(skipped)}")
+
+    report = run_harness(args.engine, args.strategy, tuple(args.convention or CONVENTIONS), args.symbol,
+                         args.start, args.end, args.commission, args.repeat, args.price_rtol,
+                         args.equity_rtol, args.data_dir, [] if args.no_project else args.project)
+    print_report(report)
+
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存: {args.json}")
+
+    bad = sum(1 for c in report['cases'] + report['projects'] if c['problems'])
+    sys.exit(1 if bad else 0)
@@ -19,6 +19,11 @@ from eoh_core.prompts import PromptLibrary, PromptStyle
 from eoh_core.llm import LocalHFClient, extract_code_blocks
 from eoh_core.utils import ensure_dir, log
 
+from date_index import WindowedFrame
+from feature_store import compute as compute_feature
+from frame_cache import FrameCache, file_mtime
+from price_loader import load_prices as read_price_csv
+
 try:
     import yfinance as yf
     _HAS_YF = True
@@ -43,6 +48,8 @@ def get_args():
     ap.add_argument("--seed", type=int, default=42)
     ap.add_argument("--prompt-style", default="normal")
     ap.add_argument("--prompt-dir", default="prompts")
+    ap.add_argument("--price-cache-dir", default="./price_cache/frames")
+    ap.add_argument("--price-cache-mb", type=float, default=512)
     return ap.parse_args()
 
 
@@ -54,14 +61,8 @@ def load_local_csv(symbol: str, start: str, end: str) -> Optional[pd.DataFrame]:
     # 优先尝试通用数据文件（Day 15 手动上传的固定范围数据）
     generic_fp = Path(f"/root/autodl-tmp/data/{symbol}_2020_2023.csv")
     if generic_fp.exists():
-        # yfinance CSV 有多级表头，需要特殊处理
-        df = pd.read_csv(generic_fp, header=[0, 1], index_col=0, parse_dates=True).sort_index()
-        # 展平多级列名
-        df.columns = [col[0] for col in df.columns]
-        # 过滤到所需日期范围
-        start_dt = pd.to_datetime(start)
-        end_dt = pd.to_datetime(end)
-        df = df.loc[(df.index >= start_dt) & (df.index <= end_dt)]
+        # yfinance 多级表头由统一读取器识别, 列名规范为小写 (load_splits 再转为 Backtesting.py 的大写)
+        df = WindowedFrame(read_price_csv(generic_fp)).window(start, end)
         log(f"[INFO] loaded from generic CSV: {generic_fp} rows={len(df)}")
         if len(df) > 0:
             return df
@@ -69,7 +70,7 @@ def load_local_csv(symbol: str, start: str, end: str) -> Optional[pd.DataFrame]:
     # 回退到原始 cache 方式（保持向后兼容）
     cache_fp = Path(f"./price_cache/{symbol}_{start}_{end}.csv")
     if cache_fp.exists():
-        df = pd.read_csv(cache_fp, index_col=0, parse_dates=True).sort_index()
+        df = read_price_csv(cache_fp)
         log(f"[INFO] local CSV hit: {cache_fp} rows={len(df)}")
         return df
     
@@ -97,28 +98,46 @@ def load_prices(symbol: str, start: str, end: str) -> pd.DataFrame:
     raise RuntimeError("no price data")
 
 
-def slice_df(df: pd.DataFrame, start: str, end: str) -> pd.DataFrame:
-    df = df.loc[(df.index >= pd.to_datetime(start)) & (df.index <= pd.to_datetime(end))].copy()
-    # Fix column names for Backtesting.py
-    df.columns = [col.capitalize() for col in df.columns]
-    return df
+# Normalized train/test frames, shared by every launch (symbol/prompt-style/temperature runs)
+PRICE_CACHE = FrameCache()
+
+
+def split_cache_key(symbol: str, train: Tuple[str, str], test: Tuple[str, str]) -> tuple:
+    # Source files in load_local_csv order; yfinance-only data is refreshed daily
+    span_start, span_end = min(train[0], test[0]), max(train[1], test[1])
+    sources = (
+        file_mtime(f"/root/autodl-tmp/data/{symbol}_2020_2023.csv"),
+        file_mtime(f"./price_cache/{symbol}_{span_start}_{span_end}.csv"),
+    )
+    if sources == (None, None):
+        sources = ("yfinance", pd.Timestamp.today().strftime("%Y-%m-%d"))
+    return ("eoh_split", symbol, tuple(train), tuple(test), sources)
+
+
+def load_splits(symbol: str, train: Tuple[str, str], test: Tuple[str, str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    key = split_cache_key(symbol, train, test)
+    cached = PRICE_CACHE.get(key)
+    if cached is not None:
+        log(f"[CACHE] price split hit: {symbol} train={train} test={test}")
+        return cached
+
+    df_all = load_prices(symbol, min(train[0], test[0]), max(train[1], test[1]))
+    # Capitalize once for Backtesting.py; train/test are O(log n) searchsorted views
+    history = WindowedFrame(df_all.rename(columns=str.capitalize))
+    splits = (history.window(*train), history.window(*test))
+    PRICE_CACHE.put(key, splits)
+    log(f"[CACHE] price split miss: {symbol} train={train} test={test}")
+    return splits
 
 
 def SMA(series, n=10):
-    s = pd.Series(series, copy=False)
-    return s.rolling(int(n)).mean().to_numpy()
+    # rolling mean, shared kernel with feature_store (kind='simple')
+    return compute_feature('sma', {'close': series}, [int(n)], kind='simple')[0]
 
 
 def RSI(series, n=14):
-    s = pd.Series(series, copy=False).astype(float)
-    delta = s.diff()
-    up = delta.clip(lower=0.0)
-    down = (-delta).clip(lower=0.0)
-    roll_up = up.rolling(int(n)).mean()
-    roll_down = down.rolling(int(n)).mean()
-    rs = roll_up / (roll_down.replace(0, np.nan) + 1e-12)
-    rsi = 100 - (100 / (1 + rs))
-    return rsi.fillna(50.0).to_numpy()
+    # rolling-mean RSI, NaN filled with 50 (feature_store kind='simple')
+    return compute_feature('rsi', {'close': series}, [int(n)], kind='simple')[0]
 
 
 def crossover(a, b):
@@ -278,13 +297,13 @@ def main():
             }
         )
 
-    span_start = min(args.train_start, args.test_start)
-    span_end = max(args.train_end, args.test_end)
-    df_all = load_prices(args.symbol, span_start, span_end)
-    
-    df_train = slice_df(df_all, args.train_start, args.train_end)
-    df_test = slice_df(df_all, args.test_start, args.test_end)
+    PRICE_CACHE.cache_dir = Path(args.price_cache_dir).expanduser()
+    PRICE_CACHE.max_disk_bytes = int(args.price_cache_mb * 1024 * 1024)
+    df_train, df_test = load_splits(
+        args.symbol, (args.train_start, args.train_end), (args.test_start, args.test_end)
+    )
     log(f"[INFO] split: train={len(df_train)} test={len(df_test)}")
+    log(f"[CACHE] {PRICE_CACHE.summary()}")
 
     tokenizer = AutoTokenizer.from_pretrained(args.model_dir, use_fast=True, trust_remote_code=True)
     model = AutoModelForCausalLM.from_pretrained(
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+权益曲线与交易记录器 (Equity Recorder)
+======================================
+
+功能: 各回测脚本为每次运行挂 SharpeRatio / DrawDown / TradeAnalyzer (有时还有 Returns) 分析器,
+      结果四舍五入进JSON后原始数据就丢了, 以后想算一个新指标只能全部重跑。本模块提供:
+
+    - EquityRecorder: 一个backtrader分析器, 每根K线只追加 (时间, 账户价值, 现金, 持仓) 四个数,
+                      另记录每笔成交和每笔平仓交易; get_analysis() 返回紧凑的numpy数组 (record)
+    - save_records / load_records: 把一个脚本的全部 record 存成一个 .npz, 之后用 perf_metrics
+                      直接在数组上计算任意指标, 不需要重新回测
+
+record 字段:
+    date / equity / cash / position              (T,)  每根K线收盘后 (与分析器看到的账户价值相同)
+    fill_date / fill_size / fill_price / fill_commission      每笔成交 (Completed订单)
+    trade_open / trade_close / trade_bars / trade_pnl / trade_pnlcomm    每笔平仓交易
+    initial_cash                                  标量
+
+使用方法:
+    from equity_recorder import RECORDER, save_records, load_records
+    runs = run_strategies(df, strategies, analyzers=(RECORDER,))
+    save_records('outputs/xxx_records.npz', {('SPY', 'test', 'SMA'): runs['SMA']['record']})
+
+    from perf_metrics import compute_metrics
+    for key, record in load_records('outputs/xxx_records.npz').items():
+        print(key, compute_metrics(record))
+"""
+
+import json
+from pathlib import Path
+
+import backtrader as bt
+import numpy as np
+
+
+# =============================================================================
+# 分析器
+# =============================================================================
+
+def num2datetime64(nums):
+    """backtrader的日期数 (公历序数, 0001-01-01 为 1.0) → datetime64[ns]"""
+    nums = np.asarray(nums, dtype=np.float64)
+    micros = np.round((nums - 1.0) * 86400e6).astype(np.int64)
+    return (np.datetime64('0001-01-01T00:00:00', 'us') + micros.astype('timedelta64[us]')).astype('datetime64[ns]')
+
+
+class EquityRecorder(bt.Analyzer):
+    """记录第一个数据源上的账户价值序列、成交与平仓交易"""
+
+    def start(self):
+        self._dt, self._value, self._cash, self._position = [], [], [], []
+        self._fills = []
+        self._trades = []
+        self._fund = (self.strategy.broker.getcash(), self.strategy.broker.getvalue())
+        self._initial = self._fund[1]
+        self._record = None
+
+    def notify_fund(self, cash, value, fundvalue, shares):
+        # 与 TimeReturn / DrawDown 相同: 使用broker通知的账户价值, 不在next中重新计算
+        self._fund = (cash, value)
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self._fills.append((self.data.datetime[0], order.executed.size,
+                                order.executed.price, order.executed.comm))
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self._trades.append((trade.dtopen, trade.dtclose, trade.barlen, trade.pnl, trade.pnlcomm))
+
+    def next(self):
+        self._dt.append(self.data.datetime[0])
+        self._cash.append(self._fund[0])
+        self._value.append(self._fund[1])
+        self._position.append(self.strategy.position.size)
+
+    def stop(self):
+        fills = np.array(self._fills, dtype=np.float64).reshape(-1, 4)
+        trades = np.array(self._trades, dtype=np.float64).reshape(-1, 5)
+        self._record = {
+            'date': num2datetime64(self._dt),
+            'equity': np.array(self._value, dtype=np.float64),
+            'cash': np.array(self._cash, dtype=np.float64),
+            'position': np.array(self._position, dtype=np.float64),
+            'fill_date': num2datetime64(fills[:, 0]),
+            'fill_size': fills[:, 1],
+            'fill_price': fills[:, 2],
+            'fill_commission': fills[:, 3],
+            'trade_open': num2datetime64(trades[:, 0]),
+            'trade_close': num2datetime64(trades[:, 1]),
+            'trade_bars': trades[:, 2].astype(np.int64),
+            'trade_pnl': trades[:, 3],
+            'trade_pnlcomm': trades[:, 4],
+            'initial_cash': np.float64(self._initial),
+        }
+
+    def get_analysis(self):
+        return self._record
+
+
+RECORDER = ('record', EquityRecorder, {})
+
+
+# =============================================================================
+# 持久化
+# =============================================================================
+
+def save_records(path, records):
+    """
+    {key: record} → 一个 .npz (key 为字符串或元组, 读回时还原)
+
+    数组名为 "<序号>/<字段>", 另存一个 __keys__ (JSON) 记录序号与key的对应
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    arrays = {}
+    keys = []
+    for i, (key, record) in enumerate(records.items()):
+        if record is None:
+            continue
+        keys.append([i, list(key) if isinstance(key, tuple) else key])
+        for field, value in record.items():
+            arrays[f'{i}/{field}'] = np.asarray(value)
+    arrays['__keys__'] = np.array(json.dumps(keys, ensure_ascii=False))
+    np.savez_compressed(path, **arrays)
+    return path
+
+
+def load_records(path):
+    """save_records 的逆操作: {key: record}"""
+    with np.load(path) as data:
+        records = {}
+        for i, key in json.loads(str(data['__keys__'])):
+            prefix = f'{i}/'
+            record = {name[len(prefix):]: data[name] for name in data.files if name.startswith(prefix)}
+            if 'initial_cash' in record:
+                record['initial_cash'] = np.float64(record['initial_cash'])
+            records[tuple(key) if isinstance(key, list) else key] = record
+    return records
@@ -12,6 +12,8 @@ from datetime import datetime
 import json
 from tqdm import tqdm
 
+from price_store import load_ohlcv
+
 # ========== 配置 ==========
 DATA_DIR = Path("/root/autodl-tmp/eoh/backtest_data_extended")
 OUTPUT_DIR = Path("/root/autodl-tmp/eoh/experiment10_industry_adaptive")
@@ -170,12 +172,8 @@ class TrendFollowingStrategy(bt.Strategy):
 # ========== 回测函数 ==========
 
 def load_data(file_path):
-    """加载数据"""
-    df = pd.read_csv(file_path)
-    df['date'] = pd.to_datetime(df['date'])
-    df.set_index('date', inplace=True)
-    df = df[['open', 'high', 'low', 'close', 'volume']]
-    return df
+    """加载数据 (列式存储, 首次读取时自动ingest)"""
+    return load_ohlcv(file_path)
 
 
 def run_backtest(strategy_class, params, data, stock_info):
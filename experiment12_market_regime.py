@@ -12,6 +12,9 @@ from datetime import datetime
 import json
 from tqdm import tqdm
 
+from date_index import WindowedFrame
+from price_store import load_ohlcv
+
 # ========== 配置 ==========
 DATA_DIR = Path("/root/autodl-tmp/eoh/backtest_data_extended")
 OUTPUT_DIR = Path("/root/autodl-tmp/eoh/experiment12_market_regime")
@@ -168,20 +171,14 @@ class TrendFollowingStrategy(bt.Strategy):
 # ========== 回测函数 ==========
 
 def load_data(file_path):
-    """加载数据"""
-    df = pd.read_csv(file_path)
-    df['date'] = pd.to_datetime(df['date'])
-    df.set_index('date', inplace=True)
-    df = df[['open', 'high', 'low', 'close', 'volume']]
-    return df
+    """加载数据 (列式存储, 首次读取时自动ingest)"""
+    return load_ohlcv(file_path)
 
 
 def filter_data_by_regime(data, regime_periods):
     """根据市场环境筛选数据"""
-    filtered_dfs = []
-    for start_date, end_date in regime_periods:
-        mask = (data.index >= start_date) & (data.index <= end_date)
-        filtered_dfs.append(data[mask])
+    # 二分查找取各区间视图, 不再为每个区间扫描完整历史
+    filtered_dfs = WindowedFrame(data).windows(regime_periods)
 
     if filtered_dfs:
         return pd.concat(filtered_dfs)
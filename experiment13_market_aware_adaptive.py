@@ -20,6 +20,8 @@ from pathlib import Path
 from datetime import datetime
 import json
 from tqdm import tqdm
+
+from price_store import load_ohlcv
 import sys
 
 # 导入市场环境识别模块
@@ -188,12 +190,8 @@ class TrendFollowingStrategy(bt.Strategy):
 # ========== 回测函数 ==========
 
 def load_data(file_path):
-    """加载数据"""
-    df = pd.read_csv(file_path)
-    df['date'] = pd.to_datetime(df['date'])
-    df.set_index('date', inplace=True)
-    df = df[['open', 'high', 'low', 'close', 'volume']]
-    return df
+    """加载数据 (列式存储, 首次读取时自动ingest)"""
+    return load_ohlcv(file_path)
 
 
 def run_backtest(strategy_class, params, data, stock_name, strategy_name):
@@ -10,8 +10,17 @@ from pathlib import Path
 from datetime import datetime
 import json
 import itertools
+import copy
+from functools import partial
 from tqdm import tqdm
 
+from adaptive_engine import resolve_rules, simulate_batch
+from feature_store import StoredFeature
+from price_store import load_ohlcv
+from sweep_executor import collect
+from adaptive_optimizer import optimize
+from pruning import add_pruner, pruner_fields, record, prune_summary, format_summary
+
 # ========== 配置 ==========
 DATA_FILE = Path("/root/autodl-tmp/eoh/backtest_data_extended/stock_sh_600519.csv")
 OUTPUT_DIR = Path("/root/autodl-tmp/eoh/experiment8_parameter_optimization")
@@ -20,6 +29,19 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 INITIAL_CASH = 100000.0
 COMMISSION = 0.001
 
+# 逐组合Cerebro的网格分发到进程池 (None 为全部可用CPU, 1 为当前进程串行)
+WORKERS = None
+
+# 搜索方式: 'grid' 穷举全部组合; 'adaptive' 逐级减半 + 代理模型, 最多 SEARCH_BUDGET 次回测
+# (None 为网格的10%, 至少20次); 批量数组引擎的网格始终穷举
+SEARCH_MODE = 'grid'
+SEARCH_BUDGET = None
+
+# 逐组合网格的提前剪枝规则 (pruning.py), 如 [DrawdownCeiling(50), NoTradesBy(250), FitnessBound(k=10)];
+# 被剪的组合标记 pruned 且不参与排序; None 不剪枝。只作用于 SEARCH_MODE='grid' 的逐组合Cerebro,
+# 批量数组引擎与自适应搜索不剪枝
+PRUNING = None
+
 # ========== 参数搜索空间 ==========
 
 PARAM_SPACES = {
@@ -54,6 +76,20 @@ PARAM_SPACES = {
     }
 }
 
+# 属于自适应策略族的策略: 整个参数网格由批量数组引擎一次运行 (结果与逐组合Cerebro一致)
+# {策略名: (adaptive_engine预设, {策略参数: 引擎参数})}
+BATCH_ENGINE = {
+    "innovation_triple_fusion": ('triple_fusion', {
+        'fast_ma_period': 'sma_fast',
+        'medium_ma_period': 'sma_medium',
+        'slow_ma_period': 'sma_slow',
+        'rsi_period': 'rsi_period',
+        'atr_period': 'atr_period',
+        'atr_multiple': 'atr_multiplier',
+        'risk_factor': 'risk_percent',
+    }),
+}
+
 # ========== 策略定义 ==========
 
 class TrendFollowingStrategy(bt.Strategy):
@@ -69,8 +105,8 @@ class TrendFollowingStrategy(bt.Strategy):
     def __init__(self):
         self.order = None
         self.dataclose = self.datas[0].close
-        self.sma_short = bt.indicators.SMA(period=self.p.short_window)
-        self.sma_long = bt.indicators.SMA(period=self.p.long_window)
+        self.sma_short = StoredFeature(self.data, feature='sma', period=self.p.short_window)
+        self.sma_long = StoredFeature(self.data, feature='sma', period=self.p.long_window)
 
     def next(self):
         if self.position:
@@ -98,7 +134,7 @@ class VolatilityBreakoutStrategy016(bt.Strategy):
         self.data_close = self.datas[0].close
         self.data_high = self.datas[0].high
         self.data_low = self.datas[0].low
-        self.data_atr = bt.indicators.AverageTrueRange(self.data, period=self.p.maperiod)
+        self.data_atr = StoredFeature(self.data, feature='atr', period=self.p.maperiod)
 
         self.stop_loss_price = None
         self.take_profit_price = None
@@ -140,9 +176,9 @@ class VolatilityBreakoutStrategy022(bt.Strategy):
 
     def __init__(self):
         self.data_close = self.datas[0].close
-        self.fast_ma = bt.indicators.SMA(self.data.close, period=self.params.fast_ma_period)
-        self.slow_ma = bt.indicators.SMA(self.data.close, period=self.params.slow_ma_period)
-        self.atr = bt.indicators.ATR(self.data, period=self.params.atr_period)
+        self.fast_ma = StoredFeature(self.data, feature='sma', period=self.params.fast_ma_period)
+        self.slow_ma = StoredFeature(self.data, feature='sma', period=self.params.slow_ma_period)
+        self.atr = StoredFeature(self.data, feature='atr', period=self.params.atr_period)
         self.order = None
         self.entry_price = None
 
@@ -183,12 +219,12 @@ class AdaptiveMultiFactorStrategy(bt.Strategy):
     )
 
     def __init__(self):
-        from backtrader.indicators import SMA, ATR, RSI
-        self.fast_ma = SMA(self.data.close, period=self.params.fast_ma_period)
-        self.medium_ma = SMA(self.data.close, period=self.params.medium_ma_period)
-        self.slow_ma = SMA(self.data.close, period=self.params.slow_ma_period)
-        self.rsi = RSI(self.data.close, period=self.params.rsi_period)
-        self.atr = ATR(self.data, period=self.params.atr_period)
+        # 指标从特征库查表 (与 bt SMA/RSI/ATR 数值逐位一致)
+        self.fast_ma = StoredFeature(self.data, feature='sma', period=self.params.fast_ma_period)
+        self.medium_ma = StoredFeature(self.data, feature='sma', period=self.params.medium_ma_period)
+        self.slow_ma = StoredFeature(self.data, feature='sma', period=self.params.slow_ma_period)
+        self.rsi = StoredFeature(self.data, feature='rsi', period=self.params.rsi_period)
+        self.atr = StoredFeature(self.data, feature='atr', period=self.params.atr_period)
 
         self.order = None
         self.entry_price = None
@@ -234,22 +270,19 @@ class AdaptiveMultiFactorStrategy(bt.Strategy):
 # ========== 回测函数 ==========
 
 def load_data(file_path):
-    """加载数据"""
-    df = pd.read_csv(file_path)
-    df['date'] = pd.to_datetime(df['date'])
-    df.set_index('date', inplace=True)
-    df = df[['open', 'high', 'low', 'close', 'volume']]
-    return df
+    """加载数据 (列式存储, 首次读取时自动ingest)"""
+    return load_ohlcv(file_path)
 
 
-def run_backtest(strategy_class, params, data):
-    """运行单次回测"""
+def run_backtest(strategy_class, params, data, pruning=None):
+    """运行单次回测 (pruning: 剪枝规则列表, 触发时提前结束并标记 pruned)"""
     try:
         cerebro = bt.Cerebro()
         cerebro.addstrategy(strategy_class, **params)
 
         btdata = bt.feeds.PandasData(dataname=data)
-        cerebro.adddata(btdata)
+        # feed名即特征库的symbol, StoredFeature据此查表
+        cerebro.adddata(btdata, name=DATA_FILE.stem)
 
         cerebro.broker.setcash(INITIAL_CASH)
         cerebro.broker.setcommission(commission=COMMISSION)
@@ -258,6 +291,7 @@ def run_backtest(strategy_class, params, data):
         cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
         cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
         cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
+        add_pruner(cerebro, pruning)
 
         initial = cerebro.broker.getvalue()
         results = cerebro.run()
@@ -277,7 +311,7 @@ def run_backtest(strategy_class, params, data):
         lost = trade_analysis.get('lost', {}).get('total', 0)
         win_rate = (won / (won + lost) * 100) if (won + lost) > 0 else 0
 
-        return {
+        result = {
             "success": True,
             "return_pct": return_pct,
             "sharpe": sharpe,
@@ -286,6 +320,12 @@ def run_backtest(strategy_class, params, data):
             "win_rate": win_rate,
             "params": params
         }
+        # 被剪枝的组合只跑了一部分K线, 指标截至剪枝时, 不参与排序
+        result.update(pruner_fields(strat))
+        if result.get('pruned'):
+            result['success'] = False
+        record(pruning, result)
+        return result
     except Exception as e:
         return {
             "success": False,
@@ -294,8 +334,41 @@ def run_backtest(strategy_class, params, data):
         }
 
 
-def grid_search(strategy_name, strategy_class, param_space, data):
-    """Grid Search参数优化"""
+def evaluate_params(data, params, strategy_class, pruning=None):
+    """进程池中评估一个组合 (sweep_executor 的 evaluate 接口; 每个worker持有自己的一份剪枝规则)"""
+    return run_backtest(strategy_class, params, data, pruning)
+
+
+def run_backtest_batch(strategy_name, param_list, data):
+    """批量运行一个网格的全部组合, 每项与 run_backtest 的返回值相同"""
+    preset, names = BATCH_ENGINE[strategy_name]
+    rules_list = [resolve_rules(preset, **{names[k]: v for k, v in params.items()}) for params in param_list]
+    batch = simulate_batch(data, rules_list, initial_cash=INITIAL_CASH, commission=COMMISSION,
+                           riskfreerate=0.03)
+
+    results = []
+    for i, params in enumerate(param_list):
+        if batch['error'][i]:
+            results.append({"success": False, "error": batch['error'][i], "params": params})
+            continue
+        final = float(batch['final_value'][i])
+        won, lost = int(batch['won_trades'][i]), int(batch['lost_trades'][i])
+        results.append({
+            "success": True,
+            "return_pct": (final - INITIAL_CASH) / INITIAL_CASH * 100,
+            "sharpe": batch['sharpe'][i],
+            "max_drawdown": float(batch['max_drawdown'][i]),
+            "total_trades": int(batch['total_trades'][i]),
+            "win_rate": (won / (won + lost) * 100) if (won + lost) > 0 else 0,
+            "params": params
+        })
+    return results
+
+
+def grid_search(strategy_name, strategy_class, param_space, data, mode=None, budget=None):
+    """Grid Search参数优化 (mode / budget 默认取 SEARCH_MODE / SEARCH_BUDGET)"""
+    mode = mode or SEARCH_MODE
+    budget = budget or SEARCH_BUDGET
     print(f"\n{'='*80}")
     print(f"优化策略: {strategy_name}")
     print(f"{'='*80}")
@@ -309,11 +382,33 @@ def grid_search(strategy_name, strategy_class, param_space, data):
     print(f"参数: {param_names}")
 
     # 运行所有组合
-    results = []
-    for combo in tqdm(param_combinations, desc=f"Grid Search {strategy_name}"):
-        params = dict(zip(param_names, combo))
-        result = run_backtest(strategy_class, params, data)
-        results.append(result)
+    search = None
+    pruning = None
+    if PRUNING and (strategy_name in BATCH_ENGINE or mode != 'grid'):
+        print(f"⚠️  PRUNING 只作用于 grid 模式的逐组合回测, {strategy_name} "
+              f"({'批量数组引擎' if strategy_name in BATCH_ENGINE else f'{mode} 搜索'}) 不剪枝")
+    if strategy_name in BATCH_ENGINE:
+        print(f"批量数组引擎: {len(param_combinations)} 个组合一次运行")
+        results = run_backtest_batch(strategy_name, [dict(zip(param_names, combo)) for combo in param_combinations], data)
+    elif mode == 'grid':
+        # 数据随进程池初始化传给每个worker一次; 进度按完成顺序更新, 结果按组合原顺序排列
+        # 剪枝规则每个策略一份新的 (FitnessBound 的前k名不跨策略)
+        param_list = [dict(zip(param_names, combo)) for combo in param_combinations]
+        pruning = copy.deepcopy(PRUNING)
+        with tqdm(total=len(param_list), desc=f"Grid Search {strategy_name}") as bar:
+            results = collect(partial(evaluate_params, strategy_class=strategy_class, pruning=pruning), param_list,
+                              workers=WORKERS, data=data, progress=bar.update)
+    else:
+        # 只有完整区间上的回测进入结果 (与穷举时的结果dict相同)
+        search = optimize(partial(evaluate_params, strategy_class=strategy_class), param_space, data,
+                          budget=budget, workers=WORKERS)
+        results = search['results']
+        print(f"自适应搜索: {search['backtests']} 次回测 (完整回测当量 {search['full_equivalent']:.1f}), "
+              f"完整区间 {len(results)} 个组合")
+
+    pruned = prune_summary(results) if pruning else None
+    if pruned:
+        print(format_summary(pruned))
 
     # 筛选成功的结果
     successful = [r for r in results if r['success']]
@@ -343,8 +438,11 @@ def grid_search(strategy_name, strategy_class, param_space, data):
         json.dump({
             "strategy": strategy_name,
             "date": datetime.now().isoformat(),
-            "total_combinations": len(results),
+            "search_mode": mode if search else "grid",
+            "total_combinations": len(param_combinations),
+            "backtests": search['backtests'] if search else len(results),
             "successful": len(successful),
+            "pruning": pruned,
             "top_10": successful[:10],
             "all_results": results
         }, f, indent=2, default=str)
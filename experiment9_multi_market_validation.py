@@ -11,6 +11,9 @@ from datetime import datetime
 import json
 from tqdm import tqdm
 
+from price_store import load_ohlcv
+from universe_panel import open_panel
+
 # ========== 配置 ==========
 DATA_DIR = Path("/root/autodl-tmp/eoh/backtest_data_extended")
 OUTPUT_DIR = Path("/root/autodl-tmp/eoh/experiment9_multi_market_validation")
@@ -256,12 +259,8 @@ class AdaptiveMultiFactorStrategy(bt.Strategy):
 # ========== 回测函数 ==========
 
 def load_data(file_path):
-    """加载数据"""
-    df = pd.read_csv(file_path)
-    df['date'] = pd.to_datetime(df['date'])
-    df.set_index('date', inplace=True)
-    df = df[['open', 'high', 'low', 'close', 'volume']]
-    return df
+    """加载数据 (列式存储, 首次读取时自动ingest)"""
+    return load_ohlcv(file_path)
 
 
 def run_backtest(strategy_class, params, data, stock_name):
@@ -325,13 +324,15 @@ def test_strategy_on_all_stocks(strategy_name, strategy_class, params):
     print(f"参数: {params}")
     print(f"{'='*80}")
 
+    # 全部股票共用一份对齐的memmap面板, 不再逐个文件加载
+    panel = open_panel(DATA_DIR)
+
     results = []
     for stock_file in tqdm(STOCK_FILES, desc=f"{strategy_name}"):
-        file_path = DATA_DIR / stock_file
         stock_name = stock_file.replace('.csv', '')
 
         try:
-            data = load_data(file_path)
+            data = panel.frame(stock_name)
             result = run_backtest(strategy_class, params, data, stock_name)
             results.append(result)
         except Exception as e:
@@ -13,12 +13,18 @@ import importlib.util
 import warnings
 warnings.filterwarnings('ignore')
 
+from data_quality import load_clean_history
+from result_cache import ResultCache, cache_key
+
 # 配置
 DATA_DIR = Path('/root/autodl-tmp/eoh/backtest_data_extended')
 STRATEGY_DIR = Path('/root/autodl-tmp/eoh/strategy_library/batch1')
 RESULTS_DIR = Path('/root/autodl-tmp/eoh/backtest_results/extended')
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
+# 回测结果缓存 (策略源码 / 数据内容 / broker设置 不变时直接复用; 失败的回测不缓存)
+RESULT_CACHE = ResultCache()
+
 # 时间段划分
 PERIODS = {
     'full': ('2010-01-01', '2025-11-21'),      # 全周期
@@ -28,26 +34,9 @@ PERIODS = {
 }
 
 def load_data(csv_path: Path, start_date: str = None, end_date: str = None) -> pd.DataFrame:
-    """加载并预处理数据"""
-    df = pd.read_csv(csv_path)
-    df['date'] = pd.to_datetime(df['date'])
-    df.set_index('date', inplace=True)
-
-    # 筛选时间段
-    if start_date:
-        df = df[df.index >= start_date]
-    if end_date:
-        df = df[df.index <= end_date]
-
-    # 确保列名正确
-    df.columns = ['open', 'high', 'low', 'close', 'volume'][:len(df.columns)]
-
-    # 转换数值类型
-    for col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-
-    df.dropna(inplace=True)
-    return df
+    """加载数据 (质量检查后的清洗副本, 同一文件内容只检查一次)"""
+    # 完整历史只加载一次, 各时间段为 O(log n) 视图; NaN/非正价格已在清洗副本中剔除
+    return load_clean_history(csv_path).window(start_date, end_date)
 
 def load_strategy(strategy_path: Path):
     """动态加载策略类 - 跳过有语法错误的"""
@@ -74,7 +63,16 @@ def load_strategy(strategy_path: Path):
         return None
 
 def run_single_backtest(strategy_class, df: pd.DataFrame, initial_cash: float = 100000) -> dict:
-    """运行单次回测"""
+    """运行单次回测 (命中结果缓存时不重新回测)"""
+    key = cache_key(strategy_class, data=df, broker={'cash': initial_cash, 'commission': 0.001})
+    result = RESULT_CACHE.get(key)
+    if result is None:
+        result = _run_single_backtest(strategy_class, df, initial_cash)
+        if result['success']:
+            RESULT_CACHE.put(key, result)
+    return result
+
+def _run_single_backtest(strategy_class, df: pd.DataFrame, initial_cash: float) -> dict:
     try:
         cerebro = bt.Cerebro()
         cerebro.addstrategy(strategy_class)
@@ -227,6 +225,7 @@ def main():
         print(f"  平均Sharpe: {summary['avg_sharpe']}")
 
     print(f'\n结果保存: {results_file}')
+    print(f'结果缓存: {RESULT_CACHE.summary()}')
     print('='*80)
 
     return 0
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+预计算指标特征库 (Indicator Feature Store)
+==========================================
+
+功能: 每个 (symbol, 指标, 参数) 序列只计算一次, 以 .npy 持久化在列式行情存储旁边,
+      回测引擎与参数扫描直接查表, 不再在每个策略 __init__ / 每次回测里重复计算
+
+存储布局:
+    backtest_data_extended/price_store/<symbol>/features/
+        sma_bt_20.npy  atr_simple_14.npy  ...   float64, 与 price_store 行一一对齐 (完整历史)
+        meta.json                               对应的行情源签名 (行情重新ingest后自动失效)
+
+两类算法 (kind):
+    bt      与 backtrader 指标逐位一致 (SMA=fsum/period, EMA/SMMA 以SMA为种子递推)
+            sma / ema / rsi / atr
+    simple  项目中pandas实现的口径 (rolling mean), 多个周期一次向量化计算
+            sma / rsi (eoh) / atr (HardCodedAdaptiveStrategy, SimpleBacktest) / adx (MarketRegimeDetector)
+
+使用方法:
+    python feature_store.py build                   # 按 DEFAULT_SPEC 预计算全部标的
+
+    from feature_store import get_feature, get_features, compute
+    atr14 = get_feature('stock_sh_600519', 'atr', 14, start='2018-01-01')
+    smas = get_features('stock_sh_600519', 'sma', range(5, 61))   # 缺失周期一次补齐
+    rsi = compute('rsi', {'close': close}, [7, 14], kind='simple')  # 任意数组直接计算
+
+    # backtrader策略中查表 (feed需以 name=symbol 加入cerebro)
+    self.sma = StoredFeature(self.data, feature='sma', period=20)
+"""
+
+import json
+import math
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from date_index import date_bounds
+from price_store import DATA_DIR, _open_store, ingest_all, resolve_symbol
+
+try:
+    import backtrader as bt
+    _HAS_BT = True
+except ImportError:
+    _HAS_BT = False
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+FEATURE_DIRNAME = 'features'
+
+# {指标: {kind: 需要的行情字段}}
+INDICATORS = {
+    'sma': {'bt': ('close',), 'simple': ('close',)},
+    'ema': {'bt': ('close',)},
+    'rsi': {'bt': ('close',), 'simple': ('close',)},
+    'atr': {'bt': ('high', 'low', 'close'), 'simple': ('high', 'low', 'close')},
+    'adx': {'simple': ('high', 'low', 'close')},
+}
+
+# 预计算默认范围 (覆盖现有实验的参数空间)
+DEFAULT_SPEC = {
+    ('sma', 'bt'): range(5, 61),
+    ('rsi', 'bt'): (7, 10, 14, 20),
+    ('atr', 'bt'): (14, 20, 28),
+    ('sma', 'simple'): (20, 50),
+    ('atr', 'simple'): (14, 20),
+    ('adx', 'simple'): (14,),
+}
+
+# 进程内已打开的特征memmap: {(store_dir, name, kind, period): array}
+_OPEN_FEATURES = {}
+
+
+def bt_minperiod(name, period):
+    """backtrader中该指标的最小周期 (第一个有效值的行号 + 1)"""
+    return period + 1 if name in ('rsi', 'atr') else period
+
+
+# =============================================================================
+# 计算内核
+# =============================================================================
+
+def _rolling_sum(x, periods, state=None):
+    """
+    多周期滚动求和 (一次cumsum, 向量化); 与 pandas rolling(p).sum() 口径一致:
+    前 p-1 个值及窗口内含NaN时为NaN
+
+    state: 分块续算时跨块携带的dict (此前各行的累计和/NaN计数, 保留最近 max(periods) 行)。
+    cumsum 逐项顺序累加, 以上一块末尾的累计和续算, 结果与在完整序列上一次计算逐位一致
+    """
+    x = np.asarray(x, dtype=np.float64)
+    nan = np.isnan(x)
+    head_cs, head_cn = ((state['cs'], state['cn']) if state is not None and 'cs' in state
+                        else (np.zeros(1), np.zeros(1, dtype=np.int64)))
+    cs = np.concatenate((head_cs[:-1], np.cumsum(np.concatenate((head_cs[-1:], np.where(nan, 0.0, x))))))
+    cn = np.concatenate((head_cn[:-1], np.cumsum(np.concatenate((head_cn[-1:], nan)))))
+    h, n = len(head_cs) - 1, len(x)
+    out = np.full((len(periods), h + n), np.nan)
+    for i, p in enumerate(periods):
+        if p > h + n:
+            continue
+        has_nan = (cn[p:] - cn[:-p]) > 0
+        out[i, p - 1:] = np.where(has_nan, np.nan, cs[p:] - cs[:-p])
+    if state is not None:
+        keep = max(periods) + 1
+        state['cs'], state['cn'] = cs[-keep:], cn[-keep:]
+    return out[:, h:]
+
+
+def _rolling_mean(x, periods, state=None):
+    """多周期滚动均值, 口径同 pandas rolling(p).mean()"""
+    return _rolling_sum(x, periods, state) / np.asarray(periods, dtype=np.float64)[:, None]
+
+
+def _bt_sma(x, period, start=0):
+    """backtrader Average: fsum(window) / period, 第一个值在 start + period - 1"""
+    out = np.full(len(x), np.nan)
+    values = x.tolist()
+    for i in range(start + period - 1, len(values)):
+        out[i] = math.fsum(values[i - period + 1:i + 1]) / period
+    return out
+
+
+def _bt_smoothing(x, period, alpha, start=0):
+    """backtrader ExponentialSmoothing: SMA作种子, 之后 prev * (1 - alpha) + x * alpha"""
+    out = np.full(len(x), np.nan)
+    values = x.tolist()
+    seed = start + period - 1
+    if seed >= len(values):
+        return out
+    alpha1 = 1.0 - alpha
+    prev = math.fsum(values[start:seed + 1]) / period
+    out[seed] = prev
+    for i in range(seed + 1, len(values)):
+        prev = prev * alpha1 + values[i] * alpha
+        out[i] = prev
+    return out
+
+
+def _true_range_bt(high, low, close):
+    """backtrader TrueRange: max(high, prev_close) - min(low, prev_close), 第0行无效"""
+    prev = np.concatenate(([np.nan], close[:-1]))
+    tr = np.maximum(high, prev) - np.minimum(low, prev)
+    tr[0] = np.nan
+    return tr
+
+
+def _true_range_simple(high, low, close, prev_close=np.nan):
+    """pandas口径: max(h-l, |h-prev_c|, |l-prev_c|) 跳过NaN, 第0行为 h-l (prev_close 为分块续算时上一块的收盘价)"""
+    prev = np.concatenate(([prev_close], close[:-1]))
+    parts = np.vstack([high - low, np.abs(high - prev), np.abs(low - prev)])
+    return np.nanmax(parts, axis=0)
+
+
+def compute(name, arrays, periods, kind='bt', state=None):
+    """
+    计算一个指标的多个周期
+
+    Args:
+        name: 'sma' / 'ema' / 'rsi' / 'atr' / 'adx'
+        arrays: {'close': ..., 'high': ..., 'low': ...} (按需)
+        periods: 周期列表
+        kind: 'bt' 或 'simple'
+        state: 分块流式计算时每个 (指标, 周期组) 一个dict, 逐块传入同一个dict;
+               结果与在完整序列上一次计算逐位一致 (仅 kind='simple' 的 sma / atr)
+
+    Returns:
+        np.ndarray: (len(periods), T) float64, 预热期为NaN
+    """
+    if kind not in INDICATORS.get(name, {}):
+        raise ValueError(f"不支持的指标: {name} (kind={kind})")
+    if state is not None and (kind, name) not in (('simple', 'sma'), ('simple', 'atr')):
+        raise ValueError(f"分块续算只支持 kind='simple' 的 sma / atr (不是 {name}, kind={kind})")
+    periods = [int(p) for p in periods]
+    cols = {f: np.asarray(arrays[f], dtype=np.float64) for f in INDICATORS[name][kind]}
+    close = cols.get('close')
+
+    if kind == 'simple':
+        if name == 'sma':
+            return _rolling_mean(close, periods, state)
+
+        if name == 'rsi':
+            # eoh_gpu_loop_fixed.RSI
+            delta = np.concatenate(([np.nan], np.diff(close)))
+            up = np.where(np.isnan(delta), np.nan, np.clip(delta, 0.0, None))
+            down = np.where(np.isnan(delta), np.nan, np.clip(-delta, 0.0, None))
+            roll_up, roll_down = _rolling_mean(up, periods), _rolling_mean(down, periods)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rs = roll_up / (np.where(roll_down == 0, np.nan, roll_down) + 1e-12)
+                rsi = 100 - (100 / (1 + rs))
+            return np.where(np.isnan(rsi), 50.0, rsi)
+
+        high, low = cols['high'], cols['low']
+        if name == 'atr':
+            prev_close = state.get('close', np.nan) if state is not None else np.nan
+            tr = _true_range_simple(high, low, close, prev_close)
+            if state is not None and len(close):
+                state['close'] = close[-1]
+            return _rolling_mean(tr, periods, state)
+        tr = _true_range_simple(high, low, close)
+
+        # adx: MarketRegimeDetector.calculate_adx (rolling sum 平滑)
+        high_diff = np.concatenate(([np.nan], np.diff(high)))
+        low_diff = np.concatenate(([np.nan], -np.diff(low)))
+        with np.errstate(invalid='ignore'):
+            plus_dm = np.where((high_diff > low_diff) & (high_diff > 0), high_diff, 0.0)
+            minus_dm = np.where((low_diff > high_diff) & (low_diff > 0), low_diff, 0.0)
+        tr_s = _rolling_sum(tr, periods)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            plus_di = 100 * _rolling_sum(plus_dm, periods) / tr_s
+            minus_di = 100 * _rolling_sum(minus_dm, periods) / tr_s
+            dx = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
+        return np.vstack([_rolling_mean(row, [p]) for row, p in zip(dx, periods)])
+
+    # ---- kind == 'bt': 复刻backtrader的逐位算术 (递推本质上是串行的, 逐周期计算) ----
+    out = np.full((len(periods), len(close)), np.nan)
+    for i, p in enumerate(periods):
+        if name == 'sma':
+            out[i] = _bt_sma(close, p)
+        elif name == 'ema':
+            out[i] = _bt_smoothing(close, p, 2.0 / (1.0 + p))
+        elif name == 'rsi':
+            prev = np.concatenate(([np.nan], close[:-1]))
+            up = np.maximum(close - prev, 0.0)
+            down = np.maximum(prev - close, 0.0)
+            maup = _bt_smoothing(up, p, 1.0 / p, start=1)
+            madown = _bt_smoothing(down, p, 1.0 / p, start=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out[i] = 100.0 - 100.0 / (1.0 + maup / madown)
+        elif name == 'atr':
+            tr = _true_range_bt(cols['high'], cols['low'], close)
+            out[i] = _bt_smoothing(tr, p, 1.0 / p, start=1)
+    return out
+
+
+# =============================================================================
+# 持久化
+# =============================================================================
+
+def _feature_dir(symbol, data_dir=None):
+    """返回 (price_meta, price_arrays, features目录); 行情源变化时清空旧特征"""
+    meta, arrays = _open_store(symbol, data_dir)
+    _, store_dir = resolve_symbol(symbol, data_dir)
+    feature_dir = store_dir / FEATURE_DIRNAME
+    meta_path = feature_dir / 'meta.json'
+
+    stale = True
+    if meta_path.exists():
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            stale = json.load(f).get('source') != meta['source']
+    if stale:
+        feature_dir.mkdir(parents=True, exist_ok=True)
+        for old in feature_dir.glob('*.npy'):
+            old.unlink()
+        for key in [k for k in _OPEN_FEATURES if k[0] == store_dir]:
+            del _OPEN_FEATURES[key]
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'symbol': meta['symbol'], 'source': meta['source'], 'rows': meta['rows']},
+                      f, indent=2, ensure_ascii=False)
+    return meta, arrays, feature_dir
+
+
+def get_features(symbol, name, periods, kind='bt', data_dir=None):
+    """
+    读取 (必要时计算并持久化) 一个指标的多个周期
+
+    Returns:
+        dict: {period: 只读memmap (完整历史, 与 price_store 行对齐)}
+    """
+    _, arrays, feature_dir = _feature_dir(symbol, data_dir)
+    store_dir = feature_dir.parent
+    periods = [int(p) for p in periods]
+
+    missing = [p for p in periods if not (feature_dir / f'{name}_{kind}_{p}.npy').exists()]
+    if missing:
+        values = compute(name, arrays, missing, kind=kind)
+        for p, row in zip(missing, values):
+            path = feature_dir / f'{name}_{kind}_{p}.npy'
+            tmp_path = path.with_name(path.stem + '.tmp.npy')
+            np.save(tmp_path, row)
+            os.replace(tmp_path, path)  # 多进程并发补齐时不会读到写了一半的文件
+
+    out = {}
+    for p in periods:
+        key = (store_dir, name, kind, p)
+        if key not in _OPEN_FEATURES:
+            _OPEN_FEATURES[key] = np.load(feature_dir / f'{name}_{kind}_{p}.npy', mmap_mode='r')
+        out[p] = _OPEN_FEATURES[key]
+    return out
+
+
+def get_feature(symbol, name, period, kind='bt', start=None, end=None, data_dir=None):
+    """
+    读取单个指标序列的 [start, end] 窗口 (零拷贝视图)
+
+    注意: 值按完整历史计算。SMA类指标在窗口内与局部计算一致 (除预热期外),
+    EMA/RSI/ATR等递推指标为"已充分预热"的值, 需要与窗口内局部计算严格一致时用 compute()。
+    """
+    values = get_features(symbol, name, [period], kind, data_dir)[int(period)]
+    _, arrays = _open_store(symbol, data_dir)
+    lo, hi = date_bounds(arrays['date'], start, end)
+    return values[lo:hi]
+
+
+def feature_frame(symbol, spec, start=None, end=None, data_dir=None):
+    """
+    多个特征组成的DataFrame
+
+    Args:
+        spec: {(name, kind): periods}, 列名为 f'{name}_{kind}_{period}'
+    """
+    _, arrays = _open_store(symbol, data_dir)
+    lo, hi = date_bounds(arrays['date'], start, end)
+    columns = {}
+    for (name, kind), periods in spec.items():
+        for p, values in get_features(symbol, name, periods, kind, data_dir).items():
+            columns[f'{name}_{kind}_{p}'] = values[lo:hi]
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(arrays['date'][lo:hi], name='date'))
+
+
+def build(data_dir=None, spec=None):
+    """按spec为数据目录下全部标的预计算特征"""
+    data_dir = Path(data_dir or DATA_DIR)
+    spec = spec or DEFAULT_SPEC
+    metas = ingest_all(data_dir)
+    for meta in metas:
+        n = 0
+        for (name, kind), periods in spec.items():
+            n += len(get_features(meta['symbol'], name, periods, kind, data_dir))
+        print(f"  ✅ {meta['symbol']:<20} {n} 个特征序列")
+    return metas
+
+
+# =============================================================================
+# backtrader 查表指标
+# =============================================================================
+
+if _HAS_BT:
+    # bt的日期数值 (proleptic ordinal) 中 1970-01-01 对应的值
+    _BT_EPOCH = 719163.0
+
+    class StoredFeature(bt.Indicator):
+        """
+        从特征库查表的backtrader指标, 可替代 SMA/EMA/RSI/ATR (kind='bt' 时数值逐位一致)
+
+        symbol 缺省取 data._name (cerebro.adddata(feed, name=symbol))。
+        feed 从完整历史起点开始时直接查表; feed 为历史中间的窗口时, 递推类指标
+        (ema/rsi/atr) 在feed数据上局部计算, 保证与原生bt指标结果一致。
+        """
+        lines = ('value',)
+        params = (
+            ('feature', 'sma'),
+            ('period', 14),
+            ('kind', 'bt'),
+            ('symbol', None),
+            ('data_dir', None),
+        )
+
+        def __init__(self):
+            self.addminperiod(bt_minperiod(self.p.feature, self.p.period))
+            self._values = None
+
+        def _feed_values(self, size):
+            data = self.data
+            nums = np.asarray(data.datetime.array[:size], dtype=np.float64)
+            dates = ((nums - _BT_EPOCH) * 86400 * 1e6).round().astype('datetime64[us]').astype('datetime64[ns]')
+
+            symbol = self.p.symbol or data._name
+            _, arrays = _open_store(symbol, self.p.data_dir)
+            stored_dates = arrays['date']
+            pos = np.searchsorted(stored_dates, dates)
+            aligned = (pos < len(stored_dates)) & (stored_dates[np.minimum(pos, len(stored_dates) - 1)] == dates)
+
+            recursive = self.p.feature in ('ema', 'rsi', 'atr')
+            if aligned.all() and (pos[0] == 0 or not recursive):
+                stored = get_features(symbol, self.p.feature, [self.p.period], self.p.kind, self.p.data_dir)
+                values = np.asarray(stored[self.p.period])[pos]
+            else:
+                local = {f: np.asarray(getattr(data, f).array[:size], dtype=np.float64)
+                         for f in INDICATORS[self.p.feature][self.p.kind]}
+                values = compute(self.p.feature, local, [self.p.period], self.p.kind)[0]
+            return values
+
+        def once(self, start, end):
+            if self._values is None:
+                self._values = self._feed_values(self.data.buflen())
+            dst = self.lines.value.array
+            for i in range(start, end):
+                dst[i] = self._values[i]
+
+        def next(self):
+            # preload模式下buflen即完整长度, 只计算一次; 实时feed才会随长度增长重算
+            i = len(self) - 1
+            if self._values is None or i >= len(self._values):
+                self._values = self._feed_values(self.data.buflen())
+            self.lines.value[0] = self._values[i]
+
+
+# =============================================================================
+# 命令行接口
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='预计算指标特征库: build')
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--data-dir', default=str(DATA_DIR), help='CSV数据目录')
+    args = parser.parse_args()
+
+    print('=' * 80)
+    print(f'Feature Store - {args.command}')
+    print('=' * 80)
+    build(args.data_dir)
+
+    sys.exit(0)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+两级LRU帧缓存 (Process + On-disk LRU Frame Cache)
+=================================================
+
+功能: 缓存"读取 + 规范化 + 切片"之后的DataFrame (或其元组),
+      同一进程内直接返回内存中的对象, 跨进程 (每次启动一个新的EOH循环) 从磁盘pickle恢复,
+      不再重复解析CSV / 请求yfinance
+
+    - 内存层: OrderedDict, 按条目字节数 (pickle大小) 淘汰最久未使用的条目
+    - 磁盘层: 每个条目一个 <sha1(key)>.pkl, 命中时更新mtime, 按总字节数淘汰mtime最旧的文件
+              不依赖共享索引文件, 多个进程并发读写同一目录是安全的 (写入为 tmp + os.replace)
+    - 计数器: memory_hits / disk_hits / misses / evictions
+
+使用方法:
+    from frame_cache import FrameCache
+    cache = FrameCache('price_cache/frames', max_disk_mb=512)
+    value = cache.get(key)
+    if value is None:
+        value = expensive_load()
+        cache.put(key, value)
+    print(cache.summary())
+
+key 可以是任意可repr的元组, 调用方负责把源文件mtime等失效条件放进key。
+"""
+
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+
+
+class FrameCache:
+    """内存 + 磁盘两级LRU缓存"""
+
+    def __init__(self, cache_dir=None, max_memory_mb=256, max_disk_mb=512):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+
+        # {key: (value, nbytes)}
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # -------------------------------------------------------------------------
+    # 内存层
+    # -------------------------------------------------------------------------
+
+    def _remember(self, key, value, nbytes):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (value, nbytes)
+        self._memory_bytes += nbytes
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, (_, size) = self._memory.popitem(last=False)
+            self._memory_bytes -= size
+            self.evictions += 1
+
+    # -------------------------------------------------------------------------
+    # 磁盘层
+    # -------------------------------------------------------------------------
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return self.cache_dir / f'{digest}.pkl'
+
+    def _evict_disk(self, keep):
+        entries = []
+        for path in self.cache_dir.glob('*.pkl'):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue  # 其他进程刚刚删除
+            entries.append((st.st_mtime_ns, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    # -------------------------------------------------------------------------
+    # 接口
+    # -------------------------------------------------------------------------
+
+    def get(self, key):
+        """命中返回缓存的对象 (与其他调用方共享, 不要原地修改), 未命中返回None"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return self._memory[key][0]
+
+        if self.cache_dir is not None:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    payload = f.read()
+                stored_key, value = pickle.loads(payload)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                stored_key = None
+            if stored_key == key:
+                os.utime(path)  # LRU: 最近使用
+                self.disk_hits += 1
+                self._remember(key, value, len(payload))
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        payload = pickle.dumps((key, value), protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, value, len(payload))
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self._path(key)
+            tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            self._evict_disk(keep=path)
+
+    def clear(self):
+        self._memory.clear()
+        self._memory_bytes = 0
+        if self.cache_dir is not None and self.cache_dir.exists():
+            for path in self.cache_dir.glob('*.pkl'):
+                path.unlink(missing_ok=True)
+
+    def stats(self):
+        disk_files = list(self.cache_dir.glob('*.pkl')) if self.cache_dir and self.cache_dir.exists() else []
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'memory_entries': len(self._memory),
+            'memory_mb': round(self._memory_bytes / 1024 / 1024, 3),
+            'disk_entries': len(disk_files),
+            'disk_mb': round(sum(p.stat().st_size for p in disk_files) / 1024 / 1024, 3),
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"hits={s['memory_hits']}+{s['disk_hits']}(mem+disk) misses={s['misses']} "
+                f"evictions={s['evictions']} disk={s['disk_entries']} files/{s['disk_mb']:.2f}MB")
+
+
+def file_mtime(path):
+    """缓存key用: 文件不存在时为None"""
+    try:
+        return Path(path).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='帧缓存: info / clear')
+    parser.add_argument('command', choices=['info', 'clear'])
+    parser.add_argument('--cache-dir', default='price_cache/frames')
+    args = parser.parse_args()
+
+    cache = FrameCache(args.cache_dir)
+    if args.command == 'clear':
+        cache.clear()
+    s = cache.stats()
+    print(f"{args.cache_dir}: {s['disk_entries']} 个条目, {s['disk_mb']:.2f} MB")
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+断点续跑的增量回测 (Resumable Incremental Backtests)
+====================================================
+
+功能: run_strategy_on_new_data 每次有新数据都从窗口起点重放全部历史。本模块在一次运行结束时
+      把完整状态写入checkpoint, 下次只在新追加的K线上继续运行, 结果与完整重放逐位一致:
+
+    - 指标窗口: SMA 保留最近 period 根收盘价 (fsum窗口), RSI/ATR 保留平滑递推值与上一根收盘价,
+      CrossOver 保留最近一个非零差值 — 算术顺序与 feature_store 的 bt 内核相同
+    - 状态机: adaptive_engine 的 next_open 状态 (现金/持仓/入场价/最后一根K线提交的未成交订单)
+    - 指标口径: 各年最后一根K线的账户价值 (SharpeRatio), 历史峰值与最大回撤, closed交易数, 订单日志
+    - 尾部K线: 续跑前与新数据中的同日期K线比对, 历史被修订 (复权/补数据) 时拒绝续跑
+
+    首次运行也是"从空checkpoint续跑", 与增量走同一条代码路径; verify 命令与 adaptive_engine
+    的完整重放 (run_adaptive) 逐项对比。只支持 next_open 口径的预设 (llm_adaptive / adaptive_13 等)。
+
+checkpoint 为 JSON (浮点数按 repr 写出, 读回后逐位相同), 写入时先写临时文件再替换。
+
+使用方法:
+    python incremental_engine.py run --data backtest_data_extended/stock_sh_600519.csv \\
+        --checkpoint outputs/ckpt_600519.json --preset adaptive_13 --start 2024-01-01
+    python incremental_engine.py verify                # 全部标的: 多个切分点续跑 vs 完整重放
+    python incremental_engine.py benchmark             # 追加1根/21根K线: 续跑 vs 完整重放 耗时
+
+    from incremental_engine import new_checkpoint, advance
+    ckpt = new_checkpoint('adaptive_13', start='2024-01-01')
+    result, ckpt = advance(ckpt, df_until_june)
+    result, ckpt = advance(ckpt, df_until_july)     # 只模拟6月之后的K线
+"""
+
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from adaptive_engine import bt_sharpe, initial_state, resolve_rules, run_adaptive, simulate_segment
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+CHECKPOINT_VERSION = 1
+OHLC = ('open', 'high', 'low', 'close')
+
+
+def _normalized(rules):
+    """JSON往返后的规则 (tuple → list), 用于与checkpoint中保存的规则比较"""
+    return json.loads(json.dumps(rules))
+
+
+def new_checkpoint(preset='llm_adaptive', initial_cash=100000, commission=0.0015, start=None, **overrides):
+    """空checkpoint (尚未处理任何K线)"""
+    rules = resolve_rules(preset, **overrides)
+    if rules['fill'] != 'next_open':
+        raise ValueError(f"断点续跑只支持 next_open 口径的预设, 收到: {preset}")
+
+    periods = [rules.get(k) or 0 for k in ('sma_fast', 'sma_medium', 'sma_slow', 'rsi_period', 'atr_period')]
+    smoother = {'count': 0, 'buffer': [], 'prev': None}
+    return {
+        'version': CHECKPOINT_VERSION,
+        'preset': preset,
+        'rules': _normalized(rules),
+        'initial_cash': initial_cash,
+        'commission': commission,
+        'start': start,
+        'bars': 0,
+        'last_date': None,
+        'tail': {'date': [], **{f: [] for f in OHLC}},
+        'tail_size': max(periods) + 1,
+        'indicators': {
+            'rsi_up': dict(smoother), 'rsi_down': dict(smoother), 'atr': dict(smoother),
+            'nzd': None, 'cross_seeded': False,
+            'prev_fast': math.nan, 'prev_slow': math.nan,
+        },
+        'engine': initial_state(rules, initial_cash),
+        'metrics': {'year_values': [], 'peak': None, 'max_drawdown': 0.0,
+                    'closed_trades': 0, 'final_value': float(initial_cash)},
+        'orders': [],
+    }
+
+
+# =============================================================================
+# 增量指标 (与 feature_store kind='bt' 逐位一致)
+# =============================================================================
+
+def _sma(tail, close, period, bars):
+    """tail: 之前的收盘价 (至少 period-1 根, 或全部历史); bars: 之前已处理的K线数"""
+    out = np.full(len(close), np.nan)
+    values = list(tail) + close.tolist()
+    offset = len(tail)
+    for j in range(len(close)):
+        if bars + j >= period - 1:
+            i = offset + j
+            out[j] = math.fsum(values[i - period + 1:i + 1]) / period
+    return out
+
+
+def _smooth(state, x, period, bars, start=1):
+    """
+    ExponentialSmoothing 递推 (SMA作种子); state 为 {'count', 'buffer', 'prev'}, 原地更新
+
+    start: 第一根参与计算的全局K线下标 (RSI/ATR 的差分在第0根无效)
+    """
+    out = np.full(len(x), np.nan)
+    alpha = 1.0 / period
+    alpha1 = 1.0 - alpha
+    prev = state['prev']
+    for j, v in enumerate(x.tolist()):
+        if bars + j < start:
+            continue
+        state['count'] += 1
+        if prev is None:
+            state['buffer'].append(v)
+            if state['count'] == period:
+                prev = math.fsum(state['buffer']) / period
+                state['buffer'] = []
+                out[j] = prev
+        else:
+            prev = prev * alpha1 + v * alpha
+            out[j] = prev
+    state['prev'] = prev
+    return out
+
+
+def _crossover(ind, fast, slow):
+    """bt.indicators.CrossOver 的逐K线形式 (NonZeroDifference), 状态保存在 ind"""
+    cross = np.full(len(fast), np.nan)
+    nzd, seeded = ind['nzd'], ind['cross_seeded']
+    for j, (f, s) in enumerate(zip(fast.tolist(), slow.tolist())):
+        if not seeded:
+            if not (math.isnan(f) or math.isnan(s)):
+                seeded, nzd = True, f - s
+            continue
+        diff = f - s
+        up = nzd < 0.0 and f > s
+        down = nzd > 0.0 and f < s
+        cross[j] = float(up) - float(down)
+        if diff != 0.0:
+            nzd = diff
+    ind['nzd'], ind['cross_seeded'] = nzd, seeded
+    return cross
+
+
+def _extend_signals(ckpt, arrays):
+    """在新K线上继续计算指标与信号, 更新 ckpt['indicators'] (与 adaptive_engine.compute_signals 同口径)"""
+    rules, ind, bars = ckpt['rules'], ckpt['indicators'], ckpt['bars']
+    tail_close = ckpt['tail']['close']
+    close, high, low = arrays['close'], arrays['high'], arrays['low']
+    prev_close = np.concatenate(([tail_close[-1] if tail_close else np.nan], close[:-1]))
+
+    features = {}
+    for key in ('sma_fast', 'sma_medium', 'sma_slow'):
+        features[key] = _sma(tail_close, close, rules[key], bars) if rules.get(key) else None
+
+    features['rsi'] = None
+    if rules.get('rsi_period'):
+        p = rules['rsi_period']
+        maup = _smooth(ind['rsi_up'], np.maximum(close - prev_close, 0.0), p, bars)
+        madown = _smooth(ind['rsi_down'], np.maximum(prev_close - close, 0.0), p, bars)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100.0 - 100.0 / (1.0 + maup / madown)
+        if rules.get('rsi_raises', True):
+            warm = rsi[max(p - bars, 0):]
+            if np.any(np.isnan(warm) | (warm == 100.0)):
+                raise ZeroDivisionError('RSI: float division by zero (madown == 0)')
+        features['rsi'] = rsi
+
+    features['atr'] = None
+    if rules.get('atr_period'):
+        tr = np.maximum(high, prev_close) - np.minimum(low, prev_close)
+        atr = _smooth(ind['atr'], tr, rules['atr_period'], bars)
+        if rules.get('atr_fallback'):
+            with np.errstate(invalid='ignore'):
+                atr = np.where(atr > 0, atr, close * rules['atr_fallback'])
+        features['atr'] = atr
+
+    fast, slow, rsi = features['sma_fast'], features['sma_slow'], features['rsi']
+    with np.errstate(invalid='ignore'):
+        if rules['entry'] == 'crossover':
+            cross = _crossover(ind, fast, slow)
+            entry, exit_signal = cross > 0, cross < 0
+        elif rules['entry'] == 'trend_stack':
+            medium = features['sma_medium']
+            entry, exit_signal = (fast > medium) & (medium > slow), fast < medium
+        else:
+            f_prev = np.concatenate(([ind['prev_fast']], fast[:-1]))
+            s_prev = np.concatenate(([ind['prev_slow']], slow[:-1]))
+            entry = (fast > slow) & (f_prev <= s_prev)
+            exit_signal = (fast < slow) & (f_prev >= s_prev)
+        if len(close):
+            ind['prev_fast'], ind['prev_slow'] = float(fast[-1]), float(slow[-1])
+
+        if rules.get('rsi_above') is not None:
+            entry &= rsi > rules['rsi_above']
+        if rules.get('rsi_below') is not None:
+            entry &= rsi < rules['rsi_below']
+        if rules.get('rsi_outside') is not None:
+            lo, hi = rules['rsi_outside']
+            entry &= (rsi < lo) | (rsi > hi)
+
+    return {'close': close, 'atr': features['atr'], 'entry': entry, 'exit_signal': exit_signal}
+
+
+# =============================================================================
+# 续跑
+# =============================================================================
+
+def _arrays(df):
+    columns = {c.lower(): c for c in df.columns}
+    return {f: df[columns[f]].to_numpy(dtype=np.float64) for f in OHLC}
+
+
+def _stamps(index):
+    return [str(ts) for ts in index]
+
+
+def _new_bars(ckpt, df):
+    """df 中 last_date 之后的K线; 与checkpoint尾部重叠的K线必须完全相同 (按下标二分切片, 不做整列比较)"""
+    index = df.index
+    lo = index.searchsorted(pd.Timestamp(ckpt['start'])) if ckpt['start'] is not None else 0
+    if ckpt['last_date'] is None:
+        return df.iloc[lo:]
+
+    tail = ckpt['tail']
+    cut = max(lo, index.searchsorted(pd.Timestamp(ckpt['last_date']), side='right'))
+    overlap = df.iloc[max(lo, index.searchsorted(pd.Timestamp(tail['date'][0]))):cut]
+    if len(overlap):  # 只传入新K线时没有可比对的部分
+        arrays = _arrays(overlap)
+        same = _stamps(overlap.index) == tail['date'] and all(arrays[f].tolist() == tail[f] for f in OHLC)
+        if not same:
+            raise ValueError(f"{ckpt['last_date']} 及之前的K线与checkpoint不一致 (历史数据被修订), 需要完整重算")
+    return df.iloc[cut:]
+
+
+def _update_metrics(metrics, dates, equity):
+    """年度账户价值 / 峰值 / 最大回撤 (与 bt_sharpe / bt_max_drawdown 同一算术)"""
+    years = dates.year.values
+    last = np.flatnonzero(np.diff(years) != 0).tolist() + [len(years) - 1]
+    year_values = metrics['year_values']
+    for i in last:
+        year, value = int(years[i]), float(equity[i])
+        if year_values and year_values[-1][0] == year:
+            year_values[-1][1] = value
+        else:
+            year_values.append([year, value])
+
+    start_peak = [metrics['peak']] if metrics['peak'] is not None else []
+    peak = np.maximum.accumulate(np.concatenate((start_peak, equity)))[len(start_peak):]
+    metrics['max_drawdown'] = max(metrics['max_drawdown'], float(np.max(100.0 * (peak - equity) / peak)))
+    metrics['peak'] = float(peak[-1])
+    metrics['final_value'] = float(equity[-1])
+
+
+def advance(ckpt, df):
+    """
+    在 df 中 checkpoint 之后的新K线上继续运行
+
+    Args:
+        ckpt: new_checkpoint() / load_checkpoint() / 上一次 advance() 返回的checkpoint (不会被修改)
+        df: DatetimeIndex + open/high/low/close 列; 可以包含完整历史, 只有 last_date 之后的K线会被模拟
+
+    Returns:
+        (result, ckpt): result 与 adaptive_engine.run_adaptive 同口径 (另含 new_bars / equity 为新K线的权益),
+                        ckpt 为新的checkpoint
+    """
+    ckpt = json.loads(json.dumps(ckpt))
+    new = _new_bars(ckpt, df)
+    arrays = _arrays(new)
+    n, bars = len(new), ckpt['bars']
+
+    equity = np.array([])
+    if n:
+        signals = _extend_signals(ckpt, arrays)
+        sim = simulate_segment(arrays['open'], signals, ckpt['rules'], ckpt['engine'], ckpt['commission'])
+        equity = sim['equity']
+        ckpt['engine'] = sim['state']
+        ckpt['orders'].extend(dict(o, bar=int(o['bar']) + bars) for o in sim['orders'])
+        ckpt['metrics']['closed_trades'] += sim['closed_trades']
+        _update_metrics(ckpt['metrics'], pd.DatetimeIndex(new.index), equity)
+
+        keep = ckpt['tail_size']
+        tail = ckpt['tail']
+        tail['date'] = (tail['date'] + _stamps(new.index))[-keep:]
+        for f in OHLC:
+            tail[f] = (tail[f] + arrays[f].tolist())[-keep:]
+        ckpt['bars'] = bars + n
+        ckpt['last_date'] = tail['date'][-1]
+
+    return summarize(ckpt, new_bars=n, equity=equity), ckpt
+
+
+def summarize(ckpt, **extra):
+    """checkpoint → run_adaptive 同口径的结果dict"""
+    initial_cash = ckpt['initial_cash']
+    metrics = ckpt['metrics']
+    final_value = metrics['final_value']
+    sharpe = None
+    if metrics['year_values']:
+        year_ends = pd.DatetimeIndex([f'{y}-12-31' for y, _ in metrics['year_values']])
+        sharpe = bt_sharpe(year_ends, [v for _, v in metrics['year_values']], initial_cash)
+    return dict({
+        'returns_pct': round(((final_value - initial_cash) / initial_cash) * 100, 2),
+        'final_value': round(final_value, 2),
+        'sharpe_ratio': round(sharpe or 0, 3),
+        'max_drawdown_pct': round(metrics['max_drawdown'], 2),
+        'total_trades': metrics['closed_trades'],
+        'initial_cash': initial_cash,
+        'data_points': ckpt['bars'],
+        'orders': ckpt['orders'],
+        'last_date': ckpt['last_date'],
+    }, **extra)
+
+
+# =============================================================================
+# 持久化
+# =============================================================================
+
+def save_checkpoint(path, ckpt):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(ckpt, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        ckpt = json.load(f)
+    if ckpt.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"checkpoint版本不兼容: {ckpt.get('version')}")
+    return ckpt
+
+
+def run_incremental(df, checkpoint_path, preset='llm_adaptive', initial_cash=100000, commission=0.0015,
+                    start=None, end=None, **overrides):
+    """
+    带checkpoint的回测: checkpoint存在且配置相同则续跑, 否则 (或历史被修订时) 从头运行
+
+    Returns:
+        (result, resumed): resumed 为 False 表示本次是完整运行
+    """
+    fresh = new_checkpoint(preset, initial_cash, commission, start, **overrides)
+    ckpt = None
+    if checkpoint_path and Path(checkpoint_path).exists():
+        ckpt = load_checkpoint(checkpoint_path)
+        config = ('rules', 'initial_cash', 'commission', 'start')
+        if any(ckpt.get(k) != fresh[k] for k in config):
+            ckpt = None
+    if end is not None:
+        df = df[df.index <= pd.Timestamp(end)]
+
+    resumed = ckpt is not None
+    try:
+        result, ckpt = advance(ckpt or fresh, df)
+    except ValueError:
+        if not resumed:
+            raise
+        resumed = False
+        result, ckpt = advance(fresh, df)
+    if checkpoint_path:
+        save_checkpoint(checkpoint_path, ckpt)
+    return result, resumed
+
+
+# =============================================================================
+# 验证与耗时
+# =============================================================================
+
+def _histories(data_dir=None, symbols=None):
+    from data_quality import load_clean_history
+    from price_store import DATA_DIR
+
+    for csv_path in sorted(Path(data_dir or DATA_DIR).glob('*.csv')):
+        if symbols and csv_path.stem not in symbols:
+            continue
+        yield csv_path.stem, load_clean_history(csv_path).window()
+
+
+def _same(ours, ref):
+    keys = ('returns_pct', 'final_value', 'sharpe_ratio', 'max_drawdown_pct', 'total_trades', 'data_points')
+    return all(ours[k] == ref[k] for k in keys) and ours['orders'] == ref['orders']
+
+
+def verify(presets=('llm_adaptive', 'adaptive_13'), splits=(0.3, 0.6, 0.9, 0.999), step=21,
+           start='2018-01-01', data_dir=None, symbols=None):
+    """
+    每个标的: (1) 在各切分点保存checkpoint后续跑到末尾, (2) 每 step 根K线续跑一次,
+    与 run_adaptive 在同一窗口上的完整重放逐项对比 (订单逐笔 / 最终价值 / 指标)
+    """
+    mismatches = []
+    total = 0
+    for symbol, history in _histories(data_dir, symbols):
+        df = history[history.index >= pd.Timestamp(start)]
+        if len(df) < 50:
+            continue
+        for preset in presets:
+            try:
+                ref = run_adaptive(df, preset)
+            except ZeroDivisionError:
+                ref = None
+
+            plans = [[int(len(df) * s), len(df)] for s in splits]
+            plans.append(list(range(step, len(df), step)) + [len(df)])
+            for cuts in plans:
+                total += 1
+                ckpt = new_checkpoint(preset, start=start)
+                try:
+                    for cut in cuts:  # advance() 内部做JSON往返, 等价于每段落盘后重新读取
+                        ours, ckpt = advance(ckpt, df.iloc[:cut])
+                except ZeroDivisionError:
+                    ours = None
+                ok = (ref is None and ours is None) or (ref is not None and ours is not None and _same(ours, ref))
+                if not ok:
+                    mismatches.append((symbol, preset, cuts[0]))
+                    print(f"  MISMATCH {symbol} {preset} 切分 {cuts[0]}/{len(df)} (共{len(cuts)}段)")
+    print(f"\n对比完成: {total - len(mismatches)}/{total} 一致")
+    return mismatches
+
+
+def benchmark(preset='adaptive_13', appended=(1, 21), start='2010-01-01', repeat=5, data_dir=None, symbols=None):
+    """追加 k 根新K线: 完整重放 vs 读checkpoint续跑 的平均耗时 (ms)"""
+    rows = []
+    for symbol, history in _histories(data_dir, symbols):
+        df = history[history.index >= pd.Timestamp(start)]
+        for k in appended:
+            if len(df) <= k + 100:
+                continue
+            try:
+                _, ckpt = advance(new_checkpoint(preset, start=start), df.iloc[:-k])
+            except ZeroDivisionError:
+                continue
+            text = json.dumps(ckpt)  # 计时包含checkpoint的读取
+
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                full = run_adaptive(df, preset)
+            full_ms = (time.perf_counter() - t0) / repeat * 1000
+
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                ours, _ = advance(json.loads(text), df)
+            resume_ms = (time.perf_counter() - t0) / repeat * 1000
+            rows.append({'symbol': symbol, 'bars': len(df), 'appended': k, 'full_ms': full_ms,
+                         'resume_ms': resume_ms, 'same': _same(ours, full)})
+    return rows
+
+
+# =============================================================================
+# 命令行
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='断点续跑的增量回测: run / verify / benchmark')
+    parser.add_argument('command', choices=['run', 'verify', 'benchmark'])
+    parser.add_argument('--data', help='run: CSV数据文件')
+    parser.add_argument('--checkpoint', help='run: checkpoint文件 (不存在时完整运行并创建)')
+    parser.add_argument('--preset', action='append', help='预设 (verify可重复; 默认 llm_adaptive/adaptive_13)')
+    parser.add_argument('--start', default=None, help='回测窗口起点')
+    parser.add_argument('--end', default=None, help='run: 只使用该日期之前的K线')
+    parser.add_argument('--cash', type=float, default=100000)
+    parser.add_argument('--commission', type=float, default=0.0015)
+    parser.add_argument('--symbol', action='append', help='verify/benchmark: 只使用指定标的 (可重复)')
+    parser.add_argument('--data-dir', default=None, help='数据目录 (默认 backtest_data_extended)')
+    args = parser.parse_args()
+
+    print('=' * 80)
+    print(f'Incremental Engine - {args.command}')
+    print('=' * 80)
+
+    if args.command == 'verify':
+        bad = verify(tuple(args.preset or ('llm_adaptive', 'adaptive_13')), start=args.start or '2018-01-01',
+                     data_dir=args.data_dir, symbols=args.symbol)
+        sys.exit(1 if bad else 0)
+
+    if args.command == 'benchmark':
+        rows = benchmark((args.preset or ['adaptive_13'])[0], start=args.start or '2010-01-01',
+                         data_dir=args.data_dir, symbols=args.symbol)
+        print(f"\n{'标的':<20} {'K线数':>6} {'新增':>5} {'完整重放(ms)':>13} {'续跑(ms)':>10} {'加速':>7} {'一致':>5}")
+        print('-' * 74)
+        for r in rows:
+            print(f"{r['symbol']:<20} {r['bars']:>6} {r['appended']:>5} {r['full_ms']:>13.2f} "
+                  f"{r['resume_ms']:>10.2f} {r['full_ms'] / r['resume_ms']:>6.1f}x {'是' if r['same'] else '否':>5}")
+        sys.exit(0 if all(r['same'] for r in rows) else 1)
+
+    if not args.data or not args.checkpoint:
+        parser.error('run 需要 --data 与 --checkpoint')
+    from data_quality import load_clean_history
+
+    df = load_clean_history(args.data).window()
+    preset = (args.preset or ['llm_adaptive'])[0]
+    result, resumed = run_incremental(df, args.checkpoint, preset, args.cash, args.commission,
+                                      args.start, args.end)
+    print(f"\n{'续跑' if resumed else '完整运行'}: 新增 {result['new_bars']} 根K线, 共 {result['data_points']} 根 "
+          f"(截至 {result['last_date']})")
+    print(f"  收益率: {result['returns_pct']:+.2f}%  Sharpe: {result['sharpe_ratio']:.3f}  "
+          f"最大回撤: {result['max_drawdown_pct']:.2f}%  交易次数: {result['total_trades']}")
+    print(f"  checkpoint: {args.checkpoint}")
+    sys.exit(0)
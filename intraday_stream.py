@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+分钟线流式读取 (Chunked Intraday Bar Stream)
+============================================
+
+功能: 分钟线每个标的可达数千万行, 无法整体读入DataFrame。本模块按固定行数分块读取,
+      块与块之间只携带滚动窗口所需的尾部状态, 峰值内存只与 chunksize 有关, 与文件总行数无关
+
+    - iter_bars(path, chunksize, start, end)   规范化的升序K线块 (跨块检查时间单调)
+    - RollingCarry()                            块间携带滚动指标的精确状态 (累计和尾部 / 上一行)
+    - StreamStats                               不保存完整权益曲线的在线统计 (夏普/最大回撤)
+    - StreamingBarData                          backtrader数据源, 逐块拉取, 配合 exactbars=1 使用
+
+回测入口:
+    HardCodedAdaptiveStrategy.backtest_stream(iter_bars(...))       (code_策略代码/)
+    run_strategy_on_new_data.run_backtest(..., chunksize=N)          (code/, backtrader路径)
+
+使用方法:
+    python intraday_stream.py synth --rows 5000000 --out /tmp/minute.csv     # 生成测试用分钟线
+    python intraday_stream.py benchmark --path /tmp/minute.csv --chunksizes 50000 200000 1000000
+
+CSV格式识别由 price_loader 处理 (datetime,open,... / akshare 分钟线 / 日线各格式均可)。
+"""
+
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from date_index import date_bounds
+from feature_store import compute as compute_feature
+from price_loader import FIELDS, iter_prices
+
+try:
+    import backtrader as bt
+    _HAS_BT = True
+except ImportError:
+    _HAS_BT = False
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+DEFAULT_CHUNKSIZE = 200_000
+
+# A股每个交易日240根1分钟K线
+MINUTES_PER_DAY = 240
+TRADING_DAYS = 252
+
+
+def _end_bound(end):
+    """纯日期的 end 视为当日收盘 (否则分钟线会丢掉 end 当天的全部K线)"""
+    if end is None:
+        return None
+    ts = pd.Timestamp(end)
+    if ts == ts.normalize():
+        ts = ts + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+    return ts
+
+
+# =============================================================================
+# 分块读取
+# =============================================================================
+
+def iter_bars(csv_path, chunksize=DEFAULT_CHUNKSIZE, start=None, end=None, dtype='float64'):
+    """
+    逐块读取K线, 只保留 [start, end] 内的行
+
+    文件须按时间升序存储 (分钟线无法整体排序); 检测到倒序时抛出 ValueError。
+    越过 end 后立即停止读取剩余文件。
+
+    Yields:
+        pd.DataFrame: index='date', 列 open/high/low/close/volume
+    """
+    end = _end_bound(end)
+    last = None
+    for chunk in iter_prices(csv_path, chunksize=chunksize, dtype=dtype):
+        if not len(chunk):
+            continue
+        dates = chunk.index.values
+        if not chunk.index.is_monotonic_increasing or (last is not None and dates[0] < last):
+            raise ValueError(f"{csv_path} 未按时间升序存储, 无法流式读取 (先用 load_prices 排序后另存)")
+        last = dates[-1]
+
+        if end is not None and dates[0] > np.datetime64(end, 'ns'):
+            break
+        lo, hi = date_bounds(dates, start, end)
+        if hi > lo:
+            yield chunk.iloc[lo:hi]
+
+
+class RollingCarry:
+    """
+    块间携带滚动指标的精确状态: feature_store 'simple' 内核的累计和尾部 (每个指标最近 max(周期) 行)
+    与 shift(1) 所需的上一行
+
+    每块上续算的指标与在完整序列上一次计算逐位一致, 与分块位置无关。不能把上一块尾部拼到当前块前面
+    重新计算: 窗口和的舍入 (~1e-15) 会随块边界变化, 翻转两条均线恰好相等时的交叉判断。
+    不传 carry 的一次性计算 (整体回测) 用一个新的 RollingCarry() 即可, 两条路径共用同一内核。
+    """
+
+    def __init__(self):
+        self.states = {}
+        self.last = {}
+
+    def compute(self, name, arrays, periods, kind='simple'):
+        """feature_store.compute 续算 (状态按 (指标, kind, 周期) 分别保存)"""
+        state = self.states.setdefault((name, kind, tuple(int(p) for p in periods)), {})
+        return compute_feature(name, arrays, periods, kind, state=state)
+
+    def shift(self, key, values):
+        """values 下移一行, 第一行为上一块的最后一个值 (第一块为NaN); 等价于整列 shift(1)"""
+        values = np.asarray(values, dtype=np.float64)
+        shifted = np.concatenate(([self.last.get(key, np.nan)], values[:-1]))
+        if len(values):
+            self.last[key] = values[-1]
+        return shifted
+
+
+class StreamStats:
+    """
+    权益曲线在线统计 (Welford), 与 pandas 口径一致:
+    收益率 = pct_change().dropna(), std 为样本标准差 (ddof=1), 回撤相对历史最高点
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last = None
+        self.peak = None
+        self.max_drawdown = 0.0
+
+    def update(self, equity):
+        if self.last is not None:
+            ret = equity / self.last - 1.0
+            self.count += 1
+            delta = ret - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (ret - self.mean)
+        self.last = equity
+
+        self.peak = equity if self.peak is None else max(self.peak, equity)
+        drawdown = (equity - self.peak) / self.peak
+        if drawdown < self.max_drawdown:
+            self.max_drawdown = drawdown
+
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else float('nan')
+
+    def sharpe(self, periods_per_year=TRADING_DAYS):
+        std = self.std()
+        if not std > 0:
+            return 0
+        return self.mean / std * np.sqrt(periods_per_year)
+
+
+# =============================================================================
+# backtrader 数据源
+# =============================================================================
+
+if _HAS_BT:
+
+    class StreamingBarData(bt.feed.DataBase):
+        """
+        逐块拉取的backtrader数据源 (不预加载)
+
+        与 cerebro.run(exactbars=1) 一起使用时, 数据与指标都只保留最小缓冲,
+        内存不随K线总数增长。分钟线需指定 timeframe=bt.TimeFrame.Minutes。
+        """
+
+        params = (
+            ('path', None),
+            ('chunksize', DEFAULT_CHUNKSIZE),
+            ('start', None),
+            ('end', None),
+        )
+
+        def start(self):
+            super().start()
+            self._chunks = iter_bars(self.p.path, self.p.chunksize, self.p.start, self.p.end)
+            self._rows = iter(())
+
+        def _load(self):
+            row = next(self._rows, None)
+            while row is None:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    return False
+                self._rows = zip(chunk.index.to_pydatetime(), *(chunk[f].values for f in FIELDS))
+                row = next(self._rows, None)
+
+            dt, o, h, l, c, v = row
+            self.lines.datetime[0] = bt.date2num(dt)
+            self.lines.open[0] = o
+            self.lines.high[0] = h
+            self.lines.low[0] = l
+            self.lines.close[0] = c
+            self.lines.volume[0] = v
+            return True
+
+
+# =============================================================================
+# 测试数据与内存测量
+# =============================================================================
+
+def write_synthetic_minutes(path, rows, start='2015-01-05', seed=0, chunksize=1_000_000):
+    """
+    生成A股交易时段的合成1分钟K线 (几何布朗运动), 分块写出, 生成过程本身也是有界内存
+
+    交易时段: 09:31-11:30, 13:01-15:00, 每日240根, 跳过周末
+    """
+    rng = np.random.default_rng(seed)
+    offsets = np.concatenate([np.arange(9 * 60 + 31, 11 * 60 + 31), np.arange(13 * 60 + 1, 15 * 60 + 1)])
+    offsets = offsets.astype('timedelta64[m]')
+    days = pd.bdate_range(start, periods=rows // MINUTES_PER_DAY + 1).values.astype('datetime64[m]')
+
+    path = Path(path)
+    price = 10.0
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('datetime,open,high,low,close,volume\n')
+        while written < rows:
+            n = min(chunksize, rows - written)
+            idx = np.arange(written, written + n)
+            stamps = days[idx // MINUTES_PER_DAY] + offsets[idx % MINUTES_PER_DAY]
+
+            close = price * np.exp(np.cumsum(rng.normal(0, 0.0012, n)))
+            open_ = np.concatenate([[price], close[:-1]])
+            spread = np.abs(rng.normal(0, 0.0008, n)) * close
+            high = np.maximum(open_, close) + spread
+            low = np.minimum(open_, close) - spread
+            volume = rng.integers(100, 50_000, n) * 100
+
+            frame = pd.DataFrame({'datetime': np.datetime_as_string(stamps, unit='m'),
+                                  'open': open_.round(3), 'high': high.round(3),
+                                  'low': low.round(3), 'close': close.round(3), 'volume': volume})
+            frame.to_csv(f, header=False, index=False)
+            price = close[-1]
+            written += n
+    return path
+
+
+def _peak_rss_mb():
+    """本进程峰值RSS (Linux下 ru_maxrss 单位为KB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _load_baseline_strategy():
+    sys.path.insert(0, str(Path(__file__).resolve().parent / 'code_策略代码'))
+    from hard_coded_adaptive_baseline import HardCodedAdaptiveStrategy
+    return HardCodedAdaptiveStrategy
+
+
+def measure(path, chunksize=None, periods_per_year=MINUTES_PER_DAY * TRADING_DAYS):
+    """
+    在当前进程中跑一次 HardCodedAdaptiveStrategy, 返回耗时与峰值RSS
+
+    chunksize=None 为整体读入后 backtest() 的对照组。
+    """
+    strategy = _load_baseline_strategy()()
+    rss_before = _peak_rss_mb()
+    t0 = time.perf_counter()
+    if chunksize is None:
+        from price_loader import load_prices
+        result = strategy.backtest(load_prices(path, cache=False))
+        bars = len(result['equity_curve'])
+    else:
+        result = strategy.backtest_stream(iter_bars(path, chunksize), periods_per_year=periods_per_year)
+        bars = result['bars']
+    elapsed = time.perf_counter() - t0
+    return {
+        'chunksize': chunksize,
+        'bars': int(bars),
+        'elapsed_s': round(elapsed, 2),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'rss_before_mb': round(rss_before, 1),
+        'num_trades': result['num_trades'],
+        'total_return': round(result['total_return'], 4),
+    }
+
+
+def benchmark(path, chunksizes=(50_000, 200_000, 1_000_000), full=True):
+    """
+    每种 chunksize 在独立子进程中测量 (峰值RSS互不干扰)
+
+    Returns:
+        list[dict]
+    """
+    configs = list(chunksizes) + ([None] if full else [])
+    results = []
+    for chunksize in configs:
+        cmd = [sys.executable, str(Path(__file__).resolve()), 'measure', '--path', str(path)]
+        if chunksize is not None:
+            cmd += ['--chunksize', str(chunksize)]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"\n{'Chunksize':>12} {'Bars':>12} {'Time(s)':>9} {'Peak RSS(MB)':>13} {'Trades':>7} {'Return%':>9}")
+    print('-' * 68)
+    for r in results:
+        label = 'full load' if r['chunksize'] is None else f"{r['chunksize']:,}"
+        print(f"{label:>12} {r['bars']:>12,} {r['elapsed_s']:>9.2f} {r['peak_rss_mb']:>13.1f} "
+              f"{r['num_trades']:>7} {r['total_return']:>9.3f}")
+    return results
+
+
+# =============================================================================
+# 命令行接口
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='分钟线流式读取: synth / measure / benchmark')
+    parser.add_argument('command', choices=['synth', 'measure', 'benchmark'])
+    parser.add_argument('--path', help='分钟线CSV')
+    parser.add_argument('--out', default='/tmp/synthetic_minutes.csv', help='synth 输出路径')
+    parser.add_argument('--rows', type=int, default=5_000_000, help='synth 行数')
+    parser.add_argument('--chunksize', type=int, default=None, help='measure: 块大小 (缺省为整体读入)')
+    parser.add_argument('--chunksizes', type=int, nargs='+', default=[50_000, 200_000, 1_000_000])
+    parser.add_argument('--no-full', action='store_true', help='benchmark 不跑整体读入对照组')
+    args = parser.parse_args()
+
+    if args.command == 'synth':
+        out = write_synthetic_minutes(args.out, args.rows)
+        print(f"已生成 {args.rows:,} 行 → {out} ({out.stat().st_size / 1024 / 1024:.1f} MB)")
+    elif args.command == 'measure':
+        print(json.dumps(measure(args.path, args.chunksize)))
+    else:
+        print('=' * 80)
+        print(f'Intraday Stream - benchmark ({args.path})')
+        print('=' * 80)
+        benchmark(args.path, args.chunksizes, full=not args.no_full)
+
+    sys.exit(0)
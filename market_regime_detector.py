@@ -10,6 +10,8 @@ Market Regime Detector
 import pandas as pd
 import numpy as np
 
+from feature_store import compute as compute_feature
+
 
 class MarketRegimeDetector:
     """市场环境识别器"""
@@ -88,44 +90,9 @@ class MarketRegimeDetector:
         if len(data) < period + 1:
             return 0.0
 
-        df = data.copy()
-
-        # 计算True Range (TR)
-        df['high_low'] = df['high'] - df['low']
-        df['high_close'] = abs(df['high'] - df['close'].shift(1))
-        df['low_close'] = abs(df['low'] - df['close'].shift(1))
-        df['tr'] = df[['high_low', 'high_close', 'low_close']].max(axis=1)
-
-        # 计算方向移动 (+DM和-DM)
-        df['high_diff'] = df['high'] - df['high'].shift(1)
-        df['low_diff'] = df['low'].shift(1) - df['low']
-
-        df['plus_dm'] = np.where(
-            (df['high_diff'] > df['low_diff']) & (df['high_diff'] > 0),
-            df['high_diff'],
-            0
-        )
-
-        df['minus_dm'] = np.where(
-            (df['low_diff'] > df['high_diff']) & (df['low_diff'] > 0),
-            df['low_diff'],
-            0
-        )
-
-        # 平滑TR, +DM, -DM
-        df['tr_smooth'] = df['tr'].rolling(period).sum()
-        df['plus_dm_smooth'] = df['plus_dm'].rolling(period).sum()
-        df['minus_dm_smooth'] = df['minus_dm'].rolling(period).sum()
-
-        # 计算方向指标 (+DI和-DI)
-        df['plus_di'] = 100 * df['plus_dm_smooth'] / df['tr_smooth']
-        df['minus_di'] = 100 * df['minus_dm_smooth'] / df['tr_smooth']
-
-        # 计算DX
-        df['dx'] = 100 * abs(df['plus_di'] - df['minus_di']) / (df['plus_di'] + df['minus_di'])
-
-        # 计算ADX (DX的平滑)
-        adx = df['dx'].rolling(period).mean().iloc[-1]
+        # TR / +DM / -DM 滚动求和 → +DI/-DI → DX → DX的滚动均值
+        # (与特征库 feature_store 的 adx kind='simple' 为同一实现)
+        adx = compute_feature('adx', data, [period], kind='simple')[0][-1]
 
         return adx if not np.isnan(adx) else 0.0
 
@@ -3,9 +3,27 @@
 """Extract Cross-Market Validation Summary - P0 Critical Evidence"""
 
 import json
+import sys
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from trade_log import load_trade_logs, trades_frame
+
+
+def load_trade_stats(records_file):
+    """Per (market, method) trade stats from the closed-trade logs (trade_log) saved with the results"""
+    stats = {}
+    for (market, method), log in load_trade_logs(records_file).items():
+        stats[(market, method)] = {
+            'num_trades': len(log),
+            'win_rate': float(np.mean(log['pnl'] > 0) * 100) if len(log) else 0,
+            'stop_loss_exits': int(np.sum(log.labels('exit_reason') == 'stop_loss')),
+        }
+    return stats
+
+
 def extract_cross_market_summary():
     """Extract and summarize cross-market validation results"""
 
@@ -15,6 +33,11 @@ def extract_cross_market_summary():
     with open(input_file, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
+    # Per-trade logs saved next to the JSON (<output>_records.npz, keyed by (market, method));
+    # trade counts and win rates come from the logs when present, else from the JSON summary
+    records_file = Path(input_file.replace('.json', '_records.npz'))
+    trade_stats = load_trade_stats(records_file) if records_file.exists() else {}
+
     # Extract market results
     results = []
 
@@ -22,8 +45,8 @@ def extract_cross_market_summary():
         if market_name == 'metadata':
             continue
 
-        fixed = market_data.get('fixed', {})
-        adaptive = market_data.get('adaptive', {})
+        fixed = {**market_data.get('fixed', {}), **trade_stats.get((market_name, 'fixed'), {})}
+        adaptive = {**market_data.get('adaptive', {}), **trade_stats.get((market_name, 'adaptive'), {})}
 
         results.append({
             'market': market_name,
@@ -35,7 +58,8 @@ def extract_cross_market_summary():
             'improvement_pp': market_data.get('improvement_pp', 0),
             'sharpe_ratio': adaptive.get('sharpe_ratio', 0),
             'max_drawdown': adaptive.get('max_drawdown', 0),
-            'win_rate': adaptive.get('win_rate', 0)
+            'win_rate': adaptive.get('win_rate', 0),
+            'adaptive_stop_loss_exits': adaptive.get('stop_loss_exits')
         })
 
     # Create DataFrame
@@ -52,6 +76,13 @@ def extract_cross_market_summary():
     output_csv = '/root/autodl-tmp/paper_results/02_cross_market/cross_market_summary.csv'
     df.to_csv(output_csv, index=False, encoding='utf-8-sig')
 
+    # Every trade of every market in one CSV (from the trade logs)
+    output_trades_csv = None
+    if records_file.exists():
+        trades = trades_frame(records_file).rename(columns={'key0': 'market', 'key1': 'method'})
+        output_trades_csv = output_csv.replace('_summary.csv', '_trades.csv')
+        trades.to_csv(output_trades_csv, index=False, encoding='utf-8-sig')
+
     # Create Markdown Report
     output_md = '/root/autodl-tmp/paper_results/02_cross_market/cross_market_summary.md'
 
@@ -90,7 +121,11 @@ def extract_cross_market_summary():
         f.write(f'### 2. Adaptive Strategy Success\n\n')
         f.write(f'- **All {total_markets} markets** executed trades with adaptive strategy\n')
         f.write(f'- **ATR x3.0** automatically scales to market volatility\n')
-        f.write(f'- **2% risk** automatically adjusts position sizing\n\n')
+        f.write(f'- **2% risk** automatically adjusts position sizing\n')
+        if trade_stats:
+            stop_exits = int(df['adaptive_stop_loss_exits'].fillna(0).sum())
+            f.write(f'- **{stop_exits}/{int(df["adaptive_trades"].sum())} adaptive trades** exited at the ATR stop-loss\n')
+        f.write('\n')
 
         # Best and Worst Markets
         best_market = df.loc[df['improvement_pp'].idxmax()]
@@ -135,6 +170,8 @@ def extract_cross_market_summary():
     print(f'Fixed Parameter Trap: {fixed_zero_trades}/{total_markets} markets with 0 trades')
     print()
     print(f'CSV: {output_csv}')
+    if output_trades_csv:
+        print(f'Trades CSV: {output_trades_csv}')
     print(f'Markdown: {output_md}')
     print('=' * 80)
 
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+向量化绩效指标 (Post-hoc Metrics on Equity Arrays)
+==================================================
+
+功能: 在 equity_recorder 保存的数组 (或 adaptive_engine / portfolio_engine 输出的权益曲线) 上
+      事后计算指标, 不需要重新回测; 逐K线的序列运算全部为numpy整列运算。
+
+    风险收益   sharpe_ratio (日频年化) / sortino_ratio / annual_return (CAGR) / calmar_ratio
+    回撤       max_drawdown (百分比) / max_drawdown_duration (最长水下K线数)
+    交易       win_rate / profit_factor / turnover (年化换手: 成交额 / 平均权益)
+    backtrader口径   bt_summary: 与各脚本原来从 SharpeRatio (年度收益) / DrawDown / TradeAnalyzer
+                     读出的 sharpe_ratio / max_drawdown_pct / total_trades 逐位一致
+
+    权益类函数接受 (T,) 或 (N, T) 数组 (N条等长曲线一次计算), 沿最后一维计算。
+
+使用方法:
+    python perf_metrics.py outputs/classical_baselines_extended_records.npz
+    python perf_metrics.py outputs/ablation_study_results_records.npz --sort sortino --json metrics.json
+
+    from perf_metrics import compute_metrics, max_drawdown
+    metrics = compute_metrics(record)            # record: equity_recorder 的字段dict
+    dd = max_drawdown(np.vstack(curves))         # (N,) 每条曲线的最大回撤
+"""
+
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from adaptive_engine import bt_max_drawdown, bt_sharpe
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+PERIODS_PER_YEAR = 252
+
+
+# =============================================================================
+# 收益与风险
+# =============================================================================
+
+def simple_returns(equity, initial_cash=None):
+    """逐K线简单收益; 给出 initial_cash 时第一根K线相对初始资金, 否则为0"""
+    equity = np.asarray(equity, dtype=np.float64)
+    first = equity[..., :1]
+    base = np.full_like(first, initial_cash) if initial_cash is not None else first
+    previous = np.concatenate((base, equity[..., :-1]), axis=-1)
+    return equity / previous - 1.0
+
+
+def sharpe_ratio(equity, initial_cash=None, riskfree=0.0, periods=PERIODS_PER_YEAR):
+    """日收益的年化Sharpe (样本标准差); 标准差为0时为NaN"""
+    excess = simple_returns(equity, initial_cash) - riskfree / periods
+    std = excess.std(axis=-1, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(std > 0, excess.mean(axis=-1) / std * np.sqrt(periods), np.nan)
+
+
+def sortino_ratio(equity, initial_cash=None, riskfree=0.0, periods=PERIODS_PER_YEAR):
+    """年化Sortino: 下行偏差为 sqrt(mean(min(excess, 0)^2))"""
+    excess = simple_returns(equity, initial_cash) - riskfree / periods
+    downside = np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2, axis=-1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(downside > 0, excess.mean(axis=-1) / downside * np.sqrt(periods), np.nan)
+
+
+def annual_return(equity, dates, initial_cash=None):
+    """按自然日折算的年化收益率 (%), 基准为 initial_cash (默认第一根K线的权益)"""
+    equity = np.asarray(equity, dtype=np.float64)
+    dates = pd.DatetimeIndex(dates)
+    base = initial_cash if initial_cash is not None else equity[..., 0]
+    years = (dates[-1] - dates[0]).days / 365.25
+    if years <= 0:
+        return np.full(equity.shape[:-1], np.nan) if equity.ndim > 1 else np.nan
+    with np.errstate(invalid='ignore'):
+        return ((equity[..., -1] / base) ** (1.0 / years) - 1.0) * 100
+
+
+def drawdown(equity):
+    """逐K线回撤 (%), 相对此前的最高权益"""
+    equity = np.asarray(equity, dtype=np.float64)
+    peak = np.maximum.accumulate(equity, axis=-1)
+    return 100.0 * (peak - equity) / peak
+
+
+def max_drawdown(equity):
+    """最大回撤 (%)"""
+    return drawdown(equity).max(axis=-1)
+
+
+def max_drawdown_duration(equity):
+    """最长水下期 (K线数): 从创出高点到重新回到该高点 (或序列结束) 的最大间隔"""
+    equity = np.asarray(equity, dtype=np.float64)
+    t = np.arange(equity.shape[-1])
+    at_peak = equity >= np.maximum.accumulate(equity, axis=-1)
+    last_peak = np.maximum.accumulate(np.where(at_peak, t, 0), axis=-1)
+    return (t - last_peak).max(axis=-1)
+
+
+def calmar_ratio(equity, dates, initial_cash=None):
+    """年化收益率 / 最大回撤"""
+    mdd = max_drawdown(equity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(mdd > 0, annual_return(equity, dates, initial_cash) / mdd, np.nan)
+
+
+# =============================================================================
+# 交易
+# =============================================================================
+
+def win_rate(pnl):
+    """盈利交易占比 (%); 没有交易时为NaN"""
+    pnl = np.asarray(pnl, dtype=np.float64)
+    return float(np.mean(pnl > 0) * 100) if len(pnl) else np.nan
+
+
+def profit_factor(pnl):
+    """总盈利 / 总亏损; 没有亏损交易时为inf (没有交易时为NaN)"""
+    pnl = np.asarray(pnl, dtype=np.float64)
+    if not len(pnl):
+        return np.nan
+    loss = -pnl[pnl < 0].sum()
+    return float(pnl[pnl > 0].sum() / loss) if loss > 0 else np.inf
+
+
+def turnover(fill_size, fill_price, equity, periods=PERIODS_PER_YEAR):
+    """年化换手率: 成交额合计 / 平均权益, 按K线数折算到一年"""
+    traded = float(np.sum(np.abs(np.asarray(fill_size) * np.asarray(fill_price))))
+    equity = np.asarray(equity, dtype=np.float64)
+    if not len(equity):
+        return np.nan
+    return traded / float(equity.mean()) * periods / len(equity)
+
+
+# =============================================================================
+# 汇总
+# =============================================================================
+
+def bt_summary(record, riskfreerate=0.01):
+    """
+    与各脚本原来的分析器读数一致的汇总 (未四舍五入):
+    SharpeRatio 默认参数 (年度收益) / DrawDown max.drawdown / TradeAnalyzer total.closed
+    """
+    equity = record['equity']
+    initial_cash = float(record['initial_cash'])
+    final_value = float(equity[-1]) if len(equity) else initial_cash
+    return {
+        'final_value': final_value,
+        'sharpe_ratio': bt_sharpe(record['date'], equity, initial_cash, riskfreerate) if len(equity) else None,
+        'max_drawdown_pct': bt_max_drawdown(equity),
+        'total_trades': int(len(record['trade_pnl'])),
+    }
+
+
+def compute_metrics(record, riskfree=0.0, periods=PERIODS_PER_YEAR):
+    """一个 record 的全部指标 (float)"""
+    equity = np.asarray(record['equity'], dtype=np.float64)
+    if not len(equity):
+        return {}
+    initial_cash = float(record['initial_cash'])
+    dates = record['date']
+    pnl = record['trade_pnlcomm']
+    return {
+        'returns_pct': (float(equity[-1]) / initial_cash - 1.0) * 100,
+        'annual_return_pct': float(annual_return(equity, dates, initial_cash)),
+        'sharpe': float(sharpe_ratio(equity, initial_cash, riskfree, periods)),
+        'sortino': float(sortino_ratio(equity, initial_cash, riskfree, periods)),
+        'calmar': float(calmar_ratio(equity, dates, initial_cash)),
+        'max_drawdown_pct': float(max_drawdown(equity)),
+        'max_drawdown_bars': int(max_drawdown_duration(equity)),
+        'trades': int(len(pnl)),
+        'win_rate_pct': win_rate(pnl),
+        'profit_factor': profit_factor(pnl),
+        'turnover': turnover(record['fill_size'], record['fill_price'], equity, periods),
+        'exposure_pct': float(np.mean(record['position'] != 0) * 100),
+    }
+
+
+# =============================================================================
+# 命令行
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    from equity_recorder import load_records
+
+    parser = argparse.ArgumentParser(description='在保存的权益/交易数组上计算指标 (不重新回测)')
+    parser.add_argument('records', help='equity_recorder.save_records 写出的 .npz')
+    parser.add_argument('--sort', default=None, help='按该指标降序排列 (如 sharpe / calmar)')
+    parser.add_argument('--riskfree', type=float, default=0.0, help='年化无风险利率')
+    parser.add_argument('--json', default=None, help='把指标写入JSON文件')
+    args = parser.parse_args()
+
+    rows = [(key, compute_metrics(record, args.riskfree)) for key, record in load_records(args.records).items()]
+    if args.sort:
+        rows.sort(key=lambda kv: np.nan_to_num(kv[1].get(args.sort, np.nan), nan=-np.inf), reverse=True)
+
+    columns = ('returns_pct', 'annual_return_pct', 'sharpe', 'sortino', 'calmar',
+               'max_drawdown_pct', 'max_drawdown_bars', 'trades', 'win_rate_pct', 'turnover')
+    labels = ('收益%', '年化%', 'Sharpe', 'Sortino', 'Calmar', '回撤%', '水下K线', '交易', '胜率%', '换手')
+    names = [' / '.join(map(str, key)) if isinstance(key, tuple) else str(key) for key, _ in rows]
+    width = max([len(n) for n in names] + [10])
+
+    print('=' * 80)
+    print(f'Post-hoc Metrics - {args.records} ({len(rows)} runs)')
+    print('=' * 80)
+    print(f"\n{'运行':<{width}} " + ' '.join(f'{label:>8}' for label in labels))
+    print('-' * (width + 9 * len(labels)))
+    for name, (_, m) in zip(names, rows):
+        print(f"{name:<{width}} " + ' '.join(f"{m.get(c, np.nan):>8.2f}" for c in columns))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({name: m for name, (_, m) in zip(names, rows)}, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存: {args.json}")
+
+    sys.exit(0)
@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+"""
+共享资金多标的组合回测引擎 (Shared-cash Multi-asset Portfolio Engine)
+====================================================================
+
+功能: experiment9 / experiment10 把每只股票各自配 10万 独立回测再取平均; 本模块在整个股票池上
+      用同一个资金账户运行 ATR止损 + 2%风险仓位 策略:
+
+    - 数据来自 universe_panel (S × T 对齐面板), 指标/信号按标的一次性预计算为 (S, T) 数组
+    - 逐K线循环只沿时间轴: 每根K线对全部标的做 (S,) 向量运算 (成交 / 盯市 / 止损 / 入场排序),
+      不存在"每个标的每根K线"的Python循环, 标的数量扩大到几百只时单根K线的开销基本不变
+    - 组合约束: 共享现金, 最大持仓数 max_positions, 单标的权重上限 max_weight;
+      入场候选超过剩余仓位时按趋势强度 (fast/slow - 1) 排序, 资金不足时按同一顺序依次放弃
+
+撮合口径 (与 backtrader 默认broker一致): 收盘产生信号, 下一根有效K线开盘成交,
+    费用按 cost_model 方案计算 (默认只有佣金 abs(size) * commission * price); 先卖后买,
+    买单按优先级依次扣减现金, 资金不足的订单撤销 (不占用资金, 后面的订单继续检查); 停牌 (面板掩码为False) 的标的订单保留到复牌, 估值沿用最近收盘价
+
+A股规则 (cost=ashare_schedule(), 命令行 --ashare): 卖出印花税 / 最低佣金 / 买入按100股整手向下取整 /
+    开盘涨停不能买、开盘跌停不能卖、成交量为0不能成交 (掩码由OHLCV一次性预计算为 (S, T),
+    无法成交的订单与停牌一样保留到下一根K线)
+
+策略 (LLM_Adaptive 同族): SMA金叉 (可选 RSI 过滤) 入场, 死叉或 close < 成交价 - ATR × 倍数 离场,
+    仓位 int(组合权益 × risk_percent / (ATR × 倍数)), 再受 max_weight 限制
+
+使用方法:
+    python portfolio_engine.py run                                 # 全部A股, 全部历史
+    python portfolio_engine.py run --start 2018-01-01 --end 2023-12-31 --max-positions 8
+    python portfolio_engine.py run --ashare                        # A股费用与成交规则
+    python portfolio_engine.py benchmark --replicate 1 --replicate 10 --replicate 30
+    python portfolio_engine.py verify --ashare                     # 与逐标的逐K线参照循环对比
+
+    from portfolio_engine import run_portfolio
+    result = run_portfolio(start='2018-01-01', max_positions=10)
+    result['equity'], result['trades'], result['summary']
+"""
+
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from adaptive_engine import bt_max_drawdown, bt_sharpe
+from cost_model import ashare_schedule, fill_masks, limit_pct, order_fees, previous_close, round_lot, schedule
+from feature_store import compute as compute_feature
+from universe_panel import open_panel
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+DEFAULT_PARAMS = {
+    'sma_fast': 5,
+    'sma_slow': 20,
+    'rsi_period': 7,
+    'rsi_above': 50,         # None 表示不过滤
+    'atr_period': 14,
+    'atr_multiplier': 3.0,
+    'risk_percent': 0.02,
+    'max_positions': 10,
+    'max_weight': 0.1,       # 单标的市值 / 组合权益 的上限 (按信号K线收盘价)
+}
+
+
+def universe_symbols(panel):
+    """面板中的A股个股 (不含指数与美股ETF)"""
+    return [s for s in panel.symbols if s.startswith('stock_')]
+
+
+# =============================================================================
+# 信号预计算 (S × T)
+# =============================================================================
+
+def _forward_fill(values, valid):
+    """沿时间轴用最近一根有效K线的值填充 (首根有效K线之前为0)"""
+    t = np.arange(values.shape[1])
+    last = np.maximum.accumulate(np.where(valid, t, -1), axis=1)
+    filled = np.take_along_axis(values, np.maximum(last, 0), axis=1)
+    return np.where(last >= 0, filled, 0.0)
+
+
+def compute_signals(panel, params):
+    """
+    每个标的在自己的有效K线序列上计算指标 (停牌日不参与均线), 再放回共享日历
+
+    Returns:
+        dict: open / high / low / close / close_ffill / volume / valid / atr / entry / exit_signal / strength,
+              均为 (S, T)
+    """
+    S, T = panel.mask.shape
+    valid = np.asarray(panel.mask, dtype=bool)
+    open_ = np.asarray(panel.field('open'), dtype=np.float64)
+    close = np.asarray(panel.field('close'), dtype=np.float64)
+    high = np.asarray(panel.field('high'), dtype=np.float64)
+    low = np.asarray(panel.field('low'), dtype=np.float64)
+
+    atr = np.full((S, T), np.nan)
+    entry = np.zeros((S, T), dtype=bool)
+    exit_signal = np.zeros((S, T), dtype=bool)
+    strength = np.full((S, T), np.nan)
+
+    for i in range(S):
+        rows = np.flatnonzero(valid[i])
+        if len(rows) < params['sma_slow'] + 1:
+            continue
+        arrays = {'close': close[i, rows], 'high': high[i, rows], 'low': low[i, rows]}
+        fast, slow = compute_feature('sma', arrays, [params['sma_fast'], params['sma_slow']], kind='bt')
+        atr[i, rows] = compute_feature('atr', arrays, [params['atr_period']], kind='bt')[0]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            f_prev = np.concatenate(([np.nan], fast[:-1]))
+            s_prev = np.concatenate(([np.nan], slow[:-1]))
+            golden = (fast > slow) & (f_prev <= s_prev)
+            death = (fast < slow) & (f_prev >= s_prev)
+            if params.get('rsi_above') is not None:
+                rsi = compute_feature('rsi', arrays, [params['rsi_period']], kind='bt')[0]
+                golden &= rsi > params['rsi_above']
+            entry[i, rows] = golden
+            exit_signal[i, rows] = death
+            strength[i, rows] = fast / slow - 1.0
+
+    return {
+        'open': open_, 'high': high, 'low': low, 'close': close, 'close_ffill': _forward_fill(close, valid),
+        'volume': np.asarray(panel.field('volume'), dtype=np.float64), 'valid': valid,
+        'atr': atr, 'entry': entry, 'exit_signal': exit_signal, 'strength': strength,
+    }
+
+
+# =============================================================================
+# 组合状态机
+# =============================================================================
+
+def market_masks(signals, symbols, dates, cost):
+    """方案的涨跌停/停牌掩码 (can_buy, can_sell), 均为 (S, T); 不限制涨跌停时为 None"""
+    limit = cost.get('price_limit')
+    if limit is None:
+        return None
+    if limit == 'board':
+        limit = np.vstack([limit_pct(s, dates) for s in symbols])
+    return fill_masks(signals['open'], previous_close(signals['close_ffill']), limit, signals['volume'])
+
+
+def simulate_portfolio(signals, params, initial_cash=1000000, commission=0.0015, cost=None, masks=None):
+    """
+    共享资金逐K线模拟 (循环只沿时间轴)
+
+    Args:
+        cost: cost_model 方案 (默认 schedule(commission))
+        masks: market_masks() 的 (can_buy, can_sell); None 表示只受停牌掩码限制
+
+    Returns:
+        dict: equity / cash / positions_held (T,), size (S,) 期末持仓, trades (dict of arrays)
+    """
+    cost = cost or schedule(commission)
+    rate, stamp, minimum = cost['commission'], cost['stamp_duty'], cost['min_commission']
+    slip, lot = cost['slippage'], cost['lot_size']
+    open_, close, valid = signals['open'], signals['close'], signals['valid']
+    can_buy, can_sell = masks if masks is not None else (valid, valid)
+    close_ffill, atr = signals['close_ffill'], signals['atr']
+    entry, exit_signal, strength = signals['entry'], signals['exit_signal'], signals['strength']
+    S, T = close.shape
+    mult = params['atr_multiplier']
+
+    cash = float(initial_cash)
+    size = np.zeros(S, dtype=np.int64)
+    entry_price = np.zeros(S)
+    entry_fee = np.zeros(S)
+    entry_bar = np.zeros(S, dtype=np.int64)
+    pending = np.zeros(S, dtype=np.int64)     # 正为买单, 负为卖单, 在下一根有效K线开盘成交
+    priority = np.zeros(S)
+
+    equity = np.empty(T)
+    cash_curve = np.empty(T)
+    held_curve = np.empty(T, dtype=np.int64)
+    closed = {k: [] for k in ('symbol', 'entry_bar', 'exit_bar', 'size', 'entry_price', 'exit_price', 'pnl')}
+    rejected = 0
+    deferred = 0
+
+    for t in range(T):
+        v = valid[:, t]
+
+        # 1) 开盘成交: 先卖后买
+        if pending.any():
+            px = open_[:, t]
+            if masks is not None:
+                deferred += int(((pending != 0) & v & ~np.where(pending > 0, can_buy[:, t], can_sell[:, t])).sum())
+            idx = np.flatnonzero((pending < 0) & v & can_sell[:, t])
+            if len(idx):
+                q, p = size[idx], px[idx]
+                if slip:
+                    p = np.maximum(p * (1 - slip), signals['low'][idx, t])
+                fee = order_fees(-q, p, rate, stamp, minimum)
+                cash += float(np.sum(q * p - fee))
+                closed['symbol'].append(idx)
+                closed['entry_bar'].append(entry_bar[idx])
+                closed['exit_bar'].append(np.full(len(idx), t))
+                closed['size'].append(q)
+                closed['entry_price'].append(entry_price[idx])
+                closed['exit_price'].append(p)
+                closed['pnl'].append((p - entry_price[idx]) * q - fee - entry_fee[idx])
+                size[idx] = 0
+                pending[idx] = 0
+
+            idx = np.flatnonzero((pending > 0) & v & can_buy[:, t])
+            if len(idx):
+                idx = idx[np.argsort(-priority[idx], kind='stable')]
+                q, p = pending[idx], px[idx]
+                if slip:
+                    p = np.minimum(p * (1 + slip), signals['high'][idx, t])
+                fee = order_fees(q, p, rate, stamp, minimum)
+                amount = q * p + fee
+                # 按优先级依次检查资金: 被撤销的订单不占用现金, 排在后面的小额订单仍可成交
+                ok = np.zeros(len(idx), dtype=bool)
+                for j in range(len(idx)):
+                    if amount[j] <= cash:
+                        cash -= float(amount[j])
+                        ok[j] = True
+                filled = idx[ok]
+                size[filled] = q[ok]
+                entry_price[filled] = p[ok]
+                entry_fee[filled] = fee[ok]
+                entry_bar[filled] = t
+                rejected += int(len(idx) - ok.sum())
+                pending[idx] = 0
+
+        # 2) 收盘盯市 (停牌标的按最近收盘价)
+        value = cash + float(np.dot(size, close_ffill[:, t]))
+        equity[t] = value
+        cash_curve[t] = cash
+        held = size > 0
+        held_curve[t] = int(held.sum())
+
+        # 3) 收盘信号 → 下一根有效K线的订单
+        c, a = close[:, t], atr[:, t]
+        with np.errstate(invalid='ignore'):
+            leave = held & v & (pending == 0) & (exit_signal[:, t] | (c < entry_price - a * mult))
+        pending[leave] = -size[leave]
+
+        candidates = np.flatnonzero(~held & (pending == 0) & entry[:, t])
+        if len(candidates):
+            slots = params['max_positions'] - int((held & ~leave).sum()) - int((pending > 0).sum())
+            if slots > 0:
+                candidates = candidates[np.argsort(-strength[candidates, t], kind='stable')][:slots]
+                stop_distance = a[candidates] * mult
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    q = np.floor(value * params['risk_percent'] / stop_distance)
+                    q = np.minimum(q, np.floor(value * params['max_weight'] / c[candidates]))
+                q = round_lot(np.where(np.isfinite(q) & (stop_distance > 0), q, 0).astype(np.int64), lot)
+                go = q > 0
+                pending[candidates[go]] = q[go]
+                priority[candidates[go]] = strength[candidates[go], t]
+
+    trades = {k: (np.concatenate(v) if v else np.array([])) for k, v in closed.items()}
+    return {
+        'equity': equity, 'cash': cash_curve, 'positions_held': held_curve,
+        'size': size, 'trades': trades, 'rejected_orders': rejected, 'deferred_orders': deferred,
+    }
+
+
+# =============================================================================
+# 接口
+# =============================================================================
+
+def _prepare(panel, params, cost):
+    """信号 / 共享日历 / 成交掩码"""
+    # 共享日历是全部标的日期的并集: 去掉股票池中没有任何K线的日期 (如只有美股交易的日子)
+    days = np.asarray(panel.mask).any(axis=0)
+    signals = {k: v[:, days] for k, v in compute_signals(panel, params).items()}
+    dates = pd.DatetimeIndex(panel.dates[days])
+    return signals, dates, market_masks(signals, panel.symbols, dates, cost)
+
+
+def run_portfolio(start=None, end=None, symbols=None, initial_cash=1000000, commission=0.0015,
+                  data_dir=None, panel=None, cost=None, **params):
+    """
+    在股票池上运行共享资金组合回测
+
+    Args:
+        symbols: 标的列表 (默认面板中全部A股个股)
+        panel: 可选, 已打开/切片好的 UniversePanel (benchmark 用)
+        cost: 可选, cost_model 方案 (如 ashare_schedule()), 覆盖 commission
+        **params: 覆盖 DEFAULT_PARAMS
+
+    Returns:
+        dict: dates / symbols / equity / cash / positions_held / trades / summary
+    """
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"未知参数: {sorted(unknown)}")
+    params = dict(DEFAULT_PARAMS, **params)
+
+    if panel is None:
+        base = open_panel(data_dir)
+        panel = base.slice(start, end, symbols or universe_symbols(base))
+    cost = cost or schedule(commission)
+    signals, dates, masks = _prepare(panel, params, cost)
+    sim = simulate_portfolio(signals, params, initial_cash, commission, cost, masks)
+
+    equity = sim['equity']
+    trades = sim['trades']
+    final_value = float(equity[-1]) if len(equity) else float(initial_cash)
+    sharpe = bt_sharpe(dates, equity, initial_cash) if len(equity) else None
+    pnl = trades['pnl']
+
+    contributions = {}
+    for i, symbol in enumerate(panel.symbols):
+        mine = trades['symbol'] == i if len(pnl) else np.zeros(0, dtype=bool)
+        contributions[symbol] = {'trades': int(mine.sum()), 'pnl': round(float(pnl[mine].sum()), 2) if len(pnl) else 0.0}
+
+    summary = {
+        'symbols': len(panel.symbols),
+        'bars': len(dates),
+        'initial_cash': initial_cash,
+        'final_value': round(final_value, 2),
+        'returns_pct': round((final_value - initial_cash) / initial_cash * 100, 2),
+        'sharpe_ratio': round(sharpe or 0, 3),
+        'max_drawdown_pct': round(bt_max_drawdown(equity), 2),
+        'closed_trades': int(len(pnl)),
+        'win_rate': round(float((pnl > 0).mean()) * 100, 2) if len(pnl) else 0.0,
+        'avg_positions': round(float(sim['positions_held'].mean()), 2) if len(equity) else 0.0,
+        'max_positions_held': int(sim['positions_held'].max()) if len(equity) else 0,
+        'avg_invested_pct': round(float(np.mean(1.0 - sim['cash'] / equity)) * 100, 2) if len(equity) else 0.0,
+        'rejected_orders': sim['rejected_orders'],
+        'deferred_orders': sim['deferred_orders'],
+        'open_positions': int((sim['size'] > 0).sum()),
+    }
+    return {
+        'dates': dates, 'symbols': list(panel.symbols), 'params': params,
+        'equity': equity, 'cash': sim['cash'], 'positions_held': sim['positions_held'],
+        'trades': trades, 'contributions': contributions, 'summary': summary,
+    }
+
+
+# =============================================================================
+# 参照实现 (逐标的逐K线循环)
+# =============================================================================
+
+def reference_portfolio(signals, params, initial_cash=1000000, commission=0.0015, cost=None, masks=None):
+    """
+    与 simulate_portfolio 同一口径的朴素循环: 每根K线逐个标的处理, 每笔买单单独检查现金
+
+    Returns:
+        dict: equity (T,), trades (symbol, entry_bar, exit_bar, size, entry_price, exit_price) 列表,
+              rejected_orders
+    """
+    cost = cost or schedule(commission)
+    rate, stamp, minimum = cost['commission'], cost['stamp_duty'], cost['min_commission']
+    slip, lot = cost['slippage'], cost['lot_size']
+    open_, high, low, close = signals['open'], signals['high'], signals['low'], signals['close']
+    valid, close_ffill, atr = signals['valid'], signals['close_ffill'], signals['atr']
+    can_buy, can_sell = masks if masks is not None else (valid, valid)
+    S, T = close.shape
+    mult = params['atr_multiplier']
+
+    cash = float(initial_cash)
+    size = [0] * S
+    entry_price = [0.0] * S
+    entry_bar = [0] * S
+    pending = [0] * S
+    priority = [0.0] * S
+    equity = np.empty(T)
+    trades = []
+    rejected = 0
+
+    for t in range(T):
+        for i in range(S):
+            if pending[i] < 0 and valid[i, t] and can_sell[i, t]:
+                p = open_[i, t]
+                if slip:
+                    p = max(p * (1 - slip), low[i, t])
+                cash += size[i] * p - float(order_fees(-size[i], p, rate, stamp, minimum))
+                trades.append((i, entry_bar[i], t, size[i], entry_price[i], p))
+                size[i] = pending[i] = 0
+
+        buys = [i for i in range(S) if pending[i] > 0 and valid[i, t] and can_buy[i, t]]
+        for i in sorted(buys, key=lambda i: -priority[i]):
+            p = open_[i, t]
+            if slip:
+                p = min(p * (1 + slip), high[i, t])
+            amount = pending[i] * p + float(order_fees(pending[i], p, rate, stamp, minimum))
+            if amount <= cash:
+                cash -= amount
+                size[i], entry_price[i], entry_bar[i] = pending[i], p, t
+            else:
+                rejected += 1
+            pending[i] = 0
+
+        value = cash + sum(size[i] * close_ffill[i, t] for i in range(S))
+        equity[t] = value
+
+        held = [size[i] > 0 for i in range(S)]
+        leaving = 0
+        for i in range(S):
+            if (held[i] and valid[i, t] and pending[i] == 0
+                    and (signals['exit_signal'][i, t] or close[i, t] < entry_price[i] - atr[i, t] * mult)):
+                pending[i] = -size[i]
+                leaving += 1
+
+        slots = params['max_positions'] - (sum(held) - leaving) - sum(1 for q in pending if q > 0)
+        candidates = [i for i in range(S) if not held[i] and pending[i] == 0 and signals['entry'][i, t]]
+        for i in sorted(candidates, key=lambda i: -signals['strength'][i, t])[:max(slots, 0)]:
+            stop_distance = atr[i, t] * mult
+            if not stop_distance > 0:
+                continue
+            q = min(math.floor(value * params['risk_percent'] / stop_distance),
+                    math.floor(value * params['max_weight'] / close[i, t]))
+            q = q // lot * lot
+            if q > 0:
+                pending[i], priority[i] = q, signals['strength'][i, t]
+
+    return {'equity': equity, 'trades': trades, 'rejected_orders': rejected}
+
+
+def verify(start=None, end=None, symbols=None, initial_cash=1000000, commission=0.0015, cost=None,
+           data_dir=None, panel=None, rtol=1e-9, **params):
+    """
+    simulate_portfolio vs reference_portfolio: 平仓交易逐笔相同, 权益曲线相对偏差在 rtol 内
+
+    Returns:
+        list: 差异描述 (空表示一致)
+    """
+    params = dict(DEFAULT_PARAMS, **params)
+    if panel is None:
+        base = open_panel(data_dir)
+        panel = base.slice(start, end, symbols or universe_symbols(base))
+    cost = cost or schedule(commission)
+    signals, _, masks = _prepare(panel, params, cost)
+    ours = simulate_portfolio(signals, params, initial_cash, commission, cost, masks)
+    ref = reference_portfolio(signals, params, initial_cash, commission, cost, masks)
+
+    problems = []
+    t = ours['trades']
+    trades = sorted(zip(*(t[k].tolist() for k in ('symbol', 'entry_bar', 'exit_bar', 'size',
+                                                   'entry_price', 'exit_price')))) if len(t['pnl']) else []
+    if trades != sorted(ref['trades']):
+        problems.append(f"平仓交易不同: {len(trades)} vs 参照 {len(ref['trades'])} 笔")
+    if ours['rejected_orders'] != ref['rejected_orders']:
+        problems.append(f"资金不足撤单 {ours['rejected_orders']} vs 参照 {ref['rejected_orders']}")
+    deviation = float(np.max(np.abs(ours['equity'] - ref['equity']) / ref['equity'])) if len(ref['equity']) else 0.0
+    if deviation > rtol:
+        problems.append(f"权益偏差 {deviation:.2e}")
+    return problems
+
+
+# =============================================================================
+# 扩展性测试
+# =============================================================================
+
+class _TiledPanel:
+    """把面板的标的维度重复k次 (模拟几百只标的的股票池, 只用于计时)"""
+
+    def __init__(self, panel, k):
+        self.symbols = [f'{s}#{j}' for j in range(k) for s in panel.symbols]
+        self.fields = panel.fields
+        self.dates = panel.dates
+        self.values = np.tile(np.asarray(panel.values), (k, 1, 1))
+        self.mask = np.tile(np.asarray(panel.mask), (k, 1))
+
+    def field(self, name):
+        return self.values[:, :, self.fields.index(name)]
+
+
+def benchmark(replicates=(1, 5, 20), start=None, end=None, data_dir=None):
+    """标的数量 × k 时的耗时 (信号预计算 / 逐K线模拟分开计)"""
+    base = open_panel(data_dir)
+    panel = base.slice(start, end, universe_symbols(base))
+    rows = []
+    for k in replicates:
+        tiled = _TiledPanel(panel, k)
+        params = dict(DEFAULT_PARAMS, max_positions=10 * k)
+        days = tiled.mask.any(axis=0)
+
+        t0 = time.perf_counter()
+        signals = {key: v[:, days] for key, v in compute_signals(tiled, params).items()}
+        signal_seconds = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        simulate_portfolio(signals, params)
+        sim_seconds = time.perf_counter() - t0
+
+        bars = int(days.sum())
+        rows.append({'symbols': len(tiled.symbols), 'bars': bars, 'signal_seconds': signal_seconds,
+                     'sim_seconds': sim_seconds, 'us_per_bar': sim_seconds / bars * 1e6})
+    return rows
+
+
+# =============================================================================
+# 命令行
+# =============================================================================
+
+def _print_summary(result):
+    s = result['summary']
+    print(f"\n股票池: {s['symbols']} 只, {s['bars']} 根K线 "
+          f"({result['dates'][0].date()} ~ {result['dates'][-1].date()})")
+    print(f"初始资金: {s['initial_cash']:,.0f}  期末价值: {s['final_value']:,.2f}  收益率: {s['returns_pct']:+.2f}%")
+    print(f"Sharpe: {s['sharpe_ratio']:.3f}  最大回撤: {s['max_drawdown_pct']:.2f}%")
+    print(f"平仓交易: {s['closed_trades']}  胜率: {s['win_rate']:.1f}%  资金不足撤单: {s['rejected_orders']}  "
+          f"涨跌停/停牌顺延: {s['deferred_orders']}")
+    print(f"平均持仓数: {s['avg_positions']:.2f} (最多 {s['max_positions_held']})  "
+          f"平均仓位: {s['avg_invested_pct']:.1f}%  期末持仓: {s['open_positions']}")
+
+    print(f"\n{'标的':<20} {'交易数':>6} {'已实现盈亏':>14}")
+    print('-' * 44)
+    ranked = sorted(result['contributions'].items(), key=lambda kv: kv[1]['pnl'], reverse=True)
+    for symbol, c in ranked:
+        print(f"{symbol:<20} {c['trades']:>6} {c['pnl']:>14,.2f}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='共享资金组合回测: run / benchmark / verify')
+    parser.add_argument('command', choices=['run', 'benchmark', 'verify'])
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--symbol', action='append', help='只使用指定标的 (可重复, 默认全部A股)')
+    parser.add_argument('--cash', type=float, default=1000000)
+    parser.add_argument('--commission', type=float, default=0.0015)
+    parser.add_argument('--ashare', action='store_true',
+                        help='A股费用与成交规则 (印花税/最低佣金/整手/涨跌停, 佣金取 --commission)')
+    parser.add_argument('--max-positions', type=int, default=DEFAULT_PARAMS['max_positions'])
+    parser.add_argument('--max-weight', type=float, default=DEFAULT_PARAMS['max_weight'])
+    parser.add_argument('--risk', type=float, default=DEFAULT_PARAMS['risk_percent'])
+    parser.add_argument('--replicate', type=int, action='append', help='benchmark: 标的数量放大倍数 (可重复)')
+    parser.add_argument('--data-dir', default=None, help='数据目录 (默认 backtest_data_extended)')
+    parser.add_argument('--json', default=None, help='run: 把汇总与权益曲线写入JSON文件')
+    args = parser.parse_args()
+
+    print('=' * 80)
+    print(f'Shared-cash Portfolio Engine - {args.command}')
+    print('=' * 80)
+
+    if args.command == 'benchmark':
+        rows = benchmark(tuple(args.replicate or (1, 5, 20)), args.start, args.end, args.data_dir)
+        print(f"\n{'标的数':>6} {'K线数':>6} {'信号预计算(s)':>14} {'组合模拟(s)':>12} {'us/K线':>9}")
+        print('-' * 54)
+        for r in rows:
+            print(f"{r['symbols']:>6} {r['bars']:>6} {r['signal_seconds']:>14.2f} "
+                  f"{r['sim_seconds']:>12.2f} {r['us_per_bar']:>9.1f}")
+        sys.exit(0)
+
+    cost = ashare_schedule(args.start, commission=args.commission) if args.ashare else None
+    if args.command == 'verify':
+        problems = verify(args.start, args.end, args.symbol, args.cash, args.commission, cost, args.data_dir,
+                          max_positions=args.max_positions, max_weight=args.max_weight, risk_percent=args.risk)
+        for p in problems:
+            print(f"  MISMATCH {p}")
+        print(f"\n对比完成: {'一致' if not problems else '不一致'}")
+        sys.exit(1 if problems else 0)
+
+    result = run_portfolio(args.start, args.end, args.symbol, args.cash, args.commission, args.data_dir,
+                           cost=cost, max_positions=args.max_positions, max_weight=args.max_weight,
+                           risk_percent=args.risk)
+    _print_summary(result)
+
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        output = {
+            'summary': result['summary'],
+            'params': result['params'],
+            'contributions': result['contributions'],
+            'equity': dict(zip(result['dates'].strftime('%Y-%m-%d'), np.round(result['equity'], 2).tolist())),
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存: {args.json}")
+
+    sys.exit(0)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+统一行情CSV读取器 (Schema-normalizing Price Loader)
+====================================================
+
+功能: 自动识别项目中出现过的各种CSV格式, 统一规范为同一schema:
+      index='date' (DatetimeIndex, 升序), 列 open/high/low/close/volume (显式dtype)
+
+支持的格式 (dialect):
+    standard     date,open,high,low,close,volume            backtest_data_extended/*.csv
+                                                             (SPY.csv 为倒序存储, 读取后统一升序)
+    yfinance     Price,Close,... / Ticker,... / Date,,,...  yfinance新版 to_csv 的多行表头 (QQQ.csv)
+    capitalized  Date,Open,High,Low,Close,[Adj Close,]Volume  yfinance旧版 / 补充实验脚本的下载结果
+    akshare_cn   日期,开盘,收盘,最高,最低,成交量,...         backtest_data/ (akshare原始中文列名)
+    intraday     datetime,open,high,low,close,volume        分钟线 (见 intraday_stream)
+    akshare_cn_minute  时间,开盘,收盘,最高,最低,成交量,...  akshare 分钟线
+
+使用方法:
+    from price_loader import load_prices
+    df = load_prices('backtest_data_extended/SPY.csv')
+    df32 = load_prices(path, dtype='float32')
+    for chunk in iter_prices(minute_csv, chunksize=500_000): ...   # 大文件分块读取
+
+    python price_loader.py report [--data-dir DIR]      # 与各脚本原有读取方式对比耗时/内存
+
+进程内缓存以 (路径, size, mtime, dtype, sort) 为键; 返回的是缓存中的同一个DataFrame,
+需要原地修改时请先 .copy()。
+"""
+
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+DTYPES = ('float64', 'float32')
+
+# 各格式的列名映射 (原始列名 → 规范列名), 未列出的列丢弃
+COLUMN_MAPS = {
+    'standard': {'date': 'date', 'open': 'open', 'high': 'high', 'low': 'low',
+                 'close': 'close', 'volume': 'volume'},
+    'yfinance': {'Price': 'date', 'Open': 'open', 'High': 'high', 'Low': 'low',
+                 'Close': 'close', 'Volume': 'volume'},
+    'capitalized': {'Date': 'date', 'Open': 'open', 'High': 'high', 'Low': 'low',
+                    'Close': 'close', 'Volume': 'volume'},
+    'akshare_cn': {'日期': 'date', '开盘': 'open', '最高': 'high', '最低': 'low',
+                   '收盘': 'close', '成交量': 'volume'},
+    'intraday': {'datetime': 'date', 'open': 'open', 'high': 'high', 'low': 'low',
+                 'close': 'close', 'volume': 'volume'},
+    'akshare_cn_minute': {'时间': 'date', '开盘': 'open', '最高': 'high', '最低': 'low',
+                          '收盘': 'close', '成交量': 'volume'},
+}
+
+CACHE_SIZE = 64
+
+# 进程内缓存: {(path, size, mtime_ns, dtype, sort): DataFrame}
+_CACHE = OrderedDict()
+
+
+# =============================================================================
+# 格式识别
+# =============================================================================
+
+def detect_dialect(csv_path):
+    """
+    根据前两行识别CSV格式
+
+    Returns:
+        (dialect, skiprows, header)
+    """
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        header = [c.strip() for c in f.readline().strip().split(',')]
+        second = f.readline()
+
+    if header[0] == 'Price' and second.startswith('Ticker'):
+        return 'yfinance', [1, 2], header
+    for dialect, mapping in COLUMN_MAPS.items():
+        required = [src for src, dst in mapping.items() if dst in ('date', 'close')]
+        if all(col in header for col in required):
+            return dialect, None, header
+    raise ValueError(f"无法识别的CSV格式: {csv_path} (表头: {header[:8]})")
+
+
+# =============================================================================
+# 读取
+# =============================================================================
+
+def _parse_dates(values):
+    try:
+        return pd.to_datetime(values, format='ISO8601')
+    except (ValueError, TypeError):
+        return pd.to_datetime(values)
+
+
+def _normalize(df, mapping, dtype, csv_path):
+    """原始列 → 规范schema (DatetimeIndex + FIELDS), 不排序"""
+    df = df.rename(columns=mapping)
+    missing = [f for f in FIELDS if f not in df.columns]
+    if missing:
+        raise ValueError(f"{csv_path} 缺少列: {missing}")
+
+    index = pd.DatetimeIndex(_parse_dates(df['date']), name='date')
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return pd.DataFrame(df[list(FIELDS)].to_numpy(dtype=dtype), index=index, columns=list(FIELDS))
+
+
+def _read(csv_path, dialect, skiprows, header, dtype, sort=True):
+    mapping = COLUMN_MAPS[dialect]
+    usecols = [c for c in header if c in mapping]
+
+    # 数值列直接以目标dtype解析; 含非数值 (如 'null') 时回退为逐列to_numeric(coerce)
+    try:
+        df = pd.read_csv(csv_path, usecols=usecols, skiprows=skiprows, encoding='utf-8-sig',
+                         dtype={c: dtype for c in usecols if mapping[c] != 'date'})
+    except ValueError:
+        df = pd.read_csv(csv_path, usecols=usecols, skiprows=skiprows, encoding='utf-8-sig')
+        numeric = [c for c in usecols if mapping[c] != 'date']
+        df[numeric] = df[numeric].apply(pd.to_numeric, errors='coerce').astype(dtype)
+
+    df = _normalize(df, mapping, dtype, csv_path)
+    if sort and not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind='stable')
+    return df
+
+
+def load_prices(csv_path, dtype='float64', cache=True, sort=True):
+    """
+    读取任意已知格式的行情CSV并规范为统一schema
+
+    Args:
+        csv_path: CSV路径
+        dtype: 'float64' (默认) 或 'float32' (内存减半)
+        cache: 是否使用进程内缓存 (源文件size/mtime变化时自动失效)
+        sort: 按日期升序排序; False 时保留文件中的原始行顺序 (数据质量检查用)
+
+    Returns:
+        pd.DataFrame: index='date' (DatetimeIndex, 升序), 列 open/high/low/close/volume
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype必须为 {DTYPES} 之一, 收到: {dtype}")
+
+    csv_path = Path(csv_path)
+    st = csv_path.stat()
+    key = (str(csv_path.resolve()), st.st_size, st.st_mtime_ns, dtype, sort)
+    if cache and key in _CACHE:
+        _CACHE.move_to_end(key)
+        return _CACHE[key]
+
+    dialect, skiprows, header = detect_dialect(csv_path)
+    df = _read(csv_path, dialect, skiprows, header, dtype, sort=sort)
+
+    if cache:
+        _CACHE[key] = df
+        while len(_CACHE) > CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    return df
+
+
+def clear_cache():
+    _CACHE.clear()
+
+
+def iter_prices(csv_path, chunksize=100_000, dtype='float64'):
+    """
+    分块读取行情CSV (分钟线等无法整体装入内存的大文件)
+
+    每块规范为与 load_prices 相同的schema, 保持文件中的原始行顺序, 不做缓存。
+
+    Yields:
+        pd.DataFrame: 最多 chunksize 行
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype必须为 {DTYPES} 之一, 收到: {dtype}")
+
+    dialect, skiprows, header = detect_dialect(csv_path)
+    mapping = COLUMN_MAPS[dialect]
+    usecols = [c for c in header if c in mapping]
+    numeric = [c for c in usecols if mapping[c] != 'date']
+
+    reader = pd.read_csv(csv_path, usecols=usecols, skiprows=skiprows, encoding='utf-8-sig',
+                         chunksize=chunksize)
+    for df in reader:
+        # 块内出现非数值 (如 'null') 的列按 to_numeric(coerce) 处理
+        bad = [c for c in numeric if df[c].dtype == object]
+        if bad:
+            df[bad] = df[bad].apply(pd.to_numeric, errors='coerce')
+        yield _normalize(df, mapping, dtype, csv_path)
+
+
+# =============================================================================
+# 对比报告: 各脚本原有的读取方式
+# =============================================================================
+
+def _adhoc_standard(csv_path):
+    """extended_backtest.load_data 原实现: 位置重命名 + 逐列 pd.to_numeric"""
+    df = pd.read_csv(csv_path)
+    df['date'] = pd.to_datetime(df['date'])
+    df.set_index('date', inplace=True)
+    df.columns = ['open', 'high', 'low', 'close', 'volume'][:len(df.columns)]
+    for col in df.columns:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df.dropna(inplace=True)
+    return df
+
+
+def _adhoc_yfinance(csv_path):
+    """eoh_gpu_loop_fixed.load_local_csv 原实现: 两行表头"""
+    df = pd.read_csv(csv_path, header=[0, 1], index_col=0, parse_dates=True).sort_index()
+    df.columns = [col[0] for col in df.columns]
+    return df
+
+
+def _adhoc_capitalized(csv_path):
+    """补充实验脚本原实现: index_col=0 + parse_dates"""
+    return pd.read_csv(csv_path, index_col=0, parse_dates=True)
+
+
+def _adhoc_akshare_cn(csv_path):
+    """day45_portfolio.load_data 原实现: 中文列名重命名"""
+    df = pd.read_csv(csv_path)
+    df['日期'] = pd.to_datetime(df['日期'])
+    df.set_index('日期', inplace=True)
+    df = df.rename(columns={'开盘': 'open', '收盘': 'close', '最高': 'high', '最低': 'low', '成交量': 'volume'})
+    return df[['open', 'high', 'low', 'close', 'volume']]
+
+
+ADHOC_READERS = {
+    'standard': _adhoc_standard,
+    'yfinance': _adhoc_yfinance,
+    'capitalized': _adhoc_capitalized,
+    'akshare_cn': _adhoc_akshare_cn,
+}
+
+
+def _measure(func, repeat):
+    """返回 (平均耗时ms, tracemalloc峰值MB, 结果DataFrame占用MB)"""
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - t0) / repeat * 1000
+
+    # 内存单独测一次, tracemalloc本身会拖慢计时
+    tracemalloc.start()
+    df = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024, df.memory_usage(deep=True).sum() / 1024 / 1024
+
+
+def report(data_dir, repeat=5):
+    """
+    对比原有读取方式与 load_prices (冷读取 / 缓存命中 / float32) 的耗时与内存
+
+    Returns:
+        dict: {file: {...}}
+    """
+    results = {}
+    for csv_path in sorted(Path(data_dir).glob('*.csv')):
+        try:
+            dialect = detect_dialect(csv_path)[0]
+        except ValueError:
+            continue
+
+        adhoc = _measure(lambda: ADHOC_READERS[dialect](csv_path), repeat)
+        cold = _measure(lambda: load_prices(csv_path, cache=False), repeat)
+        cold32 = _measure(lambda: load_prices(csv_path, dtype='float32', cache=False), repeat)
+        load_prices(csv_path)
+        warm = _measure(lambda: load_prices(csv_path), repeat)
+
+        results[csv_path.name] = {
+            'dialect': dialect,
+            'adhoc_ms': round(adhoc[0], 3), 'adhoc_peak_mb': round(adhoc[1], 3), 'adhoc_mb': round(adhoc[2], 3),
+            'loader_ms': round(cold[0], 3), 'loader_peak_mb': round(cold[1], 3), 'loader_mb': round(cold[2], 3),
+            'loader32_mb': round(cold32[2], 3),
+            'cached_ms': round(warm[0], 4),
+        }
+
+    print(f"\n{'File':<24} {'Dialect':<12} {'Ad-hoc(ms)':>10} {'Loader(ms)':>10} {'Cached(ms)':>10} "
+          f"{'Peak MB':>15} {'Frame MB':>20}")
+    print('-' * 108)
+    for name, r in results.items():
+        print(f"{name:<24} {r['dialect']:<12} {r['adhoc_ms']:>10.2f} {r['loader_ms']:>10.2f} {r['cached_ms']:>10.4f} "
+              f"{r['adhoc_peak_mb']:>6.2f} → {r['loader_peak_mb']:>6.2f} "
+              f"{r['adhoc_mb']:>6.3f} → {r['loader_mb']:.3f}/{r['loader32_mb']:.3f}")
+
+    if results:
+        total = {k: sum(r[k] for r in results.values())
+                 for k in ('adhoc_ms', 'loader_ms', 'cached_ms', 'adhoc_mb', 'loader_mb', 'loader32_mb')}
+        print('-' * 108)
+        print(f"合计耗时: ad-hoc {total['adhoc_ms']:.1f} ms → loader {total['loader_ms']:.1f} ms "
+              f"({total['adhoc_ms'] / total['loader_ms']:.1f}x), 缓存命中 {total['cached_ms']:.3f} ms")
+        print(f"合计内存: ad-hoc {total['adhoc_mb']:.2f} MB → loader {total['loader_mb']:.2f} MB "
+              f"(float32: {total['loader32_mb']:.2f} MB)")
+
+    return results
+
+
+# =============================================================================
+# 命令行接口
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='统一行情CSV读取器: report')
+    parser.add_argument('command', choices=['report'])
+    parser.add_argument('--data-dir', default=str(Path(__file__).resolve().parent / 'backtest_data_extended'))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('=' * 80)
+    print('Price Loader - 读取方式对比')
+    print('=' * 80)
+    report(args.data_dir, repeat=args.repeat)
+
+    sys.exit(0)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+列式二进制行情存储 (Columnar Price Store)
+==========================================
+
+功能: 一次性把 backtest_data_extended/ 下的 OHLCV CSV 转成按列存储的 .npy 文件,
+      所有回测驱动脚本通过 load_ohlcv(symbol, start, end) 共享读取,
+      不再在每次回测里重复 pd.read_csv + pd.to_datetime
+
+存储布局:
+    backtest_data_extended/price_store/<symbol>/
+        date.npy                      datetime64[ns], 升序
+        open/high/low/close/volume.npy  float64
+        meta.json                     源CSV的size/mtime/行数 (用于判断是否需要重新ingest)
+
+使用方法:
+    python price_store.py ingest               # 一次性转换全部CSV
+    python price_store.py ingest --force       # 强制重建
+    python price_store.py benchmark            # 与CSV读取路径对比耗时
+
+symbol 可以是文件名主干 ('stock_sh_600519'), 带后缀的文件名, 或CSV完整路径。
+若给出完整路径, 存储目录位于该CSV所在目录下的 price_store/。
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from date_index import WindowedFrame, date_bounds
+from price_loader import load_prices
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+DATA_DIR = Path(__file__).resolve().parent / 'backtest_data_extended'
+STORE_DIRNAME = 'price_store'
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+# 进程内已打开的memmap: {store_dir: (meta, arrays)}
+_OPEN_STORES = {}
+
+# 进程内已加载的完整历史: {store_dir: (meta, WindowedFrame)}
+_HISTORIES = {}
+
+
+# =============================================================================
+# 路径解析
+# =============================================================================
+
+def resolve_symbol(symbol, data_dir=None):
+    """
+    解析symbol为 (csv_path, store_dir)
+
+    Args:
+        symbol: 'stock_sh_600519' / 'stock_sh_600519.csv' / CSV完整路径
+        data_dir: 数据目录 (默认 DATA_DIR, 给出完整路径时忽略)
+    """
+    path = Path(symbol)
+    if path.suffix == '.csv' and (path.is_absolute() or len(path.parts) > 1):
+        csv_path = path
+    else:
+        csv_path = Path(data_dir or DATA_DIR) / f'{path.stem}.csv'
+    store_dir = csv_path.parent / STORE_DIRNAME / csv_path.stem
+    return csv_path, store_dir
+
+
+def _source_signature(csv_path):
+    """源文件签名 (size + mtime), 用于判断存储是否过期"""
+    st = csv_path.stat()
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+# =============================================================================
+# Ingest: CSV → 列式 .npy
+# =============================================================================
+
+def read_source_csv(csv_path):
+    """
+    读取原始CSV并规范为 date索引 + open/high/low/close/volume (float64, 日期升序)
+
+    格式识别 (标准格式 / yfinance多行表头 / 中文列名 等) 由 price_loader 统一处理。
+    """
+    return load_prices(csv_path, cache=False)
+
+
+def ingest_file(csv_path, force=False):
+    """
+    将单个CSV转换为列式存储
+
+    Returns:
+        dict: meta信息 (若存储已是最新且未force, 直接返回已有meta)
+    """
+    csv_path = Path(csv_path)
+    _, store_dir = resolve_symbol(csv_path)
+    signature = _source_signature(csv_path)
+
+    meta_path = store_dir / 'meta.json'
+    if not force and meta_path.exists():
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('source') == signature:
+            return meta
+
+    df = read_source_csv(csv_path)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    np.save(store_dir / 'date.npy', df.index.values.astype('datetime64[ns]'))
+    for field in FIELDS:
+        np.save(store_dir / f'{field}.npy', np.ascontiguousarray(df[field].values))
+
+    meta = {
+        'symbol': csv_path.stem,
+        'csv': str(csv_path),
+        'source': signature,
+        'rows': int(len(df)),
+        'start': str(df.index[0].date()) if len(df) else None,
+        'end': str(df.index[-1].date()) if len(df) else None,
+        'fields': list(FIELDS),
+        'ingested_at': pd.Timestamp.now().isoformat(),
+    }
+    # meta最后写入: 中断的ingest不会留下"看似有效"的存储
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    _OPEN_STORES.pop(store_dir, None)
+    return meta
+
+
+def ingest_all(data_dir=None, force=False):
+    """转换数据目录下全部CSV"""
+    data_dir = Path(data_dir or DATA_DIR)
+    metas = []
+    for csv_path in sorted(data_dir.glob('*.csv')):
+        try:
+            meta = ingest_file(csv_path, force=force)
+            metas.append(meta)
+            print(f"  ✅ {csv_path.stem:<20} {meta['rows']:>6} 行 ({meta['start']} ~ {meta['end']})")
+        except Exception as e:
+            print(f"  ❌ {csv_path.stem:<20} {str(e)[:80]}")
+    return metas
+
+
+# =============================================================================
+# 读取接口
+# =============================================================================
+
+def _open_store(symbol, data_dir=None):
+    """打开(必要时先ingest)某个symbol的存储, 返回 (meta, arrays) — arrays 为只读memmap"""
+    csv_path, store_dir = resolve_symbol(symbol, data_dir)
+
+    cached = _OPEN_STORES.get(store_dir)
+    if cached is not None:
+        if not csv_path.exists() or cached[0]['source'] == _source_signature(csv_path):
+            return cached
+
+    if csv_path.exists():
+        meta = ingest_file(csv_path)
+    else:
+        # 只有存储、没有CSV (例如只分发了price_store) 也可以读取
+        with open(store_dir / 'meta.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+    arrays = {'date': np.load(store_dir / 'date.npy', mmap_mode='r')}
+    for field in meta['fields']:
+        arrays[field] = np.load(store_dir / f'{field}.npy', mmap_mode='r')
+
+    _OPEN_STORES[store_dir] = (meta, arrays)
+    return meta, arrays
+
+
+def load_arrays(symbol, start=None, end=None, data_dir=None, fields=FIELDS):
+    """
+    读取原始numpy数组 (零拷贝只读视图)
+
+    Returns:
+        dict: {'date': datetime64[ns] 数组, 'open': ..., ...}
+    """
+    _, arrays = _open_store(symbol, data_dir)
+    lo, hi = date_bounds(arrays['date'], start, end)
+    out = {'date': arrays['date'][lo:hi]}
+    for field in fields:
+        out[field] = arrays[field][lo:hi]
+    return out
+
+
+def load_ohlcv(symbol, start=None, end=None, data_dir=None):
+    """
+    读取OHLCV DataFrame (所有驱动脚本共用的读取入口)
+
+    Args:
+        symbol: 'stock_sh_600519' / 文件名 / CSV完整路径
+        start, end: 日期闭区间 (str或Timestamp, None表示不限)
+
+    Returns:
+        pd.DataFrame: index='date' (DatetimeIndex, 升序), 列 open/high/low/close/volume (float64)
+    """
+    arrays = load_arrays(symbol, start, end, data_dir)
+    index = pd.DatetimeIndex(arrays['date'], name='date')
+    return pd.DataFrame({field: arrays[field] for field in FIELDS}, index=index)
+
+
+def load_history(symbol, data_dir=None):
+    """
+    读取完整历史并包装为 WindowedFrame (进程内缓存)
+
+    滚动窗口/多时间段驱动脚本对同一标的反复取窗口时使用:
+    history.window(start, end) 为 O(log n) 的零拷贝视图。
+    """
+    meta, _ = _open_store(symbol, data_dir)
+    _, store_dir = resolve_symbol(symbol, data_dir)
+    cached = _HISTORIES.get(store_dir)
+    if cached is not None and cached[0] is meta:
+        return cached[1]
+
+    history = WindowedFrame(load_ohlcv(symbol, data_dir=data_dir))
+    _HISTORIES[store_dir] = (meta, history)
+    return history
+
+
+# =============================================================================
+# 基准测试
+# =============================================================================
+
+def _load_via_csv(csv_path, start, end):
+    """现有驱动脚本的读取方式 (pd.read_csv + to_datetime + 布尔掩码)"""
+    df = pd.read_csv(csv_path)
+    df['date'] = pd.to_datetime(df['date'])
+    df.set_index('date', inplace=True)
+    df = df[(df.index >= start) & (df.index <= end)]
+    return df[['open', 'high', 'low', 'close', 'volume']]
+
+
+def benchmark(data_dir=None, start='2018-01-01', end='2023-12-31', repeat=20):
+    """
+    对比CSV读取路径与列式存储的加载耗时
+
+    Returns:
+        dict: {symbol: {'csv_ms', 'store_ms', 'speedup'}}
+    """
+    data_dir = Path(data_dir or DATA_DIR)
+    ingest_all(data_dir)
+
+    results = {}
+    for csv_path in sorted(data_dir.glob('*.csv')):
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            if not f.readline().startswith('date,'):
+                continue  # 非标准表头 (QQQ) 现有脚本无法直接读取, 不参与对比
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            _load_via_csv(csv_path, start, end)
+        csv_ms = (time.perf_counter() - t0) / repeat * 1000
+
+        load_ohlcv(csv_path, start, end)  # 预热: 打开memmap
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            load_ohlcv(csv_path, start, end)
+        store_ms = (time.perf_counter() - t0) / repeat * 1000
+
+        results[csv_path.stem] = {
+            'csv_ms': round(csv_ms, 3),
+            'store_ms': round(store_ms, 3),
+            'speedup': round(csv_ms / store_ms, 1) if store_ms > 0 else None,
+        }
+
+    print(f"\n{'Symbol':<20} {'CSV (ms)':>10} {'Store (ms)':>12} {'Speedup':>9}")
+    print('-' * 55)
+    for symbol, r in results.items():
+        print(f"{symbol:<20} {r['csv_ms']:>10.3f} {r['store_ms']:>12.3f} {r['speedup']:>8.1f}x")
+    if results:
+        csv_total = sum(r['csv_ms'] for r in results.values())
+        store_total = sum(r['store_ms'] for r in results.values())
+        print('-' * 55)
+        print(f"{'TOTAL':<20} {csv_total:>10.3f} {store_total:>12.3f} {csv_total / store_total:>8.1f}x")
+
+    return results
+
+
+# =============================================================================
+# 命令行接口
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='列式行情存储: ingest / benchmark')
+    parser.add_argument('command', choices=['ingest', 'benchmark'])
+    parser.add_argument('--data-dir', default=str(DATA_DIR), help='CSV数据目录')
+    parser.add_argument('--force', action='store_true', help='强制重建存储')
+    parser.add_argument('--repeat', type=int, default=20, help='benchmark重复次数')
+    args = parser.parse_args()
+
+    print('=' * 80)
+    print(f'Price Store - {args.command}')
+    print('=' * 80)
+
+    if args.command == 'ingest':
+        metas = ingest_all(args.data_dir, force=args.force)
+        print(f"\n完成: {len(metas)} 个文件 → {Path(args.data_dir) / STORE_DIRNAME}")
+    else:
+        benchmark(args.data_dir, repeat=args.repeat)
+
+    sys.exit(0)
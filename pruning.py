@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+参数扫描的提前剪枝 (Early-abort Pruning)
+========================================
+
+功能: 大网格中的多数组合跑到一部分历史时就已经没有希望 (回撤超过50%、权益跌破下限、
+      很久都没有成交), 但 experiment8 grid_search / run_single_backtest 总是模拟到最后一根K线。
+      本模块提供可插拔的剪枝规则, 由一个backtrader分析器 (Pruner) 在每根K线后检查,
+      任一规则成立即 cerebro.runstop() 提前结束, 结果标记为 pruned:
+
+    - DrawdownCeiling(50): 账户价值相对此前最高点回撤超过 50%
+    - EquityFloor(50): 账户价值低于初始资金的 50%
+    - NoTradesBy(250): 第 250 根K线时仍没有任何成交
+    - FitnessBound(k=10): 收益率的上界已低于当前第 k 名 —— 上界假设剩余每根K线都以
+          max(最高价, 前收盘) / min(最低价, 前收盘) 的倍数增值 (exposure < 1 表示持仓市值最多占
+          账户价值的该比例)。前提是策略只做多且无杠杆: 同一根K线内先多后空 (开盘做多、盘中反手做空)
+          可以同时吃到上涨和下跌两段, 收益超过该上界。满足前提时被剪掉的组合不可能进入前 k 名,
+          Top-k 结果与不剪枝时相同 (在进程池中每个worker维护自己的前 k 名, 门槛只会更低, 结论不变)。
+          长区间上这个上界很宽松, 主要剪掉回测尾段; 大部分节省来自前三条规则
+
+    前三条是启发式规则, 会改变被剪组合的结果 (它们不再参与排序); FitnessBound 不改变Top-k。
+
+    结果dict 增加 pruned / pruned_reason / pruned_bar / bars_run / bars_total;
+    prune_summary(results) 汇总剪枝数与节省的K线评估数。
+
+使用方法:
+    from pruning import DrawdownCeiling, NoTradesBy, FitnessBound, add_pruner, pruner_fields
+    rules = [DrawdownCeiling(50), NoTradesBy(250), FitnessBound(k=10)]
+    add_pruner(cerebro, rules)
+    strat = cerebro.run()[0]
+    result.update(pruner_fields(strat))
+    ...
+    print(format_summary(prune_summary(results)))
+"""
+
+import heapq
+import math
+
+import backtrader as bt
+import numpy as np
+
+
+# =============================================================================
+# 规则
+# =============================================================================
+
+class PruneRule:
+    """剪枝规则: start() 每次回测开始时调用, check() 每根K线后调用 (返回 True 即剪枝), record() 回测结束后调用"""
+
+    name = 'rule'
+
+    def start(self, initial_value, total_bars, prices):
+        pass
+
+    def check(self, bar, value, fills):
+        return False
+
+    def record(self, result):
+        pass
+
+
+class DrawdownCeiling(PruneRule):
+    name = 'drawdown'
+
+    def __init__(self, max_drawdown_pct=50.0):
+        self.max_drawdown_pct = max_drawdown_pct
+
+    def start(self, initial_value, total_bars, prices):
+        self._peak = initial_value
+
+    def check(self, bar, value, fills):
+        self._peak = max(self._peak, value)
+        return (self._peak - value) / self._peak * 100 > self.max_drawdown_pct
+
+
+class EquityFloor(PruneRule):
+    name = 'equity_floor'
+
+    def __init__(self, floor_pct=50.0):
+        self.floor_pct = floor_pct
+
+    def start(self, initial_value, total_bars, prices):
+        self._floor = initial_value * self.floor_pct / 100
+
+    def check(self, bar, value, fills):
+        return value < self._floor
+
+
+class NoTradesBy(PruneRule):
+    name = 'no_trades'
+
+    def __init__(self, bar=250):
+        self.bar = bar
+
+    def check(self, bar, value, fills):
+        return bar >= self.bar and fills == 0
+
+
+class FitnessBound(PruneRule):
+    """
+    收益率 (score, %) 的乐观上界低于当前第 k 名时剪枝; 前 k 名按回测长度分别维护
+
+    只对只做多、无杠杆的策略成立 (K线内多空反手的收益可以超过上界, 会误剪进入前 k 名的组合)
+    """
+
+    name = 'fitness_bound'
+
+    def __init__(self, k=10, score='return_pct', exposure=1.0):
+        self.k = k
+        self.score = score
+        self.exposure = exposure
+        self._top = {}          # 回测K线数 → 前k名得分 (小根堆)
+
+    def start(self, initial_value, total_bars, prices):
+        high, low, close = (np.asarray(prices[f], dtype=np.float64) for f in ('high', 'low', 'close'))
+        prev = np.concatenate(([close[0]], close[:-1]))
+        log_ratio = np.log1p(self.exposure * (np.maximum(high, prev) / np.minimum(low, prev) - 1))
+        # remaining[t]: 第 t 根K线 (0起) 之后全部K线的对数倍数之和
+        self._remaining = np.concatenate((np.cumsum(log_ratio[::-1])[::-1][1:], [0.0]))
+        self._initial = initial_value
+        top = self._top.get(total_bars, [])
+        self._threshold = top[0] if len(top) >= self.k else -math.inf
+
+    def check(self, bar, value, fills):
+        if self._threshold == -math.inf:
+            return False
+        bound = value * math.exp(self._remaining[bar - 1])
+        return (bound - self._initial) / self._initial * 100 < self._threshold
+
+    def record(self, result):
+        if (result.get('pruned', True) or not result.get('success', True)
+                or result.get(self.score) is None):
+            return
+        top = self._top.setdefault(result['bars_total'], [])
+        if len(top) < self.k:
+            heapq.heappush(top, result[self.score])
+        elif result[self.score] > top[0]:
+            heapq.heapreplace(top, result[self.score])
+
+
+# =============================================================================
+# 分析器
+# =============================================================================
+
+class Pruner(bt.Analyzer):
+    """每根K线后检查剪枝规则 (最后一根除外, 已跑完全程); 触发时记录 (规则名, K线序号) 并停止本次回测"""
+
+    params = (('rules', ()),)
+
+    def start(self):
+        self.total_bars = self.data.buflen()
+        self.bars_run = 0
+        self.fills = 0
+        self.pruned = None
+        prices = {f: getattr(self.data, f).array for f in ('high', 'low', 'close')}
+        for rule in self.p.rules:
+            rule.start(self.strategy.broker.getvalue(), self.total_bars, prices)
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self.fills += 1
+
+    def next(self):
+        self.bars_run = len(self.data)
+        if self.pruned is not None or self.bars_run >= self.total_bars:
+            return
+        value = self.strategy.broker.getvalue()
+        for rule in self.p.rules:
+            if rule.check(self.bars_run, value, self.fills):
+                self.pruned = (rule.name, self.bars_run)
+                self.strategy.env.runstop()
+                break
+
+    def get_analysis(self):
+        return {'pruned': self.pruned, 'bars_run': self.bars_run, 'total_bars': self.total_bars}
+
+
+def add_pruner(cerebro, rules):
+    """给 cerebro 挂上 Pruner (rules 为空时不挂)"""
+    if rules:
+        cerebro.addanalyzer(Pruner, _name='pruner', rules=tuple(rules))
+
+
+def pruner_fields(strat):
+    """回测结束后写入结果dict的字段 (没有挂 Pruner 时为空dict)"""
+    pruner = getattr(strat.analyzers, 'pruner', None)
+    if pruner is None:
+        return {}
+    analysis = pruner.get_analysis()
+    reason, bar = analysis['pruned'] or (None, None)
+    return {'pruned': reason is not None, 'pruned_reason': reason, 'pruned_bar': bar,
+            'bars_run': analysis['bars_run'], 'bars_total': analysis['total_bars']}
+
+
+def record(rules, result):
+    """一次回测的最终结果交给各规则 (FitnessBound 据此更新前k名)"""
+    if result is None:
+        return
+    for rule in rules or ():
+        rule.record(result)
+
+
+# =============================================================================
+# 汇总
+# =============================================================================
+
+def prune_summary(results):
+    """剪枝数 (按规则) 与K线评估数: 实际运行 / 不剪枝时的总数 / 节省"""
+    tracked = [r for r in results if r and 'bars_total' in r]
+    reasons = {}
+    for r in tracked:
+        if r['pruned']:
+            reasons[r['pruned_reason']] = reasons.get(r['pruned_reason'], 0) + 1
+    bars_run = sum(r['bars_run'] for r in tracked)
+    bars_total = sum(r['bars_total'] for r in tracked)
+    return {
+        'runs': len(tracked),
+        'pruned': sum(reasons.values()),
+        'by_rule': reasons,
+        'bars_run': bars_run,
+        'bars_total': bars_total,
+        'bars_saved': bars_total - bars_run,
+        'saved_pct': (bars_total - bars_run) / bars_total * 100 if bars_total else 0.0,
+    }
+
+
+def format_summary(summary):
+    rules = ', '.join(f'{name}={count}' for name, count in summary['by_rule'].items()) or '-'
+    return (f"剪枝 {summary['pruned']}/{summary['runs']} 个组合 ({rules}); "
+            f"K线评估 {summary['bars_run']}/{summary['bars_total']}, "
+            f"节省 {summary['bars_saved']} ({summary['saved_pct']:.1f}%)")
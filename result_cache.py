@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+回测结果缓存 (Content-addressed Backtest Result Cache)
+======================================================
+
+功能: run_parameter_sensitivity_analysis / run_ablation_study / multi_year_rolling_validation /
+      transaction_cost_sensitivity / extended_backtest 每次重跑都从头回测全部单元格,
+      即使只改了报告部分。本模块按内容给每个回测单元格算一个key, 结果存进本地SQLite:
+
+    - cache_key: 对 策略 (类源码, 含项目内基类) / 参数 / 数据 (文件内容或DataFrame内容) /
+                 日期区间 / broker设置 / 引擎模块源码 等组成部分求 sha256;
+                 任何一项变化即换key (旧条目之后被淘汰), 与文件路径、修改时间无关
+    - ResultCache: SQLite单文件 (多进程/多主机可并发读写), 值为pickle;
+                   按总字节数淘汰最久未访问的条目; 计数 hits / misses / stores / evictions
+    - lookup(key, compute): 命中直接返回, 否则计算并写入 (None 不写入, 下次重算)
+
+    各驱动脚本结束时打印 RESULT_CACHE.summary() (命中率)。
+
+    work_queue 的多台主机worker共享仓库目录时也共享这个缓存文件; 与队列一样使用 DELETE 日志模式
+    (WAL 的 -shm 共享内存索引不能跨主机, 也不能放在网络文件系统上), 写入由文件锁串行化。
+
+使用方法:
+    from result_cache import ResultCache, cache_key
+    RESULT_CACHE = ResultCache()
+    key = cache_key(LLM_Adaptive, data=Path(data_path), start=start, end=end,
+                    broker={'cash': 100000, 'commission': 0.0015})
+    result = RESULT_CACHE.lookup(key, lambda: run_backtest(...))
+    print(RESULT_CACHE.summary())
+
+    python result_cache.py info                     # 条目数 / 大小
+    python result_cache.py clear
+"""
+
+import hashlib
+import inspect
+import json
+import pickle
+import sqlite3
+import sys
+import time
+import types
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+CACHE_PATH = Path(__file__).resolve().parent / 'price_cache' / 'results.sqlite'
+MAX_MB = 256
+
+
+# =============================================================================
+# key
+# =============================================================================
+
+_FILE_HASHES = {}      # (路径, mtime_ns, 大小) → sha256
+_SOURCE_HASHES = {}    # 类/函数 → sha256
+
+
+def file_hash(path):
+    """文件内容的 sha256 (同一进程内按 路径/mtime/大小 记忆); 文件不存在时为 None"""
+    path = Path(path)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    memo = (str(path.resolve()), st.st_mtime_ns, st.st_size)
+    if memo not in _FILE_HASHES:
+        _FILE_HASHES[memo] = hashlib.sha256(path.read_bytes()).hexdigest()
+    return _FILE_HASHES[memo]
+
+
+def frame_hash(df):
+    """DataFrame 内容 (索引 + 列名 + 数值) 的 sha256"""
+    digest = hashlib.sha256(repr(list(df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def source_hash(obj):
+    """
+    类或函数的源码 sha256; 类包含MRO中全部项目内基类 (backtrader / 内置类型除外)
+    取不到源码时 (交互式定义等) 退回到限定名
+    """
+    if obj not in _SOURCE_HASHES:
+        digest = hashlib.sha256()
+        parts = inspect.getmro(obj) if inspect.isclass(obj) else (obj,)
+        for part in parts:
+            module = getattr(part, '__module__', '') or ''
+            if module == 'builtins' or module.split('.')[0] == 'backtrader':
+                continue
+            try:
+                digest.update(inspect.getsource(part).encode('utf-8'))
+            except (OSError, TypeError):
+                digest.update(f'{module}.{part.__qualname__}'.encode('utf-8'))
+        _SOURCE_HASHES[obj] = digest.hexdigest()
+    return _SOURCE_HASHES[obj]
+
+
+def _token(value):
+    """可JSON序列化的内容标识"""
+    if inspect.isclass(value) or inspect.isfunction(value):
+        return ['source', value.__qualname__, source_hash(value)]
+    if isinstance(value, types.ModuleType):
+        return ['module', value.__name__, file_hash(value.__file__)]
+    if isinstance(value, Path):
+        return ['file', file_hash(value) or f'missing:{value}']
+    if isinstance(value, pd.DataFrame):
+        return ['frame', frame_hash(value)]
+    if isinstance(value, dict):
+        return ['dict', sorted([str(k), _token(v)] for k, v in value.items())]
+    if isinstance(value, (list, tuple)):
+        return [_token(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+
+def cache_key(*parts, **named):
+    """
+    回测单元格的key
+
+    类/函数 → 源码; 模块 → 源文件内容; Path → 文件内容 (不是路径); DataFrame → 内容;
+    dict / list / tuple 递归; 其余取值本身 (str 按字面, 路径请传 Path)
+    """
+    payload = json.dumps([_token(list(parts)), _token(named)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# =============================================================================
+# 缓存
+# =============================================================================
+
+class ResultCache:
+    """SQLite中的 key → pickle 结果, 按总字节数做LRU淘汰"""
+
+    def __init__(self, path=None, max_mb=MAX_MB, enabled=True):
+        self.path = Path(path) if path else CACHE_PATH
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enabled = enabled
+        self._db = None
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _connect(self):
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), timeout=60)
+            self._db.execute('PRAGMA journal_mode=DELETE')   # WAL 不能跨主机共享 (见模块说明)
+            self._db.execute('CREATE TABLE IF NOT EXISTS results ('
+                             'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                             'nbytes INTEGER NOT NULL, accessed REAL NOT NULL)')
+            self._db.commit()
+        return self._db
+
+    def get(self, key):
+        """命中时返回结果 (并更新访问时间), 否则 None"""
+        if not self.enabled:
+            self.misses += 1
+            return None
+        db = self._connect()
+        row = db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        db.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+        db.commit()
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        db = self._connect()
+        db.execute('INSERT OR REPLACE INTO results (key, value, nbytes, accessed) VALUES (?, ?, ?, ?)',
+                   (key, payload, len(payload), time.time()))
+        self.stores += 1
+        self._evict(keep=key)
+        db.commit()
+
+    def lookup(self, key, compute):
+        """命中则返回缓存结果, 否则 compute() 并写入 (结果为 None 时不写入)"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def _evict(self, keep):
+        db = self._connect()
+        total = db.execute('SELECT COALESCE(SUM(nbytes), 0) FROM results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = db.execute('SELECT key, nbytes FROM results WHERE key != ? ORDER BY accessed', (keep,))
+        doomed = []
+        for key, nbytes in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= nbytes
+        db.executemany('DELETE FROM results WHERE key = ?', doomed)
+        self.evictions += len(doomed)
+
+    def clear(self):
+        db = self._connect()
+        db.execute('DELETE FROM results')
+        db.commit()
+        db.execute('VACUUM')
+
+    def stats(self):
+        entries, nbytes = (0, 0)
+        if self.path.exists():
+            entries, nbytes = self._connect().execute(
+                'SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM results').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'entries': entries,
+            'mb': round(nbytes / 1024 / 1024, 3),
+        }
+
+    def summary(self):
+        s = self.stats()
+        rate = f"{s['hit_rate'] * 100:.1f}%" if s['hit_rate'] is not None else 'n/a'
+        return (f"hits={s['hits']} misses={s['misses']} hit_rate={rate} stores={s['stores']} "
+                f"evictions={s['evictions']} entries={s['entries']}/{s['mb']:.2f}MB")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='回测结果缓存: info / clear')
+    parser.add_argument('command', choices=['info', 'clear'])
+    parser.add_argument('--path', default=None, help=f'缓存文件 (默认 {CACHE_PATH})')
+    args = parser.parse_args()
+
+    cache = ResultCache(args.path)
+    if args.command == 'clear':
+        cache.clear()
+    s = cache.stats()
+    print(f"{cache.path}: {s['entries']} 个条目, {s['mb']:.2f} MB")
+
+    sys.exit(0)
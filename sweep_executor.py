@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+参数网格并行执行器 (Process-pool Sweep Executor)
+================================================
+
+功能: experiment8_parameter_optimization.grid_search 与 补充实验_P0_单独调参对比.grid_search_optimal_params
+      原来在一个进程里逐个跑 itertools.product 的全部组合 (每个组合一次Cerebro / 一次状态机)。
+      本模块把组合分发到进程池:
+
+    - 每个worker进程启动时由 initializer 调用一次 loader(*loader_args) 读入数据, 存在进程内全局变量,
+      之后该worker上的所有组合都复用这份数据 (不再随每个任务序列化DataFrame);
+      数据已在当前进程里时可直接传 data=, 每个worker只在启动时接收一次
+    - 组合按 chunksize 成块分发 (一块一次进程间通信), 默认每个worker约4块, 兼顾负载均衡与IPC开销
+    - 结果按完成顺序流式返回 (imap_unordered), 调用方可以边收边显示进度;
+      每项带组合序号, collect() 按原顺序还原 (排序/取最优与串行时完全一致)
+    - workers=1 时不建进程池, 在当前进程内串行执行 (同样只读一次数据)
+
+    evaluate(data, params) 与 loader 必须是模块级函数 (可被pickle); 可以用 functools.partial 绑定额外参数。
+
+使用方法:
+    from sweep_executor import grid, run_sweep, collect
+    combos = grid({'stop_loss': [100, 200], 'position_size': [10, 20]})
+    for index, params, result in run_sweep(evaluate, combos, load_data, (DATA_FILE,), workers=8):
+        ...                                          # 完成顺序
+    results = collect(evaluate, combos, data=df)                      # 原顺序的结果列表
+
+    # 不同worker数的耗时 / 加速比 / 并行效率 (并检查结果与串行一致)
+    python sweep_executor.py benchmark
+    python sweep_executor.py benchmark --symbol stock_sh_600519 --workers 1 2 4 8 --json outputs/sweep_scaling.json
+
+    benchmark 同时按各worker实际占用的CPU时间给出"负载上限" (全部组合的CPU时间 / 最忙worker的CPU时间):
+    CPU足够时墙钟加速应接近该上限, 差值即进程启动、读数据与进程间通信的开销;
+    进程数超过可用CPU时墙钟加速没有意义 (表中标 *), 只看负载上限
+"""
+
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+
+# =============================================================================
+# 组合
+# =============================================================================
+
+def grid(param_space):
+    """{参数: [取值]} → [{参数: 取值}], 顺序与 itertools.product 相同"""
+    names = list(param_space.keys())
+    return [dict(zip(names, combo)) for combo in itertools.product(*(param_space[k] for k in names))]
+
+
+def default_workers():
+    """当前进程可用的CPU数"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_chunksize(n, workers, chunks_per_worker=4):
+    return max(1, -(-n // (workers * chunks_per_worker)))
+
+
+# =============================================================================
+# worker
+# =============================================================================
+
+# worker进程内的数据与评估函数 (由 _init_worker 设置)
+_WORKER = {}
+
+
+def _init_worker(evaluate, loader, loader_args, data):
+    _WORKER['evaluate'] = evaluate
+    _WORKER['data'] = loader(*loader_args) if loader is not None else data
+
+
+def _run_chunk(chunk):
+    """一块组合: [(序号, 参数)] → [(序号, 参数, 结果)]"""
+    evaluate, data = _WORKER['evaluate'], _WORKER['data']
+    return [(index, params, evaluate(data, params)) for index, params in chunk]
+
+
+# =============================================================================
+# 执行
+# =============================================================================
+
+def run_sweep(evaluate, combos, loader=None, loader_args=(), workers=None, chunksize=None, data=None):
+    """
+    并行评估全部组合
+
+    Args:
+        evaluate: evaluate(data, params) → 结果 (需可pickle)
+        combos: 参数dict列表 (如 grid() 的结果)
+        loader: 每个worker启动时调用一次 loader(*loader_args) 得到 data
+        data: 不给 loader 时直接使用的数据 (随 initializer 传给每个worker一次)
+        workers: 进程数 (默认可用CPU数, 不超过组合数); 1 为当前进程串行
+        chunksize: 每次分发的组合数 (默认 组合数 / (workers*4) 向上取整)
+
+    Yields:
+        (序号, 参数, 结果), 按完成顺序
+    """
+    combos = list(combos)
+    if not combos:
+        return
+    workers = max(1, min(workers or default_workers(), len(combos)))
+    chunksize = chunksize or default_chunksize(len(combos), workers)
+    indexed = list(enumerate(combos))
+    chunks = [indexed[i:i + chunksize] for i in range(0, len(indexed), chunksize)]
+
+    if workers == 1:
+        _init_worker(evaluate, loader, loader_args, data)
+        try:
+            for chunk in chunks:
+                yield from _run_chunk(chunk)
+        finally:
+            _WORKER.clear()
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(evaluate, loader, loader_args, data)) as pool:
+        for done in pool.imap_unordered(_run_chunk, chunks):
+            yield from done
+
+
+def collect(evaluate, combos, loader=None, loader_args=(), workers=None, chunksize=None, data=None,
+            progress=None):
+    """run_sweep 的结果按组合原顺序排成列表; progress 为每完成一个组合调用一次的回调"""
+    combos = list(combos)
+    results = [None] * len(combos)
+    for index, _, result in run_sweep(evaluate, combos, loader, loader_args, workers, chunksize, data):
+        results[index] = result
+        if progress is not None:
+            progress()
+    return results
+
+
+# =============================================================================
+# 扩展性测试 (benchmark)
+# =============================================================================
+
+# 基准网格: sensitivity_fixed 预设 (Strategy13_FixedStopLoss) 的止损 × 仓位, 每个组合一次Cerebro
+BENCHMARK_SPACE = {
+    'stop_loss': [100, 150, 200, 300, 400, 500, 700, 1000],
+    'position_size': [5, 10, 15, 20, 25, 30],
+}
+
+
+def _benchmark_data(symbol, start, end):
+    from price_store import load_ohlcv
+
+    return load_ohlcv(symbol, start, end)
+
+
+def _benchmark_task(data, params):
+    """(结果, worker进程号, 本组合占用的CPU秒数)"""
+    from adaptive_engine import run_reference
+
+    t0 = time.process_time()
+    value = run_reference(data, 'sensitivity_fixed', **params)['raw_final_value']
+    return value, os.getpid(), time.process_time() - t0
+
+
+def benchmark(symbol='stock_sh_600519', start='2018-01-01', end='2023-12-31', worker_counts=None):
+    """
+    同一网格分别用不同worker数运行
+
+    Returns:
+        [dict]: workers / combos / seconds (墙钟) / cpu_seconds (全部组合) / busiest_cpu_seconds (最忙worker) /
+                same (结果与第一行逐项相同)
+    """
+    combos = grid(BENCHMARK_SPACE)
+    loader_args = (symbol, start, end)
+    cpus = default_workers()
+    worker_counts = worker_counts or [w for w in (1, 2, 4, 8, 16, 32, 64) if w < cpus] + [cpus]
+
+    rows = []
+    baseline = None
+    for workers in worker_counts:
+        t0 = time.perf_counter()
+        results = collect(_benchmark_task, combos, _benchmark_data, loader_args, workers)
+        elapsed = time.perf_counter() - t0
+
+        values = [value for value, _, _ in results]
+        busy = {}
+        for _, pid, cpu in results:
+            busy[pid] = busy.get(pid, 0.0) + cpu
+        if baseline is None:
+            baseline = values
+        rows.append({'workers': workers, 'combos': len(combos), 'seconds': elapsed,
+                     'cpu_seconds': sum(busy.values()), 'busiest_cpu_seconds': max(busy.values()),
+                     'same': values == baseline})
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='参数网格并行执行器: 不同进程数的扩展性测试')
+    parser.add_argument('command', choices=['benchmark'])
+    parser.add_argument('--symbol', default='stock_sh_600519', help='price_store 标的 (默认 stock_sh_600519)')
+    parser.add_argument('--start', default='2018-01-01')
+    parser.add_argument('--end', default='2023-12-31')
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='依次测试的进程数 (默认 1, 2, 4, ... 直到可用CPU数)')
+    parser.add_argument('--json', default=None, help='把测量结果写入JSON文件')
+    args = parser.parse_args()
+
+    cpus = default_workers()
+    print("=" * 80)
+    print(f"Sweep Executor - benchmark ({args.symbol}, 可用CPU: {cpus})")
+    print("=" * 80)
+    print(f"\n{'进程数':>6} {'组合数':>6} {'耗时(s)':>9} {'加速':>7} {'效率':>7} {'负载上限':>8} {'一致':>5}")
+    print("-" * 58)
+    rows = benchmark(args.symbol, args.start, args.end, args.workers)
+    base = rows[0]
+    for row in rows:
+        row['speedup'] = base['seconds'] / row['seconds']
+        row['efficiency'] = row['speedup'] * base['workers'] / row['workers']
+        row['balance_bound'] = base['cpu_seconds'] / row['busiest_cpu_seconds']
+        oversubscribed = '*' if row['workers'] > cpus else ' '
+        print(f"{row['workers']:>6} {row['combos']:>6} {row['seconds']:>9.2f} {row['speedup']:>6.2f}x{oversubscribed}"
+              f"{row['efficiency']:>6.0%} {row['balance_bound']:>7.2f}x {'✓' if row['same'] else '✗':>5}")
+    if any(row['workers'] > cpus for row in rows):
+        print(f"\n* 进程数超过可用CPU ({cpus}), 墙钟加速不反映扩展性")
+
+    if args.json:
+        import json
+
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'symbol': args.symbol, 'start': args.start, 'end': args.end, 'cpus': cpus, 'rows': rows},
+                      f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存: {args.json}")
+
+    sys.exit(0 if all(row['same'] for row in rows) else 1)
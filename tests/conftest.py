@@ -0,0 +1,33 @@
+"""
+各引擎测试共用的合成行情 (不依赖 backtest_data_extended / price_store)
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def synthetic_ohlc(n=750, seed=7, start='2019-01-01', drift=0.0004, vol=0.018, price=50.0):
+    """几何随机游走的日线 OHLCV (工作日, 有趋势段与回撤, 足够触发交叉/止损)"""
+    rng = np.random.default_rng(seed)
+    # 分段漂移让均线交叉与止损都出现
+    regime = np.repeat(rng.choice([-1.5, 0.5, 2.0], size=n // 50 + 1), 50)[:n]
+    ret = rng.normal(drift * regime, vol)
+    close = price * np.exp(np.cumsum(ret))
+    open_ = np.concatenate(([price], close[:-1])) * np.exp(rng.normal(0, vol / 3, n))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, vol / 2, n)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, vol / 2, n)))
+    volume = rng.integers(1_000_000, 5_000_000, n).astype(np.float64)
+    index = pd.bdate_range(start, periods=n, name='date')
+    return pd.DataFrame({'open': open_.round(2), 'high': high.round(2), 'low': low.round(2),
+                         'close': close.round(2), 'volume': volume}, index=index)
+
+
+@pytest.fixture(params=[7, 11, 23], ids=lambda s: f'seed{s}')
+def ohlc(request):
+    return synthetic_ohlc(seed=request.param)
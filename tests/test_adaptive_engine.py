@@ -0,0 +1,46 @@
+"""
+adaptive_engine: 数组引擎 vs backtrader 参考策略 (合成行情, 逐笔订单 + 最终价值精确相等)
+"""
+
+import itertools
+
+import pytest
+
+from adaptive_engine import BATCH_GRIDS, resolve_rules, run_adaptive, run_reference, simulate, simulate_batch
+
+METRICS = ('returns_pct', 'sharpe_ratio', 'max_drawdown_pct', 'total_trades')
+
+
+@pytest.mark.parametrize('commission', [0.0, 0.0015])
+@pytest.mark.parametrize('preset', ['llm_adaptive', 'adaptive_13'])
+def test_matches_backtrader(ohlc, preset, commission):
+    ref = run_reference(ohlc, preset, commission=commission)
+    ours = run_adaptive(ohlc, preset, commission=commission)
+
+    assert ref['total_trades'] > 0
+    assert ours['orders'] == [dict(o) for o in ref['orders']]
+    assert float(simulate(ohlc, resolve_rules(preset), commission=commission)['equity'][-1]) == ref['raw_final_value']
+    assert {k: ours[k] for k in METRICS} == {k: ref[k] for k in METRICS}
+
+
+@pytest.mark.parametrize('overrides', [{'atr_multiplier': 2.0}, {'risk_percent': 0.2}, {'sma_fast': 10}])
+def test_overrides_match_backtrader(ohlc, overrides):
+    ref = run_reference(ohlc, 'llm_adaptive', **overrides)
+    ours = run_adaptive(ohlc, 'llm_adaptive', **overrides)
+
+    assert ours['final_value'] == ref['final_value']
+    assert ours['total_trades'] == ref['total_trades']
+
+
+@pytest.mark.parametrize('preset', sorted(BATCH_GRIDS))
+def test_batch_matches_backtrader(ohlc, preset):
+    grid = BATCH_GRIDS[preset]
+    combos = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    batch = simulate_batch(ohlc, [dict(resolve_rules(preset, **c), rsi_raises=True) for c in combos])
+
+    for i, combo in enumerate(combos):
+        ref = run_reference(ohlc, preset, **combo)
+        assert not batch['error'][i]
+        assert float(batch['final_value'][i]) == ref['raw_final_value'], combo
+        assert batch['closed_trades'][i] == ref['total_trades'], combo
+        assert batch['won_trades'][i] == ref['won_trades'], combo
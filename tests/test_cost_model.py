@@ -0,0 +1,96 @@
+"""
+cost_model: 成交序列重定价 (及其回退) vs backtrader 逐方案完整重跑; 数组引擎的成本方案 vs make_broker
+"""
+
+import itertools
+
+import pytest
+
+import cost_model
+from adaptive_engine import BATCH_GRIDS, _reference_strategies, resolve_rules, run_reference, simulate, simulate_batch
+from cost_model import ashare_schedule, resimulate, run_backtrader, schedule, sweep
+
+KEYS = ('returns_pct', 'final_value', 'sharpe_ratio', 'max_drawdown_pct', 'total_trades')
+
+# 板块涨跌停按沪市主板 (10%)
+SYMBOL = 'stock_sh_600000'
+
+# 整手 + 印花税 + 最低佣金 + 滑点 + 很窄的涨跌停 (合成行情上订单经常顺延到后面的K线成交)
+TIGHT = schedule(0.00025, stamp_duty=0.001, slippage=0.001, min_commission=5.0, lot_size=100, price_limit=0.005)
+
+SCHEDULES = [
+    schedule(0.0),
+    schedule(0.001),
+    schedule(0.003),
+    schedule(0.0015, stamp_duty=0.001),
+    schedule(0.0015, slippage=0.0005),
+    schedule(0.00025, min_commission=5.0),
+    ashare_schedule(),
+    TIGHT,
+]
+
+
+@pytest.mark.parametrize('preset', ['llm_adaptive', 'sensitivity_fixed'])
+def test_sweep_matches_backtrader(ohlc, preset):
+    strategy_class = _reference_strategies()[preset][0]
+    results = sweep(ohlc, preset, SCHEDULES, strategy_class=strategy_class, symbol=SYMBOL)
+
+    for cost, ours in zip(SCHEDULES, results):
+        ref = run_backtrader(ohlc, strategy_class, cost, symbol=SYMBOL)
+        assert ours['raw_final_value'] == ref['raw_final_value'], (cost, ours['method'], ours['reason'])
+        assert {k: ours[k] for k in KEYS} == {k: ref[k] for k in KEYS}
+        assert float(ours['equity'][-1]) == ours['raw_final_value']
+
+
+def test_fixed_size_schedules_are_repriced(ohlc):
+    strategy_class = _reference_strategies()['sensitivity_fixed'][0]
+    results = sweep(ohlc, 'sensitivity_fixed', SCHEDULES[:4], strategy_class=strategy_class)
+    assert [r['method'] for r in results] == ['repriced'] * 4
+
+
+@pytest.mark.parametrize('cost', [ashare_schedule(), TIGHT], ids=['ashare', 'tight_limit'])
+@pytest.mark.parametrize('preset, overrides', [
+    ('llm_adaptive', {}),
+    ('adaptive_13', {}),
+    ('sensitivity_fixed', {}),                      # 20股不足一手: 每个买单都被拒绝
+    ('sensitivity_fixed', {'position_size': 200}),
+    ('triple_fusion', {}),
+])
+def test_engine_matches_make_broker(ohlc, preset, overrides, cost):
+    ref = run_reference(ohlc, preset, cost=cost, symbol=SYMBOL, **overrides)
+    sim = simulate(ohlc, resolve_rules(preset, **overrides), cost=cost, symbol=SYMBOL)
+
+    assert sim['orders'] == ref['orders']
+    assert float(sim['equity'][-1]) == ref['raw_final_value']
+    assert sim['closed_trades'] == ref['total_trades']
+
+
+@pytest.mark.parametrize('preset, grid', [
+    ('llm_adaptive', BATCH_GRIDS['llm_adaptive']),
+    ('adaptive_13', BATCH_GRIDS['adaptive_13']),
+    ('sensitivity_fixed', {'stop_loss': [100, 300], 'position_size': [50, 200]}),
+])
+def test_batch_matches_make_broker(ohlc, preset, grid):
+    combos = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    batch = simulate_batch(ohlc, [dict(resolve_rules(preset, **c), rsi_raises=True) for c in combos],
+                           cost=TIGHT, symbol=SYMBOL)
+
+    for i, combo in enumerate(combos):
+        ref = run_reference(ohlc, preset, cost=TIGHT, symbol=SYMBOL, **combo)
+        assert not batch['error'][i]
+        assert float(batch['final_value'][i]) == ref['raw_final_value'], combo
+        assert batch['closed_trades'][i] == ref['total_trades'], combo
+        assert batch['won_trades'][i] == ref['won_trades'], combo
+
+
+def test_backtrader_fallback_maps_overrides(ohlc, monkeypatch):
+    overrides = {'stop_loss': 100, 'position_size': 200}
+    expected = simulate(ohlc, resolve_rules('sensitivity_fixed', **overrides), cost=TIGHT, symbol=SYMBOL)
+
+    def unsupported(*args, **kwargs):
+        raise ValueError('数组引擎不支持')
+
+    monkeypatch.setattr(cost_model, 'simulate', unsupported)
+    result = resimulate(ohlc, 'sensitivity_fixed', TIGHT, strategy_class=_reference_strategies()['sensitivity_fixed'][0],
+                        symbol=SYMBOL, **overrides)
+    assert result['raw_final_value'] == float(expected['equity'][-1])
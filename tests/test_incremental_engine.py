@@ -0,0 +1,49 @@
+"""
+incremental_engine: 分段续跑 vs 完整重放 (数组引擎与backtrader), checkpoint 落盘与历史修订
+"""
+
+import pytest
+
+from adaptive_engine import run_adaptive, run_reference
+from incremental_engine import advance, new_checkpoint, run_incremental
+
+KEYS = ('returns_pct', 'final_value', 'sharpe_ratio', 'max_drawdown_pct', 'total_trades', 'data_points')
+
+
+@pytest.mark.parametrize('cuts', [(0.5,), (0.3, 0.6, 0.9), tuple(k / 40 for k in range(1, 40))],
+                         ids=['half', 'thirds', 'every-19-bars'])
+@pytest.mark.parametrize('preset', ['llm_adaptive', 'adaptive_13'])
+def test_resumed_equals_full_replay(ohlc, preset, cuts):
+    ref = run_adaptive(ohlc, preset)
+    ckpt = new_checkpoint(preset)
+    for cut in [int(len(ohlc) * c) for c in cuts] + [len(ohlc)]:
+        ours, ckpt = advance(ckpt, ohlc.iloc[:cut])
+
+    assert {k: ours[k] for k in KEYS} == {k: ref[k] for k in KEYS}
+    assert ours['orders'] == ref['orders']
+    assert ours['final_value'] == run_reference(ohlc, preset)['final_value']
+
+
+def test_checkpoint_round_trip(ohlc, tmp_path):
+    path = tmp_path / 'ckpt.json'
+    first, resumed = run_incremental(ohlc.iloc[:500], path, 'adaptive_13')
+    assert not resumed and first['data_points'] == 500
+
+    result, resumed = run_incremental(ohlc, path, 'adaptive_13')
+    assert resumed
+    assert result['new_bars'] == len(ohlc) - 500
+    assert result['final_value'] == run_adaptive(ohlc, 'adaptive_13')['final_value']
+
+
+def test_revised_history_is_rejected(ohlc, tmp_path):
+    _, ckpt = advance(new_checkpoint('llm_adaptive'), ohlc.iloc[:500])
+    revised = ohlc.copy()
+    revised.iloc[499, revised.columns.get_loc('close')] *= 1.01
+    with pytest.raises(ValueError):
+        advance(ckpt, revised)
+
+    path = tmp_path / 'ckpt.json'
+    run_incremental(ohlc.iloc[:500], path, 'llm_adaptive')
+    result, resumed = run_incremental(revised, path, 'llm_adaptive')   # 回退到完整重算
+    assert not resumed
+    assert result['final_value'] == run_adaptive(revised, 'llm_adaptive')['final_value']
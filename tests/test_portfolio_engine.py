@@ -0,0 +1,58 @@
+"""
+portfolio_engine: 向量化共享资金模拟 vs 逐标的逐K线参照循环 (合成股票池, 含停牌日)
+"""
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_ohlc
+from cost_model import ashare_schedule
+from portfolio_engine import DEFAULT_PARAMS, run_portfolio, simulate_portfolio, verify
+
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class SyntheticPanel:
+    """UniversePanel 的最小替身: symbols / fields / dates / values (S, T, F) / mask (S, T)"""
+
+    def __init__(self, n_symbols=6, n=600, suspended=0.02, seed=0):
+        frames = [synthetic_ohlc(n=n, seed=seed + k, price=10.0 + 5 * k) for k in range(n_symbols)]
+        self.symbols = [f'stock_sh_60{k:04d}' for k in range(n_symbols)]
+        self.fields = FIELDS
+        self.dates = frames[0].index.to_numpy()
+        self.values = np.stack([f[FIELDS].to_numpy() for f in frames])
+        self.mask = np.random.default_rng(seed).random((n_symbols, n)) >= suspended
+
+    def field(self, name):
+        return self.values[:, :, self.fields.index(name)]
+
+
+@pytest.mark.parametrize('cost', [None, ashare_schedule()], ids=['commission', 'ashare'])
+@pytest.mark.parametrize('cash, params', [
+    (1000000, {}),
+    (100000, {'max_weight': 0.6, 'risk_percent': 0.2, 'max_positions': 3}),   # 资金紧张: 大量撤单
+])
+def test_matches_reference_loop(cost, cash, params):
+    panel = SyntheticPanel()
+    assert verify(panel=panel, initial_cash=cash, cost=cost, **params) == []
+
+    summary = run_portfolio(panel=panel, initial_cash=cash, cost=cost, **params)['summary']
+    assert summary['closed_trades'] > 0
+
+
+def test_rejected_order_does_not_block_smaller_ones():
+    # 两只标的同一根K线发出买单: 优先级高的A跳空后资金不足被撤销, 较小的B仍应成交
+    close = np.array([[100.0, 200.0, 200.0], [10.0, 10.0, 10.0]])
+    signals = {
+        'open': close.copy(), 'high': close.copy(), 'low': close.copy(), 'close': close, 'close_ffill': close,
+        'volume': np.ones_like(close), 'valid': np.ones_like(close, dtype=bool), 'atr': np.ones_like(close),
+        'entry': np.array([[True, False, False], [True, False, False]]),
+        'exit_signal': np.zeros_like(close, dtype=bool),
+        'strength': np.array([[0.2, 0.2, 0.2], [0.1, 0.1, 0.1]]),
+    }
+    params = dict(DEFAULT_PARAMS, atr_multiplier=1.0, risk_percent=1.0, max_weight=0.5)
+    sim = simulate_portfolio(signals, params, initial_cash=1000, commission=0.001)
+
+    assert sim['rejected_orders'] == 1
+    assert sim['size'].tolist() == [0, 50]
+    assert sim['cash'][1] == pytest.approx(1000 - 50 * 10 * 1.001)
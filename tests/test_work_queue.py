@@ -0,0 +1,117 @@
+"""
+work_queue: 租约过期收回、出错重试 / failed / retry、中断后续跑 (任务函数定义在本文件, 按仓库内路径加载)
+"""
+
+import time
+from pathlib import Path
+
+import pytest
+
+import work_queue
+from work_queue import MAX_ATTEMPTS, WorkQueue
+
+
+def square(x, log):
+    with open(log, 'a') as f:
+        f.write(f'{x}\n')
+    return x * x
+
+
+def needs_file(x, path):
+    """path 不存在时抛出 (模拟某台主机缺少数据文件)"""
+    if not Path(path).exists():
+        raise FileNotFoundError(path)
+    return x + 1
+
+
+def stop_once(x, stop, log):
+    """stop 文件存在时删除它并中断 (模拟 Ctrl-C / 进程被杀), 否则同 square"""
+    if x == 2 and Path(stop).exists():
+        Path(stop).unlink()
+        raise KeyboardInterrupt
+    return square(x, log)
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, 'POLL_SECONDS', 0.01)
+    return WorkQueue(tmp_path / 'queue.sqlite', lease_seconds=0.2)
+
+
+def states(queue):
+    return dict(queue._connect().execute('SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall())
+
+
+def calls(log):
+    return [int(line) for line in Path(log).read_text().split()] if Path(log).exists() else []
+
+
+def test_expired_lease_is_reclaimed(queue, tmp_path):
+    tasks = [{'x': 3, 'log': str(tmp_path / 'calls')}]
+    queue.enqueue(square, tasks, 'q')
+
+    [(task_id, _, args)] = queue.lease('crashed', 'q')
+    assert args == tasks[0]
+    assert queue.lease('other', 'q') == []          # 租约有效期内不重发
+
+    time.sleep(0.25)
+    [(reclaimed, _, _)] = queue.lease('other', 'q')
+    assert reclaimed == task_id
+    assert queue.complete(task_id, 'other', 9)
+    assert not queue.complete(task_id, 'crashed', -1)   # 原worker迟到的结果被忽略
+    assert queue.results(square, tasks, 'q') == [9]
+
+
+def test_lease_expiring_max_attempts_fails(queue, tmp_path):
+    queue.enqueue(square, [{'x': 3, 'log': str(tmp_path / 'calls')}], 'q')
+    for _ in range(MAX_ATTEMPTS):
+        assert len(queue.lease('crashed', 'q')) == 1
+        time.sleep(0.25)
+    assert queue.lease('other', 'q') == []
+    assert states(queue) == {'failed': 1}
+
+
+def test_raising_task_is_retried_not_stored(queue, tmp_path):
+    flag = tmp_path / 'data.csv'
+    tasks = [{'x': 1, 'path': str(flag)}, {'x': 2, 'path': str(tmp_path / 'calls')}]
+    (tmp_path / 'calls').touch()
+
+    assert queue.map(needs_file, tasks, 'q', log=None) == [None, 3]
+    assert states(queue) == {'failed': 1, 'done': 1}
+    attempts, error = queue._connect().execute(
+        "SELECT attempts, error FROM tasks WHERE state = 'failed'").fetchone()
+    assert attempts == MAX_ATTEMPTS and error.startswith('FileNotFoundError')
+
+    # 重跑时失败的任务重置再试 (已完成的不重跑); 数据补齐后得到结果
+    flag.touch()
+    assert queue.map(needs_file, tasks, 'q', log=None) == [2, 3]
+    assert states(queue) == {'done': 2}
+
+
+def test_retry_resets_failed(queue, tmp_path):
+    flag = tmp_path / 'data.csv'
+    tasks = [{'x': 1, 'path': str(flag)}]
+    queue.enqueue(needs_file, tasks, 'q')
+    queue.work('q', log=None)
+    assert states(queue) == {'failed': 1}
+
+    flag.touch()
+    assert queue.retry('q') == 1
+    queue.work('q', log=None)
+    assert queue.results(needs_file, tasks, 'q') == [2]
+
+
+def test_resume_after_interruption(queue, tmp_path):
+    log, stop = tmp_path / 'calls', tmp_path / 'stop'
+    tasks = [{'x': x, 'stop': str(stop), 'log': str(log)} for x in range(5)]
+    stop.touch()
+
+    with pytest.raises(KeyboardInterrupt):
+        queue.map(stop_once, tasks, 'q', log=None)
+    assert calls(log) == [0, 1]
+    assert states(queue) == {'done': 2, 'leased': 1, 'pending': 2}
+
+    # 新进程 (新连接) 重跑: 只补未完成的任务, 中断时持有的租约过期后收回
+    resumed = WorkQueue(queue.path, lease_seconds=0.2)
+    assert resumed.map(stop_once, tasks, 'q', log=None) == [0, 1, 4, 9, 16]
+    assert sorted(calls(log)) == [0, 1, 2, 3, 4]          # 每个任务只完成一次
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+列式交易记录 (Columnar Trade Log)
+=================================
+
+功能: HardCodedAdaptiveStrategy / SimpleStrategy / SimpleBacktest 原来每笔交易追加一个dict、
+      每根K线追加一个float, 结果再用 json.dump(indent=2) 整体写出; 多年、多标的运行时
+      这些Python对象占用的内存和输出体积远大于数据本身。本模块提供:
+
+    - TradeLog: 结构化numpy数组 (每个字段一列) + 预分配、按倍数扩容的缓冲区, append 均摊 O(1);
+                字符串类字段 (如 exit_reason / type) 存为 uint8 编码, 类别表随日志保存
+    - to_record / from_record: 与 equity_recorder 的 record 同一种 "字段名 → 数组" 形式,
+                可以和权益曲线放进同一个 record, 用 save_records 写成 .npz (二进制, 无pickle)
+    - fills_log: adaptive_engine 的成交列表直接转为日志
+    - load_trade_logs / trades_frame: 报告脚本读回 (TradeLog 或展开为 DataFrame)
+
+使用方法:
+    from trade_log import TradeLog, CLOSED_TRADE_FIELDS, EXIT_REASONS
+    log = TradeLog(CLOSED_TRADE_FIELDS, categories={'exit_reason': EXIT_REASONS})
+    log.append(entry_price=10.0, exit_price=11.0, shares=100, pnl=100.0, exit_reason='signal')
+    log['pnl'], len(log), log.rows()
+
+    from equity_recorder import save_records
+    save_records('outputs/xxx_records.npz', {('SPY', 'hard_coded'): {'equity': curve, **log.to_record()}})
+
+    from trade_log import trades_frame
+    df = trades_frame('outputs/xxx_records.npz')          # 每行一笔交易, 带 key 列
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# =============================================================================
+# 常用字段
+# =============================================================================
+
+# 平仓交易 (HardCodedAdaptiveStrategy)
+CLOSED_TRADE_FIELDS = [('entry_price', 'f8'), ('exit_price', 'f8'), ('shares', 'i8'), ('pnl', 'f8'),
+                       ('exit_reason', 'u1')]
+EXIT_REASONS = ('stop_loss', 'signal', 'end_of_period')
+
+# 成交 (adaptive_engine 收盘价口径的 trades: buy / sell / stop)
+FILL_FIELDS = [('bar', 'i8'), ('date', 'M8[ns]'), ('type', 'u1'), ('price', 'f8'), ('size', 'i8')]
+FILL_TYPES = ('buy', 'sell', 'stop')
+
+# record 中交易日志字段的默认前缀 (避开 equity_recorder 自己的 trade_* 字段)
+PREFIX = 'log_'
+
+
+# =============================================================================
+# 日志
+# =============================================================================
+
+class TradeLog:
+    """
+    可增长的结构化数组
+
+    Args:
+        fields: [(字段名, numpy类型)], 类别字段用 'u1'
+        categories: {字段名: (类别, ...)}; append 时可直接传类别字符串
+        capacity: 初始容量 (之后按2倍扩容)
+    """
+
+    __slots__ = ('dtype', 'categories', '_codes', '_buffer', '_size')
+
+    def __init__(self, fields, categories=None, capacity=64):
+        self.dtype = np.dtype(list(fields))
+        self.categories = {name: tuple(values) for name, values in (categories or {}).items()}
+        self._codes = {name: {v: i for i, v in enumerate(values)} for name, values in self.categories.items()}
+        self._buffer = np.zeros(max(int(capacity), 1), dtype=self.dtype)
+        self._size = 0
+
+    def _reserve(self, extra):
+        need = self._size + extra
+        if need > len(self._buffer):
+            grown = np.zeros(max(need, 2 * len(self._buffer)), dtype=self.dtype)
+            grown[:self._size] = self._buffer[:self._size]
+            self._buffer = grown
+
+    def _encode(self, name, value):
+        codes = self._codes.get(name)
+        if codes is None:
+            return value
+        if isinstance(value, str):
+            return codes[value]
+        values = np.asarray(value)
+        if values.dtype.kind in 'US':
+            return np.array([codes[v] for v in values.tolist()], dtype=np.uint8)
+        return values
+
+    def append(self, **values):
+        """追加一行 (未给出的字段为0)"""
+        self._reserve(1)
+        row = self._buffer[self._size]
+        for name, value in values.items():
+            row[name] = self._encode(name, value)
+        self._size += 1
+
+    def extend(self, **columns):
+        """一次追加多行: 每个字段一个等长数组"""
+        n = len(next(iter(columns.values()))) if columns else 0
+        self._reserve(n)
+        block = self._buffer[self._size:self._size + n]
+        for name, values in columns.items():
+            block[name] = self._encode(name, values)
+        self._size += n
+
+    def clear(self):
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, name):
+        """字段列 (视图; 类别字段为编码, 解码用 labels)"""
+        return self._buffer[name][:self._size]
+
+    @property
+    def array(self):
+        """已写入部分的结构化数组 (视图)"""
+        return self._buffer[:self._size]
+
+    def labels(self, name):
+        """类别字段解码为字符串数组"""
+        return np.asarray(self.categories[name], dtype=object)[self[name]]
+
+    def rows(self):
+        """逐行dict (类别字段为字符串); 只用于打印或小规模输出"""
+        columns = {name: (self.labels(name) if name in self.categories else self[name]).tolist()
+                   for name in self.dtype.names}
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def to_frame(self):
+        return pd.DataFrame({name: self.labels(name) if name in self.categories else self[name]
+                             for name in self.dtype.names})
+
+    def to_record(self, prefix=PREFIX):
+        """{前缀+字段: 数组}, 类别表存为 前缀+字段+'_categories' (字符串数组)"""
+        record = {prefix + name: self[name].copy() for name in self.dtype.names}
+        for name, values in self.categories.items():
+            record[f'{prefix}{name}_categories'] = np.array(values, dtype=str)
+        return record
+
+    @classmethod
+    def from_record(cls, record, prefix=PREFIX):
+        """to_record 的逆操作 (record 来自 load_records)"""
+        names = [k[len(prefix):] for k in record
+                 if k.startswith(prefix) and not k.endswith('_categories')]
+        categories = {name: tuple(record[f'{prefix}{name}_categories'].tolist()) for name in names
+                      if f'{prefix}{name}_categories' in record}
+        fields = [(name, record[prefix + name].dtype) for name in names]
+        n = len(record[prefix + names[0]]) if names else 0
+        log = cls(fields, categories, capacity=n)
+        log.extend(**{name: record[prefix + name] for name in names})
+        return log
+
+
+def fills_log(trades, dates=None):
+    """adaptive_engine.simulate 的 trades (dict列表) → FILL_FIELDS 日志; dates 给出时填 date 列"""
+    log = TradeLog(FILL_FIELDS, categories={'type': FILL_TYPES}, capacity=len(trades))
+    if trades:
+        bar = np.array([t['bar'] for t in trades], dtype=np.int64)
+        columns = {'bar': bar, 'type': np.array([t['type'] for t in trades]),
+                   'price': np.array([t['price'] for t in trades], dtype=np.float64),
+                   'size': np.array([t['size'] for t in trades], dtype=np.int64)}
+        if dates is not None:
+            columns['date'] = np.asarray(dates, dtype='datetime64[ns]')[bar]
+        log.extend(**columns)
+    return log
+
+
+# =============================================================================
+# 读回
+# =============================================================================
+
+def load_trade_logs(path, prefix=PREFIX):
+    """save_records 写出的 .npz → {key: TradeLog}"""
+    from equity_recorder import load_records
+
+    return {key: TradeLog.from_record(record, prefix) for key, record in load_records(path).items()}
+
+
+def trades_frame(path, prefix=PREFIX):
+    """全部 key 的交易合并为一个 DataFrame (key 为元组时展开为 key0, key1, ... 列)"""
+    frames = []
+    for key, log in load_trade_logs(path, prefix).items():
+        frame = log.to_frame()
+        parts = key if isinstance(key, tuple) else (key,)
+        for i, part in enumerate(parts):
+            frame.insert(i, f'key{i}', part)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
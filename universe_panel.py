@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+对齐的全市场面板 (Universe Panel: symbol × date × field)
+=========================================================
+
+功能: 把 backtest_data_extended/ 下全部股票/指数/SPY/QQQ 对齐到同一交易日历,
+      持久化为一个内存映射的三维数组 + 有效性掩码。
+      截面类任务可以零拷贝地跨所有标的切片, 多个worker进程以只读memmap打开
+      同一份文件时共享操作系统页缓存, 不再各自持有一份DataFrame副本
+
+存储布局:
+    backtest_data_extended/universe_panel/
+        values.npy   (S, T, F)  float64/float32, 缺失处为NaN
+        mask.npy     (S, T)     bool, 该标的当日是否有K线
+        dates.npy    (T,)       datetime64[ns], 共享日历 (各标的日期的并集)
+        meta.json    symbols / fields / dtype / 各源文件签名
+
+使用方法:
+    python universe_panel.py build             # 构建 (源数据未变化时跳过)
+    python universe_panel.py build --force --dtype float32
+    python universe_panel.py info
+
+    from universe_panel import open_panel
+    panel = open_panel()
+    close = panel.field('close')                          # (S, T) 零拷贝视图
+    df = panel.frame('stock_sh_600519', '2024-01-01')     # 单标的DataFrame (仅有效行)
+
+数据读取复用 price_store (CSV → 列式存储的ingest与过期判断)。
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from date_index import date_bounds
+from price_store import DATA_DIR, FIELDS, ingest_file, load_arrays
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+PANEL_DIRNAME = 'universe_panel'
+DTYPES = ('float64', 'float32')
+
+# 进程内已打开的面板: {panel_dir: UniversePanel}
+_OPEN_PANELS = {}
+
+
+def panel_dir_for(data_dir=None):
+    return Path(data_dir or DATA_DIR) / PANEL_DIRNAME
+
+
+def _source_signatures(data_dir):
+    """ingest数据目录下全部CSV, 返回 {symbol: 源文件签名}"""
+    signatures = {}
+    for csv_path in sorted(Path(data_dir).glob('*.csv')):
+        meta = ingest_file(csv_path)
+        signatures[csv_path.stem] = meta['source']
+    return signatures
+
+
+# =============================================================================
+# 构建
+# =============================================================================
+
+def build_panel(data_dir=None, dtype='float64', force=False):
+    """
+    对齐全部CSV并写出内存映射面板
+
+    Args:
+        data_dir: CSV数据目录 (默认 DATA_DIR)
+        dtype: 'float64' (与逐文件回测结果一致) 或 'float32' (体积减半)
+        force: 源数据未变化时也重建
+
+    Returns:
+        dict: meta信息
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype必须为 {DTYPES} 之一, 收到: {dtype}")
+
+    data_dir = Path(data_dir or DATA_DIR)
+    panel_dir = panel_dir_for(data_dir)
+    signatures = _source_signatures(data_dir)
+    if not signatures:
+        raise FileNotFoundError(f"{data_dir} 下没有CSV文件")
+
+    meta_path = panel_dir / 'meta.json'
+    if not force and meta_path.exists():
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('sources') == signatures and meta.get('dtype') == dtype:
+            return meta
+
+    symbols = list(signatures)
+    series = {symbol: load_arrays(symbol, data_dir=data_dir) for symbol in symbols}
+
+    # 共享日历: 所有标的交易日的并集 (A股与美股日历不同, 缺失处由mask标记)
+    dates = np.unique(np.concatenate([s['date'] for s in series.values()]))
+    n_sym, n_dates, n_fields = len(symbols), len(dates), len(FIELDS)
+
+    panel_dir.mkdir(parents=True, exist_ok=True)
+    # meta先删除: 中断的构建不会留下"看似有效"的面板
+    if meta_path.exists():
+        meta_path.unlink()
+
+    tmp_values = panel_dir / 'values.tmp.npy'
+    values = np.lib.format.open_memmap(tmp_values, mode='w+', dtype=dtype,
+                                       shape=(n_sym, n_dates, n_fields))
+    values[:] = np.nan
+    mask = np.zeros((n_sym, n_dates), dtype=bool)
+
+    for i, symbol in enumerate(symbols):
+        s = series[symbol]
+        pos = np.searchsorted(dates, s['date'])
+        mask[i, pos] = True
+        for j, field in enumerate(FIELDS):
+            values[i, pos, j] = s[field]
+
+    values.flush()
+    del values
+    os.replace(tmp_values, panel_dir / 'values.npy')
+    np.save(panel_dir / 'mask.npy', mask)
+    np.save(panel_dir / 'dates.npy', dates)
+
+    meta = {
+        'symbols': symbols,
+        'fields': list(FIELDS),
+        'dtype': dtype,
+        'shape': [n_sym, n_dates, n_fields],
+        'start': str(pd.Timestamp(dates[0]).date()),
+        'end': str(pd.Timestamp(dates[-1]).date()),
+        'sources': signatures,
+        'built_at': pd.Timestamp.now().isoformat(),
+    }
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    _OPEN_PANELS.pop(panel_dir, None)
+    return meta
+
+
+# =============================================================================
+# 读取
+# =============================================================================
+
+class UniversePanel:
+    """
+    只读面板视图
+
+    values/mask/dates 均为memmap (或其切片), 所有切片操作不复制数据。
+    """
+
+    def __init__(self, meta, values, mask, dates):
+        self.meta = meta
+        self.symbols = list(meta['symbols'])
+        self.fields = list(meta['fields'])
+        self.values = values
+        self.mask = mask
+        self.dates = dates
+        self._sym_index = {s: i for i, s in enumerate(self.symbols)}
+        self._field_index = {f: j for j, f in enumerate(self.fields)}
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def symbol_index(self, symbol):
+        """symbol可以是 'stock_sh_600519' / 文件名 / CSV路径"""
+        stem = Path(str(symbol)).stem
+        if stem not in self._sym_index:
+            raise KeyError(f"面板中不存在标的: {stem}")
+        return self._sym_index[stem]
+
+    def slice(self, start=None, end=None, symbols=None):
+        """按日期闭区间 (及可选标的子集) 切片, 返回新的 UniversePanel 视图"""
+        lo, hi = date_bounds(self.dates, start, end)
+        values, mask = self.values[:, lo:hi], self.mask[:, lo:hi]
+        meta = self.meta
+        if symbols is not None:
+            idx = [self.symbol_index(s) for s in symbols]
+            if idx == list(range(idx[0], idx[0] + len(idx))):
+                rows = slice(idx[0], idx[0] + len(idx))  # 连续子集仍为视图
+            else:
+                rows = idx  # 花式索引会复制
+            values, mask = values[rows], mask[rows]
+            meta = dict(meta, symbols=[self.symbols[i] for i in idx])
+        return UniversePanel(meta, values, mask, self.dates[lo:hi])
+
+    def field(self, name):
+        """(S, T) 单字段视图, 缺失处为NaN"""
+        return self.values[:, :, self._field_index[name]]
+
+    def cross_section(self, date, field='close'):
+        """某一交易日全部标的的截面 (pd.Series, 当日无K线的标的为NaN)"""
+        t = int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date), 'ns')))
+        if t >= len(self.dates) or self.dates[t] != np.datetime64(pd.Timestamp(date), 'ns'):
+            raise KeyError(f"共享日历中不存在日期: {date}")
+        return pd.Series(self.values[:, t, self._field_index[field]], index=self.symbols, name=field)
+
+    def frame(self, symbol, start=None, end=None):
+        """
+        单标的OHLCV DataFrame (仅保留有效行, 与 price_store.load_ohlcv 结果一致)
+
+        需要剔除无效行, 因此返回的是副本 (可直接交给 bt.feeds.PandasData)。
+        """
+        i = self.symbol_index(symbol)
+        lo, hi = date_bounds(self.dates, start, end)
+        valid = self.mask[i, lo:hi]
+        block = np.asarray(self.values[i, lo:hi][valid], dtype=np.float64)
+        index = pd.DatetimeIndex(self.dates[lo:hi][valid], name='date')
+        return pd.DataFrame(block, index=index, columns=self.fields)
+
+
+def open_panel(data_dir=None, build=True):
+    """
+    打开面板 (只读memmap)。多个进程各自调用即可共享同一份物理页。
+
+    Args:
+        build: 面板不存在或源数据已变化时自动 build_panel
+    """
+    data_dir = Path(data_dir or DATA_DIR)
+    panel_dir = panel_dir_for(data_dir)
+
+    cached = _OPEN_PANELS.get(panel_dir)
+    if cached is not None:
+        return cached
+
+    meta_path = panel_dir / 'meta.json'
+    if build:
+        dtype = 'float64'
+        if meta_path.exists():
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                dtype = json.load(f).get('dtype', dtype)
+        meta = build_panel(data_dir, dtype=dtype)
+    else:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+    panel = UniversePanel(
+        meta,
+        np.load(panel_dir / 'values.npy', mmap_mode='r'),
+        np.load(panel_dir / 'mask.npy', mmap_mode='r'),
+        np.load(panel_dir / 'dates.npy', mmap_mode='r'),
+    )
+    _OPEN_PANELS[panel_dir] = panel
+    return panel
+
+
+# =============================================================================
+# 命令行接口
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='对齐的全市场面板: build / info')
+    parser.add_argument('command', choices=['build', 'info'])
+    parser.add_argument('--data-dir', default=str(DATA_DIR), help='CSV数据目录')
+    parser.add_argument('--dtype', default='float64', choices=DTYPES)
+    parser.add_argument('--force', action='store_true', help='强制重建面板')
+    args = parser.parse_args()
+
+    print('=' * 80)
+    print(f'Universe Panel - {args.command}')
+    print('=' * 80)
+
+    if args.command == 'build':
+        meta = build_panel(args.data_dir, dtype=args.dtype, force=args.force)
+    else:
+        meta = open_panel(args.data_dir).meta
+
+    n_sym, n_dates, n_fields = meta['shape']
+    panel = open_panel(args.data_dir, build=False)
+    print(f"标的数: {n_sym}  交易日: {n_dates} ({meta['start']} ~ {meta['end']})  字段: {n_fields}  dtype: {meta['dtype']}")
+    print(f"面板大小: {panel.values.nbytes / 1024 / 1024:.1f} MB → {panel_dir_for(args.data_dir)}")
+    print(f"\n{'Symbol':<20} {'有效K线':>8} {'覆盖率':>8}")
+    print('-' * 40)
+    coverage = panel.mask.sum(axis=1)
+    for symbol, n in zip(panel.symbols, coverage):
+        print(f"{symbol:<20} {int(n):>8} {n / n_dates * 100:>7.1f}%")
+
+    sys.exit(0)
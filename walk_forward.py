@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+滚动前推优化 (Walk-forward Optimization)
+========================================
+
+功能: 补充实验_P0_单独调参对比 在一个固定训练期上网格搜索, 再单独回放测试期;
+      multi_year_rolling_validation 每年用固定参数。本模块做真正的滚动前推:
+      在第 k 个训练窗口上选参数, 用它交易紧随其后的测试窗口, 按自然年向前滚动 (如 2010–2025)。
+
+    - 折 (fold): 训练窗口 train_years 年、测试窗口 test_years 年; anchored=True 时训练期起点固定
+                 在第一年 (扩张窗口), 否则整体滚动
+    - 指标只算一次: 数据读取 (data_quality 清洗副本) 与全部参数组合用到的 SMA/RSI/ATR
+                    在完整历史上各算一次, 每折只取切片; 切片向前多带 strategy_start 根K线,
+                    使状态机恰好从窗口第一根K线开始交易, 指标在窗口开头已是热的
+    - 并行: 各折互相独立, 经 sweep_executor 分发到进程池 (每个worker读一次数据、算一次指标)
+    - 样本外曲线: 各折以相同初始资金独立运行, 按各折测试期收益率首尾相接, 得到连续的样本外权益曲线
+                  (测试期末未平仓的持仓按最后收盘价计值, 下一折从空仓开始)
+
+使用方法:
+    python walk_forward.py                                           # 600519, simple_fixed, 4年训练/1年测试
+    python walk_forward.py --symbol stock_sz_000858 --anchored --output outputs/wf_000858.csv
+    python walk_forward.py --preset llm_adaptive --train-years 3
+
+    from walk_forward import walk_forward
+    wf = walk_forward('stock_sh_600519', 'simple_fixed', {'stop_loss': [...], 'position_size': [...]})
+    wf['equity']       # pd.Series: 拼接后的样本外权益
+    wf['folds']        # 每折: 训练/测试区间, 选出的参数, 训练得分, 测试期指标
+"""
+
+import math
+import sys
+
+import numpy as np
+import pandas as pd
+
+from adaptive_engine import bt_max_drawdown, resolve_rules, simulate, strategy_start
+from feature_store import compute as compute_feature
+from sweep_executor import grid, run_sweep
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+# 各预设默认的参数网格 (simple_fixed 与 补充实验_P0_单独调参对比 的网格相同)
+DEFAULT_SPACES = {
+    'simple_fixed': {
+        'stop_loss': [100, 200, 300, 400, 500, 600, 700, 800, 900, 1000],
+        'position_size': [5, 10, 15, 20, 25, 30],
+    },
+    'llm_adaptive': {
+        'atr_multiplier': [2.0, 3.0, 4.0],
+        'risk_percent': [0.01, 0.02, 0.03],
+    },
+}
+
+# 预设的固定覆盖参数 (simple_fixed: P0 的 SimpleStrategy 只在现金足够时买入)
+PRESET_OVERRIDES = {
+    'simple_fixed': {'require_cash': True},
+}
+
+# compute_signals 的特征名 → (指标, 规则中的周期参数)
+FEATURES = (('sma_fast', 'sma', 'sma_fast'), ('sma_medium', 'sma', 'sma_medium'),
+            ('sma_slow', 'sma', 'sma_slow'), ('rsi', 'rsi', 'rsi_period'), ('atr', 'atr', 'atr_period'))
+
+
+# =============================================================================
+# 折
+# =============================================================================
+
+def make_folds(years, train_years=4, test_years=1, anchored=False):
+    """
+    按自然年划分的折
+
+    Returns:
+        [{'train': (第一年, 最后一年), 'test': (第一年, 最后一年)}], 测试期首尾相接覆盖其余年份
+    """
+    years = sorted(years)
+    folds = []
+    k = train_years
+    while k < len(years):
+        first = years[0] if anchored else years[k - train_years]
+        test = years[k:k + test_years]
+        folds.append({'train': (first, years[k - 1]), 'test': (test[0], test[-1])})
+        k += test_years
+    return folds
+
+
+# =============================================================================
+# 完整历史 (每个worker一次)
+# =============================================================================
+
+def load_history(symbol, preset, param_space, data_dir=None):
+    """
+    完整历史 + 网格中全部参数组合用到的指标 (每个 (指标, 周期) 只算一次)
+
+    Returns:
+        dict: history (WindowedFrame), arrays, features {(指标, 周期): ndarray}, preset
+    """
+    from data_quality import load_clean_history
+
+    history = load_clean_history(symbol, data_dir)
+    arrays = {f: history.df[f].to_numpy(dtype=np.float64) for f in ('open', 'high', 'low', 'close')}
+    periods = {}
+    for params in grid(param_space):
+        rules = resolve_rules(preset, **PRESET_OVERRIDES.get(preset, {}), **params)
+        for _, name, period_key in FEATURES:
+            if rules.get(period_key):
+                periods.setdefault((name, rules['kind']), set()).add(int(rules[period_key]))
+
+    features = {}
+    for (name, kind), values in periods.items():
+        values = sorted(values)
+        for period, column in zip(values, compute_feature(name, arrays, values, kind=kind)):
+            features[name, period] = column
+    return {'history': history, 'arrays': arrays, 'features': features, 'preset': preset}
+
+
+def run_slice(data, rules, lo, hi, initial_cash, commission):
+    """
+    在完整历史的 [lo, hi) 上运行状态机 (指标取自完整历史的切片)
+
+    Returns:
+        simulate 的结果, equity 只保留 [lo, hi) 部分
+    """
+    warmup = strategy_start(rules)
+    begin = max(0, lo - warmup)
+    features = {key: data['features'][name, int(rules[period_key])][begin:hi]
+                for key, name, period_key in FEATURES if rules.get(period_key)}
+    sim = simulate(data['history'].df.iloc[begin:hi], rules, initial_cash, commission, features=features)
+    sim['equity'] = sim['equity'][lo - begin:]
+    return sim
+
+
+# =============================================================================
+# 单折
+# =============================================================================
+
+def _score(equity, initial_cash):
+    return (float(equity[-1]) - initial_cash) / initial_cash * 100 if len(equity) else -np.inf
+
+
+def run_fold(data, fold, param_space, initial_cash=100000, commission=0.0):
+    """训练窗口上选最优参数 (收益率最高, 相同时取网格中靠前者), 再在测试窗口上交易"""
+    index = data['history'].index
+    preset = data['preset']
+    train = (index.year_bounds(fold['train'][0])[0], index.year_bounds(fold['train'][1])[1])
+    test = (index.year_bounds(fold['test'][0])[0], index.year_bounds(fold['test'][1])[1])
+
+    best, best_score = None, -np.inf
+    for params in grid(param_space):
+        rules = resolve_rules(preset, **PRESET_OVERRIDES.get(preset, {}), **params)
+        try:
+            score = _score(run_slice(data, rules, *train, initial_cash, commission)['equity'], initial_cash)
+        except ZeroDivisionError:
+            continue
+        if score > best_score:
+            best, best_score = params, score
+
+    result = {**fold, 'params': best, 'train_return_pct': best_score, 'test_dates': index.dates[test[0]:test[1]]}
+    if best is None:
+        result['test_equity'] = np.full(test[1] - test[0], float(initial_cash))
+        return result
+    rules = resolve_rules(preset, **PRESET_OVERRIDES.get(preset, {}), **best)
+    sim = run_slice(data, rules, *test, initial_cash, commission)
+    result.update(test_equity=sim['equity'], test_return_pct=_score(sim['equity'], initial_cash),
+                  test_trades=len(sim['trades']))
+    return result
+
+
+def _fold_task(data, item):
+    fold, param_space, initial_cash, commission = item
+    return run_fold(data, fold, param_space, initial_cash, commission)
+
+
+# =============================================================================
+# 滚动前推
+# =============================================================================
+
+def stitch(folds, initial_cash=100000):
+    """各折测试期权益按收益率首尾相接 → 连续的样本外权益 (pd.Series)"""
+    pieces, dates, level = [], [], float(initial_cash)
+    for fold in folds:
+        curve = np.asarray(fold['test_equity'], dtype=np.float64) / initial_cash * level
+        pieces.append(curve)
+        dates.append(fold['test_dates'])
+        if len(curve):
+            level = float(curve[-1])
+    if not pieces:
+        return pd.Series(dtype=np.float64, name='equity')
+    return pd.Series(np.concatenate(pieces), index=pd.DatetimeIndex(np.concatenate(dates), name='date'),
+                     name='equity')
+
+
+def walk_forward(symbol, preset='simple_fixed', param_space=None, train_years=4, test_years=1,
+                 anchored=False, first_year=None, last_year=None, initial_cash=100000, commission=0.0,
+                 workers=None, data_dir=None):
+    """
+    Args:
+        symbol: price_store / data_quality 可解析的标的 (如 stock_sh_600519) 或CSV路径
+        param_space: {参数: [取值]} (默认 DEFAULT_SPACES[preset])
+        first_year / last_year: 参与划分的年份范围 (默认数据覆盖的全部年份)
+
+    Returns:
+        dict: folds (按时间顺序), equity (样本外拼接曲线), summary
+    """
+    from data_quality import load_clean_history
+
+    param_space = param_space or DEFAULT_SPACES[preset]
+    years = [y for y in load_clean_history(symbol, data_dir).index.years()
+             if (first_year is None or y >= first_year) and (last_year is None or y <= last_year)]
+    folds = make_folds(years, train_years, test_years, anchored)
+
+    results = [None] * len(folds)
+    items = [(fold, param_space, initial_cash, commission) for fold in folds]
+    for i, _, result in run_sweep(_fold_task, items, load_history, (symbol, preset, param_space, data_dir),
+                                  workers=workers, chunksize=1):
+        results[i] = result
+
+    equity = stitch(results, initial_cash)
+    summary = {'folds': len(results)}
+    if len(equity):
+        years_span = (equity.index[-1] - equity.index[0]).days / 365.25
+        summary.update(
+            returns_pct=(float(equity.iloc[-1]) / initial_cash - 1) * 100,
+            annual_return_pct=((float(equity.iloc[-1]) / initial_cash) ** (1 / years_span) - 1) * 100
+            if years_span > 0 else math.nan,
+            max_drawdown_pct=bt_max_drawdown(equity.to_numpy()),
+        )
+    return {'folds': results, 'equity': equity, 'summary': summary}
+
+
+# =============================================================================
+# 命令行
+# =============================================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='滚动前推优化: 训练窗口选参 → 下一窗口交易 → 拼接样本外曲线')
+    parser.add_argument('--symbol', default='stock_sh_600519')
+    parser.add_argument('--preset', default='simple_fixed', choices=sorted(DEFAULT_SPACES))
+    parser.add_argument('--train-years', type=int, default=4)
+    parser.add_argument('--test-years', type=int, default=1)
+    parser.add_argument('--anchored', action='store_true', help='训练期起点固定 (扩张窗口)')
+    parser.add_argument('--first-year', type=int, default=2010)
+    parser.add_argument('--last-year', type=int, default=2025)
+    parser.add_argument('--initial-cash', type=float, default=100000)
+    parser.add_argument('--commission', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=None, help='进程数 (默认全部可用CPU)')
+    parser.add_argument('--output', default=None, help='样本外权益曲线写入CSV')
+    args = parser.parse_args()
+
+    wf = walk_forward(args.symbol, args.preset, None, args.train_years, args.test_years, args.anchored,
+                      args.first_year, args.last_year, args.initial_cash, args.commission, args.workers)
+
+    mode = 'anchored' if args.anchored else 'rolling'
+    print("=" * 80)
+    print(f"Walk-forward - {args.symbol} / {args.preset} ({mode}, {args.train_years}y train / {args.test_years}y test)")
+    print("=" * 80)
+    print(f"\n{'训练期':<11} {'测试期':<11} {'训练收益%':>10} {'测试收益%':>10} {'成交':>5}  参数")
+    print("-" * 80)
+    for fold in wf['folds']:
+        train = f"{fold['train'][0]}-{fold['train'][1]}"
+        test = f"{fold['test'][0]}" if fold['test'][0] == fold['test'][1] else f"{fold['test'][0]}-{fold['test'][1]}"
+        print(f"{train:<11} {test:<11} {fold['train_return_pct']:>10.2f} "
+              f"{fold.get('test_return_pct', math.nan):>10.2f} {fold.get('test_trades', 0):>5}  {fold['params']}")
+
+    s = wf['summary']
+    if 'returns_pct' in s:
+        print(f"\n样本外 ({wf['equity'].index[0].date()} ~ {wf['equity'].index[-1].date()}): "
+              f"收益 {s['returns_pct']:+.2f}%, 年化 {s['annual_return_pct']:+.2f}%, "
+              f"最大回撤 {s['max_drawdown_pct']:.2f}%")
+    if args.output:
+        wf['equity'].to_csv(args.output)
+        print(f"样本外权益曲线已保存: {args.output}")
+
+    sys.exit(0)
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+可续跑的共享任务队列 (SQLite Work Queue)
+========================================
+
+功能: 补充实验_P0_单独调参对比 (10只股票的网格)、补充实验_P0_跨市场扩展 与
+      run_parameter_sensitivity_analysis 的三组实验都在一个长进程里跑完, 进程一死全部重来,
+      也没法多加机器。本模块把 (策略/函数, 参数, 资产, 时期) 任务写进一个SQLite文件:
+
+    - enqueue: 任务 = 模块级函数 + JSON参数, 按内容去重 (同一任务重复提交只保留一条, 已完成的不重跑);
+               参数中带 content_signature (数据文件与回测代码的内容hash), 改动后不会取回旧结果
+    - lease: worker 原子地领取任务 (BEGIN IMMEDIATE), 租约 LEASE_SECONDS 秒;
+             运行期间后台线程每 HEARTBEAT_SECONDS 秒续租
+    - 租约过期 (worker崩溃/断网) 的任务被下一次 lease 收回重发; 同一任务过期或出错
+      MAX_ATTEMPTS 次后标记 failed (retry 命令可重置)
+    - complete: 结果 (pickle) 只写一次 —— 已 done 的任务再次完成 (被收回后原worker迟到) 直接忽略
+    - map(fn, tasks, queue): 提交 + 本进程也作为worker参与 + 等其它worker手里的任务结束,
+      返回与 tasks 同顺序的结果; 中断后重跑同一脚本只补未完成的任务 (上次 failed 的任务重新获得 MAX_ATTEMPTS 次机会)
+    - 任务函数出错时应直接抛出异常 (由 fail 记录并重发); 捕获后返回的值会被当作结果永久保存
+
+    多台主机共享同一文件系统时, 各自运行 `python work_queue.py work` 即可加入
+    (函数按仓库内相对路径定位, 各主机的仓库根目录可以不同)。
+    SQLite 的 WAL 模式依赖各进程共享内存映射的 -shm 索引, 不能跨主机, 也不能放在网络文件系统上,
+    因此队列使用 DELETE 日志模式 (回滚日志 + 文件锁), 领取/提交由 BEGIN IMMEDIATE 的写事务串行化;
+    网络文件系统需要支持可靠的文件锁 (如 NFS 的 lockd)。
+
+使用方法:
+    from work_queue import WorkQueue, content_signature
+    QUEUE = WorkQueue()
+    signature = content_signature(data_path, run_grid_task, adaptive_engine)   # 数据/代码改动 → 新任务
+    results = QUEUE.map(run_grid_task, [{'data_path': ..., 'params': ..., 'signature': signature}, ...],
+                        'per_market_optimization')
+
+    python work_queue.py work [--queue NAME] [--processes 4]   # 本机启动worker
+    python work_queue.py status [--watch 10]                   # 进度 / 吞吐 / 活跃worker / 预计剩余
+    python work_queue.py retry [--queue NAME]                  # failed → pending
+    python work_queue.py drop --queue NAME
+"""
+
+import hashlib
+import importlib.util
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+ROOT = Path(__file__).resolve().parent
+QUEUE_PATH = ROOT / 'price_cache' / 'work_queue.sqlite'
+
+LEASE_SECONDS = 300        # 租约时长 (超过即视为worker已崩溃)
+HEARTBEAT_SECONDS = 60     # 续租间隔
+MAX_ATTEMPTS = 3           # 同一任务最多领取次数
+POLL_SECONDS = 5           # 没有可领任务时的等待间隔
+RATE_WINDOW = 600          # status 吞吐统计窗口 (秒)
+
+
+# =============================================================================
+# 任务函数
+# =============================================================================
+
+def runner_spec(fn):
+    """模块级函数 → '仓库内相对路径.py:函数名'"""
+    path = Path(inspect.getsourcefile(fn)).resolve()
+    return f'{path.relative_to(ROOT).as_posix()}:{fn.__name__}'
+
+
+_RUNNERS = {}
+
+
+def load_runner(spec):
+    """'相对路径.py:函数名' → 函数 (每个进程每个文件只加载一次; 与直接运行脚本一样, 脚本目录加入 sys.path)"""
+    if spec not in _RUNNERS:
+        relpath, name = spec.rsplit(':', 1)
+        path = ROOT / relpath
+        if str(path.parent) not in sys.path:
+            sys.path.insert(0, str(path.parent))
+        module_spec = importlib.util.spec_from_file_location(f'_work_queue_{path.stem}', path)
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+        _RUNNERS[spec] = getattr(module, name)
+    return _RUNNERS[spec]
+
+
+def task_key(spec, args):
+    """任务的去重key: 函数路径 + 参数 (参数中应带 content_signature, 否则数据/代码改动后仍会取回旧结果)"""
+    payload = json.dumps([spec, args], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def content_signature(data_path, *code, **named):
+    """
+    放进任务参数的内容签名: 数据文件内容 + 被评估的代码 (函数/类源码, 模块文件内容) + 其它取值
+
+    task_key 只看参数字面值, 数据文件或回测代码改动后签名随之改变, 任务重新提交而不是复用旧结果
+    """
+    from result_cache import cache_key
+    return cache_key(*code, data=Path(data_path), **named)
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# =============================================================================
+# 队列
+# =============================================================================
+
+class WorkQueue:
+    """SQLite中的任务表: pending → leased → done / failed"""
+
+    def __init__(self, path=None, lease_seconds=LEASE_SECONDS):
+        self.path = Path(path) if path else QUEUE_PATH
+        self.lease_seconds = lease_seconds
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = self._open()
+        return self._db
+
+    def _open(self):
+        """新连接 (autocommit, 事务显式开启); 心跳线程使用自己的连接"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.path), timeout=60, isolation_level=None, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=DELETE')   # WAL 不能跨主机共享 (见模块说明)
+        db.execute('CREATE TABLE IF NOT EXISTS tasks ('
+                   'id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, key TEXT NOT NULL, '
+                   'runner TEXT NOT NULL, args TEXT NOT NULL, state TEXT NOT NULL DEFAULT \'pending\', '
+                   'worker TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, '
+                   'result BLOB, error TEXT, created REAL NOT NULL, started REAL, finished REAL, '
+                   'UNIQUE (queue, key))')
+        db.execute('CREATE INDEX IF NOT EXISTS tasks_state ON tasks (queue, state)')
+        db.execute('CREATE TABLE IF NOT EXISTS workers ('
+                   'worker TEXT PRIMARY KEY, host TEXT, pid INTEGER, started REAL, seen REAL, '
+                   'done INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0)')
+        return db
+
+    # ---------------------------------------------------------------- 提交
+
+    def enqueue(self, fn, tasks, queue):
+        """
+        提交任务 (tasks 为 fn 的关键字参数dict列表, 需可JSON序列化)
+
+        Returns:
+            新增任务数 (已存在的任务 —— 无论状态 —— 不重复提交)
+        """
+        spec = fn if isinstance(fn, str) else runner_spec(fn)
+        now = time.time()
+        rows = [(queue, task_key(spec, args), spec, json.dumps(args, sort_keys=True, ensure_ascii=False), now)
+                for args in tasks]
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        before = db.total_changes
+        db.executemany('INSERT OR IGNORE INTO tasks (queue, key, runner, args, created) VALUES (?, ?, ?, ?, ?)',
+                       rows)
+        db.execute('COMMIT')
+        return db.total_changes - before
+
+    # ---------------------------------------------------------------- worker
+
+    def lease(self, worker, queue=None, n=1):
+        """
+        领取至多 n 个任务 (pending, 或租约已过期的 leased)
+
+        Returns:
+            [(id, runner, args)]
+        """
+        now = time.time()
+        scope, params = ('AND queue = ?', (queue,)) if queue else ('', ())
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            # 过期次数用尽的任务不再重发
+            db.execute(f"UPDATE tasks SET state = 'failed', error = COALESCE(error, 'lease expired') "
+                       f"WHERE state = 'leased' AND lease_until < ? AND attempts >= ? {scope}",
+                       (now, MAX_ATTEMPTS) + params)
+            rows = db.execute(f"SELECT id, runner, args FROM tasks "
+                              f"WHERE (state = 'pending' OR (state = 'leased' AND lease_until < ?)) {scope} "
+                              f"ORDER BY id LIMIT ?", (now,) + params + (n,)).fetchall()
+            db.executemany("UPDATE tasks SET state = 'leased', worker = ?, lease_until = ?, started = ?, "
+                           "attempts = attempts + 1 WHERE id = ?",
+                           [(worker, now + self.lease_seconds, now, row[0]) for row in rows])
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return [(task_id, runner, json.loads(args)) for task_id, runner, args in rows]
+
+    def heartbeat(self, worker, task_ids, db=None):
+        """续租 worker 手里的任务, 并更新 worker 的最后活跃时间"""
+        db = db or self._connect()
+        now = time.time()
+        db.executemany("UPDATE tasks SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                       [(now + self.lease_seconds, task_id, worker) for task_id in task_ids])
+        db.execute('UPDATE workers SET seen = ? WHERE worker = ?', (now, worker))
+
+    def complete(self, task_id, worker, result):
+        """写入结果; 任务已被其它worker完成时忽略 (返回 False)"""
+        payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        db = self._connect()
+        stored = db.execute("UPDATE tasks SET state = 'done', result = ?, worker = ?, finished = ?, "
+                            "lease_until = NULL, error = NULL WHERE id = ? AND state != 'done'",
+                            (payload, worker, time.time(), task_id)).rowcount
+        db.execute('UPDATE workers SET done = done + ?, seen = ? WHERE worker = ?', (stored, time.time(), worker))
+        return bool(stored)
+
+    def fail(self, task_id, worker, error):
+        """任务出错: 领取次数未用尽时退回 pending, 否则 failed"""
+        db = self._connect()
+        db.execute("UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                   "error = ?, lease_until = NULL WHERE id = ? AND worker = ? AND state = 'leased'",
+                   (MAX_ATTEMPTS, error, task_id, worker))
+        db.execute('UPDATE workers SET failed = failed + 1, seen = ? WHERE worker = ?', (time.time(), worker))
+
+    def remaining(self, queue=None):
+        """pending + leased 任务数"""
+        scope, params = ('AND queue = ?', (queue,)) if queue else ('', ())
+        return self._connect().execute(
+            f"SELECT COUNT(*) FROM tasks WHERE state IN ('pending', 'leased') {scope}", params).fetchone()[0]
+
+    def work(self, queue=None, worker=None, wait=True, log=print):
+        """
+        worker主循环: 领取 → 运行 → 写结果, 直到没有可领的任务
+
+        Args:
+            queue: 只处理该队列 (默认全部)
+            wait: 没有可领任务但仍有其它worker持有的任务时继续等待
+                  (其租约可能过期需要接手); False 时立即返回
+
+        Returns:
+            本worker完成的任务数
+        """
+        worker = worker or default_worker_id()
+        db = self._connect()
+        now = time.time()
+        db.execute('INSERT OR REPLACE INTO workers (worker, host, pid, started, seen) VALUES (?, ?, ?, ?, ?)',
+                   (worker, socket.gethostname(), os.getpid(), now, now))
+
+        current = set()
+        stop = threading.Event()
+
+        def beat():
+            beat_db = self._open()
+            while not stop.wait(HEARTBEAT_SECONDS):
+                self.heartbeat(worker, list(current), beat_db)
+            beat_db.close()
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        done = 0
+        try:
+            while True:
+                leased = self.lease(worker, queue)
+                if not leased:
+                    if not wait or self.remaining(queue) == 0:
+                        break
+                    time.sleep(POLL_SECONDS)
+                    continue
+                for task_id, spec, args in leased:
+                    current.add(task_id)
+                    try:
+                        result = load_runner(spec)(**args)
+                    except Exception as e:
+                        self.fail(task_id, worker, f'{type(e).__name__}: {e}')
+                        if log:
+                            log(f'  ✗ 任务 {task_id} ({spec}) 失败: {e}')
+                    else:
+                        done += self.complete(task_id, worker, result)
+                    finally:
+                        current.discard(task_id)
+        finally:
+            stop.set()
+            thread.join()
+        return done
+
+    # ---------------------------------------------------------------- 结果
+
+    def results(self, fn, tasks, queue):
+        """与 tasks 同顺序的结果 (未完成或 failed 的任务为 None)"""
+        spec = fn if isinstance(fn, str) else runner_spec(fn)
+        keys = [task_key(spec, args) for args in tasks]
+        db = self._connect()
+        found = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ', '.join('?' * len(chunk))
+            found.update(db.execute(f"SELECT key, result FROM tasks WHERE queue = ? AND state = 'done' "
+                                    f"AND key IN ({marks})", [queue] + chunk).fetchall())
+        return [pickle.loads(found[key]) if key in found else None for key in keys]
+
+    def map(self, fn, tasks, queue, log=print):
+        """
+        提交 + 本进程参与运行 + 等待全部结束, 返回与 tasks 同顺序的结果
+
+        已完成的任务 (上次运行中断前、或其它主机完成的) 不重跑; 上次 failed 的任务重置后再试
+        """
+        tasks = list(tasks)
+        spec = runner_spec(fn)
+        _RUNNERS.setdefault(spec, fn)       # 本进程直接用调用方的函数
+        added = self.enqueue(spec, tasks, queue)
+        reset = self.retry(queue, [task_key(spec, args) for args in tasks])
+        if log:
+            log(f"  队列 {queue}: {len(tasks)} 个任务, 新提交 {added}, 重置失败 {reset} (其余已在队列中或已完成)")
+        self.work(queue, log=log)
+        return self.results(spec, tasks, queue)
+
+    # ---------------------------------------------------------------- 管理
+
+    def retry(self, queue=None, keys=None):
+        """failed 任务重置为 pending (领取次数清零); keys 给定时只重置这些任务"""
+        scope, params = ('AND queue = ?', (queue,)) if queue else ('', ())
+        if keys is None:
+            return self._connect().execute(f"UPDATE tasks SET state = 'pending', attempts = 0, worker = NULL "
+                                           f"WHERE state = 'failed' {scope}", params).rowcount
+        db = self._connect()
+        keys = list(keys)
+        reset = 0
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ', '.join('?' * len(chunk))
+            reset += db.execute(f"UPDATE tasks SET state = 'pending', attempts = 0, worker = NULL "
+                                f"WHERE state = 'failed' {scope} AND key IN ({marks})", params + tuple(chunk)).rowcount
+        return reset
+
+    def drop(self, queue):
+        return self._connect().execute('DELETE FROM tasks WHERE queue = ?', (queue,)).rowcount
+
+    def status(self, window=RATE_WINDOW):
+        """
+        每个队列的任务数 / 吞吐 / 预计剩余时间, 以及活跃worker
+
+        Returns:
+            {'queues': [{queue, total, pending, leased, done, failed, rate, eta}],
+             'workers': [{worker, seen, done, failed}]}
+            rate 为最近 window 秒的完成数/分钟, eta 为按该速率完成剩余任务的秒数
+        """
+        db = self._connect()
+        now = time.time()
+        queues = []
+        names = [row[0] for row in db.execute('SELECT DISTINCT queue FROM tasks ORDER BY queue')]
+        for name in names:
+            counts = dict(db.execute('SELECT state, COUNT(*) FROM tasks WHERE queue = ? GROUP BY state', (name,)))
+            recent = db.execute("SELECT COUNT(*) FROM tasks WHERE queue = ? AND state = 'done' AND finished > ?",
+                                (name, now - window)).fetchone()[0]
+            rate = recent / window * 60
+            left = counts.get('pending', 0) + counts.get('leased', 0)
+            queues.append({
+                'queue': name,
+                'total': sum(counts.values()),
+                'pending': counts.get('pending', 0),
+                'leased': counts.get('leased', 0),
+                'done': counts.get('done', 0),
+                'failed': counts.get('failed', 0),
+                'rate': rate,
+                'eta': left / rate * 60 if rate else None,
+            })
+        workers = [{'worker': worker, 'seen': now - seen, 'done': done, 'failed': failed}
+                   for worker, seen, done, failed in db.execute(
+                       'SELECT worker, seen, done, failed FROM workers WHERE seen > ? ORDER BY worker',
+                       (now - self.lease_seconds,))]
+        return {'queues': queues, 'workers': workers}
+
+
+# =============================================================================
+# 命令行
+# =============================================================================
+
+def _work_process(path, queue, wait):
+    WorkQueue(path).work(queue, wait=wait)
+
+
+def print_status(status, queue=None):
+    print(f"\n{'队列':<32} {'总数':>7} {'待领':>7} {'运行中':>7} {'完成':>7} {'失败':>5} {'任务/分':>8} {'预计剩余':>9}")
+    print('-' * 92)
+    for q in status['queues']:
+        if queue and q['queue'] != queue:
+            continue
+        eta = f"{q['eta'] / 60:.1f}min" if q['eta'] is not None else '-'
+        print(f"{q['queue']:<32} {q['total']:>7} {q['pending']:>7} {q['leased']:>7} {q['done']:>7} "
+              f"{q['failed']:>5} {q['rate']:>8.1f} {eta:>9}")
+    print(f"\n活跃worker: {len(status['workers'])}")
+    for w in status['workers']:
+        print(f"  {w['worker']:<40} 完成 {w['done']:>6}  失败 {w['failed']:>3}  {w['seen']:>5.0f}s 前")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='共享任务队列: worker / 进度 / 重试')
+    parser.add_argument('command', choices=['work', 'status', 'retry', 'drop'])
+    parser.add_argument('--path', default=None, help=f'队列文件 (默认 {QUEUE_PATH})')
+    parser.add_argument('--queue', default=None, help='只处理/显示该队列')
+    parser.add_argument('--processes', type=int, default=1, help='work: 本机worker进程数')
+    parser.add_argument('--no-wait', action='store_true', help='work: 没有可领任务时立即退出')
+    parser.add_argument('--watch', type=float, default=None, help='status: 每隔N秒刷新')
+    args = parser.parse_args()
+
+    wq = WorkQueue(args.path)
+    if args.command == 'work' and args.processes == 1:
+        wq.work(args.queue, wait=not args.no_wait)
+        print_status(wq.status(), args.queue)
+    elif args.command == 'work':
+        procs = [multiprocessing.Process(target=_work_process, args=(args.path, args.queue, not args.no_wait))
+                 for _ in range(args.processes)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        print_status(wq.status(), args.queue)
+    elif args.command == 'status':
+        while True:
+            print_status(wq.status(), args.queue)
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+    elif args.command == 'retry':
+        print(f"重置 {wq.retry(args.queue)} 个失败任务")
+    elif args.command == 'drop':
+        if not args.queue:
+            parser.error('drop 需要 --queue')
+        print(f"删除 {wq.drop(args.queue)} 个任务")
+
+    sys.exit(0)